@@ -1,11 +1,24 @@
+import time
+import threading
+import structlog
+from PIL import Image
+from typing import Optional
 from tempfile import NamedTemporaryFile
 from subprocess import PIPE, DEVNULL
+from prometheus_client import Summary
 
 from os2datascanner.utils.system_utilities import run_custom
 from ... import settings as engine2_settings
 from ..types import OutputType
 from ..registry import conversion
 
+logger = structlog.get_logger("engine2")
+
+OCR_SUMMARY = Summary(
+        "os2datascanner_ocr_image",
+        "Time spent recognising the text in a single image",
+        ["engine"])
+
 
 def tesseract(path, dest="stdout", *args):
     result = run_custom(
@@ -21,21 +34,86 @@ def tesseract(path, dest="stdout", *args):
         return None
 
 
+_apis = threading.local()
+
+
+def _get_tesserocr_api():
+    """Returns this thread's tesserocr API object, creating it (and so loading
+    Tesseract's models) the first time it's needed. Returns None if tesserocr
+    can't be used."""
+    if not hasattr(_apis, "api"):
+        try:
+            import tesserocr
+            _apis.api = tesserocr.PyTessBaseAPI()
+        except (ImportError, RuntimeError):
+            logger.warning(
+                    "tesserocr is not available, falling back to the"
+                    " tesseract command", exc_info=True)
+            _apis.api = None
+    return _apis.api
+
+
+def recognise(path) -> Optional[str]:
+    """Returns the text in the image at the given path, or None if Tesseract
+    couldn't process it.
+
+    The "conversions.ocr.engine" preference controls how Tesseract is run: the
+    default, "tesseract", runs a new tesseract process for every image, while
+    "tesserocr" keeps Tesseract loaded in this process. (The tesserocr engine
+    avoids the cost of starting Tesseract and loading its models for every
+    image, but the "subprocess.timeout" preference doesn't apply to it.)"""
+    # (The model package depends on this one, so this import can't be done at
+    # the top level)
+    from ...model.derived.utilities.extraction import TinyImageFilter
+    try:
+        if TinyImageFilter.image_too_small(path):
+            # There's no point in starting Tesseract for an image that can't
+            # contain any text
+            return ""
+    except OSError:
+        # Let Tesseract decide what to do with images that Pillow can't read
+        pass
+
+    engine = engine2_settings.conversions["ocr"]["engine"]
+    api = _get_tesserocr_api() if engine == "tesserocr" else None
+
+    start = time.perf_counter()
+    if api:
+        try:
+            api.SetImageFile(path)
+            text = api.GetUTF8Text().strip()
+        except RuntimeError:
+            text = None
+    else:
+        engine = "tesseract"
+        text = tesseract(path)
+    elapsed = time.perf_counter() - start
+
+    OCR_SUMMARY.labels(engine).observe(elapsed)
+    logger.debug("image recognised", engine=engine, seconds=elapsed)
+    return text
+
+
 @conversion(OutputType.Text, "image/png", "image/jpeg")
 def image_processor(r):
     with r.make_path() as p:
-        return tesseract(p)
+        return recognise(p)
 
 
 # Some ostensibly-supported image formats are handled badly by tesseract, so
-# turn them into PNGs with ImageMagick's convert(1) command to make them more
-# palatable
+# turn them into PNGs first to make them more palatable
 @conversion(OutputType.Text, "image/gif", "image/x-ms-bmp")
 def intermediate_image_processor(r):
     with r.make_path() as p, NamedTemporaryFile("rb", suffix=".png") as ntf:
-        result = run_custom(
-                ["convert", p, "png:{0}".format(ntf.name)], isolate_tmp=True)
-        if result.returncode == 0:
-            return tesseract(ntf.name)
-        else:
-            return None
+        try:
+            with Image.open(p) as im:
+                im.save(ntf.name, "PNG")
+        except OSError:
+            # Pillow can't read this image, so give ImageMagick's convert(1)
+            # command a chance
+            result = run_custom(
+                    ["convert", p, "png:{0}".format(ntf.name)],
+                    isolate_tmp=True)
+            if result.returncode != 0:
+                return None
+        return recognise(ntf.name)
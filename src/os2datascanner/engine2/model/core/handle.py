@@ -73,6 +73,13 @@ class Handle(TypePropertyEquality, JSONSerialisable):
             self._hints = None
         return self
 
+    def clear_hint(self, key: str) -> "Handle":
+        """Deletes a single named hint from this Handle, if it was present,
+        and (for convenience) returns a reference to this Handle."""
+        if self._hints is not None:
+            self._hints.pop(key, None)
+        return self
+
     @property
     def source(self) -> "msource.Source":
         """Returns this Handle's Source."""
@@ -1,7 +1,8 @@
 from abc import abstractmethod
 from typing import Mapping, Iterator
 
-from ...utilities.json import JSONSerialisable
+from ... import settings as engine2_settings
+from ...utilities.json import JSONSerialisable, InternTable
 from ...utilities.equality import TypePropertyEquality
 # from .errors import UnknownSchemeError
 from .import handle as mhandle
@@ -45,6 +46,25 @@ class Source(TypePropertyEquality, JSONSerialisable):
         implementation is conservative, however, and compares all
         properties.)"""
 
+    @property
+    def _state_key(self):
+        """Returns a key identifying the state that this Source generates: a
+        SourcePool will let a Source reuse the idle state of another Source
+        with the same key.
+
+        As Source equality is normally based on the properties used by the
+        _generate_state method, the default implementation returns this Source
+        itself. Subclasses that share a _generate_state method, and so can
+        share states, can override this to return something broader (a
+        fingerprint of their credentials, for example)."""
+        return self
+
+    def _check_state(self, cookie) -> bool:
+        """Indicates whether or not a state object that has been kept idle for
+        a while can still be used. (The default implementation assumes that it
+        can.)"""
+        return True
+
     @abstractmethod
     def censor(self) -> "Source":
         """Returns a version of this Source that does not carry sensitive
@@ -131,6 +151,14 @@ class Source(TypePropertyEquality, JSONSerialisable):
         return None
 
     _json_handlers = {}
+    _json_cache = InternTable(
+            engine2_settings.utilities["json"]["cache_size"])
+
+    @classmethod
+    def _is_json_cacheable(cls, obj) -> bool:
+        # Sources are immutable, but the Handles that derived Sources are
+        # built on can have their hints changed
+        return "handle" not in obj
 
     @abstractmethod
     def to_json_object(self):
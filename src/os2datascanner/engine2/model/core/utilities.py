@@ -1,9 +1,19 @@
-from typing import Callable
+from typing import Callable, Optional
+from collections import OrderedDict
+import time
 import inspect
 import structlog
+from prometheus_client import Counter
+
+from ... import settings as engine2_settings
 
 logger = structlog.get_logger("engine2")
 
+POOL_EVENTS = Counter(
+        "os2datascanner_source_pool_events",
+        "Idle Source states reused, not found or thrown away by a SourcePool",
+        ["source_type", "event"])
+
 
 def takes_named_arg(func: Callable, argname: str) -> bool:
     """Indicates whether or not the given function can take the named keyword
@@ -25,6 +35,94 @@ class _SourceDescriptor:
         self.children = []
 
 
+class SourcePool:
+    """A SourcePool keeps the states of top-level Sources that a SourceManager
+    has finished with, so that a later Source that needs the same state (as
+    identified by its _state_key property) can reuse it rather than
+    connecting, authenticating and so on all over again.
+
+    Idle states are kept for a limited time, which can be specified for each
+    type of Source, and are checked with the Source._check_state method before
+    they're reused. When the pool is full, the least recently used idle state
+    is thrown away."""
+
+    def __init__(self, *, size: int = 4, ttl: float = 300,
+                 ttls: Optional[dict] = None):
+        self._size = size
+        self._ttl = ttl
+        self._ttls = ttls or {}
+        # Maps state keys to (source, generator, cookie, expiry) tuples
+        self._idle = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._idle)
+
+    def _discard(self, source, generator):
+        self.evictions += 1
+        POOL_EVENTS.labels(source.type_label, "eviction").inc()
+        try:
+            generator.close()
+        except Exception:
+            logger.warning(
+                    "Bug! Closing _generate_state failed.",
+                    source=type(source).__name__,
+                    exc_info=True)
+
+    def expire(self):
+        """Throws away idle states that have been kept for too long, and then
+        the least recently used idle states until the pool isn't too full."""
+        now = time.monotonic()
+        for key, (source, generator, _, expiry) in list(self._idle.items()):
+            if expiry <= now:
+                del self._idle[key]
+                self._discard(source, generator)
+        while len(self._idle) > self._size:
+            _, (source, generator, _, _) = self._idle.popitem(last=False)
+            self._discard(source, generator)
+
+    def take(self, source) -> Optional[tuple]:
+        """Removes an idle state that the given Source can use from this pool
+        and returns its (generator, cookie) pair, or returns None if there
+        isn't one."""
+        self.expire()
+        match self._idle.pop(source._state_key, None):
+            case (owner, generator, cookie, _) if source._check_state(cookie):
+                self.hits += 1
+                POOL_EVENTS.labels(source.type_label, "hit").inc()
+                return generator, cookie
+            case (owner, generator, _, _):
+                self._discard(owner, generator)
+        self.misses += 1
+        POOL_EVENTS.labels(source.type_label, "miss").inc()
+        return None
+
+    def give(self, source, generator, cookie) -> bool:
+        """Puts the state of a Source that is no longer in use into this pool.
+        Returns False, without doing anything, if this pool is disabled (in
+        which case the caller is responsible for closing the state)."""
+        if self._size <= 0:
+            return False
+        if (old := self._idle.pop(source._state_key, None)):
+            # We only need one idle copy of any given state
+            self._discard(old[0], old[1])
+        self._idle[source._state_key] = (
+                source, generator, cookie,
+                time.monotonic() + self._ttls.get(
+                        source.type_label, self._ttl))
+        self.expire()
+        return True
+
+    def clear(self):
+        """Throws away every idle state in this pool."""
+        while self._idle:
+            _, (source, generator, _, _) = self._idle.popitem(last=False)
+            self._discard(source, generator)
+
+
 class SourceManager:
     """A SourceManager is responsible for tracking all of the state associated
     with one or more Sources. Operations on Sources and Handles that require
@@ -42,14 +140,24 @@ class SourceManager:
     have three open pages, and so on. When opening a new Source would cause
     the width to be exceeded, the least-recently-used Source at that level will
     be closed. (Opening an already-open Source marks it as the most recently
-    used one.)
+    used one.) The width can also be set separately for the sub-Sources of
+    each type of Source.
+
+    A SourceManager can also be given a SourcePool, in which case the states
+    of top-level Sources that are closed to make room for others are kept for
+    later reuse rather than being thrown away immediately. (Clearing the
+    SourceManager also clears its SourcePool.)
 
     SourceManagers track arbitrary state objects and so are not usefully
     serialisable or shareable."""
 
-    def __init__(self, *, width=3, configuration: dict = None):
+    def __init__(self, *, width=3, widths: Optional[dict] = None,
+                 pool: Optional[SourcePool] = None,
+                 configuration: dict = None):
         """Initialises this SourceManager."""
         self._width = width
+        self._widths = widths or {}
+        self._pool = pool
 
         self._opened = {}
         self._opening = []
@@ -61,6 +169,28 @@ class SourceManager:
         # Configuration obtained from a ScanSpec
         self.configuration = configuration
 
+    @classmethod
+    def from_settings(cls, *, width=3, **kwargs) -> "SourceManager":
+        """Returns a new SourceManager with the per-type widths and the
+        SourcePool described by the model.source_manager settings."""
+        sm_settings = engine2_settings.model["source_manager"]
+        return cls(
+                width=width,
+                widths=sm_settings["widths"],
+                pool=SourcePool(
+                        size=sm_settings["pool_size"],
+                        ttl=sm_settings["pool_ttl"],
+                        ttls=sm_settings["pool_ttls"]),
+                **kwargs)
+
+    def _width_of(self, desc):
+        """Returns the number of children that the given _SourceDescriptor can
+        have."""
+        if self._widths and desc.source is not None:
+            return self._widths.get(desc.source.type_label, self._width)
+        else:
+            return self._width
+
     def _make_descriptor(self, source):
         return self._opened.setdefault(
                 source, _SourceDescriptor(source=source, parent=self._top))
@@ -78,7 +208,8 @@ class SourceManager:
 
         # If the new parent can't have any more open Sources, then close the
         # least-recently-used one
-        if self._width and len(child_d.parent.children) > self._width:
+        width = self._width_of(child_d.parent)
+        if width and len(child_d.parent.children) > width:
             self.close(child_d.parent.children[0].source)
 
         # Also perform a dummy reparent operation all the way up the hierarchy
@@ -112,6 +243,9 @@ class SourceManager:
             desc = self._make_descriptor(source)
             # Some cookies cannot be coerced into a boolean value
             # so we have to make a somewhat quirky check, sorry.
+            if desc.cookie is None and self._is_poolable(desc):
+                if (state := self._pool.take(source)) is not None:
+                    desc.generator, desc.cookie = state
             if desc.cookie is None:
                 desc.generator = source._generate_state(self)
                 try:
@@ -126,9 +260,16 @@ class SourceManager:
         finally:
             self._opening = self._opening[:-1]
 
-    def close(self, source):
+    def _is_poolable(self, desc) -> bool:
+        return (self._pool is not None
+                and desc.parent is self._top
+                and desc.source.handle is None)
+
+    def close(self, source, *, reuse=True):
         """Closes a Source opened in this SourceManager, in the process closing
-        all other open Sources that depend upon it."""
+        all other open Sources that depend upon it. (If this SourceManager has
+        a SourcePool, the state of a top-level Source is put into it, unless
+        reuse is False.)"""
         logger.debug(
                 "SourceManager.close",
                 source=source)
@@ -141,25 +282,33 @@ class SourceManager:
                     self.close(child.source)
                 desc.children.clear()
 
-            # Clear up the state and the generator
-            # Some cookies cannot be coerced into a boolean value
-            # so we have to make a somewhat quirky check, sorry.
-            if desc.cookie is not None:
-                desc.cookie = None
-            if desc.generator:
-                try:
-                    desc.generator.close()
-                except Exception:
-                    logger.warning(
-                            "Bug! Closing _generate_state failed.",
-                            source=type(source).__name__,
-                            exc_info=True)
+            self._release_state(desc, reuse=reuse)
 
             if desc.parent:
                 # Detach this Source from its parent
                 desc.parent.children.remove(desc)
             del self._opened[source]
 
+    def _release_state(self, desc, *, reuse: bool):
+        """Clears up the state and the generator of a Source that's being
+        closed, either by putting them into the SourcePool or by closing the
+        generator."""
+        # Some cookies cannot be coerced into a boolean value
+        # so we have to make a somewhat quirky check, sorry.
+        if (reuse and desc.generator and desc.cookie is not None
+                and self._is_poolable(desc)
+                and self._pool.give(desc.source, desc.generator, desc.cookie)):
+            desc.generator = None
+        desc.cookie = None
+        if desc.generator:
+            try:
+                desc.generator.close()
+            except Exception:
+                logger.warning(
+                        "Bug! Closing _generate_state failed.",
+                        source=type(desc.source).__name__,
+                        exc_info=True)
+
     def __enter__(self):
         return self
 
@@ -170,18 +319,21 @@ class SourceManager:
         return item in self._opened
 
     def clear(self):
-        """Closes all of the Sources presently open in this SourceManager."""
+        """Closes all of the Sources presently open in this SourceManager, and
+        throws away all of the idle states in its SourcePool."""
         logger.debug("SourceManager.clear")
         for child in self._top.children.copy():
             source = child.source
             try:
-                self.close(source)
+                self.close(source, reuse=False)
             except Exception:
                 logger.error(
                         "Bug - SourceManager.close tried to raise an"
                         " exception!",
                         source=type(source).__name__,
                         exc_info=True)
+        if self._pool is not None:
+            self._pool.clear()
 
     def clear_dependents(self):
         """Closes all of the dependent Sources presently open in this
@@ -11,6 +11,7 @@ from ..core import Handle, Source
 from ..file import FilesystemResource
 from .derived import DerivedSource
 from .utilities import office_metadata
+from .utilities.libreoffice_pool import get_pool
 from .utilities.extraction import TinyImageFilter
 
 logger = structlog.get_logger("engine2")
@@ -37,7 +38,14 @@ src/engine2/conversions folder
 def libreoffice(*args):
     """Invokes LibreOffice with a fresh settings directory (which will be
     deleted as soon as the program finishes) and returns a CompletedProcess
-    with both stdout and stderr captured."""
+    with both stdout and stderr captured.
+
+    If the "model.libreoffice.servers" preference is set, then the command is
+    instead carried out by one of this process's background LibreOffice
+    processes."""
+    if (pool := get_pool()):
+        return pool.run(*args)
+
     with TemporaryDirectory() as tmpdir:
         return run_custom(
                 ["libreoffice",
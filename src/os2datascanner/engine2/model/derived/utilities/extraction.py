@@ -76,7 +76,7 @@ class ImageSizeFilter(Filter):
     def __init__(self, x_dim, y_dim):
         self.dimensions = (x_dim, y_dim)
 
-    def _image_too_small(self, image):
+    def image_too_small(self, image):
         """
         Checks whether an image is too small to contain
         any (OCR) readable text using dimensions specified
@@ -90,7 +90,7 @@ class ImageSizeFilter(Filter):
         """
 
         for image in Path(tmpdir).glob("*.png"):
-            if self._image_too_small(image):
+            if self.image_too_small(image):
                 image.unlink()
 
         return tmpdir
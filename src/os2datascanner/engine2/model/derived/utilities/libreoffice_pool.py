@@ -0,0 +1,211 @@
+"""
+Contains utilities for keeping warm LibreOffice processes around to convert
+documents.
+
+Starting LibreOffice takes much longer than converting a small document does.
+A LibreOfficeServer is a headless LibreOffice process, with its own settings
+directory, that stays running in the background and listens on a local socket.
+When LibreOffice is invoked with the settings directory of a process that's
+already running, it hands its command line over to that process and waits for
+it to finish, so conversions sent to a LibreOfficeServer skip the startup.
+"""
+import os
+import time
+import atexit
+import signal
+import socket
+import structlog
+import subprocess
+from queue import Queue
+from typing import Optional
+from tempfile import TemporaryDirectory
+from contextlib import contextmanager
+
+from .....utils.system_utilities import run_custom
+from .... import settings as engine2_settings
+
+logger = structlog.get_logger("engine2")
+
+
+def _get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LibreOfficeServer:
+    """A LibreOfficeServer manages a single background LibreOffice process.
+
+    The process is started on demand, checked before every conversion and
+    replaced if it has stopped responding, and recycled after it has performed
+    a certain number of conversions (LibreOffice is not known for its ability
+    to run for a long time without leaking memory)."""
+
+    def __init__(self, recycle_after: int, startup_timeout: float):
+        self._recycle_after = recycle_after
+        self._startup_timeout = startup_timeout
+
+        self._process = None
+        self._profile_dir = None
+        self._temp_dir = None
+        self._port = None
+        self._conversions = 0
+
+    @property
+    def _profile_argument(self) -> str:
+        return "-env:UserInstallation=file://{0}".format(
+                self._profile_dir.name)
+
+    def _responds(self) -> bool:
+        try:
+            with socket.create_connection(("127.0.0.1", self._port), 1):
+                return True
+        except OSError:
+            return False
+
+    def healthy(self) -> bool:
+        """Indicates whether or not the background process is running and
+        listening for connections."""
+        return (self._process is not None
+                and self._process.poll() is None
+                and self._responds())
+
+    def start(self):
+        """Starts the background process and waits for it to be ready."""
+        self.stop()
+
+        self._profile_dir = TemporaryDirectory()
+        self._temp_dir = TemporaryDirectory()
+        self._port = _get_free_port()
+        self._conversions = 0
+
+        temp_path = self._temp_dir.name
+        self._process = subprocess.Popen(
+                ["libreoffice", self._profile_argument,
+                 "--headless", "--invisible", "--nologo", "--norestore",
+                 "--nodefault",
+                 "--accept=socket,host=127.0.0.1,port={0};urp;".format(
+                         self._port)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                # Run LibreOffice in its own process group, so that we can get
+                # rid of all of its helper processes at once
+                preexec_fn=os.setpgrp,
+                env=os.environ | dict(
+                        TMP=temp_path, TMPDIR=temp_path, TEMP=temp_path))
+
+        deadline = time.monotonic() + self._startup_timeout
+        while not self._responds():
+            if self._process.poll() is not None:
+                returncode = self._process.returncode
+                self.stop()
+                raise subprocess.CalledProcessError(
+                        returncode, "libreoffice")
+            elif time.monotonic() > deadline:
+                self.stop()
+                raise subprocess.TimeoutExpired(
+                        "libreoffice", self._startup_timeout)
+            time.sleep(0.1)
+        logger.debug(
+                "LibreOffice server started",
+                pid=self._process.pid, port=self._port)
+
+    def stop(self):
+        """Stops the background process, if there is one, and deletes its
+        settings and temporary files."""
+        if self._process is not None:
+            try:
+                os.killpg(self._process.pid, signal.SIGTERM)
+                self._process.wait(5)
+            except ProcessLookupError:
+                pass
+            except subprocess.TimeoutExpired:
+                os.killpg(self._process.pid, signal.SIGKILL)
+                self._process.wait()
+            logger.debug(
+                    "LibreOffice server stopped",
+                    pid=self._process.pid, conversions=self._conversions)
+            self._process = None
+        for directory in (self._profile_dir, self._temp_dir,):
+            if directory is not None:
+                directory.cleanup()
+        self._profile_dir = self._temp_dir = None
+
+    def run(self, *args) -> subprocess.CompletedProcess:
+        """Has the background process carry out a LibreOffice command line,
+        starting or replacing that process first if necessary. Returns a
+        CompletedProcess as the run_custom function does."""
+        if not self.healthy():
+            self.start()
+
+        try:
+            return run_custom(
+                    ["libreoffice", self._profile_argument, *args],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                    check=True,
+                    timeout=engine2_settings.subprocess["timeout"],
+                    kill_group=True)
+        except subprocess.TimeoutExpired:
+            # The background process might still be working on this document,
+            # so it can't be trusted with anything else
+            self.stop()
+            raise
+        finally:
+            self._conversions += 1
+            if self._process and self._conversions >= self._recycle_after:
+                self.stop()
+
+
+class LibreOfficePool:
+    """A LibreOfficePool hands out LibreOfficeServers to callers, making sure
+    that each one is only used by one caller at a time."""
+
+    def __init__(
+            self, size: int, recycle_after: int, startup_timeout: float):
+        self._servers = [
+                LibreOfficeServer(recycle_after, startup_timeout)
+                for _ in range(size)]
+        self._idle = Queue()
+        for server in self._servers:
+            self._idle.put(server)
+
+    @contextmanager
+    def server(self):
+        """Waits for a LibreOfficeServer to become available, and returns it
+        to the pool afterwards."""
+        server = self._idle.get()
+        try:
+            yield server
+        finally:
+            self._idle.put(server)
+
+    def run(self, *args) -> subprocess.CompletedProcess:
+        """As LibreOfficeServer.run, but with the next available server."""
+        with self.server() as server:
+            return server.run(*args)
+
+    def shutdown(self):
+        """Stops all of the servers in this pool."""
+        for server in self._servers:
+            server.stop()
+
+
+_pool = None
+_pool_pid = None
+
+
+def get_pool() -> Optional[LibreOfficePool]:
+    """Returns this process's LibreOfficePool, creating it if necessary, or
+    None if the "model.libreoffice.servers" preference is zero."""
+    global _pool, _pool_pid
+    # A pool inherited from our parent process contains servers that belong to
+    # that process, so don't use it
+    if _pool is None or _pool_pid != os.getpid():
+        settings = engine2_settings.model["libreoffice"]
+        size = settings["servers"]
+        if size < 1:
+            return None
+        _pool = LibreOfficePool(
+                size, settings["recycle_after"], settings["startup_timeout"])
+        _pool_pid = os.getpid()
+        atexit.register(_pool.shutdown)
+    return _pool
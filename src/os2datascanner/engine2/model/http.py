@@ -1,5 +1,6 @@
 from io import BytesIO
 import re
+from base64 import b64decode
 from typing import Optional, Union
 from urllib.parse import urlsplit, urlunsplit
 import requests
@@ -15,11 +16,13 @@ from ..conversions.utilities.navigable import (
 from .core import Source, Handle, FileResource
 from .utilities.sitemap import process_sitemap_url
 
-from .utilities import crawler
+from .utilities import crawler, async_crawler
 
 
 logger = structlog.get_logger("engine2")
 TTL: int = engine2_settings.model["http"]["ttl"]
+CONTENT_LIMIT: int = engine2_settings.model["http"]["content_limit"]
+CONCURRENCY: int = engine2_settings.model["http"]["concurrency"]
 _equiv_domains = set({"www", "www2", "m", "ww1", "ww2", "en", "da", "secure"})
 # match whole words (\bWORD1\b | \bWORD2\b) and escape to handle metachars.
 # It is important to match whole words; www.magenta.dk should be .magenta.dk, not
@@ -178,9 +181,18 @@ class WebSource(Source):
 
     def handles(self, sm):  # noqa: CCR001
         session = sm.open(self)
-        wc = crawler.WebCrawler(
-                self._url, session=session, ttl=TTL,
-                allow_element_hints=self._extended_hints)
+        kwargs = dict(
+                session=session, ttl=TTL,
+                allow_element_hints=self._extended_hints,
+                content_limit=CONTENT_LIMIT)
+        if CONCURRENCY > 1:
+            http_settings = engine2_settings.model["http"]
+            wc = async_crawler.AsyncWebCrawler(
+                    self._url, concurrency=CONCURRENCY,
+                    rate=http_settings["limit"],
+                    timeout=http_settings["timeout"], **kwargs)
+        else:
+            wc = crawler.WebCrawler(self._url, **kwargs)
         if self._exclude:
             wc.exclude(*self._exclude)
 
@@ -201,7 +213,7 @@ class WebSource(Source):
             new_hints = {
                     k: v for k, v in hints.items()
                     if k in ("last_modified", "content_type", "true_url",
-                             "title", "fresh",)}
+                             "title", "fresh", "content",)}
             r = WebHandle.make_handle(
                     referrer, self._url) if referrer else None
             h = WebHandle.make_handle(
@@ -279,6 +291,7 @@ class WebResource(FileResource):
         super().__init__(handle, sm)
         self._response = None
         self._mr = None
+        self._content = None
 
     def _generate_metadata(self):
         _, netloc, _, _, _ = urlsplit(self.handle.source.url)
@@ -291,10 +304,22 @@ class WebResource(FileResource):
         return throttled_session_head(
                 self.handle._url, allow_redirects=True)
 
+    def _get_content(self) -> Optional[bytes]:
+        """Returns the content of this WebResource that the crawler attached
+        to its Handle, or None if it didn't."""
+        if self._content is None and (
+                (content := self.handle.hint("content")) is not None):
+            self._content = b64decode(content)
+        return self._content
+
     def check(self) -> bool:
         if (self.handle.source.has_trusted_sitemap
                 and self.handle.hint("fresh")):
             return True
+        elif self.handle.hint("content") is not None:
+            # The crawler only attaches content to a Handle after getting a
+            # successful response, so there's no need to ask again
+            return True
 
         context = self._get_cookie()
         th_send = wrap_session_send(
@@ -352,11 +377,17 @@ class WebResource(FileResource):
         if (self.handle.source.has_trusted_sitemap
                 and self.handle.hint("fresh")):
             return 0
+        elif (content := self._get_content()) is not None:
+            return len(content)
 
         return int(self.unpack_header(check=True).get("content-length", 0))
 
     def get_last_modified(self):
         if not (lm_hint := self.handle.hint("last_modified")):
+            if self._get_content() is not None:
+                # The server didn't tell the crawler when this page was last
+                # modified, so it won't tell us either
+                return super().get_last_modified()
             return self.unpack_header(check=True).setdefault(
                     OutputType.LastModified, super().get_last_modified())
         else:
@@ -375,6 +406,11 @@ class WebResource(FileResource):
 
     @contextmanager
     def make_stream(self):
+        if (content := self._get_content()) is not None:
+            with BytesIO(content) as s:
+                yield s
+            return
+
         # Assign session HTTP methods to variables, wrapped to constrain requests per second
         throttled_session_get = rate_limit(self._get_cookie().get)
         response = throttled_session_get(self.handle._url)
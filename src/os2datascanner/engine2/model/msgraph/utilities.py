@@ -1,9 +1,10 @@
 from dataclasses import dataclass
 from contextlib import contextmanager
+import time
 import structlog
 import requests
 
-from os2datascanner.utils.oauth2 import mint_cc_token
+from os2datascanner.utils.oauth2 import mint_cc_token, token_expiry
 from os2datascanner.engine2 import settings as engine2_settings
 from os2datascanner.engine2.utilities.backoff import WebRetrier
 
@@ -45,6 +46,10 @@ class MSGraphSource(Source):
 
     eq_properties = ("_client_id", "_tenant_id", "_client_secret",)
 
+    TOKEN_MARGIN = 60.0
+    """The least time (in seconds) that the token of an idle GraphCaller must
+    have left before it expires for that GraphCaller to be reused."""
+
     def __init__(self, client_id, tenant_id, client_secret):
         super().__init__()
         self._client_id = client_id
@@ -58,10 +63,29 @@ class MSGraphSource(Source):
         return make_token(
             self._client_id, self._tenant_id, self._client_secret)
 
+    @property
+    def _state_key(self):
+        # Every kind of MSGraphSource uses the same kind of state, which
+        # depends only on the credentials
+        return (MSGraphSource, self._client_id, self._tenant_id,
+                self._client_secret)
+
     def _generate_state(self, sm):
         with requests.Session() as session:
             yield MSGraphSource.GraphCaller(self.make_token, session)
 
+    def _check_state(self, cookie) -> bool:
+        # An idle GraphCaller is only worth keeping if its token will last a
+        # little while longer. (The token might still be rejected for some
+        # other reason, but raw_request_decorator will get a new one if it is)
+        expiry = token_expiry(cookie._token)
+        if expiry is not None and expiry - time.time() < self.TOKEN_MARGIN:
+            logger.info(
+                    "idle Microsoft Graph session's token has expired",
+                    tenant_id=self._tenant_id)
+            return False
+        return True
+
     def _list_users(self, sm):
         yield from sm.open(self).paginated_get("users")
 
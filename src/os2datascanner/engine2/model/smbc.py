@@ -1,17 +1,24 @@
 import io
+import os.path
 from os import stat_result, O_RDONLY
 import enum
 import structlog
 import smbc
+import threading
+from queue import Queue, Empty, Full
 from typing import Optional
 from urllib.parse import quote
 from pathlib import PureWindowsPath
 from datetime import datetime
+from dateutil.tz import gettz
 import operator
 import warnings
 from functools import reduce
 from contextlib import contextmanager
 
+from .. import settings as engine2_settings
+from ..rules.rule import Rule
+from ..rules.utilities.analysis import compute_mss
 from ..utilities.backoff import DefaultRetrier
 from ..conversions.types import OutputType
 from ..conversions.utilities.navigable import make_values_navigable
@@ -21,6 +28,7 @@ from .smb import (
 from .core import Source, Handle, FileResource
 from .core.errors import UncontactableError
 from .file import stat_attributes
+from .utilities.snapshot import TreeSnapshot
 
 import errno
 
@@ -37,6 +45,11 @@ IGNORABLE_SMBC_EXCEPTIONS = (
 exclude write errors or connection errors."""
 
 
+_DONE = object()
+"""The marker that SMBCSource's folder walkers use to signal the end of the
+work (or, paired with an exception, a failure)."""
+
+
 class Mode(enum.IntFlag):
     """A convenience enumeration for manipulating SMB file mode flags."""
     # description of flags mapping
@@ -75,17 +88,29 @@ class Mode(enum.IntFlag):
 ModeMask = reduce(operator.or_, Mode, Mode.NONE)
 
 
+SMBC_FOLDER_MIME = "application/x.os2datascanner.smbc-folder"
+"""The MIME type given to SMBCFolderHandles, which stand for independently
+explorable parts of a SMB share."""
+
+
 class SMBCSource(Source):
     type_label = "smbc"
     eq_properties = ("_unc", "_user", "_password", "_domain")
 
+    listing_filters = ("_skip_super_hidden",)
+    """The (boolean) properties of a SMBCSource that control which entries of
+    its folder listings are left out."""
+
     def __init__(
             self, unc: str,
             user: Optional[str] = None, password: Optional[str] = None,
             domain: Optional[str] = None, driveletter: Optional[str] = None,
             *,
             skip_super_hidden: bool = False,
-            unc_is_home_root: bool = False):
+            unc_is_home_root: bool = False,
+            split_top_level: bool = False,
+            recursive: bool = True,
+            owner_sid: Optional[str] = None):
         self._unc = unc.replace('\\', '/')
         self._user = user
         self._password = password
@@ -95,6 +120,9 @@ class SMBCSource(Source):
 
         self._skip_super_hidden = skip_super_hidden
         self._unc_is_home_root = unc_is_home_root
+        self._split_top_level = split_top_level
+        self._recursive = recursive
+        self._owner_sid = owner_sid
 
     @property
     def unc(self):
@@ -104,6 +132,38 @@ class SMBCSource(Source):
     def driveletter(self):
         return self._driveletter
 
+    @property
+    def yields_independent_sources(self) -> bool:
+        # A SMBCSource that splits its share yields a SMBCFolderHandle for each
+        # of its top-level folders (and one for the files next to them), each
+        # of which can be explored by a different explorer process
+        return self._split_top_level
+
+    def make_folder_source(
+            self, path: str,
+            owner_sid: Optional[str] = None) -> "SMBCSource":
+        """Returns a SMBCSource for the given folder in this SMBCSource's
+        share, with the same settings as this one. (If the path is empty, the
+        new SMBCSource will only cover the files directly in this
+        SMBCSource's folder.)
+
+        Files reached through the new SMBCSource have the same names, paths
+        and presentation URLs as those reached through this one, but their
+        Handles are not equal, as they belong to a different Source."""
+        unc = self._unc
+        driveletter = self._driveletter
+        if path:
+            unc = unc.rstrip("/") + "/" + path
+            if driveletter:
+                if ":" not in driveletter:
+                    driveletter += ":"
+                driveletter = driveletter.rstrip("/") + "/" + path
+        return SMBCSource(
+                unc, self._user, self._password, self._domain, driveletter,
+                skip_super_hidden=self._skip_super_hidden,
+                recursive=bool(path),
+                owner_sid=owner_sid or self._owner_sid)
+
     def __auth_handler(self, server, share, workgroup, username, password):
         """Returns the (workgroup, username, password) tuple expected of
         pysmbc authentication functions."""
@@ -117,6 +177,22 @@ class SMBCSource(Source):
         # reference to this smbc.Context when this function completes
         yield (self._to_url(), c)
 
+    def _check_state(self, cookie) -> bool:
+        # An idle smbc.Context can outlive its connection to the server (or
+        # the server's willingness to talk to us), so make sure that it can
+        # still see the root of the share before handing it out again
+        url, context = cookie
+        try:
+            context.stat(url)
+            return True
+        except Exception:
+            # (pysmbc reports failures with a mixture of its own exception
+            # types and plain ValueErrors and OSErrors carrying errno values)
+            logger.info(
+                    "idle SMBC connection no longer works",
+                    unc=self._unc, exc_info=True)
+            return False
+
     def censor(self):
         return SMBCSource(self.unc, None, None, None, self.driveletter)
 
@@ -169,46 +245,100 @@ class SMBCSource(Source):
             # owner
             return None
 
-    def handles(self, sm):  # noqa: C901,E501,CCR001
-        url, context = sm.open(self)
-
-        def handle_dirent(parents, entity, owner_sid: str = None):
-            name = entity.name
-
-            here = parents + [entity]
-            path = '/'.join([h.name for h in here])
-            url_here = url + "/" + path
+    def _is_skipped(self, context, url_here, path, name):
+        return (self._skip_super_hidden
+                and SMBCSource.is_skippable(context, url_here, path, name))
 
-            if (self._skip_super_hidden
-                    and SMBCSource.is_skippable(
-                            context, url_here, path, name)):
-                return
-
-            hints = {}
-            if owner_sid:
-                hints["owner_sid"] = owner_sid
+    def _make_hints(self, owner_sid):
+        hints = {}
+        if (owner_sid := owner_sid or self._owner_sid):
+            hints["owner_sid"] = owner_sid
+        return hints
 
-            handle_here = SMBCHandle(self, path, hints=hints)
-            if entity.smbc_type == smbc.DIR and name not in (".", ".."):
-                try:
-                    try:
-                        obj = context.opendir(url_here)
-                    except MemoryError as e:
-                        # A memory error here means that the path is using
-                        # deprecated encoding. Skip the path and keep going!
-                        logger.warning(
-                            f"Skipping handle with memory error at {url_here}")
-                        yield (handle_here, e)
-                        return
-                    for dent in obj.getdents():
-                        yield from handle_dirent(here, dent, owner_sid)
-                except (ValueError, *IGNORABLE_SMBC_EXCEPTIONS):
-                    pass
-            elif entity.smbc_type == smbc.FILE:
-                yield handle_here
+    def _get_snapshot_path(self) -> Optional[str]:
+        if not (directory := engine2_settings.model["smbc"]["snapshot_dir"]):
+            return None
+        # Snapshots hold folder listings that have already been filtered, and
+        # the flags that control that filtering don't affect the identity of
+        # this Source; a Source with different flags needs its own snapshot
+        filters = "".join(
+                f".{name.lstrip('_')}" for name in self.listing_filters
+                if getattr(self, name))
+        return os.path.join(
+                directory, "smbc-{0}{1}.json.gz".format(
+                        self.crunch(hash=True), filters))
+
+    def _list_folder(self, context, url, path, snapshot):
+        """Returns a list of (name, is-folder) pairs for the files and folders
+        in the given folder that shouldn't be skipped. If a TreeSnapshot is
+        provided, then a listing from it will be used when the folder hasn't
+        changed since it was last listed."""
+        url_here = url + "/" + path if path else url
+        mtime = None
+        if snapshot is not None:
+            mtime = context.stat(url_here)[8]
+            if (entries := snapshot.get(path, mtime)) is not None:
+                return entries
+
+        entries = []
+        for dent in context.opendir(url_here).getdents():
+            name = dent.name
+            if (name in (".", "..",)
+                    or dent.smbc_type not in (smbc.DIR, smbc.FILE)):
+                continue
+            path_here = path + "/" + name if path else name
+            if not self._is_skipped(
+                    context, url + "/" + path_here, path_here, name):
+                entries.append((name, dent.smbc_type == smbc.DIR))
+
+        if snapshot is not None:
+            snapshot.put(path, mtime, entries)
+        return entries
+
+    def _file_hints(self, context, url_here, owner_sid, cutoff):
+        """Returns the hints for a Handle to the file at the given URL, or
+        None if that file was not modified after the given cutoff (if there
+        is one).
+
+        (libsmbclient's folder listings don't include modification times, so
+        checking the cutoff takes a stat call for every file. Its result is
+        passed on as a hint so that SMBCResource doesn't have to ask the
+        server for it again.)"""
+        hints = self._make_hints(owner_sid)
+        if not cutoff:
+            return hints
+        try:
+            mtime = context.stat(url_here)[8]
+        except (ValueError, MemoryError, *IGNORABLE_SMBC_EXCEPTIONS):
+            # Let the processor decide what to do with this file
+            return hints
+        last_modified = datetime.fromtimestamp(mtime, gettz())
+        if last_modified <= cutoff:
+            return None
+        return hints | {
+            "last_modified":
+                OutputType.LastModified.encode_json_object(last_modified)
+        }
 
+    def _open_snapshot(self, rule: Rule | None):
+        """Returns the path of this SMBCSource's TreeSnapshot, the snapshot
+        itself, and the last-modified cutoff of the given rule, or three
+        Nones if incremental exploration is disabled."""
+        if not (snapshot_path := self._get_snapshot_path()):
+            return None, None, None
+
+        cutoff = None
+        for essential_rule in compute_mss(rule):
+            # (we can't do isinstance() here without making a circular
+            # dependency)
+            if essential_rule.type_label == "last-modified":
+                after = essential_rule.after
+                cutoff = (after if not cutoff else max(cutoff, after))
+        return snapshot_path, TreeSnapshot.load(snapshot_path), cutoff
+
+    def _list_top_level(self, context, url, snapshot):
         try:
-            obj = context.opendir(url)
+            return self._list_folder(context, url, "", snapshot)
         except ValueError as ex:
             code = ex.args[0]
             if code == errno.EINVAL:
@@ -216,18 +346,178 @@ class SMBCSource(Source):
             else:
                 raise ex
 
+    def _walk_sequentially(self, context, url, folders, snapshot, cutoff):
+        # Walk depth-first, as the folders in the work list are taken from its
+        # end
+        work = list(reversed(folders))
+        found = []
+        while work:
+            self._walk_folder(
+                    context, url, *work.pop(), found.append, work.append,
+                    snapshot, cutoff)
+            yield from found
+            found.clear()
+
+    def handles(self, sm, *, rule: Rule | None = None):
+        url, context = sm.open(self)
+
+        # Incremental exploration reuses the folder listings from the last
+        # exploration wherever possible, and asks the server for the
+        # modification time of each file so that files that the rule would
+        # reject can be left out
+        snapshot_path, snapshot, cutoff = self._open_snapshot(rule)
+
+        folders = []
         # Iterate over every folder lying directly under the provided UNC
-        for dent in obj.getdents():
-            if dent.name not in (".", "..",):
-                # If we know that the provided UNC is a folder containing user
-                # home folders, then compute the owner of each folder here.
-                # handle_dirent can use this as a hint so SMBCResource doesn't
-                # have to retrieve ownership metadata for individual files
-                if self._unc_is_home_root:
-                    owner = self._get_owner_for(url, context, dent.name)
-                else:
-                    owner = None
-                yield from handle_dirent([], dent, owner)
+        for name, is_folder in self._list_top_level(context, url, snapshot):
+            # If we know that the provided UNC is a folder containing user
+            # home folders, then compute the owner of each folder here. The
+            # walker can use this as a hint so SMBCResource doesn't have to
+            # retrieve ownership metadata for individual files
+            if self._unc_is_home_root:
+                owner = self._get_owner_for(url, context, name)
+            else:
+                owner = None
+
+            if is_folder:
+                folders.append((name, owner))
+            elif not self._split_top_level and (hints := self._file_hints(
+                    context, url + "/" + name, owner, cutoff)) is not None:
+                yield SMBCHandle(self, name, hints=hints)
+
+        walkers = engine2_settings.model["smbc"]["walkers"]
+        if self._split_top_level:
+            # Leave the contents of the top-level folders (and the files next
+            # to them) to other explorers
+            yield SMBCFolderHandle(self, "")
+            for path, owner in folders:
+                yield SMBCFolderHandle(
+                        self, path, hints=self._make_hints(owner))
+        elif self._recursive and walkers > 1:
+            yield from self._walk_folders(
+                    url, folders, walkers, snapshot, cutoff)
+        elif self._recursive:
+            yield from self._walk_sequentially(
+                    context, url, folders, snapshot, cutoff)
+
+        if snapshot is not None:
+            # We've reached the end of the exploration, so the snapshot now
+            # covers every folder we were able to list
+            snapshot.save(snapshot_path)
+
+    def _walk_folder(
+            self, context, url, path, owner_sid, emit, enqueue,
+            snapshot=None, cutoff=None):
+        """Lists a single folder, emitting Handles for the files in it and
+        enqueueing its subfolders to be walked."""
+        try:
+            try:
+                entries = self._list_folder(context, url, path, snapshot)
+            except MemoryError as e:
+                # A memory error here means that the path is using deprecated
+                # encoding. Skip the path and keep going!
+                logger.warning(
+                        f"Skipping handle with memory error at {url}/{path}")
+                emit((SMBCHandle(
+                        self, path, hints=self._make_hints(owner_sid)), e))
+                return
+            for name, is_folder in entries:
+                path_here = path + "/" + name
+                if is_folder:
+                    enqueue((path_here, owner_sid))
+                elif (hints := self._file_hints(
+                        context, url + "/" + path_here, owner_sid,
+                        cutoff)) is not None:
+                    emit(SMBCHandle(self, path_here, hints=hints))
+        except (ValueError, *IGNORABLE_SMBC_EXCEPTIONS):
+            pass
+
+    @staticmethod
+    def _put_until_stopped(results, item, stopping):
+        """Puts an item into the (bounded) results queue, giving up if the
+        consumer has stopped listening."""
+        while not stopping.is_set():
+            try:
+                results.put(item, timeout=1)
+                return
+            except Full:
+                continue
+
+    def _run_walker(self, url, work, emit, stopping, snapshot, cutoff):
+        """Takes folders from the work queue and walks them until the queue
+        yields the _DONE marker. Exceptions are passed on to the consumer."""
+        # libsmbclient contexts can't be shared between threads
+        context = smbc.Context(auth_fn=self.__auth_handler)
+        try:
+            while (item := work.get()) is not _DONE:
+                try:
+                    if not stopping.is_set():
+                        self._walk_folder(
+                                context, url, *item, emit, work.put,
+                                snapshot, cutoff)
+                except BaseException as ex:
+                    emit((_DONE, ex))
+                finally:
+                    work.task_done()
+        finally:
+            # See SMBCSource._generate_state for why this matters
+            del context
+
+    @staticmethod
+    def _drain_results(results):
+        """Yields items from the results queue until a walker reports an
+        exception (which is raised here) or the coordinator reports that the
+        work is finished."""
+        while True:
+            try:
+                item = results.get(timeout=1)
+            except Empty:
+                continue
+            match item:
+                case (r, None) if r is _DONE:
+                    return
+                case (r, ex) if r is _DONE:
+                    raise ex
+                case _:
+                    yield item
+
+    def _walk_folders(
+            self, url, folders, walkers, snapshot=None, cutoff=None):
+        """Walks the given folders (and all of their subfolders), yielding a
+        Handle for every file found.
+
+        Each walker thread has its own connection to the server and takes
+        whole folders from a shared queue, so a folder with many subfolders
+        is explored by several walkers at once."""
+        work = Queue()
+        results = Queue(maxsize=1024)
+        stopping = threading.Event()
+
+        def _emit(item):
+            self._put_until_stopped(results, item, stopping)
+
+        def _coordinator():
+            work.join()
+            for _ in threads:
+                work.put(_DONE)
+            _emit((_DONE, None))
+
+        for folder in folders:
+            work.put(folder)
+        threads = [
+                threading.Thread(
+                        target=self._run_walker,
+                        args=(url, work, _emit, stopping, snapshot, cutoff),
+                        daemon=True)
+                for _ in range(walkers)]
+        for thread in threads:
+            thread.start()
+        threading.Thread(target=_coordinator, daemon=True).start()
+
+        try:
+            yield from self._drain_results(results)
+        finally:
+            stopping.set()
 
     # For our own purposes, we need to be able to make a "smb://" URL to give
     # to pysmbc. That URL doesn't need to contain authentication details,
@@ -243,7 +533,10 @@ class SMBCSource(Source):
             "domain": self._domain,
             "driveletter": self._driveletter,
             "skip_super_hidden": self._skip_super_hidden,
-            "unc_is_home_root": self._unc_is_home_root
+            "unc_is_home_root": self._unc_is_home_root,
+            "split_top_level": self._split_top_level,
+            "recursive": self._recursive,
+            "owner_sid": self._owner_sid,
         }
 
     @staticmethod
@@ -254,7 +547,10 @@ class SMBCSource(Source):
                 obj["driveletter"],
 
                 skip_super_hidden=obj.get("skip_super_hidden", False),
-                unc_is_home_root=obj.get("unc_is_home_root", False))
+                unc_is_home_root=obj.get("unc_is_home_root", False),
+                split_top_level=obj.get("split_top_level", False),
+                recursive=obj.get("recursive", True),
+                owner_sid=obj.get("owner_sid"))
 
 
 class _SMBCFile(io.RawIOBase):
@@ -363,6 +659,9 @@ class SMBCResource(FileResource):
         return self.unpack_stat()["st_size"]
 
     def get_last_modified(self):
+        if (lm_hint := self.handle.hint("last_modified")):
+            # The explorer already asked the server for this
+            return OutputType.LastModified.decode_json_object(lm_hint)
         return self.unpack_stat().setdefault(OutputType.LastModified,
                                              super().get_last_modified())
 
@@ -408,3 +707,20 @@ class SMBCHandle(Handle):
     @property
     def sort_key(self):
         return str(self).removesuffix("\\")
+
+
+@Handle.stock_json_handler("smbc-folder")
+class SMBCFolderHandle(SMBCHandle):
+    """A SMBCFolderHandle stands for a folder in a SMB share that should be
+    explored by itself. (A SMBCFolderHandle with an empty path stands for the
+    files directly in the share's folder, but not its subfolders.)"""
+    type_label = "smbc-folder"
+
+    def guess_type(self):
+        return SMBC_FOLDER_MIME
+
+
+@Source.mime_handler(SMBC_FOLDER_MIME)
+def _make_folder_source(handle):
+    return handle.source.make_folder_source(
+            handle.relative_path, handle.hint("owner_sid"))
@@ -0,0 +1,300 @@
+"""
+Contains a variant of the WebCrawler that visits several pages at once.
+
+The WebCrawler visits one page at a time, so crawling a large website takes
+(at least) as long as the sum of all of the server's response times. The
+AsyncWebCrawler keeps several requests in flight at once, scheduling them with
+asyncio and limiting how often each server is contacted with a token bucket.
+Handles are streamed out as soon as they're found, so that the rest of the
+pipeline can start work on them while the crawl is still running.
+"""
+import time
+import asyncio
+import requests
+import structlog
+import threading
+from queue import Queue, Empty
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+from os2datascanner.utils.timer import TimerManager
+from ...utilities.backoff import WebRetrier, get_retry_after
+from .crawler import WebCrawler
+
+logger = structlog.get_logger("engine2")
+
+
+class TokenBucket:
+    """A TokenBucket limits how often an operation can be performed: it holds
+    up to a certain number of tokens, one of which must be taken before each
+    operation, and is refilled at a fixed rate.
+
+    TokenBuckets are meant to be used from a single asyncio event loop, and so
+    don't do any locking of their own."""
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._not_before = 0.0
+
+    @property
+    def held_off_for(self) -> float:
+        """Returns the number of seconds left of the wait period imposed by the
+        last call to TokenBucket.hold_off, or zero if there isn't one."""
+        return max(self._not_before - time.monotonic(), 0.0)
+
+    def hold_off(self, seconds: float):
+        """Prevents tokens from being taken from this TokenBucket for (at
+        least) the given number of seconds."""
+        self._not_before = max(self._not_before, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        """Waits until a token is available, and then takes it. (If this
+        TokenBucket's rate is zero, then tokens are always available, except
+        during a wait period imposed by TokenBucket.hold_off.)"""
+        while True:
+            now = time.monotonic()
+            if now < self._not_before:
+                await asyncio.sleep(self._not_before - now)
+                continue
+            elif self._rate <= 0:
+                return
+
+            self._tokens = min(
+                    self._capacity,
+                    self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+def copy_session(session: requests.Session) -> requests.Session:
+    """Returns a new requests.Session with the same headers, authentication
+    details and cookies as the given one."""
+    copy = requests.Session()
+    copy.headers.update(session.headers)
+    copy.auth = session.auth
+    copy.cookies.update(session.cookies)
+    return copy
+
+
+class _CrawlRetrier(WebRetrier):
+    """A _CrawlRetrier is a WebRetrier that also reports every wait period
+    that a server asks for, so that no other request is sent to that server
+    until it's over."""
+
+    def __init__(self, hold_off, **kwargs):
+        super().__init__(**kwargs)
+        self._hold_off = hold_off
+
+    def _before_retry(self, ex, op):
+        if (getattr(ex, "response", None) is not None
+                and (delay := get_retry_after(ex.response)) is not None):
+            logger.debug(
+                    "server asked us to wait",
+                    status=ex.response.status_code, delay=delay)
+            self._hold_off(delay)
+        super()._before_retry(ex, op)
+
+
+class AsyncWebCrawler(WebCrawler):
+    """An AsyncWebCrawler is a WebCrawler that visits several pages at once.
+
+    Apart from the order in which pages are visited, its behaviour is the same
+    as that of the WebCrawler: it follows the same links, respects the same
+    TTL values and exclusions, and produces the same hints. Each host may only
+    be sent a certain number of requests per second, and a host that responds
+    with HTTP/1.1 429 Too Many Requests or 503 Service Unavailable won't be
+    sent any more requests until its Retry-After period has passed.
+
+    Requests are made on a pool of worker threads, each of which has its own
+    requests.Session (as a Session can't safely be shared between threads).
+    By default, these are copies of the Session given to the constructor, but
+    a session_factory function can be given to make them instead."""
+
+    BURST = 2
+    """The largest number of requests that can be sent to a host at once
+    after it's been left alone for a while."""
+
+    def __init__(
+            self, url: str, session: requests.Session, *args,
+            concurrency: int = 8, rate: float = 2.0, max_tries: int = 5,
+            timeout: float = None, session_factory=None, **kwargs):
+        super().__init__(url, session, *args, **kwargs)
+        self._concurrency = max(concurrency, 1)
+        self._rate = rate
+        self._max_tries = max_tries
+        self._timeout = timeout
+        self._session_factory = (
+                session_factory or (lambda: copy_session(session)))
+        self._buckets = {}
+
+        self._local = threading.local()
+        self._worker_sessions = []
+        self._worker_lock = threading.Lock()
+
+    def _get_bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(
+                    self._rate, min(self.BURST, self._concurrency))
+        return self._buckets[host]
+
+    def _start_worker(self):
+        """(Worker thread.) Gives a new worker thread its own session."""
+        session = self._local.session = self._session_factory()
+        with self._worker_lock:
+            self._worker_sessions.append(session)
+
+    def _close_workers(self):
+        with self._worker_lock:
+            sessions, self._worker_sessions = self._worker_sessions, []
+        for session in sessions:
+            session.close()
+
+    def _fetch(self, method: str, url: str, hold_off, **kwargs):
+        """(Worker thread.) Makes a HTTP request with this thread's session,
+        retrying it with a WebRetrier if a transient error occurs. Returns the
+        final response."""
+        operation = getattr(self._local.session, method)
+        try:
+            return _CrawlRetrier(hold_off, max_tries=self._max_tries).run(
+                    operation, url, timeout=self._timeout, **kwargs)
+        except requests.exceptions.HTTPError as ex:
+            if ex.response is None:
+                raise
+            # The server was still too busy to deal with us when we gave up,
+            # which the caller can see from the response
+            return ex.response
+
+    async def _request(self, executor, method: str, url: str, **kwargs):
+        """Makes a HTTP request on one of the worker threads, once this
+        crawler is allowed to contact the server again. Returns the final
+        response."""
+        bucket = self._get_bucket(url)
+        loop = asyncio.get_running_loop()
+
+        def _hold_off(delay):
+            loop.call_soon_threadsafe(bucket.hold_off, delay)
+
+        await bucket.acquire()
+        return await loop.run_in_executor(
+                executor, lambda: self._fetch(
+                        method, url, _hold_off, **kwargs))
+
+    async def _visit_one(self, executor, url: str, ttl: int, hints):
+        """As WebCrawler.visit_one, but returns a (hints, url) pair (or None)
+        rather than yielding it."""
+        if ttl > 0 and self.is_crawlable(url) and not self._frozen:
+            response = await self._request(executor, "head", url)
+
+            if response.status_code == 405:
+                response = await self._request(executor, "get", url)
+
+            if response.status_code == 200:
+                if self._is_html(response):
+                    if not response.content:
+                        response = await self._request(
+                                executor, "get", url)
+                    # Crawler.add takes the referrer of a new link from the
+                    # _visiting field; this is safe because nothing else can
+                    # run on the event loop until this block is finished
+                    self._visiting = url
+                    try:
+                        self._visit_page(url, ttl, hints, response)
+                    finally:
+                        self._visiting = None
+            elif response.is_redirect and response.next:
+                self._visiting = url
+                try:
+                    self.add(response.next.url, ttl - 1)
+                finally:
+                    self._visiting = None
+                return None
+
+        return (hints, url)
+
+    def _start_visits(self, executor, running: set):
+        """Starts visiting the next URLs in the queue, until as many visits
+        are in progress as are allowed at once."""
+        while self.to_visit and len(running) < self._concurrency:
+            url, ttl, hints = self.to_visit.pop(0)
+            adapted = self._adapt(url)
+            if ttl > 0 and adapted not in self.visited:
+                # Several visits are in progress at once, so mark this URL as
+                # visited now to avoid visiting it twice
+                self.visited.add(adapted)
+                running.add(asyncio.create_task(
+                        self._visit_one(executor, url, ttl, hints)))
+
+    async def _crawl(self, emit, stopping: threading.Event):
+        running = set()
+        executor = ThreadPoolExecutor(
+                self._concurrency, initializer=self._start_worker)
+        try:
+            while (self.to_visit or running) and not stopping.is_set():
+                self._start_visits(executor, running)
+
+                if running:
+                    done, running = await asyncio.wait(
+                            running, timeout=1,
+                            return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if (result := task.result()) is not None:
+                            emit(result)
+        finally:
+            for task in running:
+                task.cancel()
+            # Don't wait for any requests that are still in progress
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._close_workers()
+
+    def _held_off_for(self) -> float:
+        return max(
+                (b.held_off_for for b in list(self._buckets.values())),
+                default=0.0)
+
+    def visit(self):
+        """Recursively visits all of the objects added to this Crawler,
+        yielding them as they're found.
+
+        The crawl runs on an asyncio event loop in a background thread, so
+        this generator can be consumed in the normal way."""
+        results = Queue()
+        stopping = threading.Event()
+        done = object()
+
+        def _run():
+            try:
+                asyncio.run(self._crawl(
+                        lambda r: results.put((r, None)), stopping))
+                results.put((done, None))
+            except BaseException as ex:
+                results.put((done, ex))
+
+        thread = threading.Thread(target=_run, daemon=True)
+        thread.start()
+        try:
+            while True:
+                try:
+                    result, ex = results.get(timeout=1)
+                except Empty:
+                    if (delay := self._held_off_for()) > 0:
+                        # We're waiting because a server told us to, so this
+                        # doesn't count against any timeouts in progress
+                        TimerManager.get().suspension().sleep(min(delay, 1))
+                    continue
+
+                if result is done:
+                    if ex:
+                        raise ex
+                    break
+                yield result
+        finally:
+            stopping.set()
+            thread.join()
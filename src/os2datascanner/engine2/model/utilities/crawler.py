@@ -1,4 +1,5 @@
 import re
+from base64 import b64encode
 from abc import ABC, abstractmethod
 from lxml.html import HtmlElement, document_fromstring
 from lxml.etree import ParserError
@@ -7,7 +8,8 @@ import structlog
 import requests
 
 from os2datascanner.engine2.factory import make_webretrier
-from os2datascanner.engine2.conversions.types import Link
+from os2datascanner.engine2.conversions.types import Link, OutputType
+from os2datascanner.engine2.utilities.datetime import parse_datetime
 
 logger = structlog.get_logger("engine2")
 
@@ -116,13 +118,15 @@ def simplify_mime_type(mime):
 class WebCrawler(Crawler):
     def __init__(
             self, url: str, session: requests.Session,
-            *args, allow_element_hints=False, retrier=None, **kwargs):
+            *args, allow_element_hints=False, retrier=None,
+            content_limit=0, **kwargs):
         super().__init__(*args, **kwargs)
         self._url = url
         self._split_url = urlsplit(url)
         self._session = session
         self._retrier = retrier or make_webretrier()
         self._allow_element_hints = allow_element_hints
+        self._content_limit = content_limit
         self.exclusions = set()
 
     def get(self, *args, **kwargs):
@@ -187,7 +191,48 @@ class WebCrawler(Crawler):
                     extra_hints["true_url"] = true_url
             self.add(link.url, new_ttl, **extra_hints)
 
-    def visit_one(self, url: str, ttl: int, hints):  # noqa CCR001
+    def _add_content_hints(self, hints, response, content_type):
+        hints["content"] = b64encode(response.content).decode("ascii")
+        hints.setdefault("content_type", content_type)
+        if ("last_modified" not in hints
+                and (lm := response.headers.get("Last-Modified"))):
+            try:
+                hints["last_modified"] = (
+                        OutputType.LastModified.encode_json_object(
+                                parse_datetime(lm)))
+            except (ValueError, OverflowError):
+                pass
+
+    @staticmethod
+    def _is_html(response) -> bool:
+        ct = response.headers.get("Content-Type", "application/octet-stream")
+        return simplify_mime_type(ct).lower() == "text/html"
+
+    def _visit_page(self, url: str, ttl: int, hints, response):
+        """Examines a downloaded HTML page, adding hints about it and queueing
+        all of its links for a visit."""
+        ct = response.headers.get("Content-Type", "text/html")
+        doc = parse_html(response.content, url)
+
+        if (response.status_code == 200
+                and 0 < self._content_limit
+                and len(response.content) <= self._content_limit):
+            # Small pages can travel along with their Handles, so that they
+            # needn't be downloaded again for scanning
+            self._add_content_hints(hints, response, ct)
+
+        if self._allow_element_hints and not hints.get("title"):
+            # We have to download the page anyway to crawl its links, so
+            # let's extract the title while we're here, eh?
+            for title in doc.xpath("/html/head/title/text()"):
+                title = title.strip()
+                if title:
+                    hints["title"] = title
+
+        for element, link in make_outlinks(doc):
+            self._handle_outlink(ttl - 1, element, link)
+
+    def visit_one(self, url: str, ttl: int, hints):
         if ttl > 0 and self.is_crawlable(url) and not self._frozen:
             response = self.head(url)
 
@@ -197,24 +242,10 @@ class WebCrawler(Crawler):
                 response = self.get(url)
 
             if response.status_code == 200:
-                ct = response.headers.get(
-                        "Content-Type", "application/octet-stream")
-                if simplify_mime_type(ct).lower() == "text/html":
+                if self._is_html(response):
                     if not response.content:
                         response = self.get(url)
-                    doc = parse_html(response.content, url)
-
-                    if self._allow_element_hints and not hints.get("title"):
-                        # We have to download the page anyway to crawl its
-                        # links, so let's extract the title while we're here,
-                        # eh?
-                        for title in doc.xpath("/html/head/title/text()"):
-                            title = title.strip()
-                            if title:
-                                hints["title"] = title
-
-                    for element, link in make_outlinks(doc):
-                        self._handle_outlink(ttl - 1, element, link)
+                    self._visit_page(url, ttl, hints, response)
             elif response.is_redirect and response.next:
                 # Redirects cost a TTL point *and* don't produce anything
                 self.add(response.next.url, ttl - 1)
@@ -0,0 +1,100 @@
+"""
+Contains a persistent record of the folder listings seen during an
+exploration.
+
+Listing a folder on a network share is slow, and most of the folders on a
+typical share are the same tonight as they were last night. Adding, removing
+or renaming an entry in a folder changes that folder's modification time, so a
+folder whose modification time hasn't changed since it was last listed still
+has the same entries, and the old listing can be used instead of a new one.
+"""
+import os
+import json
+import gzip
+import time
+import structlog
+from typing import Optional
+from tempfile import NamedTemporaryFile
+
+logger = structlog.get_logger("engine2")
+
+
+class TreeSnapshot:
+    """A TreeSnapshot maps the paths of folders to their modification times and
+    entries. Each TreeSnapshot is built on top of the one saved by the previous
+    exploration: listings are read from the old snapshot and written to the new
+    one, so folders that no longer exist are forgotten.
+
+    TreeSnapshots can be used from several threads at once."""
+
+    VERSION = 1
+
+    RACY_SECONDS = 2
+    """Modification times are only so precise: a folder that was changed in the
+    same instant that it was listed could have the same modification time
+    afterwards. Listings taken less than this many seconds after their folder
+    was modified are never reused."""
+
+    def __init__(self, previous: Optional[dict] = None):
+        self._previous = previous or {}
+        self._current = {}
+
+    def get(self, path: str, mtime: float) -> Optional[list]:
+        """Returns the entries of the folder at the given path, if that folder
+        was listed in the previous snapshot and its modification time is
+        still the same, or None otherwise."""
+        match self._previous.get(path):
+            case [old_mtime, listed, entries] if (
+                    old_mtime == mtime
+                    and mtime < listed - self.RACY_SECONDS):
+                self._current[path] = [old_mtime, listed, entries]
+                return [tuple(entry) for entry in entries]
+            case _:
+                return None
+
+    def put(self, path: str, mtime: float, entries: list):
+        """Records the entries of the folder at the given path, which should be
+        a list of JSON-friendly tuples."""
+        self._current[path] = [mtime, time.time(), list(entries)]
+
+    def __len__(self):
+        return len(self._current)
+
+    @classmethod
+    def load(cls, path: str) -> "TreeSnapshot":
+        """Returns a new TreeSnapshot based on the one saved at the given path.
+        (If that snapshot is missing or can't be read, then every folder will
+        be listed again.)"""
+        try:
+            with gzip.open(path, "rt") as fp:
+                obj = json.load(fp)
+            if obj.get("version") == cls.VERSION:
+                return cls(obj["folders"])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, AttributeError):
+            logger.warning(
+                    "ignoring unreadable tree snapshot",
+                    path=path, exc_info=True)
+        return cls()
+
+    def save(self, path: str):
+        """Saves the listings recorded in this TreeSnapshot to the given path,
+        atomically replacing any snapshot that was already there."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        with NamedTemporaryFile(
+                "wb", dir=directory, suffix=".tmp", delete=False) as ntf:
+            try:
+                with gzip.open(ntf, "wt") as fp:
+                    json.dump(
+                            {
+                                "version": self.VERSION,
+                                "folders": self._current
+                            }, fp, separators=(",", ":"))
+            except BaseException:
+                os.unlink(ntf.name)
+                raise
+        os.replace(ntf.name, path)
+        logger.debug(
+                "tree snapshot saved", path=path, folders=len(self._current))
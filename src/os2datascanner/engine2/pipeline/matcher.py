@@ -3,6 +3,7 @@ from ..conversions.types import decode_dict
 from . import messages
 from .. import settings
 from os2datascanner.engine2.rules.last_modified import LastModifiedRule
+from os2datascanner.engine2.rules.utilities.plan import compile_rule
 
 logger = structlog.get_logger("matcher")
 
@@ -21,13 +22,21 @@ def message_received_raw(body, channel, source_manager):  # noqa: CCR001,E501 to
     representations = decode_dict(message.representations)
     rule = message.progress.rule
     logger.debug(f"{message.handle} with rules [{rule.presentation}] "
-                 f"and representation [{list(representations.keys())}]")
+                 f"and representation [{list(representations.keys())}]"
+                 f" (and blobs [{list((message.blobs or {}).keys())}])")
+
+    def get_representation(key):
+        # Large representations are only read from the blob store if a rule
+        # actually needs them
+        if key not in representations:
+            representations.update(decode_dict({key: message.fetch(key)}))
+        return representations[key]
 
     try:
         # Keep executing rules for as long as we can with the representations
         # we have
-        conclusion, new_matches = rule.try_match(
-                representations,
+        conclusion, new_matches = compile_rule(rule).try_match(
+                get_representation,
                 obj_limit=max(1, settings.pipeline["matcher"]["obj_limit"]))
 
         # Convoluted way of checking if we _did not_ match on LastModifiedRule,
@@ -1,3 +1,4 @@
+import json
 import uuid
 from uuid import UUID
 import random
@@ -6,9 +7,13 @@ from datetime import datetime
 from dateutil import tz
 import warnings
 
+from .. import settings as engine2_settings
+from ..utilities.json import InternTable, digest_json
 from ..utilities.datetime import parse_datetime
 from ..model.core import Handle, Source
 from ..rules.rule import Rule, SimpleRule, Sensitivity
+from .utilities.interning import get_spec_store
+from .utilities.blobs import get_blob_store, scan_key
 
 
 def _deep_replace(self, **kwargs):
@@ -203,8 +208,66 @@ class ScanSpecMessage(NamedTuple):
                     self.progress.to_json_object() if self.progress else None)
         }
 
+    @property
+    def digest(self) -> str:
+        """The digest of this ScanSpecMessage's JSON representation."""
+        if (digest := _scan_specs.digest_of(self)) is None:
+            digest = digest_json(self.to_json_object())
+            _scan_specs.add(digest, self)
+        return digest
+
+    def to_reference(self) -> dict:
+        """Returns a JSON object that refers to this ScanSpecMessage, which
+        ScanSpecMessage.from_json_object will accept in place of the full JSON
+        representation.
+
+        If scan specification interning is enabled, the reference carries only
+        the scan tag and the digest of this ScanSpecMessage, which is saved to
+        the shared SpecStore if necessary. Otherwise, the reference is just the
+        full JSON representation."""
+        if not (store := get_spec_store()):
+            return self.to_json_object()
+
+        scan_tag = self.scan_tag.to_json_object()
+        digest = self.digest
+        store.save(scan_key(scan_tag), digest, self.to_json_object())
+        return {
+            "scan_tag": scan_tag,
+            "digest": digest
+        }
+
+    @staticmethod
+    def is_available(obj) -> bool:
+        """Indicates whether or not ScanSpecMessage.from_json_object will be
+        able to decode the given JSON object, which might be a reference
+        returned by ScanSpecMessage.to_reference."""
+        if "source" in obj or "digest" not in obj:
+            return True
+        digest = obj["digest"]
+        return (_scan_specs.get(digest) is not None
+                or bool((store := get_spec_store()) and store.has(
+                        scan_key(obj["scan_tag"]), digest)))
+
     @classmethod
     def from_json_object(cls, obj):
+        # A scan spec can also be a reference to an interned scan spec
+        is_reference = "source" not in obj and "digest" in obj
+        digest = obj["digest"] if is_reference else digest_json(obj)
+
+        if (spec := _scan_specs.get(digest)) is not None:
+            return spec
+        elif is_reference:
+            store = get_spec_store()
+            if not store or (obj := store.load(
+                    scan_key(obj["scan_tag"]), digest)) is None:
+                raise KeyError(digest, "scan spec is not available")
+
+        spec = cls._from_json_object(obj)
+        _scan_specs.add(digest, spec)
+        return spec
+
+    @classmethod
+    def _from_json_object(cls, obj):
         # The progress fragment is only present when a scan spec is based on a
         # derived source and so already contains scan progress information
         progress_fragment = obj.get("progress")
@@ -229,6 +292,12 @@ class ScanSpecMessage(NamedTuple):
     _deep_replace = _deep_replace
 
 
+_scan_specs = InternTable(
+        engine2_settings.pipeline["scan_specs"]["cache_size"])
+"""The ScanSpecMessages most recently seen by this process, keyed by digest.
+Each scan spec is decoded only once, however many messages carry it."""
+
+
 class ConversionMessage(NamedTuple):
     scan_spec: ScanSpecMessage
     handle: Handle
@@ -236,7 +305,7 @@ class ConversionMessage(NamedTuple):
 
     def to_json_object(self):
         return {
-            "scan_spec": self.scan_spec.to_json_object(),
+            "scan_spec": self.scan_spec.to_reference(),
             "handle": self.handle.to_json_object(),
             "progress": self.progress.to_json_object()
         }
@@ -256,14 +325,18 @@ class RepresentationMessage(NamedTuple):
     handle: Handle
     progress: ProgressFragment
     representations: dict
+    blobs: Optional[dict] = None
+    """If set, a dictionary from OutputType values to references to
+    representations that have been put in the blob store rather than in this
+    message."""
 
     def to_json_object(self):
         return {
-            "scan_spec": self.scan_spec.to_json_object(),
+            "scan_spec": self.scan_spec.to_reference(),
             "handle": self.handle.to_json_object(),
             "progress": self.progress.to_json_object(),
-            "representations": self.representations
-        }
+            "representations": self.representations,
+        } | ({"blobs": self.blobs} if self.blobs else {})
 
     @classmethod
     def from_json_object(cls, obj):
@@ -271,7 +344,38 @@ class RepresentationMessage(NamedTuple):
                 scan_spec=ScanSpecMessage.from_json_object(obj["scan_spec"]),
                 handle=Handle.from_json_object(obj["handle"]),
                 progress=ProgressFragment.from_json_object(obj["progress"]),
-                representations=obj["representations"])
+                representations=obj["representations"],
+                blobs=obj.get("blobs"))
+
+    def offload(self) -> "RepresentationMessage":
+        """Returns a copy of this RepresentationMessage in which the
+        representations that are larger than the pipeline.blobs.threshold
+        setting have been put in the blob store. (If there is no blob store,
+        then this RepresentationMessage is returned unchanged.)"""
+        if not (store := get_blob_store()):
+            return self
+
+        threshold = engine2_settings.pipeline["blobs"]["threshold"]
+        representations, blobs = {}, dict(self.blobs or {})
+        for key, value in self.representations.items():
+            raw = json.dumps(value).encode()
+            if len(raw) >= threshold:
+                blobs[key] = store.put(
+                        scan_key(self.scan_spec.scan_tag.to_json_object()),
+                        raw)
+            else:
+                representations[key] = value
+        return self._replace(representations=representations, blobs=blobs)
+
+    def fetch(self, key: str):
+        """Returns the (JSON-friendly) representation that was put in the blob
+        store under the given OutputType value. Raises KeyError if there
+        isn't one, and FileNotFoundError if it's no longer available."""
+        reference = (self.blobs or {})[key]
+        if not (store := get_blob_store()):
+            raise FileNotFoundError(
+                    reference, "blob store is not configured")
+        return json.loads(store.get(reference))
 
     _deep_replace = _deep_replace
 
@@ -512,20 +616,29 @@ class CommandMessage(NamedTuple):
     target process will print and clear any profiling statistics it might
     already have collected."""
 
+    finished: Optional[ScanTagFragment] = None
+    """If set, the scan tag of a scan that has finished. Pipeline components
+    can throw away any state they were keeping for it."""
+
     def to_json_object(self):
         return {
             "abort": self.abort.to_json_object() if self.abort else None,
             "log_level": self.log_level,
-            "profiling": self.profiling
+            "profiling": self.profiling,
+            "finished": (
+                    self.finished.to_json_object() if self.finished else None)
         }
 
     @staticmethod
     def from_json_object(obj):
         abort = obj.get("abort")
+        finished = obj.get("finished")
         return CommandMessage(
                 abort=ScanTagFragment.from_json_object(abort)
                 if abort else None,
                 log_level=obj.get("log_level"),
-                profiling=obj.get("profiling"))
+                profiling=obj.get("profiling"),
+                finished=ScanTagFragment.from_json_object(finished)
+                if finished else None)
 
     _deep_replace = _deep_replace
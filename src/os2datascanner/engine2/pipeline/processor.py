@@ -17,6 +17,15 @@ WRITES_QUEUES = (
     "os2ds_checkups",)
 PROMETHEUS_DESCRIPTION = "Representations generated"
 PREFETCH_COUNT = 8
+TRANSIENT_HINTS = ("content",)
+"""The hints that are only useful to the processor. (These can be large, so
+they're removed from Handles before they're passed on to the next stage.)"""
+
+
+def drop_transient_hints(handle):
+    for hint in TRANSIENT_HINTS:
+        handle.clear_hint(hint)
+    return handle
 
 
 def check(source_manager, handle):
@@ -57,7 +66,7 @@ def format_exception_message(ex: Exception, conversion: messages.ConversionMessa
     return exception_message
 
 
-def message_received_raw(body, channel, source_manager, *, _check=True):  # noqa: CCR001,E501,C901
+def message_received_raw(body, channel, source_manager, *, _check=True, _offload=True):  # noqa: CCR001,E501,C901
     conversion = messages.ConversionMessage.from_json_object(body)
     configuration = conversion.scan_spec.configuration
     head, _, _ = conversion.progress.rule.split()
@@ -120,15 +129,21 @@ def message_received_raw(body, channel, source_manager, *, _check=True):  # noqa
         else:
             dv = {required.value: representation}
 
+        drop_transient_hints(conversion.handle)
         logger.info(f"Required representation for {conversion.handle} is {required}")
+        representation_message = messages.RepresentationMessage(
+                conversion.scan_spec, conversion.handle,
+                conversion.progress, encode_dict(dv))
+        if _offload:
+            # Don't make RabbitMQ carry representations that are too large
+            representation_message = representation_message.offload()
         yield ("os2ds_representations",
-               messages.RepresentationMessage(
-                        conversion.scan_spec, conversion.handle,
-                        conversion.progress, encode_dict(dv)).to_json_object())
+               representation_message.to_json_object())
     except KeyError:
         # If we have a conversion we don't support, then check if the current
         # handle can be reinterpreted as a Source; if it can, then try again
         # with that
+        drop_transient_hints(conversion.handle)
         try:
             derived_source = Source.from_handle(conversion.handle, source_manager)
             if derived_source:
@@ -154,6 +169,7 @@ def message_received_raw(body, channel, source_manager, *, _check=True):  # noqa
         exception = e
 
     if exception:
+        drop_transient_hints(conversion.handle)
         exception_message = format_exception_message(exception, conversion)
         logger.warning(exception_message, exc_info=exception)
 
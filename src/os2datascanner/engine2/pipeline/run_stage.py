@@ -1,10 +1,14 @@
 import os
 import sys
+import time
 import click
 import pstats
 import random
 import structlog
+import multiprocessing
 from collections import deque
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from prometheus_client import Info, Summary, start_http_server, CollectorRegistry
 
@@ -12,6 +16,9 @@ from os2datascanner.utils import debug, profiling
 from ... import __version__
 from ..model.core import SourceManager
 from . import explorer, exporter, matcher, messages, processor, tagger, worker
+from .utilities import codec, process_pool
+from .utilities.blobs import get_blob_store, scan_key
+from .utilities.interning import get_spec_store
 from .utilities.pika import (ANON_QUEUE,
                              RejectMessage,
                              PikaPipelineThread,
@@ -49,13 +56,13 @@ class GenericRunner(PikaPipelineThread):
     def __init__(self,
                  source_manager: SourceManager, *args,
                  stage: str, module, queue_suffix, limit,
-                 read, write, **kwargs):
+                 read, write, prefetch_count=None, **kwargs):
         super().__init__(
                 *args, **kwargs,
                 read=read,
                 write=write,
                 queue_suffix=queue_suffix,
-                prefetch_count=module.PREFETCH_COUNT)
+                prefetch_count=prefetch_count or module.PREFETCH_COUNT)
         self._module = module
         self._registry = CollectorRegistry()
         self._summary = Summary(
@@ -98,6 +105,14 @@ class GenericRunner(PikaPipelineThread):
         if command.abort:
             self._cancelled.appendleft(command.abort)
 
+        if scan_tag := command.abort or command.finished:
+            # Large representations and interned scan specs won't be needed
+            # for much longer
+            for store in (get_blob_store(), get_spec_store()):
+                if store:
+                    store.finish(scan_key(scan_tag.to_json_object()))
+                    store.collect()
+
         if command.profiling is not None:
             profiling.print_stats(pstats.SortKey.CUMULATIVE, silent=True)
             if command.profiling:
@@ -109,7 +124,9 @@ class GenericRunner(PikaPipelineThread):
 
         yield from []
 
-    def _handle_content(self, routing_key, body):
+    def _check_cancelled(self, body):
+        """Raises a RejectMessage exception if the given content message
+        belongs to a scan that has been cancelled."""
         raw_scan_tag = body.get("scan_tag")
 
         if not raw_scan_tag and "scan_spec" in body:
@@ -124,6 +141,21 @@ class GenericRunner(PikaPipelineThread):
                         "ignoring")
                 raise RejectMessage(requeue=False)
 
+    def _check_scan_spec(self, body):
+        """Raises a RejectMessage exception if the given content message refers
+        to an interned scan spec that this process can't retrieve."""
+        raw_scan_spec = body.get("scan_spec")
+        if (raw_scan_spec
+                and not messages.ScanSpecMessage.is_available(raw_scan_spec)):
+            logger.error(
+                    "message refers to an unknown scan spec, dropping it",
+                    digest=raw_scan_spec.get("digest"))
+            raise RejectMessage(requeue=False)
+
+    def _handle_content(self, routing_key, body):
+        self._check_cancelled(body)
+        self._check_scan_spec(body)
+
         yield from self._module.message_received_raw(
                 body, routing_key, self._source_manager)
 
@@ -153,6 +185,143 @@ class GenericRunner(PikaPipelineThread):
             self.enqueue_stop()
 
 
+class PooledRunner(GenericRunner):
+    """A PooledRunner is a GenericRunner that hands content messages over to a
+    bounded pool of worker processes, so that several of them can be handled
+    at once. (Command messages are still handled on the main thread.)
+
+    Each worker process has its own SourceManager and TimerManager. Messages
+    are acknowledged as soon as their results come back, which need not be in
+    the order in which they were received."""
+
+    def __init__(self, *args, module, slots: int, width: int, **kwargs):
+        # Make sure that RabbitMQ gives us enough messages to keep every slot
+        # busy, with a few left over to pick up as soon as one becomes free
+        super().__init__(
+                None, *args, **kwargs,
+                module=module,
+                prefetch_count=module.PREFETCH_COUNT + slots)
+        self._slots = slots
+        self._width = width
+        self._finished = deque()
+
+    def _task_finished(self, future):
+        """(Pool management thread.) Records that a task has finished and wakes
+        up the main thread."""
+        with self._condition:
+            self._finished.append(future)
+            self._condition.notify()
+
+    def _await_event(self, accepting: bool, timeout: float):
+        """Blocks the main thread until a task has finished, until the
+        background thread has stopped, or (if the pool has a free slot) until a
+        new message is available."""
+        with self._condition:
+            self._condition.wait_for(
+                    lambda: (not self._live
+                             or self._finished
+                             or (accepting and self._incoming)),
+                    timeout)
+            finished = list(self._finished)
+            self._finished.clear()
+        return finished
+
+    def _make_pool(self):
+        return ProcessPoolExecutor(
+                max_workers=self._slots,
+                # Our background thread makes forking unsafe
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=process_pool.initialise,
+                initargs=(self._module.__name__, self._stage,
+                          self._queue_suffix, self._width,
+                          self._router, self._codec))
+
+    def _replace_pool(self, pool):
+        """Shuts down a pool that has stopped working and returns a new one."""
+        logger.warning("replacing process pool")
+        pool.shutdown(wait=False, cancel_futures=True)
+        return self._make_pool()
+
+    def _complete(self, future, method, routing_key, body, started) -> bool:
+        """Sends the results of a finished task and acknowledges its message,
+        or, if the task failed, rejects its message. Returns False if the
+        pool has stopped working and must be replaced."""
+        self._summary.observe(time.monotonic() - started)
+        try:
+            outputs = future.result()
+        except (BrokenProcessPool, CancelledError):
+            # A pool process died (perhaps because of this message, perhaps
+            # because of another one), taking every task in the pool with it.
+            # Give the message back to RabbitMQ so that it can be tried again
+            logger.error(
+                    "pool process died, requeueing message",
+                    routing_key=routing_key)
+            self.enqueue_reject(method.delivery_tag, requeue=True)
+            return False
+        except Exception:
+            # The message handler itself failed. Try the message once more,
+            # but don't let it go round in circles forever
+            requeue = not method.redelivered
+            logger.exception(
+                    "failed to handle message",
+                    routing_key=routing_key, requeue=requeue)
+            self.enqueue_reject(method.delivery_tag, requeue=requeue)
+            return True
+
+        # (The pool process has already routed and encoded these messages)
+        for rk, encoded, exchange, properties in outputs:
+            self.enqueue_encoded_message(rk, encoded, exchange, properties)
+        self.enqueue_ack(method.delivery_tag)
+        self.after_message(routing_key, body)
+        return True
+
+    def _consume_messages(self, should_run):  # noqa: CCR001, too high cognitive complexity
+        in_flight = {}
+        pool = self._make_pool()
+        try:
+            while should_run() and self.is_alive():
+                for future in self._await_event(
+                        len(in_flight) < self._slots, timeout=30.0):
+                    *task, task_pool = in_flight.pop(future)
+                    if not self._complete(future, *task) and task_pool is pool:
+                        # (The other tasks that were running in the broken
+                        # pool will fail in the same way, but we only need to
+                        # replace it once)
+                        pool = self._replace_pool(pool)
+
+                if len(in_flight) >= self._slots:
+                    continue
+
+                method, properties, body = self.await_message(timeout=0)
+                if method == properties == body is None:
+                    continue
+                try:
+                    key = method.routing_key
+                    dbd = codec.loads(body, properties.content_type)
+
+                    if key == "":
+                        self._dispatch_message(
+                                method, self.handle_message(key, dbd))
+                        self.after_message(key, dbd)
+                    else:
+                        self._check_cancelled(dbd)
+                        self._check_scan_spec(dbd)
+                        future = pool.submit(process_pool.handle, dbd, key)
+                        in_flight[future] = (
+                                method, key, dbd, time.monotonic(), pool)
+                        future.add_done_callback(self._task_finished)
+                except BrokenProcessPool:
+                    # The pool broke before we heard about it from a task
+                    self.enqueue_reject(method.delivery_tag, requeue=True)
+                    pool = self._replace_pool(pool)
+                except RejectMessage as ex:
+                    self.enqueue_reject(method.delivery_tag, requeue=ex.requeue)
+        finally:
+            # Messages that were still in flight haven't been acknowledged, so
+            # RabbitMQ will redeliver them later
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
 restarting = False
 
 
@@ -173,6 +342,11 @@ restarting = False
 @click.option('--width', default=3,
               type=int, envvar='WIDTH',
               help='allow each source to have at most SIZE simultaneous open sub-sources')
+@click.option('--slots', default=1,
+              type=int, envvar='SLOTS',
+              help='handle up to COUNT messages at once in a pool of worker'
+                   ' processes (default: 1, handling messages in this'
+                   ' process)')
 @click.option('--single-cpu', type=int,
               envvar='SCHEDULE_ON_CPU',
               help='instruct the scheduler to run this stage, and its'
@@ -192,7 +366,8 @@ restarting = False
                                    "exporter",
                                    "worker"]))
 def main(enable_profiling, enable_rusage, enable_metrics,
-         prometheus_port, width, single_cpu, restart_after, queue_suffix, stage):
+         prometheus_port, width, slots, single_cpu, restart_after, queue_suffix,
+         stage):
     debug.register_debug_signal()
     module = _module_mapping[stage]
     logger.info("starting pipeline", stage=stage)
@@ -225,17 +400,24 @@ def main(enable_profiling, enable_rusage, enable_metrics,
     if queue_suffix:
         logger.info(f"Using dedicated queues with suffix: '{queue_suffix}'")
 
+    runner_kwargs = dict(
+            stage=stage,
+            module=module,
+            limit=restart_after,
+            queue_suffix=queue_suffix,
+            read=get_queues(module.READS_QUEUES, queue_suffix),
+            write=get_queues(module.WRITES_QUEUES, queue_suffix))
+
     try:
-        with SourceManager(width=width) as source_manager:
-            GenericRunner(
-                source_manager,
-                stage=stage,
-                module=module,
-                limit=restart_after,
-                queue_suffix=queue_suffix,
-                read=get_queues(module.READS_QUEUES, queue_suffix),
-                write=get_queues(module.WRITES_QUEUES, queue_suffix),
-                ).run_consumer()
+        if slots > 1:
+            logger.info(f"handling up to {slots} messages at once")
+            PooledRunner(
+                    slots=slots, width=width, **runner_kwargs).run_consumer()
+        else:
+            with SourceManager.from_settings(
+                    width=width) as source_manager:
+                GenericRunner(
+                        source_manager, **runner_kwargs).run_consumer()
 
         if restarting:
             logger.info(f"restarting after {restart_after} messages")
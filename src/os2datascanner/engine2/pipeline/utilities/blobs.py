@@ -0,0 +1,160 @@
+"""Utilities for carrying large representations outside of pipeline messages.
+
+The processor normally puts the representations it produces straight into a
+RepresentationMessage, and so a large spreadsheet becomes a large AMQP message
+that RabbitMQ has to keep in memory. A BlobStore lets the processor put large
+representations in a directory shared by the pipeline instead; the message
+then carries only a reference to them, and the matcher reads them back when
+(and if) its rules need them."""
+
+import os
+import time
+import gzip
+import shutil
+import hashlib
+import structlog
+from typing import Optional
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from ... import settings as engine2_settings
+from ...utilities.cryptography import make_secret_box
+from ...utilities.json import digest_json
+
+
+logger = structlog.get_logger("engine2")
+
+
+def scan_key(scan_tag: dict) -> str:
+    """Returns the name of the folder that holds the blobs of the scan with the
+    given (JSON-formatted) scan tag."""
+    return digest_json(scan_tag)
+
+
+class ScanFolderStore:
+    """A ScanFolderStore keeps files in a directory shared by every pipeline
+    process, in one folder per scan, and throws away the folders of scans that
+    have finished (or that look like they'll never finish)."""
+
+    FINISHED = "finished"
+    """The name of the marker file that records that a scan has finished."""
+
+    COLLECT_INTERVAL = 600
+    """The minimum interval (in seconds) between automatic collections."""
+
+    def __init__(self, directory: str, *, ttl: float, max_age: float):
+        self._directory = Path(directory)
+        self._ttl = ttl
+        self._max_age = max_age
+        self._last_collected = time.monotonic()
+
+    @property
+    def directory(self) -> str:
+        return str(self._directory)
+
+    def _maybe_collect(self):
+        if time.monotonic() - self._last_collected > self.COLLECT_INTERVAL:
+            self.collect()
+
+    def finish(self, scan: str):
+        """Records that the scan with the given key has finished. Its files
+        will be deleted by the first collection after the time-to-live period
+        has elapsed."""
+        folder = self._directory / scan
+        if folder.is_dir():
+            (folder / self.FINISHED).touch()
+
+    def collect(self):
+        """Deletes the folders of scans that finished more than the
+        time-to-live period ago, and of scans whose folders haven't been
+        touched for longer than the maximum age."""
+        self._last_collected = time.monotonic()
+        if not self._directory.is_dir():
+            return
+
+        now = time.time()
+        for folder in self._directory.iterdir():
+            try:
+                finished = folder / self.FINISHED
+                if finished.exists():
+                    expired = now - finished.stat().st_mtime > self._ttl
+                else:
+                    expired = now - folder.stat().st_mtime > self._max_age
+            except (FileNotFoundError, NotADirectoryError):
+                # Another process got here first
+                continue
+            if expired:
+                logger.debug(
+                        "deleting folder for scan",
+                        directory=self.directory, scan=folder.name)
+                # (Several processes might try to do this at once, so
+                # ignore any files that have already disappeared)
+                shutil.rmtree(folder, ignore_errors=True)
+
+
+class BlobStore(ScanFolderStore):
+    """A BlobStore keeps encrypted blobs in a directory shared by every
+    pipeline process, in one folder per scan.
+
+    Blobs are content-addressed: the reference to a blob contains a digest of
+    its content, which is used as the password to encrypt it, and the blob is
+    stored in a file named for a hash of that digest. (This is the same
+    approach used by the CacheManager: you can only decrypt a blob if you have
+    a reference to it.)
+
+    Blobs are kept until a while after their scan has finished, and the blobs
+    of a scan that never finishes are eventually thrown away, too."""
+
+    def _path(self, reference: str) -> Path:
+        scan, _, digest = reference.partition("/")
+        name = hashlib.sha256(digest.encode()).hexdigest()
+        return self._directory / scan / f"{name}.gz"
+
+    def put(self, scan: str, raw: bytes) -> str:
+        """Stores a blob for the scan with the given key, and returns a
+        reference to it."""
+        digest = hashlib.sha512(raw).hexdigest()
+        reference = f"{scan}/{digest}"
+
+        path = self._path(reference)
+        if path.exists():
+            # Just note that this blob is still in use
+            os.utime(path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with NamedTemporaryFile(
+                    "wb", dir=path.parent, suffix=".tmp",
+                    delete=False) as ntf:
+                ntf.write(make_secret_box(digest).encrypt(
+                        gzip.compress(raw)))
+            os.replace(ntf.name, path)
+            logger.debug("blob saved", scan=scan, size=len(raw))
+
+        self._maybe_collect()
+        return reference
+
+    def get(self, reference: str) -> bytes:
+        """Retrieves the blob with the given reference. Raises
+        FileNotFoundError if that blob is no longer available."""
+        _, _, digest = reference.partition("/")
+        with self._path(reference).open("rb") as fp:
+            return gzip.decompress(make_secret_box(digest).decrypt(fp.read()))
+
+
+_blob_store = None
+
+
+def get_blob_store() -> Optional[BlobStore]:
+    """Returns the BlobStore for large representations, or None if large
+    representations should be carried in messages."""
+    global _blob_store
+    blob_settings = engine2_settings.pipeline["blobs"]
+    directory = blob_settings["directory"]
+    if not directory:
+        return None
+    elif _blob_store is None or _blob_store.directory != directory:
+        _blob_store = BlobStore(
+                directory,
+                ttl=blob_settings["ttl"],
+                max_age=blob_settings["max_age"])
+    return _blob_store
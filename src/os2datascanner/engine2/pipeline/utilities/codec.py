@@ -0,0 +1,220 @@
+"""Encodes and decodes the bodies of AMQP messages.
+
+Every pipeline message used to be serialised with the json module and
+compressed with gzip. A MessageCodec lets each queue pick its own format and
+compression instead: messages are labelled with the AMQP content_type and
+content_encoding properties, so consumers can always tell how to decode them,
+and a stage that doesn't set these properties is understood to be sending
+gzipped JSON.
+
+Consumers understand every format supported here, but stages from older
+releases only understand gzipped (or uncompressed) JSON. Don't select another
+format for a queue until everything that reads from it has been upgraded."""
+
+import gzip
+import json
+import structlog
+from typing import NamedTuple, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+logger = structlog.get_logger("engine2")
+
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+
+def _dumps_json(obj) -> bytes:
+    if orjson:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # orjson is stricter than the json module (about very large
+            # integers, for example), so give the json module a chance
+            pass
+    return json.dumps(obj).encode()
+
+
+def _loads_json(body: bytes):
+    if orjson:
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # (orjson doesn't accept NaN or Infinity, which the json module
+            # produces)
+            pass
+    return json.loads(body.decode("utf-8"))
+
+
+def _dumps_msgpack(obj) -> bytes:
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def _loads_msgpack(body: bytes):
+    return msgpack.unpackb(body, raw=False, strict_map_key=False)
+
+
+_serialisers = {
+    JSON: (_dumps_json, _loads_json, True),
+    MSGPACK: (_dumps_msgpack, _loads_msgpack, msgpack is not None),
+}
+
+
+def _zstd_compress(body: bytes) -> bytes:
+    return zstandard.ZstdCompressor().compress(body)
+
+
+def _zstd_decompress(body: bytes) -> bytes:
+    # (The frame header might not record the uncompressed size, so use the
+    # streaming interface)
+    return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+
+
+_coders = {
+    "gzip": (gzip.compress, gzip.decompress, True),
+    "zstd": (_zstd_compress, _zstd_decompress, zstandard is not None),
+}
+
+
+def dumps(obj, content_type: str = JSON) -> tuple[bytes, str]:
+    """Serialises a JSON-friendly object in the given format. Returns the
+    serialised object and the content type that was actually used: if the
+    object can't be represented in the requested format, JSON is used
+    instead."""
+    if content_type != JSON:
+        dumper, _, _ = _serialisers[content_type]
+        try:
+            return dumper(obj), content_type
+        except (TypeError, ValueError, OverflowError):
+            logger.debug(
+                    "falling back to JSON for message",
+                    content_type=content_type, exc_info=True)
+    return _dumps_json(obj), JSON
+
+
+def loads(body: bytes, content_type: Optional[str] = None):
+    """Deserialises a message body of the given content type (or, if no
+    content type is given, JSON). Returns None if the body couldn't be
+    deserialised."""
+    match _serialisers.get(content_type or JSON):
+        case (_, loader, True):
+            try:
+                return loader(body)
+            except (ValueError, TypeError):
+                pass
+        case _:
+            logger.error(
+                    "can't deserialise message with unsupported content"
+                    " type", content_type=content_type)
+    return None
+
+
+def compress(body: bytes, content_encoding: Optional[str]) -> bytes:
+    """Compresses a message body with the given content encoding."""
+    if not content_encoding:
+        return body
+    compressor, _, _ = _coders[content_encoding]
+    return compressor(body)
+
+
+def decompress(body: bytes, content_encoding: Optional[str]) -> bytes:
+    """Decompresses a message body with the given content encoding."""
+    if not content_encoding:
+        return body
+    match _coders.get(content_encoding):
+        case (_, decompressor, True):
+            return decompressor(body)
+        case _:
+            raise ValueError(
+                    f"unsupported content encoding {content_encoding}")
+
+
+class Policy(NamedTuple):
+    """A Policy describes how messages sent to a particular queue should be
+    encoded. Messages smaller than the threshold (in bytes, after
+    serialisation) are not compressed."""
+    content_type: str = JSON
+    content_encoding: Optional[str] = "gzip"
+    threshold: int = 0
+
+
+class MessageCodec:
+    """A MessageCodec encodes message bodies according to a default Policy,
+    which can be overridden for individual queues.
+
+    Formats and compression methods whose supporting libraries aren't
+    installed are replaced by JSON and gzip, respectively."""
+
+    def __init__(self, *, queues: Optional[dict] = None, **default):
+        self._default = self._check(Policy(**default))
+        self._queues = {
+            queue: self._check(self._default._replace(**policy))
+            for queue, policy in (queues or {}).items()}
+
+    @staticmethod
+    def _check(policy: Policy) -> Policy:
+        if policy.content_type not in _serialisers:
+            raise ValueError(
+                    f"unknown content type {policy.content_type}")
+        elif not _serialisers[policy.content_type][2]:
+            logger.warning(
+                    "content type not available, using JSON instead",
+                    content_type=policy.content_type)
+            policy = policy._replace(content_type=JSON)
+
+        if policy.content_encoding in ("", "identity"):
+            policy = policy._replace(content_encoding=None)
+        elif policy.content_encoding is None:
+            pass
+        elif policy.content_encoding not in _coders:
+            raise ValueError(
+                    f"unknown content encoding {policy.content_encoding}")
+        elif not _coders[policy.content_encoding][2]:
+            logger.warning(
+                    "content encoding not available, using gzip instead",
+                    content_encoding=policy.content_encoding)
+            policy = policy._replace(content_encoding="gzip")
+        return policy
+
+    def policy_for(self, routing_key: str) -> Policy:
+        """Returns the Policy for messages with the given routing key."""
+        return self._queues.get(routing_key, self._default)
+
+    def encode(
+            self, routing_key: str, body,
+            properties: dict) -> tuple[bytes, dict]:
+        """Encodes a message body, which can be either a JSON-friendly object
+        or a bytes object that has already been serialised, and returns it
+        together with a copy of the given AMQP properties that describes the
+        encoding.
+
+        Explicitly specified content_type and content_encoding properties
+        override this MessageCodec's policies. (A content_encoding of None
+        disables compression.)"""
+        policy = self.policy_for(routing_key)
+        properties = dict(properties)
+
+        if not isinstance(body, bytes):
+            content_type = (
+                    properties.get("content_type") or policy.content_type)
+            body, properties["content_type"] = dumps(body, content_type)
+        if "content_encoding" not in properties:
+            properties["content_encoding"] = (
+                    policy.content_encoding
+                    if len(body) >= policy.threshold else None)
+        return compress(body, properties["content_encoding"]), properties
@@ -0,0 +1,122 @@
+"""Utilities for sharing scan specifications between pipeline messages.
+
+A large scan produces millions of messages that all carry the same scan
+specification. A SpecStore lets messages refer to a specification by its
+digest rather than carrying a copy of it."""
+
+import os
+import gzip
+import json
+import time
+import structlog
+from typing import Optional
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from ... import settings as engine2_settings
+from ...utilities.cryptography import make_secret_box
+from .blobs import ScanFolderStore
+
+
+logger = structlog.get_logger("engine2")
+
+
+class SpecStore(ScanFolderStore):
+    """A SpecStore keeps JSON representations of scan specifications in a
+    directory shared by every pipeline process, in one folder per scan, named
+    by their digests.
+
+    As scan specifications can contain credentials, they're encrypted on disk
+    in the same way that cached conversions are: with a key derived from the
+    digest and from this installation's secret value.
+
+    Like blobs, specifications are kept until a while after their scan has
+    finished, and the specifications of a scan that never finishes are
+    eventually thrown away, too. A scan that's still using its specifications
+    touches their folder every so often to keep them alive."""
+
+    def __init__(self, directory: str, *, ttl: float, max_age: float):
+        super().__init__(directory, ttl=ttl, max_age=max_age)
+        # Maps (scan, digest) pairs to the time we last knew them to be saved
+        self._saved = {}
+
+    def _path(self, scan: str, digest: str) -> Path:
+        return self._directory / scan / f"{digest}.json.gz"
+
+    def has(self, scan: str, digest: str) -> bool:
+        if (scan, digest) in self._saved:
+            return True
+        return self._path(scan, digest).exists()
+
+    def save(self, scan: str, digest: str, obj: dict):
+        """Saves a JSON representation for the scan with the given key under
+        the given digest, unless one is already there. (Specifications never
+        change once saved, so this is safe to call from several processes at
+        once.)
+
+        Calling this method again for a specification that's already been
+        saved notes that the specification is still in use."""
+        now = time.monotonic()
+        last_saved = self._saved.get((scan, digest))
+        if last_saved is not None and now - last_saved < self.COLLECT_INTERVAL:
+            return
+
+        path = self._path(scan, digest)
+        if path.exists():
+            # Just note that this scan is still using its specifications
+            os.utime(path.parent)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with NamedTemporaryFile(
+                    "wb", dir=path.parent, suffix=".tmp",
+                    delete=False) as ntf:
+                ntf.write(make_secret_box(digest).encrypt(
+                        gzip.compress(json.dumps(obj).encode())))
+            os.replace(ntf.name, path)
+            logger.debug("scan specification saved", scan=scan, digest=digest)
+        self._saved[(scan, digest)] = now
+
+        self._maybe_collect()
+
+    def load(self, scan: str, digest: str) -> Optional[dict]:
+        """Returns the JSON representation saved for the scan with the given
+        key under the given digest, or None if there isn't one."""
+        try:
+            with self._path(scan, digest).open("rb") as fp:
+                raw = fp.read()
+        except FileNotFoundError:
+            return None
+        return json.loads(gzip.decompress(
+                make_secret_box(digest).decrypt(raw)).decode())
+
+    def finish(self, scan: str):
+        super().finish(scan)
+        # Forget what we knew about this scan's specifications, so that we
+        # don't hand out references to them after they've been deleted
+        self._saved = {
+                k: v for k, v in self._saved.items() if k[0] != scan}
+
+    def collect(self):
+        super().collect()
+        self._saved = {
+                k: v for k, v in self._saved.items()
+                if (self._directory / k[0]).is_dir()}
+
+
+_spec_store = None
+
+
+def get_spec_store() -> Optional[SpecStore]:
+    """Returns the SpecStore for interned scan specs, or None if interning is
+    disabled."""
+    global _spec_store
+    spec_settings = engine2_settings.pipeline["scan_specs"]
+    directory = spec_settings["intern_directory"]
+    if not directory:
+        return None
+    elif _spec_store is None or _spec_store.directory != directory:
+        _spec_store = SpecStore(
+                directory,
+                ttl=spec_settings["ttl"],
+                max_age=spec_settings["max_age"])
+    return _spec_store
@@ -1,15 +1,14 @@
-import gzip
-import json
 import structlog
 import pika
 import time
 import signal
 import threading
 import traceback
+from collections import deque
 from sortedcontainers import SortedList
 
 from ...utilities.backoff import ExponentialBackoffRetrier
-from ....utils.system_utilities import json_utf8_decode
+from . import codec, sharding
 from os2datascanner.utils import pika_settings
 
 
@@ -118,10 +117,12 @@ given channel.)"""
 
 class PikaPipelineRunner(PikaConnectionHolder):
     def __init__(self, *,
-                 prefetch_count=1, read=None, write=None, queue_suffix=None, **kwargs):
+                 prefetch_count=1, read=None, write=None, queue_suffix=None,
+                 shards=pika_settings.AMQP_SHARDS, **kwargs):
         super().__init__(**kwargs)
+        self._router = sharding.ShardRouter(shards)
         self._read = set() if read is None else set(read)
-        self._write = set() if write is None else set(write)
+        self._write = self._router.write_queues(write or ())
         self._prefetch_count = prefetch_count
         self._queue_suffix = queue_suffix
 
@@ -248,9 +249,79 @@ class RejectMessage(BaseException):
         self.requeue = requeue
 
 
-_coders = {
-    "gzip": (gzip.compress, gzip.decompress)
-}
+class AcknowledgementBatch:
+    """An AcknowledgementBatch collects the acknowledgements and rejections of
+    messages delivered on a single channel so that they can be sent to the
+    broker together.
+
+    RabbitMQ numbers the deliveries on a channel consecutively, starting from
+    one, and a single acknowledgement with multiple=True can settle every
+    outstanding delivery up to a given tag. That's only safe when every one of
+    those deliveries has been handled, though, and (for example) the
+    PooledRunner finishes messages in no particular order. An
+    AcknowledgementBatch therefore keeps track of the longest run of settled
+    deliveries: acknowledgements inside that run are sent as one, and the
+    others are sent individually."""
+
+    def __init__(self):
+        self._settled_upto = 0
+        self._settled = set()
+        self._pending = SortedList()
+
+    def ack(self, delivery_tag: int):
+        """Records that the given delivery should be acknowledged."""
+        self._settled.add(delivery_tag)
+        self._pending.add(delivery_tag)
+
+    def reject(self, delivery_tag: int):
+        """Records that the given delivery has been rejected. (Rejections are
+        not batched, so the caller should send this one straight away.)"""
+        self._settled.add(delivery_tag)
+
+    def __bool__(self):
+        return bool(self._pending)
+
+    def flush(self, channel) -> int:
+        """Sends all of the pending acknowledgements to the broker over the
+        given channel, and returns the number of AMQP methods that were
+        needed to do so."""
+        while (self._settled_upto + 1) in self._settled:
+            self._settled_upto += 1
+            self._settled.remove(self._settled_upto)
+
+        calls = 0
+        cut = self._pending.bisect_right(self._settled_upto)
+        if cut:
+            # The last acknowledgement in the run must be used as the tag:
+            # RabbitMQ doesn't know about deliveries that are already settled
+            channel.basic_ack(self._pending[cut - 1], multiple=True)
+            calls += 1
+        for delivery_tag in self._pending.islice(cut):
+            channel.basic_ack(delivery_tag)
+            calls += 1
+        self._pending.clear()
+        return calls
+
+
+def encode_message(
+        router: sharding.ShardRouter, message_codec: codec.MessageCodec,
+        routing_key: str, body, exchange: str = "",
+        **basic_properties) -> tuple[str, bytes, dict]:
+    """Works out where a message should actually be sent and encodes its
+    body, returning the final routing key, the encoded body and the AMQP
+    properties that describe it.
+
+    Messages sent directly to a queue that has been split into shards are sent
+    to the appropriate shard. The body is encoded according to the codec
+    policy for the (unsharded) queue; the content_type and content_encoding
+    properties can also be set explicitly."""
+    if not exchange:
+        routing_key, queue = router.route(routing_key, body), routing_key
+    else:
+        queue = routing_key
+    body, basic_properties = message_codec.encode(
+            queue, body, basic_properties)
+    return routing_key, body, basic_properties
 
 
 class SynchronisationTimeoutError(RuntimeError):
@@ -261,16 +332,28 @@ class SynchronisationTimeoutError(RuntimeError):
 class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
     """Runs a Pika session in a background thread."""
 
-    def __init__(self, *args, exclusive=False, **kwargs):
+    IDLE_WAIT = 1.0
+    """The longest time (in seconds) that the background thread will wait for
+    network activity before checking for new requests. (Enqueueing a request
+    wakes the background thread up immediately, so this is only a backstop.)"""
+
+    def __init__(self, *args, exclusive=False,
+                 batch_size=pika_settings.AMQP_BATCH_SIZE,
+                 confirms=pika_settings.AMQP_PUBLISHER_CONFIRMS,
+                 codec_settings=pika_settings.AMQP_CODEC, **kwargs):
         super().__init__()
         PikaPipelineRunner.__init__(self, *args, **kwargs)
 
         self._incoming = SortedList(key=lambda e: -(e[1].priority or 0))
-        self._outgoing = []
+        self._outgoing = deque()
         self._live = None
         self._condition = threading.Condition()
+        self._waiting = False
+        self._batch_size = max(batch_size, 1)
+        self._confirms = confirms
         self._exclusive = exclusive
-        self._default_basic_properties = dict(delivery_mode=2, content_encoding="gzip")
+        self._default_basic_properties = dict(delivery_mode=2)
+        self._codec = codec.MessageCodec(**codec_settings)
 
         self._shutdown_exception = None
 
@@ -289,6 +372,33 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
             logger.trace(f"PikaPipelineThread - Thread TID: {self.native_id} "
                          "acquired conditional and enqueued outgoing message.")
             self._outgoing.append((label, *args))
+            self._wake_up()
+
+    def _wake_up(self):
+        """Interrupts the background thread if it's waiting for network
+        activity. (The caller must hold the condition lock.)"""
+        if self._waiting and self._connection:
+            try:
+                self._connection.add_callback_threadsafe(lambda: None)
+                self._waiting = False
+            except pika.exceptions.ConnectionWrongStateError:
+                # The background thread is about to find out about this for
+                # itself
+                pass
+
+    def make_channel(self):
+        """As PikaPipelineRunner.make_channel, but also puts the channel into
+        transactional mode if publisher confirms have been requested.
+
+        (Pika's BlockingChannel can only wait for publisher confirms one
+        message at a time. Committing a transaction after every batch of
+        requests gives the same guarantee -- the broker has taken
+        responsibility for every message in the batch -- but needs only one
+        round trip per batch.)"""
+        channel = super().make_channel()
+        if self._confirms:
+            channel.tx_select()
+        return channel
 
     def enqueue_ack(self, delivery_tag: int):
         """Requests that the background thread acknowledge receipt of the
@@ -316,19 +426,24 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
                         **basic_properties):
         """Requests that the background thread send a message.
 
-        Note that the content_encoding property gets special treatment: if it's
-        set, the message will be encoded accordingly -- on the calling thread,
-        not the background one -- before it's enqueued."""
-        basic_properties = self._default_basic_properties | basic_properties
-
-        if not isinstance(body, bytes):
-            body = json.dumps(body).encode()
-        if (encoding := basic_properties.get("content_encoding")):
-            encoder, _ = _coders[encoding]
-            body = encoder(body)
-
+        The message body is encoded -- on the calling thread, not the
+        background one -- before it's enqueued, as described in
+        encode_message."""
+        routing_key, body, basic_properties = encode_message(
+                self._router, self._codec, routing_key, body, exchange,
+                **(self._default_basic_properties | basic_properties))
+        return self.enqueue_encoded_message(
+                routing_key, body, exchange, basic_properties)
+
+    def enqueue_encoded_message(
+            self, routing_key: str, body: bytes, exchange: str,
+            basic_properties: dict):
+        """Requests that the background thread send a message that has
+        already been routed and encoded by encode_message (perhaps in another
+        process)."""
         return self._enqueue(
-                "msg", routing_key, body, exchange, basic_properties)
+                "msg", routing_key, body, exchange,
+                self._default_basic_properties | basic_properties)
 
     def _enqueue_pause(self, duration: float = 5.0):
         """Requests that the background thread wait for the specified duration.
@@ -364,8 +479,9 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
         the background thread isn't running; otherwise, it will block until a
         message is available or until the given timeout elapses.
 
-        Note that messages with a declared content encoding will be decoded
-        automatically before being returned."""
+        Note that messages with a declared content encoding will be
+        decompressed automatically before being returned. (Use codec.loads to
+        deserialise the body according to its content type.)"""
         method, properties, body = None, None, None
         with self._condition:
 
@@ -377,8 +493,7 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
             if rv and self._live:
                 method, properties, body = self._incoming.pop(0)
         if body and properties and properties.content_encoding:
-            _, decoder = _coders[properties.content_encoding]
-            body = decoder(body)
+            body = codec.decompress(body, properties.content_encoding)
             # We've decoded the content, so from this point on it should be
             # regarded as unencoded
             properties.content_encoding = None
@@ -421,42 +536,58 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
             self._live = True
             self._condition.notify()
         consumer_tags = self._basic_consume(exclusive=self._exclusive)
+        acks = AcknowledgementBatch()
         try:
             running = True
             while running:
                 with self._condition:
-                    # Process all of the enqueued actions
-                    while self._outgoing:
-                        head = self._outgoing.pop(0)
-                        logger.trace("PikaPipelineThread - Thread TID:"
-                                     f" {self.native_id} got the conditional."
-                                     " Processing outgoing message.")
-                        match head:
-                            case ("msg", routing_key, body, exchange, props):
-                                self.channel.basic_publish(
-                                        exchange=exchange,
-                                        routing_key=routing_key,
-                                        properties=pika.BasicProperties(**props),
-                                        body=body)
-                            case ("ack", delivery_tag):
-                                self.channel.basic_ack(delivery_tag)
-                            case ("rej", delivery_tag, requeue):
-                                self.channel.basic_reject(
-                                        delivery_tag, requeue=requeue)
-                            case ("fin",):
-                                running = False
-                                break
-                            case ("syn", ev):
-                                ev.set()
-                            case ("zzz", duration):
-                                time.sleep(duration)
-
-                # Dispatch any waiting timer (heartbeats) and channel (calls to
-                # our handle_message_raw method) callbacks...
-                self.connection.process_data_events(0)
-                # ... and then sleep for a moment to avoid overburdening the
-                # system
-                time.sleep(0.1)
+                    batch = [self._outgoing.popleft()
+                             for _ in range(min(
+                                     len(self._outgoing), self._batch_size))]
+                logger.trace("PikaPipelineThread - Thread TID:"
+                             f" {self.native_id} processing"
+                             f" {len(batch)} outgoing requests.")
+
+                for index, head in enumerate(batch):
+                    match head:
+                        case ("msg", routing_key, body, exchange, props):
+                            self.channel.basic_publish(
+                                    exchange=exchange,
+                                    routing_key=routing_key,
+                                    properties=pika.BasicProperties(**props),
+                                    body=body)
+                        case ("ack", delivery_tag):
+                            acks.ack(delivery_tag)
+                        case ("rej", delivery_tag, requeue):
+                            acks.reject(delivery_tag)
+                            self.channel.basic_reject(
+                                    delivery_tag, requeue=requeue)
+                        case ("fin",):
+                            running = False
+                            # Leave any later requests where they were
+                            with self._condition:
+                                self._outgoing.extendleft(
+                                        reversed(batch[index + 1:]))
+                            break
+                        case ("syn", ev):
+                            self._flush(acks, commit=True)
+                            ev.set()
+                        case ("zzz", duration):
+                            self._flush(acks, commit=True)
+                            time.sleep(duration)
+                self._flush(acks, commit=bool(batch))
+
+                if running:
+                    with self._condition:
+                        # Only wait for the network if there's nothing else
+                        # to do; _enqueue will wake us up if that changes
+                        idle = self._waiting = not self._outgoing
+                    # Dispatch any waiting timer (heartbeats) and channel
+                    # (calls to our handle_message_raw method) callbacks
+                    self.connection.process_data_events(
+                            self.IDLE_WAIT if idle else 0)
+                    with self._condition:
+                        self._waiting = False
         except BaseException as ex:
             if isinstance(ex, (
                     pika.exceptions.ChannelClosed,
@@ -478,6 +609,54 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
                 self._live = False
                 self._condition.notify()
 
+    def _flush(self, acks: AcknowledgementBatch, commit: bool):
+        """(Background thread.) Sends any pending acknowledgements and, if
+        publisher confirms have been requested and the commit flag is set,
+        commits the current transaction."""
+        if acks:
+            calls = acks.flush(self.channel)
+            logger.trace("PikaPipelineThread - Thread TID:"
+                         f" {self.native_id} sent acknowledgements"
+                         f" in {calls} calls.")
+        if self._confirms and commit:
+            self.channel.tx_commit()
+
+    def _dispatch_message(self, method, outputs):
+        """Enqueues the (routing key, message[, exchange, headers]) tuples
+        produced by processing a message, followed by an acknowledgement of
+        that message."""
+        for msg in outputs:
+            match msg:
+                case (routing_key, message, exchange, headers):
+                    self.enqueue_message(routing_key,
+                                         message,
+                                         exchange=exchange,
+                                         **headers)
+                case (routing_key, message):
+                    self.enqueue_message(routing_key, message)
+
+        self.enqueue_ack(method.delivery_tag)
+
+    def _consume_messages(self, should_run):
+        """Collects messages from the background thread and handles them, one
+        at a time, for as long as the should_run function returns True and the
+        background thread is alive.
+
+        Subclasses can override this method to change how messages are
+        scheduled for handling."""
+        while should_run() and self.is_alive():
+            method, properties, body = self.await_message(timeout=30.0)
+            if method == properties == body is None:
+                continue
+            try:
+                key = sharding.base_queue(method.routing_key)
+                dbd = codec.loads(body, properties.content_type)
+
+                self._dispatch_message(method, self.handle_message(key, dbd))
+                self.after_message(key, dbd)
+            except RejectMessage as ex:
+                self.enqueue_reject(method.delivery_tag, requeue=ex.requeue)
+
     def run_consumer(self):  # noqa: CCR001, E501 too high cognitive complexity
         """Receives messages from the registered input queues, dispatches them
         to the handle_message function, and generates new output messages. All
@@ -505,28 +684,7 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
 
         self.start()
         try:
-            while running and self.is_alive():
-                method, properties, body = self.await_message(timeout=30.0)
-                if method == properties == body is None:
-                    continue
-                try:
-                    key = method.routing_key
-                    dbd = json_utf8_decode(body)
-
-                    for msg in self.handle_message(key, dbd):
-                        match msg:
-                            case (routing_key, message, exchange, headers):
-                                self.enqueue_message(routing_key,
-                                                     message,
-                                                     exchange=exchange,
-                                                     **headers)
-                            case (routing_key, message):
-                                self.enqueue_message(routing_key, message)
-
-                    self.enqueue_ack(method.delivery_tag)
-                    self.after_message(key, dbd)
-                except RejectMessage as ex:
-                    self.enqueue_reject(method.delivery_tag, requeue=ex.requeue)
+            self._consume_messages(lambda: running)
         finally:
             self.enqueue_stop()
             self.join()
@@ -543,3 +701,70 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
         if self._shutdown_exception:
             raise Exception("Worker thread died unexpectedly") from (
                     self._shutdown_exception)
+
+
+class BatchingPipelineThread(PikaPipelineThread):
+    """A BatchingPipelineThread is a PikaPipelineThread that can, if given a
+    positive batch_interval, collect incoming messages and handle them together
+    every batch_interval seconds (or every collect_batch_size messages).
+    Messages are only acknowledged once their batch has been written.
+
+    Subclasses should override the _new_batch, _add_to_batch and _write_batch
+    methods."""
+
+    def __init__(self, *args, batch_interval: float = 0,
+                 collect_batch_size: int = 1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._batch_interval = batch_interval
+        # (Not to be confused with PikaPipelineThread._batch_size, which
+        # controls how many requests the background thread handles at once)
+        self._collect_batch_size = max(collect_batch_size, 1)
+
+    def _new_batch(self):
+        """Returns an empty batch."""
+        return []
+
+    def _add_to_batch(self, batch, routing_key, body):
+        """Adds the decoded body of a message to a batch."""
+        raise NotImplementedError("BatchingPipelineThread._add_to_batch")
+
+    def _write_batch(self, batch, methods: list):
+        """Handles a batch, and then acknowledges the messages (whose
+        delivery details are given by the methods list) that it came from."""
+        raise NotImplementedError("BatchingPipelineThread._write_batch")
+
+    @staticmethod
+    def _time_left(deadline) -> float:
+        return (30.0 if deadline is None
+                else max(deadline - time.monotonic(), 0))
+
+    def _batch_due(self, methods: list, deadline) -> bool:
+        return bool(methods) and (
+                len(methods) >= self._collect_batch_size
+                or time.monotonic() >= deadline)
+
+    def _consume_messages(self, should_run):
+        """As PikaPipelineThread._consume_messages, but, if batching has been
+        enabled, collects messages into batches and writes them with the
+        _write_batch method."""
+        if self._batch_interval <= 0:
+            return super()._consume_messages(should_run)
+
+        batch, methods, deadline = self._new_batch(), [], None
+        while should_run() and self.is_alive():
+            method, properties, body = self.await_message(
+                    timeout=self._time_left(deadline))
+            if method is not None:
+                self._add_to_batch(
+                        batch, method.routing_key,
+                        codec.loads(body, properties.content_type))
+                methods.append(method)
+                if deadline is None:
+                    deadline = time.monotonic() + self._batch_interval
+
+            if self._batch_due(methods, deadline):
+                self._write_batch(batch, methods)
+                batch, methods, deadline = self._new_batch(), [], None
+
+        if methods and self.is_alive():
+            self._write_batch(batch, methods)
@@ -0,0 +1,78 @@
+"""Helper functions for running a pipeline stage's message handler in a pool of
+worker processes.
+
+Each process in the pool has its own SourceManager and its own TimerManager
+(which, as each pool process runs its tasks on its own main thread, is able to
+enforce timeouts as usual). The functions in this module are run in the pool
+processes; the parent process only ever passes them plain JSON-serialisable
+values, and gets back messages that have already been routed to the right
+shard and encoded according to the codec policy, ready to send."""
+
+import atexit
+import importlib
+import structlog
+
+from os2datascanner.utils import pika_settings
+from os2datascanner.utils.timer import TimerManager
+from ...model.core import SourceManager
+from ..headers import get_exchange, get_headers
+from .codec import MessageCodec
+from .pika import encode_message
+from .sharding import ShardRouter
+
+
+logger = structlog.get_logger("process_pool")
+
+
+_handler = None
+_source_manager = None
+_stage = None
+_queue_suffix = None
+_router = None
+_codec = None
+
+
+def initialise(
+        module_name: str, stage: str, queue_suffix: str, width: int,
+        router: ShardRouter = None, message_codec: MessageCodec = None):
+    """Prepares this pool process to handle messages for the pipeline stage
+    implemented by the named module. (This function is intended to be used as
+    the initializer of a concurrent.futures.ProcessPoolExecutor.)
+
+    The router and message_codec should be the ones used by the parent
+    process; by default, they're built from the AMQP settings."""
+    global _handler, _source_manager, _stage, _queue_suffix, _router, _codec
+    _stage = stage
+    _queue_suffix = queue_suffix
+    _router = router or ShardRouter()
+    _codec = message_codec or MessageCodec(**pika_settings.AMQP_CODEC)
+
+    module = importlib.import_module(module_name)
+    _handler = module.message_received_raw
+
+    _source_manager = SourceManager.from_settings(width=width)
+    atexit.register(_source_manager.clear)
+
+    # Install our SIGALRM handler now rather than in the middle of the first
+    # message
+    TimerManager.get()
+    logger.debug("pool process ready", module=module_name)
+
+
+def handle(body: dict, routing_key: str) -> list:
+    """Runs the message handler for this pool process's pipeline stage on the
+    given message, returning a list of (routing key, encoded message,
+    exchange, properties) tuples for all of the messages it produces, suitable
+    for PikaPipelineThread.enqueue_encoded_message."""
+    # Message objects can contain values that survive JSON serialisation but
+    # not pickling, so encode them here rather than in the parent process.
+    # (This also means that the sharding key is computed here, while the
+    # message is still a JSON object)
+    rv = []
+    for rk, msg in _handler(body, routing_key, _source_manager):
+        exchange = get_exchange(_stage, _queue_suffix, msg, rk)
+        rk, encoded, properties = encode_message(
+                _router, _codec, rk, msg, exchange,
+                **get_headers(_stage, _queue_suffix, msg, rk))
+        rv.append((rk, encoded, exchange, properties))
+    return rv
@@ -0,0 +1,140 @@
+"""Utilities for splitting the queues read by the collectors into shards.
+
+Each collector locks the database rows that a message is about -- the
+DocumentReport or ScheduledCheckup for an object, or the ScanStatus for a
+scan -- so running several replicas of a collector against the same queue
+mostly just makes them wait for each other. A ShardRouter instead splits a
+queue into a number of sub-queues, and sends every message to the one chosen
+by a stable hash of the thing that it's about. Each collector replica can then
+consume a single shard without ever contending for a row with another one.
+
+The number of shards for a queue must be configured identically everywhere
+that queue is used. The first shard also takes over the unsharded queue, so
+messages published before sharding was enabled (or by stages that don't know
+about it) are still handled."""
+
+import hashlib
+import structlog
+from typing import Callable, Iterable, Optional
+
+from os2datascanner.utils import pika_settings
+from ...model.core import Handle, Source
+from ...utilities.json import canonical_json
+
+
+logger = structlog.get_logger("engine2")
+
+
+SHARD_SEPARATOR = "_shard"
+
+
+def shard_queue(queue: str, shard: int) -> str:
+    """Returns the name of the given shard of a queue."""
+    return f"{queue}{SHARD_SEPARATOR}{shard}"
+
+
+def base_queue(name: str) -> str:
+    """Returns the name of the queue that the named queue is a shard of. (If
+    the name isn't that of a shard, it's returned unchanged.)"""
+    queue, sep, shard = name.rpartition(SHARD_SEPARATOR)
+    return queue if sep and shard.isdigit() else name
+
+
+def shard_for(key: str, shards: int) -> int:
+    """Returns the shard, between 0 and shards - 1, that a message with the
+    given key belongs to. (Unlike Python's hash function, this doesn't change
+    from one process to the next.)"""
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+def object_key(body: dict) -> Optional[str]:
+    """Returns the path that the result collector and the checkup collector
+    use to identify the object that a matches, metadata or problem message is
+    about."""
+    if body.get("handle"):
+        obj = Handle.from_json_object(body["handle"])
+    elif body.get("source"):
+        obj = Source.from_json_object(body["source"])
+    else:
+        return None
+    return obj.censor().crunch(hash=True)
+
+
+def scan_key(body: dict) -> Optional[str]:
+    """Returns a key for the scan that a status message is about."""
+    return canonical_json(body.get("scan_tag"))
+
+
+KEY_FUNCTIONS: dict[str, Callable[[dict], Optional[str]]] = {
+    "os2ds_results": object_key,
+    "os2ds_checkups": object_key,
+    "os2ds_status": scan_key,
+}
+"""The functions that compute the sharding keys of the messages sent to each
+shardable queue."""
+
+
+class ShardRouter:
+    """A ShardRouter knows how many shards each queue has been split into (by
+    default, according to the AMQP_SHARDS setting), and decides which shard a
+    message should be sent to."""
+
+    def __init__(self, shards: Optional[dict] = None):
+        if shards is None:
+            shards = pika_settings.AMQP_SHARDS
+        self._shards = {}
+        for queue, count in shards.items():
+            if queue not in KEY_FUNCTIONS:
+                raise ValueError(f"queue {queue} can't be sharded")
+            elif count > 1:
+                self._shards[queue] = count
+
+    def shards(self, queue: str) -> int:
+        """Returns the number of shards that a queue has been split into."""
+        return self._shards.get(queue, 1)
+
+    def route(self, routing_key: str, body) -> str:
+        """Returns the routing key that a message sent to the given queue
+        should actually be sent with."""
+        count = self.shards(routing_key)
+        if count == 1 or not isinstance(body, dict):
+            return routing_key
+
+        try:
+            key = KEY_FUNCTIONS[routing_key](body)
+        except Exception:
+            logger.warning(
+                    "couldn't compute sharding key, using first shard",
+                    queue=routing_key, exc_info=True)
+            key = None
+        return shard_queue(
+                routing_key, shard_for(key, count) if key is not None else 0)
+
+    def write_queues(self, queues: Iterable[str]) -> set[str]:
+        """Returns the names of all of the queues that a stage that writes to
+        the given queues might actually send messages to."""
+        rv = set()
+        for queue in queues:
+            rv.add(queue)
+            if (count := self.shards(queue)) > 1:
+                rv.update(shard_queue(queue, s) for s in range(count))
+        return rv
+
+    def read_queues(
+            self, queue: str, shard: Optional[int] = None) -> list[str]:
+        """Returns the names of the queues that a consumer of the given shard
+        of a queue (or, if no shard is specified, of every shard) should read
+        from."""
+        count = self.shards(queue)
+        if shard is not None and not 0 <= shard < count:
+            raise ValueError(
+                    f"queue {queue} only has {count} shard(s), not {shard}")
+        elif count == 1:
+            return [queue]
+
+        rv = [shard_queue(queue, s) for s in range(count)
+              if shard is None or s == shard]
+        if shard in (None, 0,):
+            rv.append(queue)
+        return rv
@@ -42,8 +42,10 @@ def explore(sm, msg, *, check=True):
 
 
 def process(sm, msg, *, check=True):
+    # Representations go straight to the matcher, so there's no point in
+    # putting them in the blob store
     for channel, message in processor_handler(
-            msg, "os2ds_conversions", sm, _check=check):
+            msg, "os2ds_conversions", sm, _check=check, _offload=False):
         if channel == "os2ds_representations":
             # Processing this object has produced a request for a new
             # conversion; there's no need to call Resource.check() a second
@@ -95,11 +97,16 @@ def message_received_raw(body, channel, source_manager):  # noqa: CCR001, E501 t
         except TimeoutError:
             # FileResource.get_size has timed out. This method should (in
             # principle) be lightweight, so there may be something wrong with
-            # our state object: we err on the side of caution and clear it
+            # our state object: we err on the side of caution and throw away
+            # everything that depends on it. (The states of other Sources
+            # are fine, though)
             logger.warning(
                     f"{message.handle}.follow(...).get_size()"
                     " took too long, clearing SourceManager state")
-            source_manager.clear()
+            source = message.handle.source
+            while source.handle:
+                source = source.handle.source
+            source_manager.close(source, reuse=False)
         except Exception:
             pass
         yield ("os2ds_status", messages.StatusMessage(
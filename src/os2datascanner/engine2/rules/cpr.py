@@ -150,7 +150,7 @@ class CPRRule(RegexRule):
             bin_storage[i] for i in range(1, num_bins+1) if bin_accepted[i])
         return list(filtered_cprs)
 
-    def match(self, content: str) -> Optional[Iterator[dict]]:  # noqa: CCR001,E501,C901 too high cognitive complexity
+    def _match(self, content: str, spans=None) -> Iterator[dict]:  # noqa: CCR001,E501,C901 too high cognitive complexity
         if content is None:
             return
 
@@ -159,26 +159,18 @@ class CPRRule(RegexRule):
                 logger.debug("Blacklist matched content", matches=m.group(0))
                 return
 
-        def _is_cpr(candidate: Match[str]):  # noqa: CCR001 Cognitive complexity is too high
-            cpr = candidate.group(1).replace(" ", "") + candidate.group(2)
-
-            if cpr in self._exceptions:
-                return False
-
-            if self._modulus_11:
-                mod11, reason = modulus11_check(cpr)
-                if not mod11:
-                    logger.debug(f"{cpr} failed modulus11 check due to {reason}")
-                    return False
+        # Numbers that appear several times only need to be checked once. (The
+        # context of each occurrence is still examined separately, though)
+        known = {}
 
-            probability = 1.0
-            if self._ignore_irrelevant:
-                probability = calculator.cpr_check(cpr, do_mod11_check=False)
-                if isinstance(probability, str):
-                    logger.debug(f"{cpr} is not valid cpr due to {probability}")
-                    return False
+        def _get_probability(candidate: Match[str]) -> Optional[float]:
+            cpr = candidate.group(1).replace(" ", "") + candidate.group(2)
+            if cpr not in known:
+                known[cpr] = self._number_probability(cpr)
+            probability = known[cpr]
+            if probability is None:
+                return None
 
-            cpr = cpr[0:4] + "XXXXXX"
             low, high = candidate.span()
             # only examine context if there is any
             if self._examine_context and len(content) > (high - low):
@@ -186,41 +178,29 @@ class CPRRule(RegexRule):
                 # determine if probability stems from context or calculator
                 probability = p if p is not None else probability
                 ctype = ctype if ctype != [] else Context.PROBABILITY_CALC
-                logger.debug(f"{cpr} with probability {probability} from context "
-                             f"due to {ctype}")
-
-            if probability:
-                return True
-            else:
-                return False
-
-        numbers = [m for m in self._compiled_expression.finditer(content)]
-
-        cpr_numbers = [m for m in numbers if _is_cpr(m)]
+                logger.debug(
+                        "probability from context",
+                        cpr=cpr[0:4] + "XXXXXX", probability=probability,
+                        ctype=ctype)
+            return probability
+
+        numbers = list(self._finditer(content, spans))
+
+        # Work out the probability of every candidate exactly once, and keep
+        # only those that might be CPR numbers
+        probabilities = {}
+        for m in numbers:
+            if (probability := _get_probability(m)):
+                probabilities[m] = probability
+        cpr_numbers = list(probabilities)
 
         if self._examine_context:
             cpr_numbers = self._bin_check(numbers, cpr_numbers)
 
         for m in cpr_numbers:
             cpr = m.group(1).replace(" ", "") + m.group(2)
-
-            probability = 1.0
-            if self._ignore_irrelevant:
-                probability = calculator.cpr_check(cpr, do_mod11_check=False)
-
-            cpr = cpr[0:4] + "XXXXXX"
-            low, high = m.span()
-            # only examine context if there is any
-            if self._examine_context and len(content) > (high - low):
-                p, ctype = self.examine_context(m)
-                # determine if probability stems from context or calculator
-                probability = p if p is not None else probability
-                ctype = ctype if ctype != [] else Context.PROBABILITY_CALC
-                logger.debug(f"{cpr} with probability {probability} from context "
-                             f"due to {ctype}")
-
             yield {
-                "match": cpr,
+                "match": cpr[0:4] + "XXXXXX",
 
                 **make_context(m, content),
 
@@ -228,9 +208,30 @@ class CPRRule(RegexRule):
                     self.sensitivity.value if self.sensitivity
                     else self.sensitivity
                 ),
-                "probability": probability,
+                "probability": probabilities[m],
             }
 
+    def _number_probability(self, cpr: str) -> Optional[float]:
+        """Returns the probability that a ten-digit number is a CPR number
+        (without considering the context in which it appears), or None if it
+        can't be one."""
+        if cpr in self._exceptions:
+            return None
+
+        if self._modulus_11:
+            mod11, reason = modulus11_check(cpr)
+            if not mod11:
+                logger.debug("failed modulus11 check", reason=reason)
+                return None
+
+        if self._ignore_irrelevant:
+            probability = calculator.cpr_check(cpr, do_mod11_check=False)
+            if isinstance(probability, str):
+                logger.debug("not a valid cpr", reason=probability)
+                return None
+            return probability
+        return 1.0
+
     def examine_context(  # noqa: CCR001, C901 too high cognitive complexity
         self, match: Match[str]
     ) -> Tuple[Optional[float], List[tuple]]:
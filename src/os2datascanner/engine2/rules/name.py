@@ -1,4 +1,6 @@
 import regex
+from typing import Optional
+from functools import cache
 
 from ..conversions.types import OutputType
 from .rule import Rule, SimpleRule, Sensitivity
@@ -58,6 +60,24 @@ def match_full_name(text):
     return matches
 
 
+@cache
+def _load_name_datasets() -> tuple[frozenset[str], frozenset[str]]:
+    """Returns the sets of known first names and last names, in upper case.
+    These sets are loaded only once per process and are shared between all
+    NameRules."""
+    # Convert list of str to upper case and to sets for efficient lookup
+    m = set(map(str.upper,
+            common_loader.load_dataset(
+                    "names", "da_20140101_dst_fornavne-mænd")))
+    k = set(map(str.upper,
+            common_loader.load_dataset(
+                    "names", "da_20140101_dst_fornavne-kvinder")))
+    e = set(map(str.upper,
+            common_loader.load_dataset(
+                    "names", "da_20140101_dst_efternavne")))
+    return frozenset(m.union(k)), frozenset(e)
+
+
 class NameRule(SimpleRule):
     """A NameRule looks for strings of text that resemble Danish names. It
     couples a regular expression-driven scan for name-like tokens with a
@@ -86,23 +106,18 @@ class NameRule(SimpleRule):
     def presentation_raw(self):
         return "personal name"
 
+    @property
+    def candidate_expression(self) -> Optional[str]:
+        if self._expansive:
+            # Any capitalised word could be a standalone name, so there's
+            # nothing useful to look for
+            return None
+        # Every full name starts with a name, some whitespace and another name
+        return rf"\b{_name}{_whitespace}{_name}"
+
     def _load_datasets(self):
         if self.first_names is None:
-            # Convert list of str to upper case and to sets for efficient
-            # lookup
-            m = set(map(str.upper,
-                    common_loader.load_dataset(
-                            "names", "da_20140101_dst_fornavne-mænd")))
-            k = set(map(str.upper,
-                    common_loader.load_dataset(
-                            "names", "da_20140101_dst_fornavne-kvinder")))
-            e = set(map(str.upper,
-                    common_loader.load_dataset(
-                            "names", "da_20140101_dst_efternavne")))
-            f = m.union(k)
-
-            self.last_names = e
-            self.first_names = f
+            self.first_names, self.last_names = _load_name_datasets()
 
     def match(self, text):  # noqa: CCR001, too high cognitive complexity
         self._load_datasets()
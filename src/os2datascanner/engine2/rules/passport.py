@@ -1,4 +1,4 @@
-from typing import Iterator, Optional
+from typing import Iterator
 import structlog
 from itertools import pairwise
 
@@ -52,11 +52,11 @@ class PassportRule(RegexRule):
     def presentation_raw(self) -> str:
         return "Passport MRZ"
 
-    def match(self, content: str) -> Optional[Iterator[dict]]:  # noqa: CCR001,E501 too high cognitive complexity
+    def _match(self, content: str, spans=None) -> Iterator[dict]:  # noqa: CCR001,E501 too high cognitive complexity
         if content is None:
             return
 
-        for match in self._compiled_expression.finditer(content):
+        for match in self._finditer(content, spans):
             country_issued, *passport_data, cd_all = match.groups()
             passport_number = passport_data[0]
 
@@ -24,11 +24,39 @@ class RegexRule(SimpleRule):
     def presentation_raw(self) -> str:
         return 'regular expression matching "{0}"'.format(self._expression)
 
+    @property
+    def candidate_expression(self) -> str:
+        return self._expression
+
+    def _finditer(self, content: str, spans=None) -> Iterator[re.Match]:
+        """As re.Pattern.finditer. If the candidate spans of this rule are
+        given, then only the places where they begin are examined."""
+        if spans is None or any(begin == end for begin, end in spans):
+            # (Empty matches follow rules of their own, so leave them to the
+            # re module)
+            yield from self._compiled_expression.finditer(content)
+            return
+
+        position = 0
+        for begin, _ in spans:
+            if begin < position:
+                # This candidate overlaps the last match
+                continue
+            elif (match := self._compiled_expression.match(content, begin)):
+                yield match
+                position = match.end()
+
     def match(self, content: str) -> Optional[Iterator[dict]]:
+        return self._match(content)
+
+    def match_candidates(self, content: str, spans) -> Iterator[dict]:
+        return self._match(content, spans)
+
+    def _match(self, content: str, spans=None) -> Iterator[dict]:
         if content is None:
             return
 
-        for match in self._compiled_expression.finditer(content):
+        for match in self._finditer(content, spans):
             low, high = match.span()
             yield {
                 "match": match.string[match.start(): match.end()],
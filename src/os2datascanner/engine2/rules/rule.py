@@ -5,7 +5,8 @@ from typing import Union, Optional, Tuple, Iterator, Callable, Any
 from itertools import islice
 
 from .utilities.properties import RulePrecedence, RuleProperties
-from ..utilities.json import JSONSerialisable
+from .. import settings as engine2_settings
+from ..utilities.json import JSONSerialisable, InternTable
 from ..utilities.equality import TypePropertyEquality
 from ..conversions.types import OutputType
 
@@ -141,6 +142,10 @@ class Rule(TypePropertyEquality, JSONSerialisable):
         return (here, list(matches.items()))
 
     _json_handlers = {}
+    # Rules are immutable, and building some of them is expensive (compiling
+    # regular expressions, loading datasets), so reuse them where possible
+    _json_cache = InternTable(
+            engine2_settings.utilities["json"]["cache_size"])
 
     @abstractmethod
     def to_json_object(self):
@@ -175,6 +180,27 @@ class SimpleRule(Rule):
     def operates_on(self) -> OutputType:
         """The type of input expected by this SimpleRule."""
 
+    @property
+    def candidate_expression(self) -> Optional[str]:
+        """Returns a regular expression that must match somewhere in a
+        representation for this SimpleRule to be able to match it, if there is
+        one. (Evaluation plans use these expressions to find the places that
+        many SimpleRules might match with a single scan.)
+
+        The default implementation of this method returns None."""
+        return None
+
+    def match_candidates(
+            self, content, spans: list[tuple[int, int]]) -> Iterator[dict]:
+        """As match, but also given the (begin, end) span of every place in the
+        content at which this SimpleRule's candidate expression matches, in
+        order of position. (Evaluation plans only call this method when there
+        is at least one such span.)
+
+        The default implementation of this method ignores the spans and calls
+        match."""
+        return self.match(content)
+
     @abstractmethod
     def match(self, content) -> Iterator[dict]:
         """Yields zero or more dictionaries suitable for JSON serialisation,
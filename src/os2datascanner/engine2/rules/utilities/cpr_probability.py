@@ -1,4 +1,4 @@
-from typing import Union, Tuple
+from typing import Optional, Union, Tuple
 from datetime import date
 
 
@@ -104,6 +104,38 @@ def modulus11_check_raw(cpr: str) -> bool:
     return sum([int(c) * v for c, v in zip(cpr, _mod_11_table)]) % 11 == 0
 
 
+def _make_serial_tables() -> Tuple[list, list]:
+    """Builds lookup tables for the last three digits of a CPR number.
+
+    Whether or not a given three-digit serial completes a valid CPR number
+    depends only on the remainder, modulo 11, of the weighted sum of the first
+    seven digits. For each of the 11 possible remainders, this function counts
+    how many serials complete a valid CPR number, and, for every serial, how
+    many of the serials before it do so."""
+    counts = []
+    preceding = []
+    for remainder in range(11):
+        valid_before = []
+        valid = 0
+        for serial in range(1000):
+            valid_before.append(valid)
+            if _serial_checksum(remainder, serial) % 11 == 0:
+                valid += 1
+        counts.append(valid)
+        preceding.append(valid_before)
+    return counts, preceding
+
+
+def _serial_checksum(remainder: int, serial: int) -> int:
+    return (remainder
+            + (serial // 100) * _mod_11_table[7]
+            + (serial // 10 % 10) * _mod_11_table[8]
+            + (serial % 10) * _mod_11_table[9])
+
+
+_serial_counts, _serials_before = _make_serial_tables()
+
+
 class CprProbabilityCalculator(object):
     """Calculate the probability that a matched str of numbers is actually a CPR
 
@@ -119,10 +151,6 @@ class CprProbabilityCalculator(object):
       always 0.5
     """
 
-    def __init__(self):
-        # Cache of dates where the possible CPRs has already been calculated.
-        self.cached_cprs = {}
-
     @staticmethod
     def _form_validator(cpr: str) -> str:
         """Checks a CPR number for formal validity.
@@ -166,31 +194,38 @@ class CprProbabilityCalculator(object):
             legal_7s = [5, 6, 7, 8]
         return legal_7s
 
-    def _calc_all_cprs(self, birth_date: date) -> list:
-        """Calculate all valid CPRs for a given birth date.
+    def _sequence_index(self, cpr: str, birth_date: date) -> Optional[int]:
+        """Finds the position of a CPR number in the sequence of all legal
+        CPRs for its birth date, without generating that sequence.
 
-        :param birh_date: The birh date to check.
-        :return: A list of all legal CPRs for that date.
+        The sequence is ordered by the seventh digit (in the order given by
+        `_legal_7s`) and then by the last three digits.
+
+        :param cpr: The CPR number to check.
+        :param birth_date: The birth date of that CPR number.
+        :return: The index of the CPR number, or None if it isn't legal.
         """
-        cache_key = str(birth_date)
-        if cache_key in self.cached_cprs:
-            return self.cached_cprs[cache_key]
         legal_7 = self._legal_7s(birth_date.year)
+        index_7 = int(cpr[6])
+        if index_7 not in legal_7:
+            return None
+
+        prefix_sum = sum(int(c) * v for c, v in zip(cpr[:6], _mod_11_table))
+
+        def _remainder(digit_7: int) -> int:
+            return (prefix_sum + digit_7 * _mod_11_table[6]) % 11
 
-        legal_cprs = []
-        for index_7 in legal_7:
-            for i in range(0, 1000):
-                cpr_candidate = (
-                    birth_date.strftime("%d%m%y")
-                    + str(index_7)
-                    + str(i).zfill(3)
-                )
-                valid = modulus11_check_raw(cpr_candidate)
-                if valid:
-                    legal_cprs.append(cpr_candidate)
-
-        self.cached_cprs[cache_key] = legal_cprs
-        return legal_cprs
+        remainder = _remainder(index_7)
+        serial = int(cpr[7:])
+        if _serial_checksum(remainder, serial) % 11 != 0:
+            return None
+
+        # Count the legal CPRs with an earlier seventh digit, and then the
+        # legal CPRs with the same seventh digit but an earlier serial
+        index = sum(
+                _serial_counts[_remainder(d)]
+                for d in legal_7[:legal_7.index(index_7)])
+        return index + _serials_before[remainder][serial]
 
     def cpr_check(self, cpr: str, do_mod11_check=True) -> Union[str, float]:
         """Estimate a probality that the number is actually a CPR.
@@ -234,10 +269,8 @@ class CprProbabilityCalculator(object):
                 birth_date not in CPR_EXCEPTION_DATES):
             return "Modulus 11 does not match"
 
-        legal_cprs = self._calc_all_cprs(birth_date)
-        try:
-            index_number = legal_cprs.index(cpr)
-        except ValueError:
+        index_number = self._sequence_index(cpr, birth_date)
+        if index_number is None:
             return "CPR is not a legal value"
 
         if index_number <= 100:
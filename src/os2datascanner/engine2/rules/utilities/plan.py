@@ -0,0 +1,201 @@
+import re
+import regex
+import structlog
+from typing import Any, Callable, Optional, Union
+from itertools import islice
+from collections import OrderedDict
+
+from ..rule import Rule, SimpleRule
+
+logger = structlog.get_logger("engine2")
+
+
+# Backreferences, conditional groups and recursive patterns refer to groups,
+# and so can't be moved into a larger expression. Candidate expressions are
+# also combined using the regex module, which reads nested sets differently
+# from the re module used by RegexRule, so those are left alone too. (This
+# also catches some harmless expressions, like an escaped backslash followed
+# by a digit, but being overly cautious here only costs performance)
+_uncombinable = re.compile(
+        r"\\[1-9]|\\g<|\(\?P=|\(\?\(|\(\?(?:[0-9R&]|P>)|\[\[")
+
+
+def _usable_expression(head: SimpleRule) -> Optional[str]:
+    """Returns the candidate expression of the given SimpleRule, or None if it
+    doesn't have one that can safely be combined with others."""
+    expression = head.candidate_expression
+    if expression is None or _uncombinable.search(expression):
+        return None
+    try:
+        # (Unlike the re module, the regex module limits the effect of inline
+        # flags to the group that contains them)
+        regex.compile(f"(?:{expression})")
+    except regex.error:
+        return None
+    return expression
+
+
+def _make_candidate_scan(heads: list[SimpleRule]):
+    """Combines the candidate expressions of the given SimpleRules, all of
+    which operate on the same representation, into a single compiled regular
+    expression. Returns that expression and a dictionary mapping each SimpleRule
+    that it covers to the name of the group that reports its candidates, or
+    None if the combined scan wouldn't be worth making.
+
+    The combined expression only matches (the empty string) at the places
+    where at least one of the candidate expressions does. Each candidate
+    expression is tried there in a lookahead of its own, so every SimpleRule
+    learns of its candidates at that place even if they overlap with those of
+    another."""
+    groups = {}
+    for head in heads:
+        if (expression := _usable_expression(head)) is not None:
+            groups[head] = (f"_candidate{len(groups)}", expression)
+
+    # Scanning the content just to guide one SimpleRule would be a waste of
+    # time
+    if len(groups) < 2:
+        return None
+
+    guard = "|".join(f"(?:{e})" for _, e in groups.values())
+    captures = "".join(
+            f"(?:(?=(?P<{name}>{e})))?" for name, e in groups.values())
+    try:
+        expression = regex.compile(f"(?={guard}){captures}")
+    except regex.error:
+        # Candidate expressions can conflict with each other
+        logger.debug("couldn't combine candidate expressions", exc_info=True)
+        return None
+    return expression, {head: name for head, (name, _) in groups.items()}
+
+
+class EvaluationPlan:
+    """An EvaluationPlan is a Rule that has been compiled for repeated
+    evaluation.
+
+    Compiling a Rule splits it and all of its continuations ahead of time, so
+    evaluating it is just a matter of walking a decision graph. It also
+    combines the candidate expressions of the SimpleRules that operate on the
+    same representation into a single regular expression: when a
+    representation is first needed, one scan with that expression finds the
+    candidates of all of those SimpleRules. A SimpleRule with no candidates
+    can't match, and so isn't run at all; the others are given their
+    candidates, so that they only need to look at those places.
+
+    Evaluating an EvaluationPlan gives exactly the same results as calling
+    Rule.try_match on the Rule it was compiled from: the same SimpleRules are
+    reported in the same order, and short-circuiting works in the same way."""
+
+    def __init__(self, rule: Rule):
+        self._rule = rule
+        self._steps = {}
+        self._heads = []
+
+        heads = OrderedDict()
+        pending = [rule]
+        while pending:
+            here = pending.pop()
+            if isinstance(here, bool) or here in self._steps:
+                continue
+            head, pve, nve = self._steps[here] = here.split()
+            heads.setdefault(head, None)
+            pending.extend((nve, pve))
+
+        self._heads = list(heads)
+
+        by_type = {}
+        for head in heads:
+            by_type.setdefault(head.operates_on, []).append(head)
+        self._scans = {}
+        for output_type, type_heads in by_type.items():
+            if (scan := _make_candidate_scan(type_heads)):
+                self._scans[output_type] = scan
+
+    @property
+    def rule(self) -> Rule:
+        """Returns the Rule that this EvaluationPlan was compiled from."""
+        return self._rule
+
+    @property
+    def heads(self) -> list[SimpleRule]:
+        """Returns all of the SimpleRules that evaluating this EvaluationPlan
+        might execute."""
+        return self._heads
+
+    def _candidates(
+            self, head: SimpleRule, content, scanned: dict) -> Optional[list]:
+        """Returns the spans of the given SimpleRule's candidates in the given
+        content, or None if the combined scan doesn't cover that SimpleRule.
+        (The combined scan of a representation happens only once, when one of
+        the SimpleRules that it covers first needs it.)"""
+        output_type = head.operates_on
+        if output_type not in self._scans or not isinstance(content, str):
+            return None
+        expression, names = self._scans[output_type]
+        if head not in names:
+            return None
+
+        if output_type not in scanned:
+            found = scanned[output_type] = {name: [] for name in names.values()}
+            for match in expression.finditer(content):
+                for name, spans in found.items():
+                    if (span := match.span(name))[0] != -1:
+                        spans.append(span)
+        return scanned[output_type][names[head]]
+
+    def try_match(
+            self,
+            get_representation: Union[Callable[[str], Optional[Any]], dict],
+            *, obj_limit=None):
+        """As Rule.try_match."""
+        if isinstance(get_representation, dict):
+            get_representation = get_representation.__getitem__
+
+        here = self._rule
+        matches = {}
+        scanned = {}
+        while not isinstance(here, bool):
+            head, pve, nve = self._steps[here]
+            try:
+                required_form = get_representation(head.operates_on.value)
+            except KeyError:
+                # Our helper callback can't produce the data we need. Stop
+                # evaluating rules and return what we have to the caller
+                break
+            if head not in matches:
+                spans = self._candidates(head, required_form, scanned)
+                if spans is None:
+                    found = head.match(required_form)
+                elif spans:
+                    found = head.match_candidates(required_form, spans)
+                else:
+                    # This SimpleRule can't match anything here
+                    found = ()
+                matches[head] = list(islice(found, obj_limit))
+            here = pve if matches[head] else nve
+        return (here, list(matches.items()))
+
+
+_plans = OrderedDict()
+_PLAN_CACHE_SIZE = 64
+
+
+def compile_rule(rule: Rule) -> EvaluationPlan:
+    """Returns an EvaluationPlan for the given Rule, reusing a previously
+    compiled one if possible.
+
+    Plans are cached by the identity of their Rule rather than by its value,
+    as some Rules compare equal even though their settings differ. (Rules
+    read from messages still share plans, as Rule.from_json_object returns the
+    same Rule object for the same JSON form.)"""
+    # (A cached plan keeps its Rule alive, so the Rule's id can't be reused
+    # while the plan is in the cache)
+    key = id(rule)
+    if key in _plans:
+        _plans.move_to_end(key)
+        return _plans[key]
+
+    plan = _plans[key] = EvaluationPlan(rule)
+    if len(_plans) > _PLAN_CACHE_SIZE:
+        _plans.popitem(last=False)
+    return plan
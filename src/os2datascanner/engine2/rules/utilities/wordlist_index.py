@@ -0,0 +1,126 @@
+import re
+from typing import Iterable, Iterator, Optional
+from functools import cached_property
+
+
+_token = re.compile(r"\w+")
+
+
+def _make_trie(words: Iterable[str]) -> dict:
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        # The empty string marks the end of an entry
+        node[""] = {}
+    return trie
+
+
+def _trie_to_expression(node: dict) -> str:
+    terminal = "" in node
+    branches = [
+            # Entries that consist of several words should match regardless of
+            # the kind and amount of whitespace separating those words
+            (r"\s+" if char.isspace() else re.escape(char))
+            + _trie_to_expression(child)
+            for char, child in node.items() if char]
+
+    if not branches:
+        return ""
+    elif len(branches) == 1:
+        expression = branches[0]
+        grouped = f"(?:{expression})" if len(expression) > 1 else expression
+    else:
+        grouped = "(?:" + "|".join(branches) + ")"
+    # Always prefer the longest entry: if the content continues with a longer
+    # entry, then try that first, and fall back to the shorter one otherwise
+    return grouped + "?" if terminal else grouped
+
+
+def make_trie_expression(words: Iterable[str]) -> str:
+    """Returns a regular expression that matches, case-insensitively, any of
+    the given entries. Entries that share a prefix share the corresponding part
+    of the expression, so the regular expression engine walks a prefix tree of
+    all of the entries rather than trying them one after another."""
+    trie = _make_trie(words)
+    if not trie:
+        # An expression that can never match
+        return r"(?!)"
+    return f"(?i:{_trie_to_expression(trie)})"
+
+
+class WordlistIndex:
+    """A WordlistIndex finds the entries of a wordlist in a piece of text.
+
+    Entries are matched without regard to case, and only as whole words: the
+    entry "lever" will match "Lever" and "LEVER", but not the first part of
+    "leverbetændelse". Entries can also consist of several words separated by
+    whitespace or punctuation, in which case any amount of whitespace can
+    appear between the words in the text. Where several entries would match at
+    the same point, the longest one wins, and matches never overlap.
+
+    The text is split into words by the regular expression engine, and each
+    word is looked up in a set of the entries. Only if a word starts a longer
+    entry is the text that follows it examined further."""
+
+    def __init__(self, words: Iterable[str]):
+        self._entries = set()
+        single = set()
+        tails = {}
+        for word in words:
+            word = " ".join(word.lower().split())
+            head = _token.match(word)
+            if not head:
+                # This entry doesn't start with a word, so it can never be
+                # found
+                continue
+            self._entries.add(word)
+            if head.end() == len(word):
+                single.add(word)
+            else:
+                tails.setdefault(head.group(), set()).add(word[head.end():])
+
+        self._words = frozenset(single)
+        self._tails = {
+                head: re.compile(make_trie_expression(rest) + r"(?!\w)")
+                for head, rest in tails.items()}
+
+    @cached_property
+    def expression(self) -> str:
+        """Returns a regular expression that matches the entries found by this
+        index. (This expression is self-contained: it sets its own flags,
+        and so can be safely combined with others.)"""
+        return rf"(?<!\w){make_trie_expression(self._entries)}(?!\w)"
+
+    def _words_at(self, content: str, positions: Iterable[int]):
+        for position in positions:
+            if (m := _token.match(content, position)):
+                yield m
+
+    def finditer(
+            self, content: str,
+            positions: Optional[Iterable[int]] = None
+            ) -> Iterator[tuple[int, int]]:
+        """Yields the span of every occurrence of an entry in the given
+        content. If the positions at which entries might begin are already
+        known (from a scan with this index's expression, for example),
+        then only the words at those positions are examined."""
+        words, tails = self._words, self._tails
+        last_end = 0
+        for m in (_token.finditer(content) if positions is None
+                  else self._words_at(content, positions)):
+            begin, end = m.span()
+            if begin < last_end:
+                # This word is part of an entry we've already found
+                continue
+            lowered = m.group().lower()
+            if lowered in tails:
+                tail = tails[lowered].match(content, end)
+                if tail:
+                    last_end = tail.end()
+                    yield (begin, last_end)
+                    continue
+            if lowered in words:
+                last_end = end
+                yield (begin, end)
@@ -1,10 +1,10 @@
-import re
-
 from typing import Iterator, Optional
+from functools import cache
 
 from ..conversions.types import OutputType
 from .rule import Rule, SimpleRule, Sensitivity
 from .datasets.loader import common as common_loader
+from .utilities.wordlist_index import WordlistIndex
 from .utilities.properties import RulePrecedence, RuleProperties
 
 
@@ -28,6 +28,14 @@ def load_words(dataset):
     yield from _flatten(loaded)
 
 
+@cache
+def get_wordlist_index(dataset) -> WordlistIndex:
+    """Returns a WordlistIndex for a dataset. Building an index is
+    relatively expensive, so each one is built only once per process and is
+    shared between all of the rules that use that dataset."""
+    return WordlistIndex(load_words(dataset))
+
+
 class OrderedWordlistRule(SimpleRule):
     """
     A OrderedWordlistRule finds matches for a single list of words.
@@ -35,7 +43,8 @@ class OrderedWordlistRule(SimpleRule):
     As of #57536 this now works on a simple flat list of words
     instead of using lists of lists of words.
 
-    Matches are not case-sensitive.
+    Matches are not case-sensitive. Entries in the list can consist of several
+    words, in which case they match those words separated by any whitespace.
     """
     operates_on = OutputType.Text
     type_label = "ordered-wordlist"
@@ -47,30 +56,36 @@ class OrderedWordlistRule(SimpleRule):
     def __init__(self, dataset: str, **super_kwargs):
         super().__init__(**super_kwargs)
         self._dataset = dataset
-        self._wordlists = frozenset(load_words(dataset))
-        self._compiled_expr = re.compile(r"\w+", re.IGNORECASE | re.DOTALL)
+        self._index = get_wordlist_index(dataset)
 
     @property
     def presentation_raw(self) -> str:
         return f"lists of words from dataset {self._dataset}"
 
-    def match(self, content: str) -> Optional[Iterator[dict]]:  # noqa
+    @property
+    def candidate_expression(self) -> str:
+        return self._index.expression
+
+    def match(self, content: str) -> Optional[Iterator[dict]]:
+        return self._match(content)
+
+    def match_candidates(self, content: str, spans) -> Iterator[dict]:
+        return self._match(content, spans)
 
+    def _match(self, content: str, spans=None) -> Iterator[dict]:
         if content is None:
             return
 
-        for m in self._compiled_expr.finditer(content):
-            lowered = str(m.group()).lower()
-            if lowered in self._wordlists:
-                begin, end = m.span()
-                context_begin = max(begin - 50, 0)
-                context_end = min(end + 50, len(content))
-                yield {
-                    "match": m.group(),
-                    "offset": begin,
-                    "context": content[context_begin:context_end],
-                    "context_offset": min(begin, 50)
-                }
+        for begin, end in self._index.finditer(
+                content, (begin for begin, _ in spans) if spans else None):
+            context_begin = max(begin - 50, 0)
+            context_end = min(end + 50, len(content))
+            yield {
+                "match": content[begin:end],
+                "offset": begin,
+                "context": content[context_begin:context_end],
+                "context_offset": min(begin, 50)
+            }
 
     def to_json_object(self) -> dict:
         return dict(**super().to_json_object(), dataset=self._dataset)
@@ -0,0 +1,95 @@
+"""Benchmarking for the encoding of pipeline messages.
+
+Each benchmark encodes and decodes one kind of message; the size of the
+encoded message is recorded in the benchmark's extra_info."""
+import random
+import pytest
+
+from os2datascanner.engine2.model.file import (
+        FilesystemSource, FilesystemHandle)
+from os2datascanner.engine2.rules.regex import RegexRule
+from os2datascanner.engine2.rules.cpr import CPRRule
+from os2datascanner.engine2.pipeline import messages
+from os2datascanner.engine2.pipeline.utilities import codec
+
+
+def _make_text(words: int) -> str:
+    rng = random.Random(1234)
+    vocabulary = [
+            "kommune", "borger", "sagsnummer", "ansøgning", "bevilling",
+            "afgørelse", "journal", "Ærø", "København", "jf.", "§", "2024"]
+    return " ".join(rng.choice(vocabulary) for _ in range(words))
+
+
+def _make_messages():
+    source = FilesystemSource("/mnt/share")
+    handle = FilesystemHandle(source, "Sager/2024/ansøgning-0042.docx")
+    rule = CPRRule()
+    scan_tag = messages.ScanTagFragment.make_dummy()
+    progress = messages.ProgressFragment(rule=rule, matches=[])
+    scan_spec = messages.ScanSpecMessage(
+            scan_tag=scan_tag, source=source, rule=rule,
+            configuration={"skip_mime_types": ["image/*"]},
+            filter_rule=RegexRule("[Aa]nsøgning"), progress=None)
+    matches = [
+        {
+            "match": "1111XXXXXX",
+            "offset": offset,
+            "context": _make_text(20),
+            "context_offset": 50,
+            "sensitivity": 750,
+            "probability": 1.0
+        } for offset in range(0, 5000, 100)]
+
+    return {
+        "scan_spec": scan_spec,
+        "conversion": messages.ConversionMessage(
+                scan_spec=scan_spec, handle=handle, progress=progress),
+        "representation": messages.RepresentationMessage(
+                scan_spec=scan_spec, handle=handle, progress=progress,
+                representations={"text": _make_text(50000)}),
+        "handle": messages.HandleMessage(scan_tag=scan_tag, handle=handle),
+        "metadata": messages.MetadataMessage(
+                scan_tag=scan_tag, handle=handle,
+                metadata={"last-modified": "2024-06-01T12:00:00+02:00",
+                          "filesystem-owner-sid": "S-1-5-21-1004"}),
+        "matches": messages.MatchesMessage(
+                scan_spec=scan_spec, handle=handle, matched=True,
+                matches=[messages.MatchFragment(rule=rule, matches=matches)]),
+        "problem": messages.ProblemMessage(
+                scan_tag=scan_tag, source=None, handle=handle,
+                message="Exploration error: access denied"),
+        "status": messages.StatusMessage(
+                scan_tag=scan_tag, object_size=123456,
+                object_type="application/msword", matches_found=50),
+        "command": messages.CommandMessage(abort=scan_tag),
+    }
+
+
+MESSAGES = {k: v.to_json_object() for k, v in _make_messages().items()}
+
+POLICIES = {
+    "json": codec.Policy(codec.JSON, None),
+    "json+gzip": codec.Policy(codec.JSON, "gzip"),
+    "json+zstd": codec.Policy(codec.JSON, "zstd"),
+    "msgpack": codec.Policy(codec.MSGPACK, None),
+    "msgpack+zstd": codec.Policy(codec.MSGPACK, "zstd"),
+}
+
+
+def _round_trip(mc, obj):
+    body, properties = mc.encode("queue", obj, {})
+    codec.loads(
+            codec.decompress(body, properties["content_encoding"]),
+            properties["content_type"])
+    return body
+
+
+@pytest.mark.parametrize("policy", POLICIES.keys())
+@pytest.mark.parametrize("message", MESSAGES.keys())
+def test_benchmark_codec(benchmark, message, policy):
+    """Test how long it takes to encode and decode a message, and how big the
+    encoded message is."""
+    mc = codec.MessageCodec(**POLICIES[policy]._asdict())
+    body = benchmark(_round_trip, mc, MESSAGES[message])
+    benchmark.extra_info["bytes"] = len(body)
@@ -0,0 +1,31 @@
+"""Benchmarking for LibreOffice conversions."""
+import os.path
+from tempfile import TemporaryDirectory
+
+from os2datascanner.engine2.model.derived.libreoffice import libreoffice
+from os2datascanner.engine2.model.derived.utilities.libreoffice_pool import (
+        LibreOfficePool)
+
+TEST_DOCUMENT = os.path.join(
+        os.path.dirname(__file__), "..", "data", "msoffice", "test.docx")
+
+
+def _convert(run):
+    with TemporaryDirectory() as outputdir:
+        run("--convert-to", "html", "--outdir", outputdir, TEST_DOCUMENT)
+
+
+def test_benchmark_libreoffice_cold_start(benchmark):
+    """Test performance when starting LibreOffice for every conversion."""
+    benchmark(_convert, libreoffice)
+
+
+def test_benchmark_libreoffice_pool(benchmark):
+    """Test performance when converting with a warm LibreOffice process."""
+    pool = LibreOfficePool(1, recycle_after=1000, startup_timeout=30)
+    try:
+        # Start the background process before we start measuring
+        _convert(pool.run)
+        benchmark(_convert, pool.run)
+    finally:
+        pool.shutdown()
@@ -0,0 +1,41 @@
+"""Benchmarking for the AMQP background thread."""
+import pytest
+
+from ..test_pika import FakePipelineThread
+
+
+MESSAGE_COUNT = 1000
+
+
+@pytest.fixture
+def pipeline_thread():
+    ppt = FakePipelineThread(read={"input"}, write={"output"})
+    ppt.start()
+    ppt.synchronise(timeout=5)
+    try:
+        yield ppt
+    finally:
+        ppt.enqueue_stop()
+        ppt.join()
+
+
+def _handle(ppt, count):
+    """Delivers some messages to the background thread, handles them in the
+    way that a pipeline stage would, and waits for the background thread to
+    catch up."""
+    for _ in range(count):
+        ppt.fake_connection.deliver("input", b"{}")
+    for _ in range(count):
+        method, _, body = ppt.await_message(timeout=5)
+        ppt._dispatch_message(method, [("output", body)])
+    ppt.synchronise(timeout=5)
+
+
+def test_benchmark_pika_latency(benchmark, pipeline_thread):
+    """Test how long it takes a single message to get through a stage."""
+    benchmark(_handle, pipeline_thread, 1)
+
+
+def test_benchmark_pika_throughput(benchmark, pipeline_thread):
+    """Test how long it takes a burst of messages to get through a stage."""
+    benchmark(_handle, pipeline_thread, MESSAGE_COUNT)
@@ -0,0 +1,42 @@
+"""Benchmarking for the sharding of the collectors' queues.
+
+Each benchmark routes a batch of result messages about different objects; the
+number of messages that went to the busiest shard, relative to a perfectly
+even split, is recorded in the benchmark's extra_info."""
+import pytest
+from collections import Counter
+
+from os2datascanner.engine2.model.smb import SMBSource, SMBHandle
+from os2datascanner.engine2.pipeline import messages
+from os2datascanner.engine2.pipeline.utilities.sharding import ShardRouter
+
+
+MESSAGE_COUNT = 1000
+
+
+def _make_results(count):
+    scan_tag = messages.ScanTagFragment.make_dummy()
+    source = SMBSource("//fs01/brugere", user="af")
+    return [
+        messages.ProblemMessage(
+                scan_tag=scan_tag, source=None,
+                handle=SMBHandle(source, f"Sager/{k // 100}/{k}.docx"),
+                message="Not ready").to_json_object()
+        for k in range(count)]
+
+
+RESULTS = _make_results(MESSAGE_COUNT)
+
+
+def _route(router, bodies):
+    return Counter(router.route("os2ds_results", body) for body in bodies)
+
+
+@pytest.mark.parametrize("shards", [1, 4, 16])
+def test_benchmark_sharding(benchmark, shards):
+    """Test how long it takes to pick shards for a batch of messages, and how
+    evenly they're spread out."""
+    router = ShardRouter({"os2ds_results": shards})
+    counts = benchmark(_route, router, RESULTS)
+    benchmark.extra_info["imbalance"] = (
+            max(counts.values()) / (MESSAGE_COUNT / shards))
@@ -0,0 +1,109 @@
+import gzip
+import json
+import unittest
+
+from ..pipeline.utilities import codec
+
+
+example = {
+    "scan_tag": {"time": "2024-06-01T12:00:00+02:00", "user": None},
+    "matches": [{"match": "1111XXXXXX", "offset": 3, "context": "æøå"}],
+    "matched": True,
+    "size": 2 ** 40,
+}
+
+
+class CodecTests(unittest.TestCase):
+    def test_default_policy(self):
+        """The default policy produces gzipped JSON that older stages can
+        read."""
+        body, properties = codec.MessageCodec().encode(
+                "os2ds_matches", example, {"delivery_mode": 2})
+
+        self.assertEqual(
+                properties,
+                {
+                    "delivery_mode": 2,
+                    "content_type": codec.JSON,
+                    "content_encoding": "gzip"
+                })
+        self.assertEqual(
+                json.loads(gzip.decompress(body)),
+                example)
+
+    def test_unlabelled(self):
+        """Messages without a content type are treated as JSON."""
+        self.assertEqual(
+                codec.loads(json.dumps(example).encode()),
+                example)
+        self.assertIsNone(
+                codec.loads(b"\xff not JSON"))
+
+    def test_explicit_properties(self):
+        """Explicitly specified properties override the policy."""
+        body, properties = codec.MessageCodec().encode(
+                "os2ds_matches", example, {"content_encoding": None})
+
+        self.assertIsNone(
+                properties["content_encoding"])
+        self.assertEqual(
+                codec.loads(body, properties["content_type"]),
+                example)
+
+    def test_threshold(self):
+        """Messages below a queue's threshold aren't compressed."""
+        mc = codec.MessageCodec(
+                queues={"os2ds_status": {"threshold": 4096}})
+
+        _, small = mc.encode("os2ds_status", example, {})
+        _, other = mc.encode("os2ds_matches", example, {})
+        self.assertIsNone(
+                small["content_encoding"])
+        self.assertEqual(
+                other["content_encoding"],
+                "gzip")
+
+    def test_unknown_policy(self):
+        """Policies that name unknown formats are rejected."""
+        with self.assertRaises(ValueError):
+            codec.MessageCodec(content_encoding="lzma")
+        with self.assertRaises(ValueError):
+            codec.MessageCodec(content_type="text/xml")
+
+    @unittest.skipUnless(
+            codec.msgpack and codec.zstandard,
+            "msgpack and zstandard are needed for this test")
+    def test_round_trip(self):
+        """Messages survive every supported encoding."""
+        for content_type in (codec.JSON, codec.MSGPACK,):
+            for content_encoding in (None, "gzip", "zstd",):
+                with self.subTest(content_type, enc=content_encoding):
+                    body, properties = codec.MessageCodec(
+                            content_type=content_type,
+                            content_encoding=content_encoding).encode(
+                                    "os2ds_matches", example, {})
+
+                    self.assertEqual(
+                            properties["content_type"],
+                            content_type)
+                    self.assertEqual(
+                            codec.loads(
+                                    codec.decompress(
+                                            body,
+                                            properties["content_encoding"]),
+                                    properties["content_type"]),
+                            example)
+
+    @unittest.skipUnless(
+            codec.msgpack, "msgpack is needed for this test")
+    def test_msgpack_fallback(self):
+        """Objects that msgpack can't represent are sent as JSON instead."""
+        body, content_type = codec.dumps(
+                {"huge": 2 ** 70}, codec.MSGPACK)
+
+        self.assertEqual(
+                content_type,
+                codec.JSON)
+        self.assertEqual(
+                codec.loads(body, content_type),
+                {"huge": 2 ** 70})
@@ -1,6 +1,7 @@
 import unittest
+from unittest.mock import patch
 
-from os2datascanner.engine2.rules.cpr import CPRRule
+from os2datascanner.engine2.rules.cpr import CPRRule, calculator
 
 
 content = """
@@ -246,3 +247,14 @@ class RuleTests(unittest.TestCase):
                                           f"test of {description} failed")
                 else:
                     self.assertFalse(list(matches))
+
+    def test_cpr_checked_once(self):
+        repeated = "\n".join(["CPR: 111111-1118"] * 10)
+        with patch.object(
+                calculator, "cpr_check",
+                wraps=calculator.cpr_check) as cpr_check:
+            matches = list(CPRRule().match(repeated))
+        self.assertEqual(len(matches), 10)
+        # Each distinct number should be checked exactly once, no matter how
+        # many times it appears
+        self.assertEqual(cpr_check.call_count, 1)
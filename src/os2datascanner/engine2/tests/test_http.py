@@ -4,6 +4,8 @@ import http.server
 import unittest
 import contextlib
 import time
+import requests
+import threading
 from random import choice
 from datetime import datetime
 from multiprocessing import Manager, Process
@@ -18,6 +20,8 @@ from os2datascanner.engine2.model.http import (
         WebHandle, WebSource, try_make_relative)
 from os2datascanner.engine2.model.utilities.crawler import (
         parse_html, make_outlinks)
+from os2datascanner.engine2.model.utilities.async_crawler import (
+        AsyncWebCrawler)
 from os2datascanner.engine2.model.utilities.sitemap import (
     process_sitemap_url, _get_url_data)
 from os2datascanner.engine2.conversions.types import Link, OutputType
@@ -462,24 +466,28 @@ def run_web_server(started):
 class Engine2HTTPSetup():
     @classmethod
     def setUpClass(cls):
-        with Manager() as manager:
-            started = manager.Condition()
-            started.acquire()
-            try:
-                cls._ws = Process(target=run_web_server, args=(started,))
-                cls._ws.start()
-
-                # Wait for the web server to check in and notify us that it's
-                # ready to be used
-                started.wait()
-            finally:
-                started.release()
+        # The web server releases the condition variable after notifying us,
+        # so the manager process must outlive this method
+        cls._manager = Manager()
+        started = cls._manager.Condition()
+        started.acquire()
+        try:
+            cls._ws = Process(target=run_web_server, args=(started,))
+            cls._ws.start()
+
+            # Wait for the web server to check in and notify us that it's
+            # ready to be used
+            started.wait()
+        finally:
+            started.release()
 
     @classmethod
     def tearDownClass(cls):
         cls._ws.terminate()
         cls._ws.join()
         cls._ws = None
+        cls._manager.shutdown()
+        cls._manager = None
 
 
 class Engine2HTTPExplorationTest(Engine2HTTPSetup, unittest.TestCase):
@@ -672,6 +680,83 @@ class Engine2HTTPExplorationTest(Engine2HTTPSetup, unittest.TestCase):
             "links identical but for their anchors should be unified")
 
 
+class Engine2HTTPAsyncExplorationTest(Engine2HTTPExplorationTest):
+    "Repeat the exploration tests with the asynchronous crawler"
+
+    def setUp(self):
+        for patcher in (
+                mock.patch(
+                        "os2datascanner.engine2.model.http.CONCURRENCY", 4),
+                mock.patch.dict(engine2_settings.model["http"], limit=0),):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_retry_after(self):
+        """The asynchronous crawler waits for as long as the server asks it to
+        before trying again."""
+        def _response(status_code, **headers):
+            response = requests.Response()
+            response.status_code = status_code
+            response.url = "https://example.invalid/"
+            response.headers.update(headers)
+            return response
+
+        session = mock.Mock()
+        session.head.side_effect = [
+                _response(429, **{"Retry-After": "1"}),
+                _response(200, **{"Content-Type": "image/png"})]
+
+        wc = AsyncWebCrawler(
+                "https://example.invalid/", session, rate=0,
+                session_factory=lambda: session)
+        wc.add("https://example.invalid/")
+
+        start = time.monotonic()
+        results = list(wc.visit())
+        self.assertGreaterEqual(
+                time.monotonic() - start, 1,
+                "Retry-After header not respected")
+        self.assertEqual(
+                [url for _, url in results],
+                ["https://example.invalid/"])
+        self.assertEqual(session.head.call_count, 2)
+
+    def test_session_per_thread(self):
+        """Each of the asynchronous crawler's worker threads uses a session of
+        its own."""
+        threads = {}
+
+        def _session():
+            session = mock.Mock()
+
+            def _head(url, **kwargs):
+                threads.setdefault(threading.get_ident(), set()).add(
+                        id(session))
+                time.sleep(0.1)
+                response = requests.Response()
+                response.status_code = 200
+                response.url = url
+                response.headers["Content-Type"] = "image/png"
+                return response
+            session.head.side_effect = _head
+            return session
+
+        wc = AsyncWebCrawler(
+                "https://example.invalid/", mock.Mock(), rate=0,
+                concurrency=4, session_factory=_session)
+        for i in range(8):
+            wc.add(f"https://example.invalid/{i}.png")
+
+        self.assertEqual(len(list(wc.visit())), 8)
+        self.assertGreater(len(threads), 1)
+        self.assertTrue(
+                all(len(sessions) == 1 for sessions in threads.values()),
+                "a worker thread used more than one session")
+        self.assertEqual(
+                len(set().union(*threads.values())), len(threads),
+                "worker threads shared a session")
+
+
 class Engine2HTTPSitemapTest(Engine2HTTPSetup, unittest.TestCase):
     def test_sitemap_lm(self):
         "Get LastModified from secret_sitemap.xml"
@@ -957,7 +1042,9 @@ class Engine2HTTPResourceTest(Engine2HTTPSetup, unittest.TestCase):
             first_thing = None
             with contextlib.closing(site["source"].handles(sm)) as handles:
                 first_thing = next(handles)
-            r = first_thing.follow(sm)
+            # Make sure that the resource has to go to the server for its
+            # metadata
+            r = first_thing.clear_hints().follow(sm)
 
             now = time_now()
 
@@ -977,6 +1064,30 @@ class Engine2HTTPResourceTest(Engine2HTTPSetup, unittest.TestCase):
                     now,
                     "{0}: Last-Modified not fresh".format(first_thing))
 
+    def test_content_hints(self):
+        """Pages downloaded by the crawler are attached to their Handles, and
+        their resources don't download them again."""
+        with SourceManager() as sm:
+            with contextlib.closing(site["source"].handles(sm)) as handles:
+                first_thing = next(handles)
+            self.assertIsNotNone(
+                    first_thing.hint("content"),
+                    "{0}: content not attached".format(first_thing))
+
+            with open(os.path.join(test_data_path, "index.html"), "rb") as fp:
+                expected = fp.read()
+
+            with mock.patch(
+                    "requests.Session.send",
+                    side_effect=AssertionError("unexpected request")):
+                r = first_thing.follow(sm)
+                self.assertTrue(r.check())
+                self.assertEqual(r.compute_type(), "text/html")
+                self.assertEqual(r.get_size(), len(expected))
+                self.assertIsInstance(r.get_last_modified(), datetime)
+                with r.make_stream() as fp:
+                    self.assertEqual(fp.read(), expected)
+
     def test_mixed_links_resource(self):
         "site mixed with external-, unresponsive- and non-http links"
 
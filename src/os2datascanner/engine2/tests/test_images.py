@@ -1,10 +1,14 @@
 import os.path
 import unittest
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+from PIL import Image
 
 from os2datascanner.engine2.model.core import SourceManager
 from os2datascanner.engine2.model.file import FilesystemSource
 from os2datascanner.engine2.conversions import convert
 from os2datascanner.engine2.conversions.types import OutputType
+from os2datascanner.engine2.conversions.text import ocr
 
 here_path = os.path.dirname(__file__)
 test_data_path = os.path.join(here_path, "data", "ocr")
@@ -46,3 +50,30 @@ class TestEngine2Images(unittest.TestCase):
                         size,
                         expected_size,
                         "{0}: size failed")
+
+    def test_tiny_images_skipped(self):
+        with TemporaryDirectory() as tmpdir:
+            Image.new("RGB", (4, 4)).save(os.path.join(tmpdir, "tiny.png"))
+            fs = FilesystemSource(tmpdir)
+            with SourceManager() as sm, patch.object(
+                    ocr, "tesseract") as tesseract:
+                for h in fs.handles(sm):
+                    self.assertEqual(
+                            convert(h.follow(sm), OutputType.Text),
+                            "",
+                            "{0}: tiny image not skipped".format(h))
+            tesseract.assert_not_called()
+
+    def test_intermediate_conversion(self):
+        fs = FilesystemSource(os.path.join(test_data_path, "good"))
+        with SourceManager() as sm, patch.object(
+                ocr, "tesseract", return_value=expected_result), patch.object(
+                ocr, "run_custom") as run_custom:
+            for h in fs.handles(sm):
+                if h.relative_path.endswith(".gif"):
+                    self.assertEqual(
+                            convert(h.follow(sm), OutputType.Text),
+                            expected_result,
+                            "{0}: content failed".format(h))
+        # Pillow can read this image, so ImageMagick shouldn't have been needed
+        run_custom.assert_not_called()
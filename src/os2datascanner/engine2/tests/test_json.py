@@ -9,7 +9,8 @@ from os2datascanner.engine2.model.file import (
         FilesystemSource, FilesystemHandle)
 from os2datascanner.engine2.model.http import WebSource, WebHandle
 from os2datascanner.engine2.model.smb import SMBSource, SMBHandle
-from os2datascanner.engine2.model.smbc import SMBCSource, SMBCHandle
+from os2datascanner.engine2.model.smbc import (
+        SMBCSource, SMBCHandle, SMBCFolderHandle)
 from os2datascanner.engine2.model.msgraph.mail import (
         MSGraphMailSource, MSGraphMailAccountHandle,
         MSGraphMailAccountSource, MSGraphMailMessageHandle)
@@ -26,6 +27,10 @@ from os2datascanner.engine2.model.derived.pdf import (
         PDFSource, PDFPageHandle, PDFPageSource, PDFObjectHandle)
 from os2datascanner.engine2.model.derived.tar import TarSource, TarHandle
 from os2datascanner.engine2.model.derived.zip import ZipSource, ZipHandle
+from os2datascanner.engine2.rules.rule import Rule
+from os2datascanner.engine2.rules.cpr import CPRRule
+from os2datascanner.engine2.rules.regex import RegexRule
+from os2datascanner.engine2.rules.logical import OrRule
 
 example_handles = [
     FilesystemHandle(
@@ -52,6 +57,13 @@ example_handles = [
                     "//SERVER/Resource",
                     "username", "topsecret", "WORKGROUP8"),
             "~ocument.docx"),
+    SMBCFolderHandle(
+            SMBCSource(
+                    "//SERVER/Homes",
+                    "username", "topsecret", "WORKGROUP8",
+                    unc_is_home_root=True, split_top_level=True),
+            "user1",
+            hints={"owner_sid": "S-1-5-21-0-0-0-1001"}),
     ZipHandle(
             ZipSource(
                     SMBCHandle(
@@ -188,3 +200,26 @@ class JSONTests(unittest.TestCase):
             @Handle.json_handler("file")
             def handle_json(j):  # noqa
                 pass
+
+    def test_json_cache(self):
+        rule = OrRule(RegexRule("Hello"), CPRRule(modulus_11=True))
+        self.assertIs(
+                Rule.from_json_object(rule.to_json_object()),
+                Rule.from_json_object(rule.to_json_object()),
+                "identical Rules were built twice")
+
+        source = FilesystemSource("/usr/share/common-licenses")
+        self.assertIs(
+                Source.from_json_object(source.to_json_object()),
+                Source.from_json_object(source.to_json_object()),
+                "identical Sources were built twice")
+
+        # Derived Sources contain Handles, whose hints can change, so they
+        # should never be shared
+        derived = ZipSource(FilesystemHandle(source, "archive.zip"))
+        first = Source.from_json_object(derived.to_json_object())
+        second = Source.from_json_object(derived.to_json_object())
+        self.assertEqual(first, second)
+        self.assertIsNot(
+                first.handle, second.handle,
+                "derived Sources share a Handle")
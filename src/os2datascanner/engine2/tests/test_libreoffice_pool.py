@@ -0,0 +1,45 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from os2datascanner.engine2.model.derived.libreoffice import libreoffice
+from os2datascanner.engine2.model.derived.utilities.libreoffice_pool import (
+        LibreOfficePool)
+
+
+here_path = os.path.dirname(__file__)
+test_document = os.path.join(here_path, "data", "msoffice", "test.docx")
+
+
+def convert(run):
+    with TemporaryDirectory() as outputdir:
+        run("--convert-to", "html", "--outdir", outputdir, test_document)
+        return {
+            name: os.path.getsize(os.path.join(outputdir, name)) > 0
+            for name in os.listdir(outputdir)}
+
+
+class LibreOfficePoolTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = LibreOfficePool(1, recycle_after=2, startup_timeout=30)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_same_output(self):
+        """Converting a document with a background LibreOffice process should
+        produce the same files as starting LibreOffice from scratch."""
+        self.assertEqual(
+                convert(self.pool.run),
+                convert(libreoffice))
+
+    def test_recycling(self):
+        """A background LibreOffice process should be replaced after it has
+        performed the configured number of conversions."""
+        with self.pool.server() as server:
+            convert(server.run)
+            self.assertTrue(server.healthy())
+            convert(server.run)
+            self.assertFalse(server.healthy())
+            convert(server.run)
+            self.assertTrue(server.healthy())
@@ -1,8 +1,18 @@
+import os
 from typing import NamedTuple
 import datetime
 import unittest
+from unittest import mock
+from tempfile import TemporaryDirectory
 
-from os2datascanner.engine2.pipeline import messages
+from os2datascanner.engine2 import settings as engine2_settings
+from os2datascanner.engine2.model.data import DataSource, DataHandle
+from os2datascanner.engine2.rules.regex import RegexRule
+from os2datascanner.engine2.pipeline import matcher, messages
+from os2datascanner.engine2.pipeline.utilities.blobs import (
+        get_blob_store, scan_key)
+from os2datascanner.engine2.pipeline.utilities.interning import get_spec_store
+from os2datascanner.engine2.utilities.json import InternTable
 
 
 class SampleTuple(NamedTuple):
@@ -92,3 +102,106 @@ class MessageTest(unittest.TestCase):
                             name="Vejstrand Kommune",
                             uuid=None),
                     "could not parse simple organisation scan tag")
+
+    def _make_conversion(self):
+        spec = messages.ScanSpecMessage(
+                scan_tag=messages.ScanTagFragment.make_dummy(),
+                source=DataSource(b"Hello, world", "text/plain"),
+                rule=RegexRule("world"),
+                configuration={},
+                filter_rule=None,
+                progress=None)
+        return messages.ConversionMessage(
+                scan_spec=spec,
+                handle=DataHandle(spec.source, "file"),
+                progress=messages.ProgressFragment(
+                        rule=spec.rule, matches=[]))
+
+    def test_scan_spec_decoded_once(self):
+        obj = self._make_conversion().to_json_object()
+        self.assertIn("source", obj["scan_spec"])
+
+        first = messages.ConversionMessage.from_json_object(obj)
+        second = messages.ConversionMessage.from_json_object(obj)
+        self.assertIs(
+                first.scan_spec, second.scan_spec,
+                "scan spec was decoded twice")
+
+    def test_interned_scan_spec(self):
+        conversion = self._make_conversion()
+        with (TemporaryDirectory() as d,
+                mock.patch.object(
+                        engine2_settings, "secret_value", "not a secret"),
+                mock.patch.dict(
+                        engine2_settings.pipeline["scan_specs"],
+                        intern_directory=d)):
+            obj = conversion.to_json_object()
+            self.assertEqual(
+                    set(obj["scan_spec"].keys()), {"scan_tag", "digest"},
+                    "interned scan spec was not replaced by a reference")
+
+            # Simulate another process that hasn't seen this scan spec yet
+            with mock.patch.object(messages, "_scan_specs", InternTable(4)):
+                self.assertTrue(
+                        messages.ScanSpecMessage.is_available(
+                                obj["scan_spec"]))
+                self.assertEqual(
+                        messages.ConversionMessage.from_json_object(obj),
+                        conversion,
+                        "interned scan spec could not be retrieved")
+
+            # Once the scan has been finished for long enough, its scan specs
+            # should be thrown away
+            store = get_spec_store()
+            store.finish(scan_key(obj["scan_spec"]["scan_tag"]))
+            with mock.patch.object(store, "_ttl", -1):
+                store.collect()
+            self.assertEqual(
+                    os.listdir(d), [],
+                    "interned scan spec was not deleted")
+            with mock.patch.object(messages, "_scan_specs", InternTable(4)):
+                self.assertFalse(
+                        messages.ScanSpecMessage.is_available(
+                                obj["scan_spec"]))
+
+            missing = obj["scan_spec"] | {"digest": "0" * 64}
+            self.assertFalse(
+                    messages.ScanSpecMessage.is_available(missing))
+            with self.assertRaises(KeyError):
+                messages.ScanSpecMessage.from_json_object(missing)
+
+    def test_offloaded_representations(self):
+        conversion = self._make_conversion()
+        representation = messages.RepresentationMessage(
+                conversion.scan_spec, conversion.handle, conversion.progress,
+                {"text": "Hello, world! " * 10})
+        with (TemporaryDirectory() as d,
+                mock.patch.object(
+                        engine2_settings, "secret_value", "not a secret"),
+                mock.patch.dict(
+                        engine2_settings.pipeline["blobs"],
+                        directory=d, threshold=100)):
+            obj = representation.offload().to_json_object()
+            self.assertEqual(
+                    obj["representations"], {},
+                    "large representation was not put in the blob store")
+            self.assertEqual(
+                    list(obj["blobs"].keys()), ["text"])
+
+            # The matcher should be able to read the representation back
+            results = list(matcher.message_received_raw(obj, None, None))
+            matches = messages.MatchesMessage.from_json_object(
+                    next(msg for q, msg in results if q == "os2ds_matches"))
+            self.assertTrue(
+                    matches.matched,
+                    "offloaded representation was not matched")
+
+            # Once the scan has been finished for long enough, the
+            # representation should be thrown away
+            store = get_blob_store()
+            store.finish(scan_key(obj["scan_spec"]["scan_tag"]))
+            with mock.patch.object(store, "_ttl", -1):
+                store.collect()
+            with self.assertRaises(FileNotFoundError):
+                messages.RepresentationMessage.from_json_object(
+                        obj).fetch("text")
@@ -2,10 +2,15 @@
 Unit tests for utilities for use with MS Graph.
 """
 
+import json
+import time
+import base64
 import requests
 import unittest
+from types import SimpleNamespace
 
 from os2datascanner.engine2.model.msgraph import utilities as msgu
+from os2datascanner.engine2.model.msgraph.mail import MSGraphMailSource
 from os2datascanner.engine2.model.msgraph.graphiti import (builder,
                                                            baseclasses,
                                                            exceptions,
@@ -37,6 +42,31 @@ class TestGraphUtilities(unittest.TestCase):
                 200,
                 "didn't get the expected status code")
 
+    def test_check_state(self):
+        """Idle Graph sessions are only reused if their tokens haven't
+        expired, and checking that doesn't involve any requests."""
+        def _token(expiry):
+            claims = base64.urlsafe_b64encode(
+                    json.dumps({"exp": expiry}).encode()).decode()
+            return f"header.{claims.rstrip('=')}.signature"
+
+        def _get(url, **kwargs):
+            raise AssertionError("checking a session shouldn't use it")
+
+        source = MSGraphMailSource("client", "tenant", "secret")
+        for token, usable in (
+                (_token(time.time() + 3600), True),
+                (_token(time.time() - 60), False),
+                (_token(time.time() + 10), False),
+                ("not-a-jwt", True)):
+            with self.subTest(token=token):
+                self.assertEqual(
+                        source._check_state(
+                                msgu.MSGraphSource.GraphCaller(
+                                        lambda t=token: t,
+                                        SimpleNamespace(get=_get))),
+                        usable)
+
 
 class TestMSGraphURLBuilder(unittest.TestCase):
     """
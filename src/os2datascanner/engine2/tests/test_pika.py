@@ -0,0 +1,284 @@
+import time
+import pika
+import unittest
+import threading
+from collections import deque
+
+from ..pipeline.utilities.pika import (
+        AcknowledgementBatch, BatchingPipelineThread, PikaPipelineThread)
+
+
+class FakeChannel:
+    """A stand-in for a Pika BlockingChannel that records what's done to it."""
+
+    def __init__(self, connection):
+        self._connection = connection
+        self.consumers = {}
+        self.published = []
+        self.acks = []
+        self.rejections = []
+        self.commits = 0
+        self.transactional = False
+
+    def basic_qos(self, *args, **kwargs):
+        pass
+
+    def exchange_declare(self, *args, **kwargs):
+        pass
+
+    def exchange_bind(self, *args, **kwargs):
+        pass
+
+    def queue_declare(self, queue, *args, **kwargs):
+        return pika.frame.Method(
+                1, pika.spec.Queue.DeclareOk(queue=queue or "amq.gen-fake"))
+
+    def queue_bind(self, *args, **kwargs):
+        pass
+
+    def basic_consume(self, queue, callback, exclusive=False):
+        self.consumers[queue] = callback
+        return queue
+
+    def basic_cancel(self, consumer_tag):
+        self.consumers.pop(consumer_tag, None)
+
+    def basic_publish(self, exchange, routing_key, properties, body):
+        self.published.append((routing_key, body))
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+    def basic_reject(self, delivery_tag, requeue=True):
+        self.rejections.append((delivery_tag, requeue))
+
+    def tx_select(self):
+        self.transactional = True
+
+    def tx_commit(self):
+        self.commits += 1
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """A stand-in for a Pika BlockingConnection to a RabbitMQ server that
+    delivers messages instantly."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._deliveries = deque()
+        self._callbacks = deque()
+        self._delivery_tag = 0
+        self.channels = []
+
+    def channel(self):
+        channel = FakeChannel(self)
+        self.channels.append(channel)
+        return channel
+
+    def deliver(self, queue: str, body: bytes):
+        """(Any thread.) Delivers a message to the consumer of a queue."""
+        with self._lock:
+            self._deliveries.append((queue, body))
+        self._event.set()
+
+    def add_callback_threadsafe(self, callback):
+        with self._lock:
+            self._callbacks.append(callback)
+        self._event.set()
+
+    def process_data_events(self, time_limit=0):
+        if time_limit:
+            self._event.wait(time_limit)
+        self._event.clear()
+        with self._lock:
+            callbacks, self._callbacks = self._callbacks, deque()
+            deliveries, self._deliveries = self._deliveries, deque()
+        for callback in callbacks:
+            callback()
+        for queue, body in deliveries:
+            self._delivery_tag += 1
+            for channel in self.channels:
+                if (callback := channel.consumers.get(queue)):
+                    callback(
+                            channel,
+                            pika.spec.Basic.Deliver(
+                                    delivery_tag=self._delivery_tag,
+                                    routing_key=queue),
+                            pika.BasicProperties(),
+                            body)
+
+    def close(self):
+        pass
+
+
+class FakePipelineThread(PikaPipelineThread):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fake_connection = FakeConnection()
+
+    def make_connection(self):
+        return self.fake_connection
+
+
+class FakeBatchingThread(BatchingPipelineThread):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fake_connection = FakeConnection()
+        self.batches = []
+
+    def make_connection(self):
+        return self.fake_connection
+
+    def _add_to_batch(self, batch, routing_key, body):
+        batch.append(body)
+
+    def _write_batch(self, batch, methods):
+        self.batches.append(batch)
+        for method in methods:
+            self.enqueue_ack(method.delivery_tag)
+
+
+class AcknowledgementBatchTests(unittest.TestCase):
+    def test_contiguous(self):
+        """A run of acknowledgements is sent as a single AMQP method."""
+        acks = AcknowledgementBatch()
+        channel = FakeChannel(None)
+        for tag in (2, 1, 3):
+            acks.ack(tag)
+
+        self.assertEqual(
+                acks.flush(channel),
+                1)
+        self.assertEqual(
+                channel.acks,
+                [(3, True)])
+        self.assertFalse(
+                acks,
+                "flushed AcknowledgementBatch still has pending tags")
+
+    def test_gap(self):
+        """Acknowledgements after a delivery that hasn't yet been handled are
+        sent individually."""
+        acks = AcknowledgementBatch()
+        channel = FakeChannel(None)
+        for tag in (1, 2, 4, 5):
+            acks.ack(tag)
+        acks.flush(channel)
+
+        self.assertEqual(
+                channel.acks,
+                [(2, True), (4, False), (5, False)])
+
+        channel.acks.clear()
+        for tag in (3, 6):
+            acks.ack(tag)
+        acks.flush(channel)
+
+        self.assertEqual(
+                channel.acks,
+                [(6, True)],
+                "filling the gap didn't complete the run")
+
+    def test_rejection(self):
+        """Rejected deliveries don't interrupt a run of acknowledgements, but
+        aren't used as its tag either."""
+        acks = AcknowledgementBatch()
+        channel = FakeChannel(None)
+        acks.ack(1)
+        acks.ack(2)
+        acks.reject(3)
+        acks.flush(channel)
+
+        self.assertEqual(
+                channel.acks,
+                [(2, True)])
+
+
+class PikaPipelineThreadTests(unittest.TestCase):
+    def run_thread(self, **kwargs):
+        ppt = FakePipelineThread(read={"input"}, **kwargs)
+        ppt.start()
+        self.addCleanup(ppt.join)
+        self.addCleanup(ppt.enqueue_stop)
+        ppt.synchronise(timeout=5)
+        return ppt
+
+    def test_batched_acks(self):
+        """Messages acknowledged together are acknowledged with a single AMQP
+        method."""
+        ppt = self.run_thread()
+        for body in (b"1", b"2", b"3"):
+            ppt.fake_connection.deliver("input", body)
+
+        methods = []
+        for _ in range(3):
+            method, _, _ = ppt.await_message(timeout=5)
+            methods.append(method)
+        with ppt._condition:
+            for method in methods:
+                ppt.enqueue_ack(method.delivery_tag)
+        ppt.synchronise(timeout=5)
+
+        self.assertEqual(
+                ppt.channel.acks,
+                [(3, True)])
+
+    def test_prompt_wakeup(self):
+        """An idle background thread handles new requests straight away."""
+        ppt = self.run_thread()
+        # Give the background thread a chance to start waiting
+        time.sleep(0.1)
+
+        start = time.monotonic()
+        ppt.enqueue_message("output", b"{}", content_encoding=None)
+        ppt.synchronise(timeout=5)
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(
+                ppt.channel.published,
+                [("output", b"{}")])
+        self.assertLess(
+                elapsed,
+                ppt.IDLE_WAIT / 2,
+                "background thread didn't wake up for a new request")
+
+    def test_confirms(self):
+        """Batches of requests are committed when publisher confirms have been
+        requested."""
+        ppt = self.run_thread(confirms=True)
+        ppt.enqueue_message("output", b"{}", content_encoding=None)
+        ppt.synchronise(timeout=5)
+
+        self.assertTrue(
+                ppt.channel.transactional)
+        self.assertGreaterEqual(
+                ppt.channel.commits,
+                1)
+
+
+class BatchingPipelineThreadTests(unittest.TestCase):
+    def test_batches(self):
+        """Messages are written in batches of the requested size, without
+        changing how many requests the background thread handles at once."""
+        bpt = FakeBatchingThread(
+                read={"input"}, batch_interval=60, collect_batch_size=2)
+        self.assertEqual(
+                bpt._batch_size,
+                PikaPipelineThread(read={"input"})._batch_size)
+
+        bpt.start()
+        self.addCleanup(bpt.join)
+        self.addCleanup(bpt.enqueue_stop)
+        bpt.synchronise(timeout=5)
+        for body in (b"1", b"2", b"3", b"4"):
+            bpt.fake_connection.deliver("input", body)
+
+        bpt._consume_messages(lambda: len(bpt.batches) < 2)
+
+        self.assertEqual(
+                bpt.batches,
+                [[1, 2], [3, 4]])
@@ -1,10 +1,14 @@
 import json
 import unittest
+from base64 import b64encode
 
 from os2datascanner.engine2.model import msgraph  # only for testing censoring
+from os2datascanner.engine2.model.core import SourceManager
+from os2datascanner.engine2.model.http import WebSource, WebHandle
 from os2datascanner.engine2.rules.rule import Sensitivity
+from os2datascanner.engine2.rules.regex import RegexRule
 from os2datascanner.engine2.rules.dummy import AlwaysMatchesRule
-from os2datascanner.engine2.pipeline import messages, exporter
+from os2datascanner.engine2.pipeline import messages, exporter, processor
 
 
 class Engine2PipelineTests(unittest.TestCase):
@@ -144,3 +148,36 @@ class Engine2PipelineTests(unittest.TestCase):
                         "SECRETVALUE",
                         censored_json,
                         "client secret present in censored JSON output")
+
+    def test_processor_drops_content(self):
+        source = WebSource("http://localhost:64346")
+        handle = WebHandle(source, "/page.html", hints={
+            "content": b64encode(
+                    b"<html><body>Hello, world!</body></html>").decode(),
+            "content_type": "text/html",
+        })
+        rule = RegexRule("world")
+        scan_spec = messages.ScanSpecMessage(
+                scan_tag=messages.ScanTagFragment.make_dummy(),
+                source=source,
+                rule=rule,
+                configuration={},
+                filter_rule=None,
+                progress=None)
+        conversion = messages.ConversionMessage(
+                scan_spec, handle,
+                messages.ProgressFragment(rule=rule, matches=[]))
+
+        with SourceManager() as sm:
+            ((queue, body),) = processor.message_received_raw(
+                    conversion.to_json_object(), None, sm)
+
+        self.assertEqual(queue, "os2ds_representations")
+        representation = messages.RepresentationMessage.from_json_object(body)
+        self.assertIn(
+                "Hello, world!",
+                representation.representations["text"],
+                "content hint not used for conversion")
+        self.assertIsNone(
+                representation.handle.hint("content"),
+                "content hint passed on to the next stage")
@@ -1,7 +1,8 @@
 import random
 import unittest
+from datetime import date
 from os2datascanner.engine2.rules.utilities.cpr_probability import (
-        CprProbabilityCalculator)
+        CprProbabilityCalculator, get_birth_date, modulus11_check_raw)
 
 
 def _cpr(time_from=None):
@@ -121,6 +122,32 @@ class TestCprTest(unittest.TestCase):
         check = self.cpr_calc.cpr_check(cpr, do_mod11_check=False)
         self.assertEqual(check, 0.5, "probability for an exception date should be 0.5")
 
+    def test_sequence_index(self):
+        """Test that the position of a CPR in the sequence of legal CPRs for
+        its date is the same as in an explicitly generated sequence"""
+
+        for birth_date in (date(1858, 3, 4), date(1937, 12, 31),
+                           date(1999, 7, 15), date(2024, 2, 29)):
+            prefix = birth_date.strftime("%d%m%y")
+            legal_cprs = [
+                    cpr for cpr in (
+                            prefix + str(digit_7) + str(i).zfill(3)
+                            for digit_7 in self.cpr_calc._legal_7s(
+                                    birth_date.year)
+                            for i in range(0, 1000))
+                    if modulus11_check_raw(cpr)]
+            for i in range(0, 10000):
+                cpr = prefix + str(i).zfill(4)
+                try:
+                    if get_birth_date(cpr) != birth_date:
+                        continue
+                except ValueError:
+                    continue
+                self.assertEqual(
+                        self.cpr_calc._sequence_index(cpr, birth_date),
+                        legal_cprs.index(cpr) if cpr in legal_cprs else None,
+                        cpr)
+
 # NOTE: This test fails too often, that we would not know if it is failing for real.
 # Furthermore it messes up the pipeline very often and decreases productivity.
 #
@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import os.path
+import unittest
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from os2datascanner.engine2.model.core import SourceManager
+from os2datascanner.engine2.model.file import (
+        FilesystemHandle, FilesystemSource)
+from os2datascanner.engine2.rules.regex import RegexRule
+
+from ..pipeline import messages, worker
+from ..pipeline.run_stage import PooledRunner
+from ..pipeline.utilities import codec, process_pool
+from ..pipeline.utilities.sharding import ShardRouter, base_queue
+from .test_pika import FakeConnection
+
+
+here_path = os.path.dirname(__file__)
+test_data_path = os.path.join(here_path, "data", "engine2")
+
+
+# This module doubles as a (very simple) pipeline stage for the PooledRunner
+# tests: it sends every message it receives to os2ds_results, except for those
+# that tell it to fail
+PREFETCH_COUNT = 1
+PROMETHEUS_DESCRIPTION = "Test messages handled"
+READS_QUEUES = ("os2ds_test",)
+WRITES_QUEUES = ("os2ds_results",)
+
+
+def message_received_raw(body, channel, source_manager):
+    match body.get("fail"):
+        case "crash":
+            os._exit(1)
+        case "raise":
+            raise ValueError(body)
+    yield ("os2ds_results", body)
+
+
+class FakePooledRunner(PooledRunner):
+    def __init__(self, *args, **kwargs):
+        super().__init__(
+                *args, **kwargs,
+                stage="test", module=sys.modules[__name__],
+                queue_suffix=None, limit=None,
+                read=READS_QUEUES, write=WRITES_QUEUES)
+        self.fake_connection = FakeConnection()
+        self.completed = 0
+
+    def make_connection(self):
+        return self.fake_connection
+
+    def _complete(self, *args):
+        try:
+            return super()._complete(*args)
+        finally:
+            self.completed += 1
+
+    def run_until(self, bodies):
+        """Delivers the given messages and handles them in the pool, returning
+        once every one of them has been acknowledged or rejected."""
+        self.start()
+        try:
+            for body in bodies:
+                self.fake_connection.deliver(
+                        READS_QUEUES[0], json.dumps(body).encode())
+            self._consume_messages(lambda: self.completed < len(bodies))
+            self.synchronise(timeout=5)
+        finally:
+            self.enqueue_stop()
+            self.join()
+        return self.fake_connection.channels[0]
+
+
+def make_conversions():
+    source = FilesystemSource(test_data_path)
+    rule = RegexRule("test_vector")
+    scan_spec = messages.ScanSpecMessage(
+            scan_tag=messages.ScanTagFragment.make_dummy(),
+            source=source,
+            rule=rule,
+            configuration={},
+            filter_rule=None,
+            progress=None)
+    with SourceManager() as sm:
+        for handle in source.handles(sm):
+            yield messages.ConversionMessage(
+                    scan_spec=scan_spec,
+                    handle=handle,
+                    progress=messages.ProgressFragment(
+                            rule=rule, matches=[])).to_json_object()
+
+
+def decode(body: bytes, properties: dict):
+    return codec.loads(
+            codec.decompress(body, properties.get("content_encoding")),
+            properties.get("content_type"))
+
+
+def strip_status(replies):
+    # Status messages include object sizes that aren't stable for compound
+    # objects, so only compare everything else
+    return [(q, json.loads(json.dumps(m)) if not isinstance(m, bytes)
+             else decode(m, properties[-1]))
+            for q, m, *properties in replies if base_queue(q) != "os2ds_status"]
+
+
+class ProcessPoolTests(unittest.TestCase):
+    def test_pool_results(self):
+        """Handling messages in a pool of worker processes should produce the
+        same results as handling them in this process."""
+        conversions = list(make_conversions())
+
+        with SourceManager() as sm:
+            expected = [
+                    strip_status(list(worker.message_received_raw(
+                            body, "os2ds_conversions", sm)))
+                    for body in conversions]
+
+        with ProcessPoolExecutor(
+                max_workers=3,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=process_pool.initialise,
+                initargs=(worker.__name__, "worker", None, 3)) as pool:
+            futures = [
+                    pool.submit(
+                            process_pool.handle, body, "os2ds_conversions")
+                    for body in conversions]
+            actual = [strip_status(f.result()) for f in futures]
+
+        self.assertEqual(
+                expected,
+                actual,
+                "pooled results differ from sequential ones")
+
+
+class PooledRunnerTests(unittest.TestCase):
+    def test_failures(self):
+        """Messages whose pool process dies or whose handler fails are given
+        back to RabbitMQ, and the pool carries on working afterwards."""
+        channel = FakePooledRunner(slots=1, width=1).run_until([
+            {"fail": "raise"},
+            {"fail": "crash"},
+            {"value": 3},
+        ])
+
+        self.assertEqual(
+                sorted(channel.rejections),
+                [(1, True), (2, True)],
+                "failed messages weren't requeued")
+        self.assertEqual(
+                [tag for tag, _ in channel.acks],
+                [3],
+                "message wasn't handled after the pool was replaced")
+        self.assertEqual(
+                len(channel.published),
+                1)
+
+    def test_sharding(self):
+        """Messages produced in the pool are sent to the right shard of their
+        queue, and are encoded according to the codec policy."""
+        shards = {"os2ds_results": 4}
+        bodies = [
+                {"handle": FilesystemHandle(
+                        FilesystemSource("/mnt/share"),
+                        f"file{i}.txt").to_json_object()}
+                for i in range(8)]
+        channel = FakePooledRunner(
+                slots=2, width=1, shards=shards).run_until(bodies)
+
+        router = ShardRouter(shards)
+        self.assertCountEqual(
+                [(rk, decode(body, {"content_encoding": "gzip"}))
+                 for rk, body in channel.published],
+                [(router.route("os2ds_results", body), body)
+                 for body in bodies])
+        self.assertGreater(
+                len({rk for rk, _ in channel.published}), 1,
+                "every message was sent to the same shard")
@@ -0,0 +1,173 @@
+import unittest
+from unittest.mock import patch
+
+from os2datascanner.engine2.rules.address import AddressRule
+from os2datascanner.engine2.rules.cpr import CPRRule
+from os2datascanner.engine2.rules.dummy import AlwaysMatchesRule
+from os2datascanner.engine2.rules.logical import (
+        AllRule, AndRule, NotRule, OrRule)
+from os2datascanner.engine2.rules.name import NameRule
+from os2datascanner.engine2.rules.regex import RegexRule
+from os2datascanner.engine2.rules.rule import Rule
+from os2datascanner.engine2.rules.wordlists import OrderedWordlistRule
+from os2datascanner.engine2.rules.utilities.plan import (
+        EvaluationPlan, compile_rule)
+from os2datascanner.engine2.conversions.types import OutputType
+
+from . import test_rules
+
+
+content_candidates = (
+    "",
+    "Nothing to see here",
+    "Jens Jensen, 111111-1118, lider af akut arteriel insufficiens",
+    "A B C",
+    "ABC 0101011234",
+    "Hr. Testsen er blevet opereret, og han har ondt i albuen",
+    "Jens Jensen bor på Vesterbrogade 12, 1620 København V",
+    "en tekst helt uden store bogstaver eller tal",
+)
+
+
+rule_candidates = [rule for rule, _ in test_rules.RuleTests.compound_candidates] + [
+    AndRule(
+            CPRRule(),
+            OrRule(
+                    RegexRule("[Jj]ens"),
+                    RegexRule(r"\bA\b"),
+                    OrderedWordlistRule("da_20211018_laegehaandbog_stikord")),
+            NotRule(RegexRule("Testsen"))),
+    OrRule(NameRule(), RegexRule("albuen"), CPRRule(), AlwaysMatchesRule()),
+    OrRule(CPRRule(), NameRule(expansive=True), AddressRule()),
+    AndRule(NameRule(), AddressRule(), RegexRule("(?i)VESTERBRO")),
+    AllRule(RegexRule("(?i)abc"), RegexRule(r"(.)\1"), RegexRule("B")),
+    AndRule(RegexRule("(?P<a>A)"), RegexRule("(?P<a>B)"), RegexRule("C")),
+    AllRule(RegexRule("B C"), RegexRule("A B"), RegexRule(r"\w"), CPRRule()),
+]
+
+
+class EvaluationPlanTests(unittest.TestCase):
+    def test_equivalence(self):
+        """Evaluating a compiled Rule should produce exactly the same results
+        as evaluating it directly."""
+        for rule in rule_candidates:
+            plan = EvaluationPlan(rule)
+            for content in content_candidates:
+                with self.subTest(rule=rule, content=content):
+                    representations = {
+                        OutputType.Text.value: content,
+                        OutputType.AlwaysTrue.value: True,
+                    }
+                    self.assertEqual(
+                            plan.try_match(representations),
+                            rule.try_match(representations))
+
+    def test_equivalence_partial(self):
+        """Evaluating a compiled Rule should stop at the same point as
+        evaluating it directly when a representation isn't available."""
+        rule = AndRule(
+                RegexRule("A"), AlwaysMatchesRule(), RegexRule("B"))
+        representations = {
+            OutputType.Text.value: "AB"
+        }
+        conclusion, matches = compile_rule(rule).try_match(representations)
+        self.assertEqual(
+                (conclusion, matches),
+                rule.try_match(representations))
+        self.assertEqual(
+                compile_rule(conclusion).try_match(
+                        representations | {OutputType.AlwaysTrue.value: True}),
+                conclusion.try_match(
+                        representations | {OutputType.AlwaysTrue.value: True}))
+
+    def test_combined_scan(self):
+        """When the combined scan finds nothing, no SimpleRule should scan the
+        representation itself."""
+        rule = OrRule(RegexRule("needle"), CPRRule(), RegexRule("thimble"))
+        with patch.object(
+                RegexRule, "match", autospec=True,
+                side_effect=RegexRule.match) as match:
+            conclusion, matches = EvaluationPlan(rule).try_match({
+                OutputType.Text.value: "a haystack without anything in it"
+            })
+        self.assertFalse(conclusion)
+        self.assertEqual(len(matches), 3)
+        match.assert_not_called()
+
+    def test_candidates_given(self):
+        """SimpleRules covered by the combined scan should be given their
+        candidates, even where those overlap with another SimpleRule's, rather
+        than scanning the representation themselves."""
+        rule = AllRule(RegexRule("A B"), RegexRule("B C"), CPRRule())
+        with patch.object(
+                RegexRule, "match", autospec=True) as match:
+            _, matches = EvaluationPlan(rule).try_match({
+                OutputType.Text.value: "A B C"
+            })
+        self.assertEqual(
+                [len(m) for _, m in matches],
+                [1, 1, 0])
+        match.assert_not_called()
+
+    def test_common_rules_skipped(self):
+        """The combined scan should cover the CPR and name rules, so that
+        neither of them scans content that can't contain what they're looking
+        for, while rules that it doesn't cover still run as usual."""
+        rule = OrRule(CPRRule(), NameRule(), AddressRule())
+        with patch.object(
+                CPRRule, "_match", autospec=True) as cpr_match, \
+                patch.object(
+                        NameRule, "match", autospec=True) as name_match, \
+                patch.object(
+                        AddressRule, "match", autospec=True,
+                        return_value=iter(())) as address_match:
+            conclusion, matches = EvaluationPlan(rule).try_match({
+                OutputType.Text.value: "en tekst uden navne, adresser og tal"
+            })
+        self.assertFalse(conclusion)
+        self.assertEqual(len(matches), 3)
+        cpr_match.assert_not_called()
+        name_match.assert_not_called()
+        address_match.assert_called_once()
+
+    def test_no_wasted_scan(self):
+        """If only one SimpleRule would be covered by the combined scan of a
+        representation, there should be no combined scan of it at all."""
+        rule = OrRule(RegexRule("needle"), RegexRule(r"(.)\1"))
+        plan = EvaluationPlan(rule)
+        self.assertEqual(plan._scans, {})
+        with patch.object(
+                RegexRule, "match", autospec=True,
+                side_effect=RegexRule.match) as match:
+            plan.try_match({
+                OutputType.Text.value: "a haystack without anything in it"
+            })
+        self.assertEqual(match.call_count, 2)
+
+    def test_uncombinable_expressions(self):
+        """SimpleRules whose candidate expressions can't be combined should
+        still be evaluated correctly."""
+        rule = rule_candidates[-1]
+        self.assertEqual(
+                EvaluationPlan(rule).try_match({
+                    OutputType.Text.value: "ABC"
+                })[0],
+                True)
+
+    def test_cache_respects_settings(self):
+        """Rules that compare equal but have different settings should not
+        share a compiled plan."""
+        strict = CPRRule()
+        lenient = CPRRule(
+                modulus_11=False, ignore_irrelevant=False,
+                examine_context=False)
+        self.assertEqual(strict, lenient)
+        self.assertIsNot(compile_rule(strict), compile_rule(lenient))
+
+    def test_cache_shares_read_rules(self):
+        """Rules read from identical JSON forms should share a compiled
+        plan."""
+        obj = OrRule(CPRRule(), RegexRule("needle")).to_json_object()
+        self.assertIs(
+                compile_rule(Rule.from_json_object(obj)),
+                compile_rule(Rule.from_json_object(obj)))
@@ -18,6 +18,8 @@ from os2datascanner.engine2.rules.meta import HasConversionRule
 from os2datascanner.engine2.rules.name import NameRule
 from os2datascanner.engine2.rules.regex import RegexRule
 from os2datascanner.engine2.rules.wordlists import OrderedWordlistRule
+from os2datascanner.engine2.rules.utilities.wordlist_index import (
+        WordlistIndex)
 from os2datascanner.engine2.rules.rule import Sensitivity
 from os2datascanner.engine2.rules.dict_lookup import EmailHeaderRule
 from os2datascanner.engine2.rules.passport import PassportRule
@@ -564,6 +566,30 @@ P<USATRAVELER<<HAPPY<<<<<<<<<<<<<<<<<<<<<<<<-1500000035USA5609165M0811150<<<<<<<
                         tuple(wrl.match(in_value)),
                         expected)
 
+    def test_wordlist_index(self):
+        index = WordlistIndex(
+                ["lever", "leverbetændelse", "akut", "akut arteriel",
+                 "akut arteriel insufficiens", "p-piller", "", "-"])
+        candidates = (
+            ("Ingen fund", []),
+            ("LEVER og Leverbetændelse", ["LEVER", "Leverbetændelse"]),
+            ("akut leverbetændelsen", ["akut"]),
+            ("akut  arteriel\ninsufficiens", ["akut  arteriel\ninsufficiens"]),
+            ("akut arteriel insufficiensen", ["akut arteriel"]),
+            ("p-piller og p piller", ["p-piller"]),
+        )
+        for in_value, expected in candidates:
+            with self.subTest(in_value):
+                self.assertEqual(
+                        [in_value[b:e]
+                         for b, e in index.finditer(in_value)],
+                        expected)
+
+    def test_wordlist_index_shared(self):
+        self.assertIs(
+                OrderedWordlistRule("en_20211018_unit_test_words")._index,
+                OrderedWordlistRule("en_20211018_unit_test_words")._index)
+
     def test_medical_combinations(self):
         candidates = (
             (
@@ -0,0 +1,107 @@
+import unittest
+
+from ..model.smb import SMBSource, SMBHandle
+from ..pipeline import messages
+from ..pipeline.utilities import sharding
+from .test_pika import FakePipelineThread
+
+
+def _result(handle):
+    return messages.ProblemMessage(
+            scan_tag=messages.ScanTagFragment.make_dummy(),
+            source=None, handle=handle, message="Not ready").to_json_object()
+
+
+class ShardingTests(unittest.TestCase):
+    def setUp(self):
+        self.router = sharding.ShardRouter({
+            "os2ds_results": 4,
+            "os2ds_status": 1,
+        })
+
+    def test_names(self):
+        """Shard names can be turned back into queue names."""
+        name = sharding.shard_queue("os2ds_results", 3)
+
+        self.assertEqual(
+                sharding.base_queue(name),
+                "os2ds_results")
+        self.assertEqual(
+                sharding.base_queue("os2ds_results"),
+                "os2ds_results")
+
+    def test_same_object(self):
+        """Messages about the same object go to the same shard, even if their
+        handles differ in ways that the collectors ignore."""
+        egon = SMBHandle(
+                SMBSource("//some/path", user="egon_olsen"), "file.txt")
+        harry = SMBHandle(
+                SMBSource("//some/path", user="dynamit_harry"), "file.txt")
+
+        self.assertEqual(
+                self.router.route("os2ds_results", _result(egon)),
+                self.router.route("os2ds_results", _result(harry)))
+
+    def test_spread(self):
+        """Messages about different objects are spread over every shard."""
+        source = SMBSource("//some/path")
+        shards = {
+            self.router.route(
+                    "os2ds_results",
+                    _result(SMBHandle(source, f"file{k}.txt")))
+            for k in range(100)}
+
+        self.assertEqual(
+                shards,
+                {sharding.shard_queue("os2ds_results", s) for s in range(4)})
+
+    def test_unsharded(self):
+        """Queues with only one shard aren't renamed."""
+        self.assertEqual(
+                self.router.route("os2ds_status", {"scan_tag": None}),
+                "os2ds_status")
+        self.assertEqual(
+                self.router.read_queues("os2ds_status"),
+                ["os2ds_status"])
+
+    def test_read_queues(self):
+        """The first shard also reads from the unsharded queue."""
+        self.assertEqual(
+                self.router.read_queues("os2ds_results", 0),
+                ["os2ds_results_shard0", "os2ds_results"])
+        self.assertEqual(
+                self.router.read_queues("os2ds_results", 2),
+                ["os2ds_results_shard2"])
+        self.assertEqual(
+                len(self.router.read_queues("os2ds_results")),
+                5)
+        with self.assertRaises(ValueError):
+            self.router.read_queues("os2ds_results", 4)
+
+    def test_unshardable(self):
+        """Only the collectors' queues can be sharded."""
+        with self.assertRaises(ValueError):
+            sharding.ShardRouter({"os2ds_conversions": 2})
+
+    def test_pipeline_thread(self):
+        """PikaPipelineThread sends messages to the right shard, and declares
+        every shard of the queues it writes to."""
+        handle = SMBHandle(SMBSource("//some/path"), "file.txt")
+        body = _result(handle)
+        ppt = FakePipelineThread(
+                write={"os2ds_results"}, shards={"os2ds_results": 4})
+        ppt.start()
+        try:
+            ppt.enqueue_message("os2ds_results", body)
+            ppt.synchronise(timeout=5)
+        finally:
+            ppt.enqueue_stop()
+            ppt.join()
+
+        [(routing_key, _)] = ppt.fake_connection.channels[0].published
+        self.assertEqual(
+                routing_key,
+                self.router.route("os2ds_results", body))
+        self.assertEqual(
+                len(ppt._write),
+                5)
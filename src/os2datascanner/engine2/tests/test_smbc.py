@@ -0,0 +1,229 @@
+import errno
+import os.path
+import unittest
+from types import SimpleNamespace
+from datetime import datetime
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+import smbc
+from dateutil.tz import gettz
+
+from os2datascanner.engine2 import settings as engine2_settings
+from os2datascanner.engine2.model.core import Source
+from os2datascanner.engine2.model.smbc import (
+        SMBCSource, SMBCHandle, SMBCFolderHandle, SMBCResource)
+from os2datascanner.engine2.model.utilities.snapshot import TreeSnapshot
+from os2datascanner.engine2.rules.last_modified import LastModifiedRule
+
+
+class FakeContext:
+    """A stand-in for a smbc.Context that serves a fixed tree of files and
+    counts the stat calls made to it."""
+
+    def __init__(self, root: str, files: dict[str, float]):
+        self._root = root
+        self._files = files
+        self.stats = 0
+
+    def _path(self, url):
+        return url.removeprefix(self._root).strip("/")
+
+    def opendir(self, url):
+        path = self._path(url)
+        prefix = path + "/" if path else ""
+        entries = {}
+        for name in self._files:
+            if name.startswith(prefix):
+                head, sep, _ = name[len(prefix):].partition("/")
+                entries[head] = smbc.DIR if sep else smbc.FILE
+        return SimpleNamespace(getdents=lambda: [
+                SimpleNamespace(name=name, smbc_type=smbc_type)
+                for name, smbc_type in entries.items()])
+
+    def stat(self, url):
+        self.stats += 1
+        path = self._path(url)
+        mtime = self._files.get(path, max(self._files.values()))
+        return (0, 0, 0, 0, 0, 0, 0, 0, mtime, 0)
+
+
+class SMBCFolderSourceTests(unittest.TestCase):
+    def setUp(self):
+        self.share = SMBCSource(
+                "//SERVER/Resource", "username", "topsecret", "WORKGROUP8",
+                driveletter="W", skip_super_hidden=True,
+                split_top_level=True)
+
+    def test_split_yields_sources(self):
+        self.assertTrue(self.share.yields_independent_sources)
+        self.assertFalse(
+                SMBCSource("//SERVER/Resource").yields_independent_sources)
+
+    def test_folder_source(self):
+        source = Source.from_handle(
+                SMBCFolderHandle(self.share, "Departments/Finance"))
+
+        self.assertEqual(
+                source,
+                SMBCSource(
+                        "//SERVER/Resource/Departments/Finance",
+                        "username", "topsecret", "WORKGROUP8"),
+                "folder source has the wrong identity")
+        self.assertFalse(
+                source.yields_independent_sources,
+                "folder source should not be split again")
+        self.assertTrue(source._skip_super_hidden)
+        self.assertTrue(source._recursive)
+
+        self.assertEqual(
+                SMBCHandle(source, "Budget.xlsx").presentation_name,
+                SMBCHandle(
+                        self.share,
+                        "Departments/Finance/Budget.xlsx").presentation_name,
+                "folder source changed the Windows path of its files")
+
+    def test_root_files_source(self):
+        source = Source.from_handle(SMBCFolderHandle(self.share, ""))
+
+        self.assertEqual(
+                SMBCHandle(source, "README.txt"),
+                SMBCHandle(self.share, "README.txt"),
+                "files next to the top-level folders changed identity")
+        self.assertFalse(source._recursive)
+
+    def test_owner_hint(self):
+        homes = SMBCSource(
+                "//SERVER/Homes", unc_is_home_root=True, split_top_level=True)
+        source = Source.from_handle(
+                SMBCFolderHandle(
+                        homes, "user1", hints={"owner_sid": "S-1-5-21-1"}))
+
+        self.assertEqual(source._owner_sid, "S-1-5-21-1")
+        self.assertEqual(
+                source._make_hints(None), {"owner_sid": "S-1-5-21-1"})
+        self.assertEqual(
+                Source.from_json_object(source.to_json_object())._owner_sid,
+                "S-1-5-21-1")
+
+    def test_check_state(self):
+        """Idle connections are only reused if they can still see the share."""
+        url = self.share._to_url()
+        self.assertTrue(self.share._check_state(
+                (url, FakeContext(url, {"README.txt": 0.0}))))
+
+        def _unreachable(url):
+            raise ValueError(errno.ECONNRESET, "Connection reset by peer")
+        self.assertFalse(self.share._check_state(
+                (url, SimpleNamespace(stat=_unreachable))))
+
+
+class SMBCExplorationTests(unittest.TestCase):
+    def test_cutoff(self):
+        """Files older than a rule's last-modified cutoff should be left out,
+        and the modification times of the others should be passed on so that
+        they don't have to be asked for again."""
+        cutoff = datetime(2024, 1, 1, tzinfo=gettz())
+        old = datetime(2023, 6, 1, tzinfo=gettz()).timestamp()
+        new = datetime(2024, 6, 1, tzinfo=gettz()).timestamp()
+
+        source = SMBCSource("//SERVER/Resource")
+        url = source._to_url()
+        context = FakeContext(url, {
+            "README.txt": old,
+            "Finance/Budget.xlsx": new,
+            "Finance/Archive/Budget-2019.xlsx": old,
+        })
+        sm = SimpleNamespace(open=lambda s: (url, context))
+
+        with TemporaryDirectory() as d, patch.dict(
+                engine2_settings.model["smbc"], snapshot_dir=d):
+            handles = list(source.handles(
+                    sm, rule=LastModifiedRule(cutoff)))
+
+        self.assertEqual(
+                [h.relative_path for h in handles],
+                ["Finance/Budget.xlsx"])
+
+        stats = context.stats
+        self.assertEqual(
+                SMBCResource(handles[0], sm).get_last_modified(),
+                datetime.fromtimestamp(new, gettz()))
+        self.assertEqual(
+                context.stats, stats,
+                "modification time was asked for twice")
+
+    def test_snapshot_filters(self):
+        """Sources that filter their folder listings differently don't share
+        snapshots, even though they're otherwise the same Source."""
+        with patch.dict(engine2_settings.model["smbc"], snapshot_dir="/tmp"):
+            everything = SMBCSource("//SERVER/Resource")._get_snapshot_path()
+            visible = SMBCSource(
+                    "//SERVER/Resource",
+                    skip_super_hidden=True)._get_snapshot_path()
+        self.assertEqual(
+                SMBCSource("//SERVER/Resource"),
+                SMBCSource("//SERVER/Resource", skip_super_hidden=True))
+        self.assertNotEqual(everything, visible)
+
+    def test_parallel_walk(self):
+        """Walking a share with several walkers should find the same files as
+        walking it with one."""
+        source = SMBCSource("//SERVER/Resource")
+        url = source._to_url()
+        context = FakeContext(url, {
+            f"Folder{i}/Sub{j}/File{k}.txt": 0.0
+            for i in range(4) for j in range(3) for k in range(5)
+        } | {"README.txt": 0.0})
+        sm = SimpleNamespace(open=lambda s: (url, context))
+
+        with patch.dict(engine2_settings.model["smbc"], walkers=3), \
+                patch("smbc.Context", return_value=context):
+            paths = {h.relative_path for h in source.handles(sm)}
+
+        self.assertEqual(paths, set(context._files))
+
+
+class TreeSnapshotTests(unittest.TestCase):
+    def test_round_trip(self):
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, "snapshots", "share.json.gz")
+
+            snapshot = TreeSnapshot.load(path)
+            self.assertIsNone(snapshot.get("Finance", 1000.0))
+            snapshot.put("Finance", 1000.0, [("Budget.xlsx", False)])
+            snapshot.put("Gone", 1000.0, [])
+            snapshot.save(path)
+
+            snapshot = TreeSnapshot.load(path)
+            self.assertEqual(
+                    snapshot.get("Finance", 1000.0),
+                    [("Budget.xlsx", False)],
+                    "unchanged folder was not remembered")
+            snapshot.save(path)
+
+            snapshot = TreeSnapshot.load(path)
+            self.assertIsNone(
+                    snapshot.get("Gone", 1000.0),
+                    "folder that wasn't seen last time was remembered")
+            self.assertIsNone(
+                    snapshot.get("Finance", 2000.0),
+                    "changed folder was remembered")
+
+    def test_racy_listing(self):
+        snapshot = TreeSnapshot()
+        snapshot.put("Finance", 1000.0, [("Budget.xlsx", False)])
+        snapshot = TreeSnapshot(snapshot._current)
+        self.assertIsNotNone(snapshot.get("Finance", 1000.0))
+
+        snapshot = TreeSnapshot({"Finance": [1000.0, 1001.0, []]})
+        self.assertIsNone(
+                snapshot.get("Finance", 1000.0),
+                "listing taken just after a change was trusted")
+
+    def test_unreadable(self):
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, "share.json.gz")
+            with open(path, "wb") as fp:
+                fp.write(b"this is not a snapshot")
+            self.assertEqual(len(TreeSnapshot.load(path)._previous), 0)
@@ -1,6 +1,7 @@
 import unittest
 
 from os2datascanner.engine2.model.core import SourceManager
+from os2datascanner.engine2.model.core.utilities import SourcePool
 
 
 class Tracker:
@@ -30,6 +31,25 @@ class Dependent:
             self.count -= 1
 
 
+class Connection(Tracker):
+    """A Tracker that pretends to be a top-level Source whose state depends
+    only on some credentials."""
+    type_label = "connection"
+    handle = None
+
+    def __init__(self, credentials):
+        super().__init__()
+        self.credentials = credentials
+        self.healthy = True
+
+    @property
+    def _state_key(self):
+        return self.credentials
+
+    def _check_state(self, cookie):
+        return self.healthy
+
+
 class BrokenSource:
     def _generate_state(self, sm):
         raise ValueError("Operation failed: eth0 carrier on fire?")
@@ -174,3 +194,77 @@ class Engine2SourceManagerTest(unittest.TestCase):
                 sm.open(source)
             with self.assertRaises(ValueError):
                 sm.open(source)
+
+    def test_pool_reuse(self):
+        """The state of an evicted top-level Source is reused by the next
+        Source with the same credentials."""
+        pool = SourcePool(size=2)
+        first = Connection("alice")
+        second = Connection("alice")
+        other = Connection("bob")
+        with SourceManager(width=1, pool=pool) as sm:
+            cookie = sm.open(first)
+            sm.open(other)
+
+            self.assertEqual(
+                    (first.count, len(pool)),
+                    (1, 1),
+                    "evicted state was not kept in the pool")
+
+            self.assertIs(
+                    sm.open(second),
+                    cookie,
+                    "pooled state was not reused")
+            self.assertEqual(
+                    (second.count, pool.hits),
+                    (0, 1))
+        self.assertEqual(
+                (first.count, other.count, len(pool)),
+                (0, 0, 0),
+                "clearing the SourceManager didn't close pooled states")
+
+    def test_pool_expiry(self):
+        """Idle states that are too old or that fail their health check are
+        thrown away rather than reused."""
+        pool = SourcePool(size=2, ttl=0)
+        first = Connection("alice")
+        with SourceManager(pool=pool) as sm:
+            sm.open(first)
+            sm.close(first)
+            self.assertEqual(
+                    (first.count, pool.evictions),
+                    (0, 1),
+                    "expired state was kept")
+
+        pool = SourcePool(size=2)
+        first.healthy = False
+        with SourceManager(pool=pool) as sm:
+            sm.open(first)
+            sm.close(first)
+            sm.open(first)
+            self.assertEqual(
+                    (first.count, pool.hits, pool.misses),
+                    (1, 0, 2),
+                    "unhealthy state was reused")
+
+    def test_pool_discard(self):
+        """Closing a Source with reuse=False doesn't keep its state."""
+        pool = SourcePool(size=2)
+        first = Connection("alice")
+        with SourceManager(pool=pool) as sm:
+            sm.open(first)
+            sm.close(first, reuse=False)
+            self.assertEqual(
+                    (first.count, len(pool)),
+                    (0, 0))
+
+    def test_widths(self):
+        """Sources of a particular type can have their own width."""
+        parent = Connection("alice")
+        children = [Dependent(parent) for _ in range(3)]
+        with SourceManager(width=2, widths={"connection": 3}) as sm:
+            for child in children:
+                sm.open(child)
+            self.assertEqual(
+                    [child.count for child in children],
+                    [1, 1, 1])
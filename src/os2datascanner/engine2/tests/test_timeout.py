@@ -4,7 +4,12 @@ Unit test for the timeout module which is part of engine2's utilities.
 import time
 import unittest
 import threading
-from os2datascanner.utils.timer import TimerManager
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from os2datascanner.utils.timer import (
+        TimerManager, ThreadTimerManager, check_timeouts)
+from os2datascanner.utils.system_utilities import run_custom
+from os2datascanner.engine2.utilities.backoff import TimeoutRetrier
 
 
 def run_with_timeout(seconds: float, func, *args, **kwargs):
@@ -376,3 +381,122 @@ class TestTimerManager(unittest.TestCase):
               self.tm.timeout(0.1) as cty):
             with self.assertRaises(cty.Timeout):
                 time.sleep(0.2)
+
+
+def spin(seconds: float):
+    """Keeps the current thread busy running Python code for the given number
+    of seconds."""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestThreadTimerManager(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        patcher = patch.object(ThreadTimerManager, "grace_period", 0.2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def in_thread(self, func, *args, **kwargs):
+        return self.executor.submit(func, *args, **kwargs).result()
+
+    def test_timeout(self):
+        """Timeouts are enforced on background threads."""
+        def _busy():
+            with (tm := TimerManager.get()).timeout(0.2) as ctx:
+                try:
+                    spin(2)
+                except ctx.Timeout:
+                    return tm
+            return None
+
+        self.assertIsNot(
+                self.in_thread(_busy),
+                None,
+                "timeout not enforced on background thread")
+
+    def test_cooperative_timeout(self):
+        """Background threads that check their timeouts give up as soon as
+        they've expired, without waiting for the grace period."""
+        def _check():
+            start = time.perf_counter()
+            with TimerManager.get().timeout(0.2) as ctx:
+                if not ctx.cancelled.wait(2):
+                    return None
+                try:
+                    check_timeouts()
+                except ctx.Timeout:
+                    return time.perf_counter() - start
+            return None
+
+        with patch.object(ThreadTimerManager, "grace_period", 5.0):
+            elapsed = self.in_thread(_check)
+        self.assertIsNot(elapsed, None, "cancellation token was not set")
+        self.assertLess(elapsed, 1)
+
+    def test_interrupt_after_grace_period(self):
+        """Background threads that don't check their timeouts are only
+        interrupted once the grace period is over."""
+        def _busy():
+            start = time.perf_counter()
+            with TimerManager.get().timeout(0.2) as ctx:
+                try:
+                    spin(2)
+                except ctx.Timeout:
+                    return time.perf_counter() - start
+            return None
+
+        with patch.object(ThreadTimerManager, "grace_period", 0.5):
+            elapsed = self.in_thread(_busy)
+        self.assertIsNot(elapsed, None, "thread was never interrupted")
+        self.assertGreaterEqual(elapsed, 0.7)
+        self.assertLess(elapsed, 2)
+
+    def test_timeout_in_time(self):
+        """Operations that finish in time on a background thread aren't
+        interrupted, then or later."""
+        def _quick():
+            with TimerManager.get().timeout(0.2):
+                spin(0.1)
+            spin(0.3)
+            return True
+
+        self.assertTrue(self.in_thread(_quick))
+
+    def test_subprocess(self):
+        """Subprocesses started on a background thread are killed when that
+        thread's timeout expires."""
+        def _wait():
+            start = time.perf_counter()
+            with TimerManager.get().timeout(0.3) as ctx:
+                try:
+                    run_custom(["sleep", "5"])
+                except ctx.Timeout:
+                    return time.perf_counter() - start
+            return None
+
+        elapsed = self.in_thread(_wait)
+        self.assertIsNot(elapsed, None)
+        self.assertLess(elapsed, 2)
+
+    def test_suspension(self):
+        """Suspending a background thread's timeouts postpones them."""
+        def _sleep():
+            with (tm := TimerManager.get()).timeout(0.2):
+                tm.suspension().sleep(0.3)
+                spin(0.1)
+            return True
+
+        self.assertTrue(self.in_thread(_sleep))
+
+    def test_retrier(self):
+        """TimeoutRetrier works on background threads."""
+        def _retry():
+            return TimeoutRetrier(seconds=0.2, max_tries=2).run(spin, 2)
+
+        with self.assertRaises(TimeoutError):
+            self.in_thread(_retry)
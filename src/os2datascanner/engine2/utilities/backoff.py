@@ -1,10 +1,11 @@
 from http import HTTPStatus
+from typing import Optional
 from time import time, sleep
 from random import random, uniform
 import requests
 import structlog
 
-from os2datascanner.utils.timer import TimerManager
+from os2datascanner.utils.timer import TimerManager, check_timeouts
 from os2datascanner.utils.system_utilities import time_now
 from .datetime import parse_datetime
 
@@ -60,6 +61,9 @@ class Retrier:
         Subclasses may wish to extend this method to, for example, reset parts
         of their internal state before calling this implementation."""
         while self._should_proceed:
+            # Don't start another attempt if the thread's been asked to give
+            # up
+            check_timeouts()
             try:
                 rv = operation(*args, **kwargs)
                 return self._test_return_value(rv)
@@ -129,9 +133,10 @@ class CountingRetrier(Retrier):
 
 class TimeoutRetrier(CountingRetrier):
     """A TimeoutRetrier is a CountingRetrier that requires that its operation
-    finish within a certain period. (Note that this is implemented using a
-    one-shot interval timer behind the scenes and consequently can only be
-    used on the main thread.)"""
+    finish within a certain period. (On the main thread, this is implemented
+    using a one-shot interval timer behind the scenes; on other threads, the
+    timeout is enforced by a watchdog thread instead. See ThreadTimerManager
+    for the details.)"""
 
     def __init__(self, *exception_set, seconds=5.0, **kwargs):
         self._ctx = (ctx := TimerManager.get().timeout(seconds))
@@ -199,6 +204,23 @@ def _stringify_response(r: requests.Response):
         yield f"{k}: {v}"
 
 
+def get_retry_after(r: requests.Response) -> Optional[float]:
+    """Returns the number of seconds that the server that produced a response
+    has asked its clients to wait before trying again, or None if it didn't
+    specify a period."""
+    if not (raw := r.headers.get("retry-after")):
+        return None
+    try:
+        return max(float(raw), 0.0)
+    except ValueError:
+        # The Retry-After header can also specify a date until which we should
+        # back off
+        try:
+            return max((parse_datetime(raw) - time_now()).total_seconds(), 0.0)
+        except (ValueError, OverflowError):
+            return None
+
+
 class WebRetrier(ExponentialBackoffRetrier):
     """A WebRetrier is an ExponentialBackoffRetrier with a special backoff
     strategy that respects the HTTP/1.1 429 Too Many Requests and 503 Service
@@ -241,16 +263,8 @@ class WebRetrier(ExponentialBackoffRetrier):
                 # that instead of the default exponential backoff behaviour
                 # Multiply it by some random number proportional to the number
                 # of tries. This will prevent workers from being livelocked.
-                if "retry-after" in ex.response.headers:
+                if (retry_after := get_retry_after(ex.response)) is not None:
                     delay_multiplier = uniform(1.1, 1.3)**self._tries
-                    raw = ex.response.headers["retry-after"]
-                    try:
-                        retry_after = float(raw)
-                    except ValueError:
-                        # The Retry-After header can also specify a date until
-                        # which we should back off
-                        retry_after = (
-                                (parse_datetime(raw) - time_now()).seconds())
                     # Consider implementing an upper limit to the delay
                     delay = delay_multiplier * retry_after
                     logger.debug(
@@ -1,8 +1,82 @@
+import json
+import hashlib
 from abc import ABC, abstractmethod
+from typing import Optional
+from threading import Lock
+from collections import OrderedDict
+from prometheus_client import Counter
 
+from .. import settings as engine2_settings
 from ..model.core.errors import UnknownSchemeError, DeserialisationError
 
 
+JSON_CACHE_COUNTER = Counter(
+        "os2datascanner_json_cache",
+        "Objects requested from the JSON deserialisation cache",
+        ["kind", "outcome"])
+
+
+def canonical_json(obj) -> str:
+    """Returns a JSON representation of the given JSON-friendly object that
+    doesn't depend on the order of its keys."""
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"))
+
+
+def digest_json(obj) -> str:
+    """Returns a digest of the given JSON-friendly object that doesn't depend
+    on the order of its keys."""
+    return hashlib.sha256(canonical_json(obj).encode()).hexdigest()
+
+
+class InternTable:
+    """An InternTable is a bounded cache of objects keyed by their JSON
+    representations (or by digests of them). The least recently used object is
+    forgotten when the table is full.
+
+    An InternTable can also find the key of an object that it contains without
+    computing it again. (Note that the objects in an InternTable
+    should be immutable, as they'll be shared between everything that asks
+    for them.)"""
+
+    def __init__(self, size: int):
+        self._size = max(size, 1)
+        self._entries = OrderedDict()
+        self._digests = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str):
+        """Returns the object with the given key, or None if this table doesn't
+        contain it."""
+        with self._lock:
+            if (obj := self._entries.get(key)) is not None:
+                self._entries.move_to_end(key)
+            return obj
+
+    def digest_of(self, obj) -> Optional[str]:
+        """Returns the key of the given object, if this table contains that
+        very object, or None otherwise."""
+        with self._lock:
+            return self._digests.get(id(obj))
+
+    def add(self, key: str, obj):
+        """Adds an object to this table, forgetting the least recently used
+        one if necessary."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = obj
+            # The object is kept alive by the table, so its id can't be reused
+            # until it's forgotten
+            self._digests[id(obj)] = key
+            while len(self._entries) > self._size:
+                _, old = self._entries.popitem(last=False)
+                del self._digests[id(old)]
+
+
 class JSONSerialisable(ABC):
     """Classes that extend the abstract base class JSONSerialisable can convert
     themselves to and from JSON-serialisable objects."""
@@ -38,10 +112,53 @@ class JSONSerialisable(ABC):
             return func
         return _json_handler
 
+    _json_cache: Optional[InternTable] = None
+    """If set, a cache of the objects recently returned by from_json_object,
+    keyed by their JSON representations. Immediate subclasses whose objects
+    are immutable can set this to avoid building identical objects over and
+    over again."""
+
+    @classmethod
+    def _is_json_cacheable(cls, obj) -> bool:
+        """Indicates whether or not the object built from the given JSON
+        representation can be cached. (Subclasses can override this method to
+        avoid caching objects that contain mutable parts.)"""
+        return True
+
     @classmethod
     def from_json_object(cls, obj):
         """Converts a JSON representation of an object, as returned by the
-        to_json_object method, back into an object."""
+        to_json_object method, back into an object.
+
+        If this class has a cache, then the object returned might also have
+        been returned by an earlier call with an identical JSON
+        representation."""
+        cache = cls._json_cache
+        if cache is None or not cls._is_json_cacheable(obj):
+            return cls._build_from_json_object(obj)
+
+        kind = next(
+                c.__name__ for c in cls.__mro__ if "_json_cache" in vars(c))
+        try:
+            key = canonical_json(obj)
+        except (TypeError, ValueError):
+            key = None
+        if (key is None or len(key)
+                > engine2_settings.utilities["json"]["max_length"]):
+            JSON_CACHE_COUNTER.labels(kind, "skipped").inc()
+            return cls._build_from_json_object(obj)
+
+        if (rv := cache.get(key)) is not None:
+            JSON_CACHE_COUNTER.labels(kind, "hit").inc()
+            return rv
+
+        JSON_CACHE_COUNTER.labels(kind, "miss").inc()
+        rv = cls._build_from_json_object(obj)
+        cache.add(key, rv)
+        return rv
+
+    @classmethod
+    def _build_from_json_object(cls, obj):
         try:
             tl = obj["type"]
             if tl not in cls._json_handlers:
@@ -15,8 +15,11 @@
 # The code is currently governed by OS2 the Danish community of open
 # source municipalities ( https://os2.eu/ )
 
+import enum
 import structlog
+from collections import deque
 
+from django.conf import settings
 from django.db import transaction
 from django.db.utils import DataError
 from django.core.management.base import BaseCommand
@@ -26,7 +29,11 @@ from prometheus_client import Summary, start_http_server
 from os2datascanner.utils import debug
 from os2datascanner.engine2.rules.last_modified import LastModifiedRule
 from os2datascanner.engine2.pipeline import messages
-from os2datascanner.engine2.pipeline.utilities.pika import PikaPipelineThread
+from os2datascanner.engine2.pipeline.utilities.pika import (
+        BatchingPipelineThread, PikaPipelineThread)
+from os2datascanner.engine2.pipeline.utilities.sharding import (
+        ShardRouter, base_queue)
+from os2datascanner.engine2.utilities.json import canonical_json
 
 from ...models.scannerjobs.scanner import (
     Scanner, ScanStatus, ScheduledCheckup)
@@ -37,6 +44,19 @@ SUMMARY = Summary("os2datascanner_checkup_collector_admin",
                   "Messages through checkup collector")
 
 
+def _problem_path(message: messages.ProblemMessage) -> str:
+    # Different types of scans have different source classes, where the
+    # source path is contained differently.
+    if message.handle and message.handle.presentation_url:
+        return message.handle.presentation_url
+    elif message.handle and str(message.handle):
+        return str(message.handle)
+    elif message.handle and message.handle.presentation_name:
+        return message.handle.presentation_name
+    else:
+        return ""
+
+
 def create_usererrorlog(message: messages.ProblemMessage):
     """Create a UserErrorLog object from a problem message."""
 
@@ -47,16 +67,7 @@ def create_usererrorlog(message: messages.ProblemMessage):
         # deleted. Throw it away
         return
     error_message = message.message
-    # Different types of scans have different source classes, where the
-    # source path is contained differently.
-    if message.handle and message.handle.presentation_url:
-        path = message.handle.presentation_url
-    elif message.handle and str(message.handle):
-        path = str(message.handle)
-    elif message.handle and message.handle.presentation_name:
-        path = message.handle.presentation_name
-    else:
-        path = ""
+    path = _problem_path(message)
 
     # Determine related ScanStatus object
     scan_status = ScanStatus.objects.filter(  # Uses the "ss_pc_lookup" index
@@ -78,7 +89,10 @@ def create_usererrorlog(message: messages.ProblemMessage):
         )
 
 
-def checkup_message_received_raw(body):
+def parse_checkup_message(body):
+    """Extracts the scan tag, the (censored) Handle, and the MatchesMessage or
+    ProblemMessage from the body of a message sent to the checkup collector.
+    Returns None if the message doesn't describe a Handle."""
     handle = None
     scan_tag = None
     matches = None
@@ -93,7 +107,26 @@ def checkup_message_received_raw(body):
         scan_tag = matches.scan_spec.scan_tag
 
     if not scan_tag or not handle:
+        return None
+
+    # Some Handles carry a dict of hints: pieces of extra information uncovered
+    # during exploration that can be used to speed Resource functions up (and
+    # to provide extra presentation information). But this information may be
+    # stale if we hold onto it until the next scan, so we need to clear it
+    # before storing it
+    here = handle
+    while here:
+        here.clear_hints()
+        here = here.source.handle
+
+    return scan_tag, handle.censor(), matches, problem
+
+
+def checkup_message_received_raw(body):
+    if not (parsed := parse_checkup_message(body)):
         return
+    scan_tag, handle, matches, problem = parsed
+
     try:
         scanner = Scanner.objects.get(pk=scan_tag.scanner.pk)
         ScanStatus.objects.get(scan_tag=scan_tag.to_json_object())
@@ -115,24 +148,49 @@ def checkup_message_received_raw(body):
             p.run()
         return
 
-    scan_time = scan_tag.time
-
-    # Some Handles carry a dict of hints: pieces of extra information uncovered
-    # during exploration that can be used to speed Resource functions up (and
-    # to provide extra presentation information). But this information may be
-    # stale if we hold onto it until the next scan, so we need to clear it
-    # before storing it
-    here = handle
-    while here:
-        here.clear_hints()
-        here = here.source.handle
-
     update_scheduled_checkup(
-            handle.censor(), matches, problem, scan_time, scanner)
+            handle, matches, problem, scan_tag.time, scanner)
 
     yield from []
 
 
+class Decision(enum.Enum):
+    """What a message received by the checkup collector means for the
+    ScheduledCheckup of its object."""
+
+    KEEP = "keep"
+    # The object still has matches: update the checkup's timestamp, or create
+    # a checkup if there isn't one
+    TOUCH = "touch"
+    # The object hasn't changed since the last scan: update the checkup's
+    # timestamp, if there is one
+    FORGET = "forget"
+    # The object no longer has matches, or has been deleted: delete the
+    # checkup, if there is one
+    RETRY = "retry"
+    # The object had a transient problem: create a checkup if there isn't one
+    # (but, if there is, leave its timestamp alone -- we don't want to forget
+    # about changes between the last match and this error)
+
+
+def decide(matches, problem) -> Decision | None:
+    """Works out what a MatchesMessage or ProblemMessage means for the
+    ScheduledCheckup of its object."""
+    if matches:
+        if not matches.matched:
+            if (len(matches.matches) == 1
+                    and isinstance(matches.matches[0].rule,
+                                   LastModifiedRule)):
+                return Decision.TOUCH
+            else:
+                return Decision.FORGET
+        else:
+            return Decision.KEEP
+    elif problem:
+        return Decision.FORGET if problem.missing else Decision.RETRY
+    return None
+
+
 def update_scheduled_checkup(handle, matches, problem, scan_time, scanner):  # noqa: CCR001, E501 too high cognitive complexity
     locked_qs = ScheduledCheckup.objects.select_for_update(
         of=('self',)
@@ -142,54 +200,35 @@ def update_scheduled_checkup(handle, matches, problem, scan_time, scanner):  # n
     )
     # Queryset is evaluated immediately with .first() to lock the database entry.
     locked_qs.first()
+    decision = decide(matches, problem)
     if locked_qs:
         # There was already a checkup object in the database. Let's take a
         # look at it
-        if matches:
-            if not matches.matched:
-                if (len(matches.matches) == 1
-                        and isinstance(matches.matches[0].rule,
-                                       LastModifiedRule)):
-                    # This object hasn't changed since the last scan.
-                    # Update the checkup timestamp so we remember to check
-                    # it again next time
-                    logger.debug(
-                            "LM/no change, updating timestamp",
-                            handle=handle.presentation)
-                    locked_qs.update(
-                            interested_before=scan_time)
-                else:
-                    # This object has been changed and no longer has any
-                    # matches. Hooray! Forget about it
-                    logger.debug(
-                            "Changed, no matches, deleting",
-                            handle=handle.presentation)
-                    locked_qs.delete()
-            else:
-                # This object has changed, but still has matches. Update
-                # the checkup timestamp
+        match decision:
+            case Decision.TOUCH | Decision.KEEP:
+                # Either this object hasn't changed since the last scan, or it
+                # has changed but still has matches. Update the checkup
+                # timestamp so we remember to check it again next time
                 logger.debug(
-                        "Changed, new matches, updating timestamp",
+                        "Unchanged or new matches, updating timestamp",
                         handle=handle.presentation)
                 locked_qs.update(
                         interested_before=scan_time)
-        elif problem:
-            if problem.missing:
-                # Permanent error, so this object has been deleted. Forget
-                # about it
+            case Decision.FORGET:
+                # This object has been changed and no longer has any matches,
+                # or it's been deleted. Hooray! Forget about it
                 logger.debug(
-                        "Problem, deleted, deleting",
+                        "No matches or deleted, deleting",
                         handle=handle.presentation)
                 locked_qs.delete()
-            else:
+            case Decision.RETRY:
                 # Transient error -- do nothing. In particular, don't
                 # update the checkup timestamp; we don't want to forget
                 # about changes between the last match and this error
                 logger.debug("Problem, transient, doing nothing",
                              handle=handle.presentation)
 
-    elif ((matches and matches.matched)
-            or (problem and not problem.missing)):
+    elif decision in (Decision.KEEP, Decision.RETRY):
         logger.debug(
                 "Interesting, creating", handle=str(handle))
         # An object with a transient problem or with real matches is an
@@ -206,7 +245,7 @@ def update_scheduled_checkup(handle, matches, problem, scan_time, scanner):  # n
                     "handle_representation": handle.to_json_object(),
                     "interested_before": scan_time
                 })
-        if problem and not problem.missing:
+        if decision == Decision.RETRY:
             # For problems, we also create a UserErrorLog object to alert
             # the user that something did not go as expected.
             create_usererrorlog(problem)
@@ -216,9 +255,167 @@ def update_scheduled_checkup(handle, matches, problem, scan_time, scanner):  # n
                 handle=handle.presentation)
 
 
-class CheckupCollectorRunner(PikaPipelineThread):
+class PendingCheckup:
+    """A PendingCheckup accumulates the effects that a number of messages have
+    on the ScheduledCheckup (if there is one) of a single object, so that they
+    can all be written to the database at once."""
+
+    def __init__(self, existing: list[int]):
+        self.existing = existing
+        self.exists = bool(existing)
+        self.delete = False
+        self.create = None
+        self.touch = None
+
+    def apply(self, decision: Decision, handle, scan_time) -> bool:
+        """Updates this PendingCheckup to reflect the given decision. Returns
+        True if this caused a new checkup to be created."""
+        match decision:
+            case Decision.KEEP | Decision.TOUCH if self.exists:
+                if self.create:
+                    self.create = (self.create[0], scan_time)
+                else:
+                    self.touch = scan_time
+            case Decision.KEEP | Decision.RETRY if not self.exists:
+                self.exists = True
+                self.create = (handle, scan_time)
+                return True
+            case Decision.FORGET if self.exists:
+                self.exists = False
+                if self.create:
+                    self.create = None
+                else:
+                    self.delete, self.touch = True, None
+        return False
+
+
+class CheckupBatch:
+    """A CheckupBatch collects the messages received by the checkup collector
+    and applies their effects to the database all at once: with one query per
+    scanner to find (and lock) the existing checkups, and a handful of bulk
+    UPDATE, DELETE and INSERT statements to change them.
+
+    Scanner and ScanStatus lookups are performed once per scan tag, not once
+    per message, and the pipeline is told at most once to abort each scan
+    that has been cancelled."""
+
+    def __init__(self, aborted: deque):
+        self._entries = []
+        self._aborted = aborted
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, body):
+        if (parsed := parse_checkup_message(body)):
+            self._entries.append(parsed)
+
+    def _group_by_scanner(self):
+        """Looks up the Scanner and ScanStatus of each collected message, and
+        yields a message telling the pipeline to abort each scan that turns
+        out to have been cancelled. Returns a dictionary mapping Scanners to
+        the details of their messages that are still relevant."""
+        scanners = Scanner.objects.select_related("organization").in_bulk(
+                {scan_tag.scanner.pk for scan_tag, *_ in self._entries})
+
+        statuses, by_scanner = {}, {}
+        for scan_tag, handle, matches, problem in self._entries:
+            if not (scanner := scanners.get(scan_tag.scanner.pk)):
+                # This is a residual message for a scanner that the
+                # administrator has deleted. Throw it away
+                continue
+
+            tag = scan_tag.to_json_object()
+            key = (scanner.pk, canonical_json(tag))
+            if key not in statuses:
+                statuses[key] = ScanStatus.objects.filter(  # Uses the "ss_pc_lookup" index
+                        scanner=scanner, scan_tag=tag).first()
+            if not (status := statuses[key]):
+                # Likely, this means that the scan has been cancelled. Tell
+                # processes to throw away its messages (but only once)
+                if key not in self._aborted:
+                    self._aborted.append(key)
+                    yield ("", messages.CommandMessage(
+                            abort=scan_tag).to_json_object(),
+                           "broadcast", {"priority": 10})
+                continue
+
+            by_scanner.setdefault(scanner, []).append(
+                    (status, handle, matches, problem, scan_tag.time))
+        return by_scanner
+
+    @staticmethod
+    def _pending_checkups(scanner, entries, errors: list) -> dict:
+        """Locks the existing ScheduledCheckups of the objects mentioned in
+        the given messages for a Scanner, and returns a dictionary mapping the
+        paths of those objects to PendingCheckups that reflect the messages.
+        (UserErrorLogs for new problems are added to the given list.)"""
+        paths = {handle.crunch(hash=True) for _, handle, *_ in entries}
+        existing = {}
+        for pk, path in ScheduledCheckup.objects.select_for_update(
+                of=('self',)).filter(
+                scanner=scanner, path__in=paths).values_list("pk", "path"):
+            existing.setdefault(path, []).append(pk)
+
+        pending = {}
+        for status, handle, matches, problem, scan_time in entries:
+            path = handle.crunch(hash=True)
+            if path not in pending:
+                pending[path] = PendingCheckup(existing.get(path, []))
+            decision = decide(matches, problem)
+            if (pending[path].apply(decision, handle, scan_time)
+                    and decision == Decision.RETRY):
+                # For problems, we also create a UserErrorLog object to
+                # alert the user that something did not go as expected
+                errors.append(UserErrorLog(
+                        scan_status=status,
+                        error_message=problem.message,
+                        path=_problem_path(problem),
+                        organization=scanner.organization,
+                        is_new=True))
+        return pending
+
+    def apply(self):
+        """Writes the effects of the collected messages to the database (which
+        should be done in a transaction), and yields the messages that should
+        be sent as a result."""
+        by_scanner = yield from self._group_by_scanner()
+
+        deletes, touches, creates, errors = [], {}, [], []
+        for scanner, entries in by_scanner.items():
+            pending = self._pending_checkups(scanner, entries, errors)
+            for path, pc in pending.items():
+                if pc.delete:
+                    deletes.extend(pc.existing)
+                elif pc.touch:
+                    touches.setdefault(pc.touch, []).extend(pc.existing)
+                if pc.create:
+                    handle, scan_time = pc.create
+                    creates.append(ScheduledCheckup(
+                            scanner=scanner, path=path,
+                            handle_representation=handle.to_json_object(),
+                            interested_before=scan_time))
+
+        if deletes:
+            ScheduledCheckup.objects.filter(pk__in=deletes).delete()
+        for scan_time, pks in touches.items():
+            ScheduledCheckup.objects.filter(pk__in=pks).update(
+                    interested_before=scan_time)
+        ScheduledCheckup.objects.bulk_create(creates)
+        UserErrorLog.objects.bulk_create(errors)
+        logger.debug(
+                "Checkup collector wrote a batch",
+                messages=len(self._entries), deleted=len(deletes),
+                updated=sum(len(pks) for pks in touches.values()),
+                created=len(creates))
+
+
+class CheckupCollectorRunner(BatchingPipelineThread):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # The keys of the most recent cancelled scans that we've told the
+        # pipeline to abort
+        self._aborted = deque(maxlen=1024)
         start_http_server(9091)
 
     def handle_message(self, routing_key, body):
@@ -241,14 +438,55 @@ class CheckupCollectorRunner(PikaPipelineThread):
                     "Could not get or create object, due to DataError",
                     error=de)
 
+    def _write_batch(self, bodies: list, methods: list):
+        """Applies the collected messages to the database in a single
+        transaction, and then acknowledges them. (If that fails because of a
+        DataError, the messages are applied one at a time instead, so that
+        only the bad ones are lost.)"""
+        outputs = []
+        with SUMMARY.time():
+            batch = CheckupBatch(self._aborted)
+            try:
+                with transaction.atomic():
+                    for body in bodies:
+                        batch.add(body)
+                    outputs.extend(batch.apply())
+            except DataError:
+                logger.warning(
+                        "DataError while writing a batch, retrying"
+                        " messages individually")
+                outputs.clear()
+                for body in bodies:
+                    outputs.extend(self.handle_message("os2ds_checkups", body))
+
+        self._dispatch_message(methods[0], outputs)
+        for method in methods[1:]:
+            self.enqueue_ack(method.delivery_tag)
+
+    @staticmethod
+    def _add_to_batch(bodies: list, routing_key, body):
+        if base_queue(routing_key) == "os2ds_checkups" and body:
+            bodies.append(body)
+
 
 class Command(BaseCommand):
     """Command for starting a pipeline collector process."""
     help = __doc__
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
+        parser.add_argument(
+                "--shard",
+                type=int,
+                metavar="N",
+                help="consume only the given shard of the os2ds_checkups queue"
+                     " (by default, every shard is consumed)",
+                default=None)
+
+    def handle(self, *args, shard=None, **options):
         debug.register_debug_signal()
 
         CheckupCollectorRunner(
-            read=["os2ds_checkups"],
-            prefetch_count=512).run_consumer()
+            read=ShardRouter().read_queues("os2ds_checkups", shard),
+            prefetch_count=512,
+            batch_interval=settings.CHECKUP_COLLECTOR_BATCH_INTERVAL,
+            collect_batch_size=settings.CHECKUP_COLLECTOR_BATCH_SIZE).run_consumer()
@@ -5,6 +5,7 @@ from django.utils.translation import ugettext, gettext_lazy as _
 
 from os2datascanner.projects.admin.adminapp.models.scannerjobs.scanner import (
         Scanner)
+from os2datascanner.projects.admin.core.models.background_job import JobState
 
 
 class Command(BaseCommand):
@@ -27,12 +28,29 @@ class Command(BaseCommand):
             help=_("disable the last modification date check for everything"
                    " in this scan"),
             action="store_true")
+        parser.add_argument(
+            "--resume",
+            help=_("instead of starting a new scan, finish submitting the"
+                   " last scan whose submission was interrupted (make sure"
+                   " that it's no longer running first!)"),
+            action="store_true")
 
-    def handle(self, id, *args, checkups_only, force, **options):
+    def handle(self, id, *args, checkups_only, force, resume, **options):
         try:
             scanner = Scanner.objects.select_subclasses().get(pk=id)
         except ObjectDoesNotExist:
             print(_("no scanner job exists with id {id}").format(id=id))
             sys.exit(1)
 
-        print(scanner.run(explore=not checkups_only, force=force))
+        if resume:
+            job = scanner.submissions.filter(_exec_state__in=(
+                    JobState.FAILED.value, JobState.RUNNING.value)).first()
+            if not job:
+                print(_("no interrupted submission exists for {scanner}").format(
+                        scanner=scanner))
+                sys.exit(1)
+            job.exec_state = JobState.RUNNING
+            job.run_here()
+            print(job.status)
+        else:
+            print(scanner.run(explore=not checkups_only, force=force))
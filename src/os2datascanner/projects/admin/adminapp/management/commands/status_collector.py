@@ -1,4 +1,5 @@
 import math
+from collections import deque
 import structlog
 
 from django.conf import settings
@@ -12,7 +13,10 @@ from prometheus_client import Summary, start_http_server
 
 from os2datascanner.utils import debug
 from os2datascanner.engine2.pipeline import messages
-from os2datascanner.engine2.pipeline.utilities.pika import PikaPipelineThread
+from os2datascanner.engine2.pipeline.utilities.pika import BatchingPipelineThread
+from os2datascanner.engine2.pipeline.utilities.sharding import (
+        ShardRouter, base_queue)
+from os2datascanner.engine2.utilities.json import canonical_json
 
 
 from ...models.scannerjobs.scanner import (
@@ -24,87 +28,151 @@ SUMMARY = Summary("os2datascanner_scan_status_collector_admin",
                   "Messages through ScanStatus collector")
 
 
-def status_message_received_raw(body):  # noqa: CCR001 complexity
-    """A status message for a scannerjob is created in Scanner.run().
-    Therefore, this method can focus merely on updating the ScanStatus object."""
-    message = messages.StatusMessage.from_json_object(body)
+class StatusDelta:
+    """A StatusDelta accumulates the changes that a number of StatusMessages
+    make to a single ScanStatus object, so that they can all be written to the
+    database at once."""
+
+    def __init__(self, scanner_pk: int, scan_tag: dict):
+        self.scanner_pk = scanner_pk
+        self.scan_tag = scan_tag
+        self.messages = 0
+        self.latest = None
+        self.total_objects = 0
+        self.total_sources = 0
+        self.explored_sources = 0
+        self.scanned_size = 0
+        self.scanned_objects = 0
+        self.skipped_by_last_modified = 0
+        self.matches_found = 0
+
+    def add(self, message: messages.StatusMessage):
+        self.messages += 1
+        if message.total_objects is not None:
+            # An explorer has finished exploring a Source
+            self.latest = message
+            self.total_objects += message.total_objects
+            self.total_sources += message.new_sources or 0
+            self.explored_sources += 1
+        elif (message.object_size is not None
+                and message.object_type is not None):
+            # A worker has finished processing a Handle
+            self.latest = message
+            self.scanned_size += message.object_size
+            self.scanned_objects += 1
+
+        if message.skipped_by_last_modified:
+            self.skipped_by_last_modified += message.skipped_by_last_modified
+
+        if message.matches_found is not None:
+            self.matches_found += message.matches_found
+
+    def get_updates(self) -> dict:
+        """Returns the keyword arguments for a single QuerySet.update call
+        that applies this StatusDelta."""
+        updates = {}
+        if self.latest:
+            updates.update(
+                    message=self.latest.message,
+                    last_modified=timezone.now(),
+                    status_is_error=self.latest.status_is_error)
+        for field in (
+                "total_objects", "total_sources", "explored_sources",
+                "scanned_size", "scanned_objects",
+                "skipped_by_last_modified", "matches_found"):
+            if (value := getattr(self, field)):
+                updates[field] = F(field) + value
+        return updates
+
 
+def _take_snapshot_if_due(scan_status: ScanStatus, delta: StatusDelta):
+    """Takes a snapshot of a ScanStatus if the changes in a StatusDelta have
+    brought it to (or past) the point at which the next one is due."""
+    n_total = scan_status.total_objects
+    if not n_total or n_total <= 0:
+        return
+
+    # Get the frequency setting and calculate a frequency for how often to
+    # take a snapshot. n_total must be at least 2 for this to work.
+    snapshot_param = settings.SNAPSHOT_PARAMETER
+    frequency = n_total * math.log(snapshot_param, max(n_total, 2))
+    # Decide whether it is time to take a snapshot: that is, whether the
+    # number of scanned objects is now, or has just gone past, a multiple of
+    # that frequency
+    interval = max(1, math.floor(frequency))
+    scanned = scan_status.scanned_objects
+    before = scanned - delta.scanned_objects
+    if scanned % interval == 0 or scanned // interval > before // interval:
+        ScanStatusSnapshot.objects.create(
+            scan_status=scan_status,
+            time_stamp=timezone.now(),
+            total_sources=scan_status.total_sources,
+            explored_sources=scan_status.explored_sources,
+            total_objects=scan_status.total_objects,
+            scanned_objects=scan_status.scanned_objects,
+            scanned_size=scan_status.scanned_size,
+            skipped_by_last_modified=scan_status.skipped_by_last_modified,
+        )
+
+
+def apply_status_delta(delta: StatusDelta, announced=None):
+    """Writes a StatusDelta to the database with a single UPDATE, and then
+    takes a snapshot of the ScanStatus or announces that its scan has finished,
+    if appropriate.
+
+    If an announced collection is given, the scan tags of finished scans are
+    recorded in it, and a scan tag that's already there isn't announced
+    again. (Status messages can still arrive after a scan has finished.)"""
     try:
-        scanner = Scanner.objects.get(pk=message.scan_tag.scanner.pk)
+        scanner = Scanner.objects.get(pk=delta.scanner_pk)
     except Scanner.DoesNotExist:
         # This is a residual message for a scanner that the administrator has
         # deleted. Throw it away
         return
 
-    locked_qs = ScanStatus.objects.select_for_update(
-        of=('self',)
-    ).filter(
-        scanner=scanner,
-        scan_tag=body["scan_tag"]
-    )
-    # Queryset is evaluated immediately with .first() to lock the database entry.
-    locked_qs.first()
-
-    if message.total_objects is not None:
-        # An explorer has finished exploring a Source
-        locked_qs.update(
-                message=message.message,
-                last_modified=timezone.now(),
-                status_is_error=message.status_is_error,
-                total_objects=F('total_objects') + message.total_objects,
-                total_sources=F('total_sources') + (message.new_sources or 0),
-                explored_sources=F('explored_sources') + 1)
-
-    elif message.object_size is not None and message.object_type is not None:
-        # A worker has finished processing a Handle
-        locked_qs.update(
-                message=message.message,
-                last_modified=timezone.now(),
-                status_is_error=message.status_is_error,
-                scanned_size=F('scanned_size') + message.object_size,
-                scanned_objects=F('scanned_objects') + 1)
-
-    if message.skipped_by_last_modified:
-        locked_qs.update(skipped_by_last_modified=F("skipped_by_last_modified") +
-                         message.skipped_by_last_modified)
-
-    if message.matches_found is not None:
-        locked_qs.update(matches_found=F('matches_found') + message.matches_found)
-
-    # Get the frequency setting and decide whether to create a snapshot
-    snapshot_param = settings.SNAPSHOT_PARAMETER
-    scan_status = locked_qs.first()
-    if scan_status:
-        n_total = scan_status.total_objects
-        if n_total and n_total > 0:
-            # Calculate a frequency for how often to take a snapshot.
-            # n_total must be at least 2 for this to work.
-            frequency = n_total * math.log(snapshot_param, max(n_total, 2))
-            # Decide whether it is time to take a snapshot.
-            take_snap = scan_status.scanned_objects % max(1, math.floor(frequency))
-            if take_snap == 0:
-                ScanStatusSnapshot.objects.create(
-                    scan_status=scan_status,
-                    time_stamp=timezone.now(),
-                    total_sources=scan_status.total_sources,
-                    explored_sources=scan_status.explored_sources,
-                    total_objects=scan_status.total_objects,
-                    scanned_objects=scan_status.scanned_objects,
-                    scanned_size=scan_status.scanned_size,
-                    skipped_by_last_modified=scan_status.skipped_by_last_modified,
-                )
-
-        if scan_status.finished:
-            # Send email upon scannerjob completion
-            logger.info("Sending notification mail for finished scannerjob.")
-            send_mail_upon_completion(scanner, scan_status)
-
-    yield from []
-
-
-class StatusCollectorRunner(PikaPipelineThread):
+    qs = ScanStatus.objects.filter(scanner=scanner, scan_tag=delta.scan_tag)
+    if (updates := delta.get_updates()):
+        # (The UPDATE also locks the row until the end of the transaction, so
+        # nobody else can change it before we read it back)
+        qs.update(**updates)
+
+    scan_status = qs.first()
+    if not scan_status:
+        return
+    _take_snapshot_if_due(scan_status, delta)
+
+    if scan_status.finished:
+        # Send email upon scannerjob completion
+        logger.info("Sending notification mail for finished scannerjob.")
+        send_mail_upon_completion(scanner, scan_status)
+
+        key = canonical_json(delta.scan_tag)
+        if announced is None or key not in announced:
+            if announced is not None:
+                announced.append(key)
+            # Tell the pipeline that it can throw away what it was keeping
+            # for this scan
+            yield ("", messages.CommandMessage(
+                    finished=messages.ScanTagFragment.from_json_object(
+                            delta.scan_tag)).to_json_object(),
+                   "broadcast", {})
+
+
+def status_message_received_raw(body, announced=None):
+    """A status message for a scannerjob is created in Scanner.run().
+    Therefore, this method can focus merely on updating the ScanStatus object."""
+    message = messages.StatusMessage.from_json_object(body)
+    delta = StatusDelta(message.scan_tag.scanner.pk, body["scan_tag"])
+    delta.add(message)
+    yield from apply_status_delta(delta, announced)
+
+
+class StatusCollectorRunner(BatchingPipelineThread):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # The scan tags of the most recent scans that we've announced to be
+        # finished
+        self._announced = deque(maxlen=1024)
         start_http_server(9091)
 
     def handle_message(self, routing_key, body):
@@ -117,7 +185,8 @@ class StatusCollectorRunner(PikaPipelineThread):
             try:
                 with transaction.atomic():
                     if routing_key == "os2ds_status":
-                        yield from status_message_received_raw(body)
+                        yield from status_message_received_raw(
+                                body, self._announced)
             except DataError as de:
                 # DataError occurs when something went wrong trying to select
                 # or create/update data in the database. For now, we
@@ -126,14 +195,63 @@ class StatusCollectorRunner(PikaPipelineThread):
                     "Could not get or create object, due to DataError",
                     error=de)
 
+    def _new_batch(self):
+        return {}
+
+    def _write_batch(self, deltas: dict, methods: list):
+        """Writes the accumulated changes to the database, one transaction
+        per scan, and then acknowledges the messages that they came from."""
+        outputs = []
+        with SUMMARY.time():
+            for delta in deltas.values():
+                try:
+                    with transaction.atomic():
+                        outputs.extend(
+                                apply_status_delta(delta, self._announced))
+                except DataError as de:
+                    logger.error(
+                        "Could not get or create object, due to DataError",
+                        error=de)
+        logger.debug(
+                "Status collector wrote a batch",
+                messages=len(methods), scans=len(deltas))
+
+        self._dispatch_message(methods[0], outputs)
+        for method in methods[1:]:
+            self.enqueue_ack(method.delivery_tag)
+
+    @staticmethod
+    def _add_to_batch(deltas: dict, routing_key, body):
+        """Adds the changes made by a status message to the StatusDelta for
+        its scan."""
+        if base_queue(routing_key) != "os2ds_status" or not body:
+            return
+        message = messages.StatusMessage.from_json_object(body)
+        key = canonical_json(body["scan_tag"])
+        if key not in deltas:
+            deltas[key] = StatusDelta(
+                    message.scan_tag.scanner.pk, body["scan_tag"])
+        deltas[key].add(message)
+
 
 class Command(BaseCommand):
     """Command for starting a ScanStatus collector process."""
     help = __doc__
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
+        parser.add_argument(
+                "--shard",
+                type=int,
+                metavar="N",
+                help="consume only the given shard of the os2ds_status queue"
+                     " (by default, every shard is consumed)",
+                default=None)
+
+    def handle(self, *args, shard=None, **options):
         debug.register_debug_signal()
 
         StatusCollectorRunner(
-            read=["os2ds_status"],
-            prefetch_count=1024).run_consumer()
+            read=ShardRouter().read_queues("os2ds_status", shard),
+            prefetch_count=1024,
+            batch_interval=settings.STATUS_COLLECTOR_BATCH_INTERVAL,
+            collect_batch_size=settings.STATUS_COLLECTOR_BATCH_SIZE).run_consumer()
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_backgroundjob__exec_state_translation'),
+        ('os2datascanner', '0131_scanstatus_skipped_by_last_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanSubmissionJob',
+            fields=[
+                ('backgroundjob_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='core.backgroundjob')),
+                ('explore', models.BooleanField(default=True)),
+                ('checkup', models.BooleanField(default=True)),
+                ('force', models.BooleanField(default=False)),
+                ('sources_sent', models.IntegerField(default=0, verbose_name='sources sent')),
+                ('checkups_total', models.IntegerField(default=0, verbose_name='total checkups')),
+                ('checkups_seen', models.IntegerField(default=0, verbose_name='checkups handled')),
+                ('checkups_sent', models.IntegerField(default=0, verbose_name='checkups sent')),
+                ('last_checkup', models.IntegerField(blank=True, null=True, verbose_name='last checkup handled')),
+                ('scan_status', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='submission', to='os2datascanner.scanstatus')),
+                ('scanner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to='os2datascanner.scanner')),
+            ],
+            bases=('core.backgroundjob',),
+        ),
+    ]
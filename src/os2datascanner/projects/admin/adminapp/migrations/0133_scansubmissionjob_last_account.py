@@ -0,0 +1,18 @@
+# Generated by Django 3.2.11 on 2026-10-18 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('os2datascanner', '0132_scansubmissionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scansubmissionjob',
+            name='last_account',
+            field=models.UUIDField(blank=True, null=True, verbose_name='last account handled'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.11 on 2026-10-18 01:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('os2datascanner', '0133_scansubmissionjob_last_account'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scansubmissionjob',
+            name='sources_done',
+            field=models.BooleanField(default=False, verbose_name='all sources sent'),
+        ),
+    ]
@@ -8,3 +8,4 @@ from . import googledrivescanner  # noqa
 from . import gmail  # noqa
 from . import sbsysscanner  # noqa
 from . import analysisscanner  # noqa
+from . import scan_submission  # noqa
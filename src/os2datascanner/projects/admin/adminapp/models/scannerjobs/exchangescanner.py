@@ -100,7 +100,7 @@ class ExchangeScanner(Scanner):
     def generate_sources(self):
         yield from (source for _, source in self.generate_sources_with_accounts())
 
-    def generate_sources_with_accounts(self):
+    def generate_sources_with_accounts(self, after=None):
         constructor_param_base = {
             "domain": self.mail_domain.lstrip("@"),
             "server": self.service_endpoint or None,
@@ -132,8 +132,8 @@ class ExchangeScanner(Scanner):
                     **constructor_param_base,
                     **kwargs)
 
-        if (covered_accounts := self.compute_covered_accounts()).exists():
-            for account in covered_accounts:
+        if self.compute_covered_accounts().exists():
+            for account in self._covered_accounts_after(after):
                 # Only try to scan mail addresses that belong to the domain
                 # associated with this scanner
                 for alias in account.aliases.filter(
@@ -99,7 +99,7 @@ class MSGraphMailScanner(MSGraphScanner):
     def generate_sources(self):
         yield from (source for _, source in self.generate_sources_with_accounts())
 
-    def generate_sources_with_accounts(self):  # noqa
+    def generate_sources_with_accounts(self, after=None):  # noqa
         base_source = MSGraphMailSource(
                 client_id=str(self.grant.app_id),
                 tenant_id=str(self.grant.tenant_id),
@@ -107,7 +107,7 @@ class MSGraphMailScanner(MSGraphScanner):
                 scan_deleted_items_folder=self.scan_deleted_items_folder,
                 scan_syncissues_folder=self.scan_syncissues_folder,
                 scan_attachments=self.scan_attachments)
-        for account in self.compute_covered_accounts():
+        for account in self._covered_accounts_after(after):
             for alias in account.aliases.filter(_alias_type=AliasType.EMAIL):
                 user_mail_address: str = alias.value
                 yield (account, MSGraphMailAccountSource(
@@ -130,18 +130,18 @@ class MSGraphFileScanner(MSGraphScanner):
     def generate_sources(self):
         yield from (source for _, source in self.generate_sources_with_accounts())
 
-    def generate_sources_with_accounts(self):  # noqa
+    def generate_sources_with_accounts(self, after=None):  # noqa
         base_source = MSGraphFilesSource(
                 client_id=str(self.grant.app_id),
                 tenant_id=str(self.grant.tenant_id),
                 client_secret=self.grant.client_secret,
                 site_drives=self.scan_site_drives,
                 user_drives=False)
-        if self.scan_site_drives:
+        if self.scan_site_drives and after is None:
             # TODO: files in a SharePoint drive do actually have an owner...
             yield None, base_source
         if self.scan_user_drives:
-            for account in self.compute_covered_accounts():
+            for account in self._covered_accounts_after(after):
                 for alias in account.aliases.filter(_alias_type=AliasType.EMAIL):
                     user_mail_address: str = alias.value
                     yield (account, MSGraphDriveSource(
@@ -168,12 +168,12 @@ class MSGraphCalendarScanner(MSGraphScanner):
     def generate_sources(self):
         yield from (source for _, source in self.generate_sources_with_accounts())
 
-    def generate_sources_with_accounts(self):  # noqa
+    def generate_sources_with_accounts(self, after=None):  # noqa
         base_source = MSGraphCalendarSource(
                 client_id=str(self.grant.app_id),
                 tenant_id=str(self.grant.tenant_id),
                 client_secret=self.grant.client_secret)
-        for account in self.compute_covered_accounts():
+        for account in self._covered_accounts_after(after):
             for alias in account.aliases.filter(_alias_type=AliasType.EMAIL):
                 user_mail_address: str = alias.value
                 yield (account, MSGraphCalendarAccountSource(
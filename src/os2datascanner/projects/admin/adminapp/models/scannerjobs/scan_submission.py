@@ -0,0 +1,273 @@
+import structlog
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
+
+from os2datascanner.engine2.pipeline import messages
+from os2datascanner.engine2.pipeline.headers import get_exchange, get_headers
+from os2datascanner.engine2.pipeline.utilities.pika import PikaPipelineThread
+from os2datascanner.projects.admin.core.models import BackgroundJob
+from os2datascanner.projects.admin.core.models.background_job import JobState
+
+from .scanner import Scanner
+from .scanner_helpers import ScanStatus
+
+logger = structlog.get_logger("adminapp")
+
+
+class ScanSubmissionJob(BackgroundJob):
+    """A ScanSubmissionJob sends the scan specifications and checkup
+    instructions of a scan to the pipeline.
+
+    The job works through the scanner's Sources and ScheduledCheckups a chunk
+    at a time over a single RabbitMQ channel, waiting for RabbitMQ to confirm
+    each chunk before it records how far it has got: the last Account whose
+    Sources have all been sent, and the last ScheduledCheckup handled. If the
+    job is interrupted, running it again picks up from there. (The messages
+    sent since the last confirmed chunk will be sent again, but the pipeline
+    tolerates that.)
+
+    The Sources aren't counted before the job starts. Until they've all been
+    sent, the scan's total is kept one ahead of the number sent so far, so
+    that the scan can't look finished in the meantime."""
+
+    CONFIRM_TIMEOUT = 300.0
+    """The longest time (in seconds) to wait for RabbitMQ to confirm a chunk
+    of messages."""
+
+    scanner = models.ForeignKey(
+            Scanner,
+            on_delete=models.CASCADE,
+            related_name="submissions")
+    scan_status = models.OneToOneField(
+            ScanStatus,
+            null=True,
+            on_delete=models.SET_NULL,
+            related_name="submission")
+
+    explore = models.BooleanField(default=True)
+    checkup = models.BooleanField(default=True)
+    force = models.BooleanField(default=False)
+
+    sources_sent = models.IntegerField(
+            verbose_name=_("sources sent"), default=0)
+    checkups_total = models.IntegerField(
+            verbose_name=_("total checkups"), default=0)
+    checkups_seen = models.IntegerField(
+            verbose_name=_("checkups handled"), default=0)
+    checkups_sent = models.IntegerField(
+            verbose_name=_("checkups sent"), default=0)
+    sources_done = models.BooleanField(
+            verbose_name=_("all sources sent"), default=False)
+    last_account = models.UUIDField(
+            verbose_name=_("last account handled"), null=True, blank=True)
+    last_checkup = models.IntegerField(
+            verbose_name=_("last checkup handled"), null=True, blank=True)
+
+    @property
+    def job_label(self) -> str:
+        return "Scan Submission Job"
+
+    @property
+    def progress(self):
+        if not self.scan_status or self.explore and not self.sources_done:
+            # (We don't know how many Sources there are until they've all
+            # been sent)
+            return None
+        total = (
+                (self.sources_sent if self.explore else 0)
+                + self.checkups_total)
+        done = self.sources_sent + self.checkups_seen
+        return min(done / total, 1.0) if total else None
+
+    def _checkpoint(self, sender, stale=0):
+        """Waits for RabbitMQ to take responsibility for every message sent so
+        far, and then records the progress of this job. (Any ScheduledCheckups
+        found to be no longer needed since the last checkpoint are taken away
+        from the scan's total.)"""
+        sender.synchronise(timeout=self.CONFIRM_TIMEOUT)
+        with transaction.atomic():
+            totals = {}
+            if stale:
+                totals["total_objects"] = F("total_objects") - stale
+            if self.explore:
+                totals["total_sources"] = (
+                        self.sources_sent + (0 if self.sources_done else 1))
+            if totals:
+                ScanStatus.objects.filter(
+                        pk=self.scan_status_id).update(**totals)
+            self.status = (
+                    f"Sent {self.sources_sent} source(s) and"
+                    f" {self.checkups_sent} checkup(s)")
+            # (Don't touch the execution state, which the user might have
+            # changed in the meantime)
+            self.save(update_fields=(
+                    "status", "changed_at", "sources_sent", "sources_done",
+                    "last_account",
+                    "checkups_seen", "checkups_sent", "last_checkup"))
+
+    def _should_stop(self) -> bool:
+        return self.exec_state == JobState.CANCELLING
+
+    def _send(self, sender, queue, message, organisation):
+        sender.enqueue_message(
+                queue, message.to_json_object(),
+                exchange=get_exchange(rk=queue),
+                **get_headers(organisation=organisation))
+
+    def _send_sources(self, scanner, spec_template, sender) -> bool:
+        """Sends the scan specifications that haven't been sent yet. Returns
+        False if the job was cancelled before they had all been sent."""
+        chunk_size = settings.SCAN_SUBMISSION_CHUNK_SIZE
+        organisation = scanner.organization.name
+        # Sources that don't belong to an Account come before the others, and
+        # can only be skipped by counting them
+        skip = self.sources_sent if self.last_account is None else 0
+        unconfirmed = 0
+        account = self.last_account
+        for account_pk, spec in scanner._iter_sources(
+                spec_template, self.force, after=self.last_account):
+            if skip:
+                # We sent this one before being interrupted
+                skip -= 1
+                continue
+            elif unconfirmed >= chunk_size and (
+                    account_pk is None or account_pk != account):
+                # Don't record our progress in the middle of an Account's
+                # Sources, so that we can resume after the last one we got to
+                self.last_account = account
+                self._checkpoint(sender)
+                unconfirmed = 0
+                if self._should_stop():
+                    return False
+
+            self._send(
+                    sender, settings.AMQP_PIPELINE_TARGET, spec, organisation)
+            self.sources_sent += 1
+            unconfirmed += 1
+            account = account_pk
+        self.last_account = account
+        self.sources_done = True
+        self._checkpoint(sender)
+        return True
+
+    def _send_checkups(self, scanner, spec_template, sender) -> bool:
+        """Sends the checkup instructions that haven't been sent yet. Returns
+        False if the job was cancelled before they had all been sent."""
+        chunk_size = settings.SCAN_SUBMISSION_CHUNK_SIZE
+        organisation = scanner.organization.name
+        stale = 0
+        for pk, message in scanner._iter_checkups(
+                spec_template, self.force, after=self.last_checkup):
+            if message is None:
+                stale += 1
+            else:
+                self._send(
+                        sender, settings.AMQP_CONVERSION_TARGET, message,
+                        organisation)
+                self.checkups_sent += 1
+            self.checkups_seen += 1
+            self.last_checkup = pk
+
+            if self.checkups_seen % chunk_size == 0:
+                self._checkpoint(sender, stale)
+                stale = 0
+                if self._should_stop():
+                    return False
+        self._checkpoint(sender, stale)
+        return True
+
+    def _finalise(self, scanner):
+        """Brings the scan's status up to date once everything has been sent
+        (or once the job has been cancelled)."""
+        if self.sources_sent == 0 and self.checkups_sent == 0:
+            # All of the checkups turned out to be unnecessary, so there's no
+            # scan to wait for
+            logger.warning("nothing to do for scan", scanner=scanner)
+            self.scan_status.delete()
+            return
+
+        # The checkups were counted when the scan was started, but they might
+        # have changed since then (and, if the job was cancelled, not all of
+        # them -- or of the sources -- will have been sent). The checkups found
+        # to be no longer needed have already been taken away from the total
+        totals = {}
+        if self.explore:
+            totals["total_sources"] = self.sources_sent
+        if self.checkup:
+            totals["total_objects"] = (
+                    F("total_objects") + self.checkups_seen - self.checkups_total)
+        ScanStatus.objects.filter(pk=self.scan_status_id).update(**totals)
+
+        # Synchronize the 'covered_accounts'-field with the accounts that
+        # have been scanned. (If the job was cancelled before all the Sources
+        # had been sent, then only the Accounts whose Sources were all sent
+        # count: the next scan must still look at everything belonging to the
+        # others)
+        if not self.explore or self.sources_done:
+            scanner.record_covered_accounts(self.scan_status)
+        elif (scanner._supports_account_annotations
+                and self.last_account is not None):
+            scanner.record_covered_accounts(
+                    self.scan_status, up_to=self.last_account)
+
+    def run(self):
+        scanner = Scanner.objects.select_subclasses().get(pk=self.scanner_id)
+        if not self.scan_status:
+            return
+
+        # The scan's scan tag was fixed when it was started, and mustn't
+        # change if we're resuming it
+        spec_template = scanner._construct_scan_spec_template(
+                None, self.force)._replace(
+                scan_tag=messages.ScanTagFragment.from_json_object(
+                        self.scan_status.scan_tag))
+
+        try:
+            with PikaPipelineThread(
+                    queue_suffix=scanner.organization.name,
+                    write={settings.AMQP_PIPELINE_TARGET,
+                           settings.AMQP_CONVERSION_TARGET},
+                    confirms=True) as sender:
+                sender.start()
+                try:
+                    carry_on = not self.explore or self._send_sources(
+                            scanner, spec_template, sender)
+                    if carry_on and self.checkup:
+                        self._send_checkups(scanner, spec_template, sender)
+                finally:
+                    sender.enqueue_stop()
+                    sender.join()
+        except BackgroundJob.MustStop:
+            # Our progress has been recorded, so we can pick up from where we
+            # left off once a job runner is available again
+            self._interrupted = True
+            raise
+
+        self._finalise(scanner)
+
+    def run_here(self):
+        """Runs this job to completion on the current thread, rather than
+        waiting for run_background_jobs to do so. (The job should already be
+        in the RUNNING state.)"""
+        try:
+            self.run()
+        except BaseException:
+            self.exec_state = JobState.FAILED
+            raise
+        else:
+            self.exec_state = JobState.FINISHED
+
+    def resume(self):
+        """Makes an interrupted job available to run_background_jobs again."""
+        if self.exec_state in (JobState.FAILED, JobState.RUNNING):
+            self.exec_state = JobState.WAITING
+
+    def finish(self):
+        if getattr(self, "_interrupted", False):
+            self.resume()
+
+    def __str__(self):
+        return f"Submission of {self.scan_status or self.scanner}"
@@ -19,6 +19,7 @@
 """Contains Django model for the scanner types."""
 
 import os
+from itertools import islice
 from typing import Iterator
 import datetime
 from dateutil.tz import gettz
@@ -43,9 +44,9 @@ from os2datascanner.engine2.rules.last_modified import LastModifiedRule
 import os2datascanner.engine2.pipeline.messages as messages
 from os2datascanner.engine2.pipeline.utilities.pika import PikaPipelineThread
 from os2datascanner.engine2.conversions.types import OutputType
-from os2datascanner.engine2.pipeline.headers import get_exchange, get_headers
 from mptt.models import TreeManyToManyField
 from os2datascanner.projects.admin.adminapp.utils import CleanProblemMessage
+from os2datascanner.projects.admin.core.models.background_job import JobState
 
 from ..rules import Rule
 from .scanner_helpers import (  # noqa (interface backwards compatibility)
@@ -276,7 +277,7 @@ class Scanner(models.Model):
         prerules = []
         if not force and self.do_last_modified_check:
             if self._supports_account_annotations:
-                # _add_sources will add a per-Source LastModifiedRule, so we
+                # _iter_sources will add a per-Source LastModifiedRule, so we
                 # don't need to do anything here
                 pass
             else:
@@ -334,55 +335,73 @@ class Scanner(models.Model):
     def _supports_account_annotations(self) -> bool:
         return hasattr(self, "generate_sources_with_accounts")
 
-    def _add_sources(
+    def _last_scanned(self, accounts) -> dict:
+        """Returns a dictionary mapping the primary keys of the given Accounts
+        to the start time of the most recent scan by this scanner that covered
+        them. (Accounts that this scanner hasn't covered before are left
+        out.)"""
+        latest = CoveredAccount.objects.filter(
+                scanner=self, account__in=accounts).order_by(
+                "account_id", "-scan_status__scan_tag__time").distinct(
+                "account_id").values_list("account_id", "scan_status__scan_tag")
+        return {
+            account_id: messages.ScanTagFragment.from_json_object(tag).time
+            for account_id, tag in latest}
+
+    def _iter_sources(
             self, spec_template: messages.ScanSpecMessage,
-            outbox: list, force: bool) -> int:
-        """Creates scan specifications, based on the provided scan
-        specification template, for every Source covered by this scanner, and
-        puts them into the provided outbox list. Returns the number of sources
-        added."""
-        source_count = 0
-        if (self.do_last_modified_check
-                and not force
-                and self._supports_account_annotations):
-            # CoveredAccount-aware scanner!
-            # TODO: If an account has more than one Alias, we'll try to scan both.
-            # This is an issue when it comes to service accounts/shared mailboxes.
-            for account, source in self.generate_sources_with_accounts():
-                rule = spec_template.rule
-                try:
-                    cva = CoveredAccount.objects.filter(
-                            account=account, scanner=self).latest()
-                    # OK, this Account has been covered by this Scanner before,
-                    # so make a custom LastModifiedRule for them
-                    rule = AndRule.make(
-                            LastModifiedRule(cva.scan_status.start_time),
-                            rule)
-                    logger.info(
-                            f"{self}: account {account} last scanned at"
-                            f" {cva.scan_status.start_time}")
-                except CoveredAccount.DoesNotExist:
-                    # This Account is new to this Scanner, so do nothing -- the
-                    # default rule is fine
-                    logger.info(
-                            f"{self}: account {account} not previously"
-                            " scanned")
-                outbox.append((
-                    settings.AMQP_PIPELINE_TARGET,
-                    spec_template._replace(source=source, rule=rule)))
-                source_count += 1
-            return source_count
-        else:
-            # The scanner isn't CoveredAccount-aware, or we're running without
-            # the Last-Modified check. In either case, we just put Sources into
-            # the queue without fiddling around with the rule
+            force: bool, after=None) -> Iterator[
+                tuple[object, messages.ScanSpecMessage]]:
+        """Yields an (Account primary key, scan specification) pair, based on
+        the provided scan specification template, for every Source covered by
+        this scanner. (The primary key is None for Sources that don't belong
+        to an Account.)
+
+        CoveredAccount-aware scanners produce their Sources in order of
+        Account primary key, and can start after the given one; the Sources
+        that don't belong to an Account come first, and are left out when
+        starting after an Account."""
+        if not self._supports_account_annotations:
+            # The scanner isn't CoveredAccount-aware, so we just put Sources
+            # into the queue without fiddling around with the rule
             for source in self.generate_sources():
-                outbox.append((
-                    settings.AMQP_PIPELINE_TARGET,
-                    spec_template._replace(source=source)
-                ))
-                source_count += 1
-        return source_count
+                yield None, spec_template._replace(source=source)
+            return
+
+        # CoveredAccount-aware scanner!
+        # TODO: If an account has more than one Alias, we'll try to scan both.
+        # This is an issue when it comes to service accounts/shared mailboxes.
+        annotate = self.do_last_modified_check and not force
+        chunk_size = settings.SCAN_SUBMISSION_CHUNK_SIZE
+        sources = iter(self.generate_sources_with_accounts(after=after))
+        while chunk := list(islice(sources, chunk_size)):
+            rules = self._account_rules(
+                    chunk, spec_template.rule) if annotate else {}
+            for account, source in chunk:
+                pk = account.pk if account else None
+                yield pk, spec_template._replace(
+                        source=source, rule=rules.get(pk, spec_template.rule))
+
+    def _account_rules(self, chunk, rule) -> dict:
+        """Returns a dictionary mapping the primary keys of the Accounts in the
+        given chunk of (Account, Source) pairs to the rule to use for them.
+        (When the Accounts were last scanned is looked up for the whole chunk
+        at once, rather than with one query for every Account.)"""
+        accounts = {account.pk: account for account, _ in chunk if account}
+        rules = {}
+        for pk, start_time in self._last_scanned(list(accounts)).items():
+            # OK, this Account has been covered by this Scanner before, so
+            # make a custom LastModifiedRule for them
+            logger.info(
+                    f"{self}: account {accounts[pk]} last scanned at"
+                    f" {start_time}")
+            rules[pk] = AndRule.make(LastModifiedRule(start_time), rule)
+        for pk in accounts.keys() - rules.keys():
+            # This Account is new to this Scanner, so do nothing -- the
+            # default rule is fine
+            logger.info(
+                    f"{self}: account {accounts[pk]} not previously scanned")
+        return rules
 
     @classmethod
     def _make_remap_dict(cls, source_iterator):
@@ -417,15 +436,20 @@ class Scanner(models.Model):
 
         return (True, handle.remap(remap_dict))
 
-    def _add_checkups(
+    def _iter_checkups(
             self, spec_template: messages.ScanSpecMessage,
-            outbox: list,
             force: bool,
-            queue_suffix=None) -> int:
-        """Creates instructions to rescan every object covered by this
-        scanner's ScheduledCheckup objects (in the process deleting objects no
-        longer covered by one of this scanner's Sources), and puts them into
-        the provided outbox list. Returns the number of checkups added."""
+            after: int = None) -> Iterator[
+                tuple[int, messages.ConversionMessage | None]]:
+        """Yields a (primary key, message) pair for each of this scanner's
+        ScheduledCheckup objects, in order of primary key (starting after the
+        given one, if there is one). The message is an instruction to rescan
+        the object covered by the checkup, or None if the checkup was deleted
+        because its object is no longer covered by one of this scanner's
+        Sources.
+
+        The checkups are read from the database, and the ones no longer
+        needed deleted, a chunk at a time."""
 
         uncensor_map = self._make_remap_dict(self.generate_sources())
 
@@ -435,28 +459,50 @@ class Scanner(models.Model):
                 progress=messages.ProgressFragment(
                     rule=None,
                     matches=[]))
+        checkups = self.checkups.order_by("pk")
+        while chunk := list(
+                (checkups.filter(pk__gt=after) if after is not None
+                 else checkups)[:settings.SCAN_SUBMISSION_CHUNK_SIZE]):
+            results = []
+            for reminder in chunk:
+                remapped, rh = self._uncensor_handle(
+                        uncensor_map, reminder.handle)
+                if not remapped:
+                    # This checkup refers to a Source that we no longer care
+                    # about (for example, an account that's been removed from
+                    # the scan). Delete it
+                    results.append((reminder.pk, None))
+                    continue
+
+                # XXX: we could be adding LastModifiedRule twice
+                ib = reminder.interested_before
+                rule_here = AndRule.make(
+                        LastModifiedRule(ib) if ib and not force else True,
+                        spec_template.rule)
+                results.append((reminder.pk, conv_template._deep_replace(
+                        scan_spec__source=rh.source,
+                        handle=rh,
+                        progress__rule=rule_here)))
+
+            if stale := [pk for pk, message in results if message is None]:
+                ScheduledCheckup.objects.filter(pk__in=stale).delete()
+            yield from results
+            after = chunk[-1].pk
+
+    def _add_checkups(
+            self, spec_template: messages.ScanSpecMessage,
+            outbox: list,
+            force: bool,
+            queue_suffix=None) -> int:
+        """Creates instructions to rescan every object covered by this
+        scanner's ScheduledCheckup objects (in the process deleting objects no
+        longer covered by one of this scanner's Sources), and puts them into
+        the provided outbox list. Returns the number of checkups added."""
         checkup_count = 0
-        for reminder in self.checkups.iterator():
-            remapped, rh = self._uncensor_handle(uncensor_map, reminder.handle)
-            if not remapped:
-                # This checkup refers to a Source that we no longer care about
-                # (for example, an account that's been removed from the scan).
-                # Delete it
-                reminder.delete()
-                continue
-
-            # XXX: we could be adding LastModifiedRule twice
-            ib = reminder.interested_before
-            rule_here = AndRule.make(
-                    LastModifiedRule(ib) if ib and not force else True,
-                    spec_template.rule)
-            outbox.append((settings.AMQP_CONVERSION_TARGET,
-                           conv_template._deep_replace(
-                               scan_spec__source=rh.source,
-                               handle=rh,
-                               progress__rule=rule_here),
-                           ),)
-            checkup_count += 1
+        for _pk, message in self._iter_checkups(spec_template, force):
+            if message is not None:
+                outbox.append((settings.AMQP_CONVERSION_TARGET, message))
+                checkup_count += 1
         return checkup_count
 
     def run(
@@ -476,65 +522,59 @@ class Scanner(models.Model):
         If the @force flag is True, then no Last-Modified checks will be
         requested, not even for ScheduledCheckup objects.
 
+        The scan is submitted to the pipeline by a ScanSubmissionJob. If the
+        SCAN_SUBMISSION_IN_BACKGROUND setting is enabled, that job is left for
+        run_background_jobs to run, and this method returns straight away;
+        otherwise, it's run before this method returns.
+
         An exception will be raised if the underlying source is not available,
         and a pika.exceptions.AMQPError (or a subclass) will be raised if it
         was not possible to communicate with the pipeline."""
 
+        from .scan_submission import ScanSubmissionJob  # noqa: avoid circular import
+
         spec_template = self._construct_scan_spec_template(user, force)
         scan_tag = spec_template.scan_tag
 
-        outbox = []
-
+        # Only check that there's something to do for now -- the scan
+        # specifications and conversion messages themselves are built, a chunk
+        # at a time, by the ScanSubmissionJob, which also counts the sources
+        # as it goes
         source_count = 0
         if explore:
-            source_count = self._add_sources(spec_template, outbox, force)
-
-            if source_count == 0:
+            if next(iter(self.generate_sources()), None) is None:
                 raise ValueError(f"{self} produced 0 explorable sources")
+            source_count = 1
 
-        checkup_count = 0
-        if checkup:
-            checkup_count = self._add_checkups(
-                spec_template,
-                outbox,
-                force,
-                queue_suffix=self.organization.name)
+        # (Some of these checkups might turn out to be no longer needed; the
+        # ScanSubmissionJob will correct the total as it deletes them)
+        checkup_count = self.checkups.count() if checkup else 0
 
         if source_count == 0 and checkup_count == 0:
             raise ValueError(f"nothing to do for {self}")
 
         self.save()
 
-        # Use the name of an appropriate organization as queue_suffix for
-        # headers-based routing.
-        queue_suffix = self.organization.name
-
         # Create a model object to track the status of this scan...
         new_status = ScanStatus.objects.create(
                 scanner=self, scan_tag=scan_tag.to_json_object(),
                 last_modified=scan_tag.time, total_sources=source_count,
                 total_objects=checkup_count)
 
-        # Synchronize the 'covered_accounts'-field with accounts, which are
-        # about to be scanned.
-        self.record_covered_accounts(new_status)
-
-        # ... and dispatch the scan specifications to the pipeline!
-        with PikaPipelineThread(
-                queue_suffix=queue_suffix,
-                write={queue for queue, _ in outbox}) as sender:
-
-            for queue, message in outbox:
-                sender.enqueue_message(queue,
-                                       message.to_json_object(),
-                                       exchange=get_exchange(rk=queue),
-                                       **get_headers(organisation=queue_suffix))
-            sender.enqueue_stop()
-            sender.start()
-            sender.join()
+        # ... and a job to dispatch its scan specifications to the pipeline!
+        background = settings.SCAN_SUBMISSION_IN_BACKGROUND
+        job = ScanSubmissionJob.objects.create(
+                scanner=self, scan_status=new_status,
+                explore=explore, checkup=checkup, force=force,
+                checkups_total=checkup_count,
+                _exec_state=(
+                        JobState.WAITING if background
+                        else JobState.RUNNING).value)
+        if not background:
+            job.run_here()
 
         logger.info(
-            "Scan submitted",
+            "Scan submitted" if not background else "Scan queued",
             scan=self,
             pk=self.pk,
             scan_type=self.get_type(),
@@ -571,7 +611,16 @@ class Scanner(models.Model):
             # that we can't know who's covered. (Scan might use a user-list file)
             relevant_units = []
         positions = Position.employees.filter(unit__in=relevant_units)
-        return Account.objects.filter(positions__in=positions).distinct()
+        # (Always in the same order, so that a scan submission can be resumed
+        # after the last Account it got to)
+        return Account.objects.filter(
+                positions__in=positions).distinct().order_by("pk")
+
+    def _covered_accounts_after(self, after=None):
+        """Returns the accounts covered by this scannerjob, starting after the
+        one with the given primary key (if there is one)."""
+        accounts = self.compute_covered_accounts()
+        return accounts.filter(pk__gt=after) if after is not None else accounts
 
     def compute_stale_accounts(self):
         """Computes all accounts that have previously been included in this
@@ -583,15 +632,21 @@ class Scanner(models.Model):
                 pk__in=all_caccs.values_list("account_id", flat=True))
         return all_accs.difference(self.compute_covered_accounts())
 
-    def record_covered_accounts(self, scan_status: ScanStatus):
+    def record_covered_accounts(self, scan_status: ScanStatus, up_to=None):
         """Creates CoveredAccount relations for accounts covered
         by current run of scannerjob.
         I.e. connects a scannerjob, an account and a scanner status
-        """
+
+        If up_to is the primary key of an Account, only that Account and the
+        ones before it are recorded (for example, because a scan submission
+        was cancelled before it got to the others)."""
+        accounts = self.compute_covered_accounts()
+        if up_to is not None:
+            accounts = accounts.filter(pk__lte=up_to)
         objects = [
             CoveredAccount(
                     account=account, scanner=self, scan_status=scan_status)
-            for account in self.compute_covered_accounts()
+            for account in accounts
         ]
         # ignore_conflicts shouldn't be needed here -- but it's harmless, so
         # let's err on the side of letting the scan actually start
@@ -1,11 +1,12 @@
 import pytest
+from collections import deque
 
 from django.db import transaction
 from django.db.utils import DataError
 
 from ..adminapp.management.commands import checkup_collector
 from ..adminapp.management.commands.checkup_collector import (
-    create_usererrorlog, checkup_message_received_raw)
+    CheckupBatch, create_usererrorlog, checkup_message_received_raw)
 from ..adminapp.management.commands.status_collector import status_message_received_raw
 from ..adminapp.models.usererrorlog import UserErrorLog
 from ..adminapp.models.scannerjobs.scanner import ScanStatus, ScheduledCheckup
@@ -98,3 +99,46 @@ class TestPipelineCollector:
         sc = ScheduledCheckup.objects.get(scanner=basic_scanner)
         for hint in ("fresh", "last_modified",):
             assert sc.handle.hint(hint) is None
+
+    def test_checkup_batch(self, positive_web_match_message, basic_scanner):
+        """A CheckupBatch applies its messages in order, and a batch with a
+        match followed by a non-match leaves no checkup behind."""
+        match = positive_web_match_message._deep_replace(
+                scan_spec__scan_tag__scanner__pk=basic_scanner.pk)
+        ScanStatus.objects.create(
+                scanner=basic_scanner,
+                scan_tag=match.scan_spec.scan_tag.to_json_object(),
+                total_sources=1,
+                total_objects=1)
+
+        batch = CheckupBatch(deque())
+        batch.add(match.to_json_object())
+        with transaction.atomic():
+            assert list(batch.apply()) == []
+        assert ScheduledCheckup.objects.filter(scanner=basic_scanner).count() == 1
+
+        batch = CheckupBatch(deque())
+        batch.add(match.to_json_object())
+        batch.add(match._replace(matched=False).to_json_object())
+        with transaction.atomic():
+            list(batch.apply())
+        assert not ScheduledCheckup.objects.filter(scanner=basic_scanner).exists()
+
+    def test_checkup_batch_aborts_once(self, positive_web_match_message, basic_scanner):
+        """A CheckupBatch asks the pipeline to abort a cancelled scan only once,
+        however many of its messages arrive."""
+        match = positive_web_match_message._deep_replace(
+                scan_spec__scan_tag__scanner__pk=basic_scanner.pk)
+        aborted = deque(maxlen=1024)
+
+        outputs = []
+        for _ in range(2):
+            batch = CheckupBatch(aborted)
+            batch.add(match.to_json_object())
+            batch.add(match.to_json_object())
+            with transaction.atomic():
+                outputs.extend(batch.apply())
+
+        assert len(outputs) == 1
+        assert outputs[0][2] == "broadcast"
+        assert not ScheduledCheckup.objects.exists()
@@ -1,4 +1,5 @@
 import pytest
+from types import SimpleNamespace
 
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import RequestFactory
@@ -6,6 +7,7 @@ from unittest import skip
 
 from os2datascanner.engine2.model.data import unpack_data_url
 from os2datascanner.engine2.model.smbc import SMBCSource, SMBCHandle
+from os2datascanner.engine2.model.http import WebSource, WebHandle
 from os2datascanner.engine2.model.msgraph import (
         mail as graph_mail, files as graph_files)
 from os2datascanner.engine2.model.derived import mail
@@ -17,7 +19,9 @@ from os2datascanner.projects.admin.adminapp.models.scannerjobs.scanner \
     import Scanner, ScheduledCheckup
 from os2datascanner.projects.admin.adminapp.views.webscanner_views \
     import WebScannerUpdate
-from ..adminapp.models.scannerjobs.scanner_helpers import CoveredAccount
+from ..adminapp.models.scannerjobs.scan_submission import ScanSubmissionJob
+from ..adminapp.models.scannerjobs.scanner_helpers import (
+        CoveredAccount, ScanStatus)
 
 
 def get_webscannerupdate_view(user):
@@ -152,6 +156,107 @@ class TestScanners:
         assert covered_accounts.count() == 3
         assert all(acc in covered_accounts for acc in (fritz, günther, hansi))
 
+    def test_sources_resume_after_account(
+            self,
+            msgraph_mailscanner,
+            nisserne,
+            fritz_email_alias,
+            günther_email_alias,
+            hansi_email_alias,
+            settings):
+        """The Sources of a CoveredAccount-aware scanner are produced in order
+        of Account, and can be resumed after a given Account."""
+        settings.SCAN_SUBMISSION_CHUNK_SIZE = 2
+        msgraph_mailscanner.grant.client_secret = "A very secret secret"
+        msgraph_mailscanner.org_unit.add(nisserne)
+        sst = msgraph_mailscanner._construct_scan_spec_template(
+                user=None, force=False)
+
+        everything = list(msgraph_mailscanner._iter_sources(sst, force=False))
+        accounts = [pk for pk, _ in everything]
+        assert accounts == sorted(accounts) and len(accounts) == 3
+
+        rest = list(msgraph_mailscanner._iter_sources(
+                sst, force=False, after=accounts[0]))
+        assert rest == everything[1:]
+
+        # A ScanSubmissionJob that's interrupted after sending the first chunk
+        # should send only the rest when run again
+        sent = []
+        sender = SimpleNamespace(
+                enqueue_message=lambda queue, message, **kwargs: sent.append(
+                        message["source"]),
+                synchronise=lambda timeout: None)
+        job = ScanSubmissionJob.objects.create(scanner=msgraph_mailscanner)
+        job._should_stop = lambda: True
+        assert not job._send_sources(msgraph_mailscanner, sst, sender)
+        assert job.last_account == accounts[1] and job.sources_sent == 2
+
+        job = ScanSubmissionJob.objects.get(pk=job.pk)
+        assert job._send_sources(msgraph_mailscanner, sst, sender)
+        assert sent == [spec.source.to_json_object() for _, spec in everything]
+
+    def test_cancelled_submission_covers_sent_accounts(
+            self,
+            msgraph_mailscanner,
+            nisserne,
+            fritz_email_alias,
+            günther_email_alias,
+            hansi_email_alias,
+            settings):
+        """A ScanSubmissionJob that's cancelled before sending every Source
+        only records the Accounts whose Sources were all sent as covered."""
+        settings.SCAN_SUBMISSION_CHUNK_SIZE = 2
+        msgraph_mailscanner.grant.client_secret = "A very secret secret"
+        msgraph_mailscanner.org_unit.add(nisserne)
+        sst = msgraph_mailscanner._construct_scan_spec_template(
+                user=None, force=False)
+        accounts = list(msgraph_mailscanner.compute_covered_accounts())
+        status = ScanStatus.objects.create(
+                scanner=msgraph_mailscanner,
+                scan_tag=sst.scan_tag.to_json_object(), total_sources=1)
+
+        sender = SimpleNamespace(
+                enqueue_message=lambda queue, message, **kwargs: None,
+                synchronise=lambda timeout: None)
+        job = ScanSubmissionJob.objects.create(
+                scanner=msgraph_mailscanner, scan_status=status)
+        job._should_stop = lambda: True
+        assert not job._send_sources(msgraph_mailscanner, sst, sender)
+
+        status.refresh_from_db()
+        assert status.total_sources == 3, "scan could look finished early"
+        assert job.progress is None
+
+        job._finalise(msgraph_mailscanner)
+        status.refresh_from_db()
+        assert status.total_sources == 2
+        assert set(CoveredAccount.objects.filter(
+                scanner=msgraph_mailscanner).values_list(
+                "account", flat=True)) == {a.pk for a in accounts[:2]}
+
+    def test_checkups_read_in_chunks(self, web_scanner, settings):
+        """ScheduledCheckups are read (and, if they're no longer needed,
+        deleted) a chunk at a time, and can be resumed from a given checkup."""
+        settings.SCAN_SUBMISSION_CHUNK_SIZE = 2
+        source = list(web_scanner.generate_sources())[0]
+        other = WebSource("http://www.example.org/")
+        checkups = [
+            ScheduledCheckup.objects.create(
+                    scanner=web_scanner, path=f"/page{i}",
+                    handle_representation=WebHandle(
+                            s, f"page{i}").to_json_object())
+            for i, s in enumerate((source, other, source, other, source))]
+
+        sst = web_scanner._construct_scan_spec_template(user=None, force=False)
+        results = list(web_scanner._iter_checkups(
+                sst, force=False, after=checkups[0].pk))
+
+        assert [pk for pk, _ in results] == [c.pk for c in checkups[1:]]
+        assert [m is None for _, m in results] == [True, False, True, False]
+        assert set(ScheduledCheckup.objects.values_list("pk", flat=True)) == {
+                checkups[0].pk, checkups[2].pk, checkups[4].pk}
+
     @skip("Accounts are now required, but this test doesn't create one")
     def test_scheduled_checkup_cleanup_bug(
             self,
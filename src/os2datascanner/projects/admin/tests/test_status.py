@@ -1,6 +1,11 @@
+from collections import deque
+
 import pytest
 
+from os2datascanner.engine2.pipeline import messages
 from os2datascanner.projects.admin.adminapp.management.commands import status_collector
+from os2datascanner.projects.admin.adminapp.models.scannerjobs.scanner import (
+        ScanStatusSnapshot)
 
 
 def record_status(status):
@@ -79,3 +84,54 @@ class TestStatus:
 
         basic_scanstatus.refresh_from_db()
         assert basic_scanstatus.explored_sources == 5
+
+    def test_batched_status(
+            self,
+            basic_scan_tag,
+            basic_scanstatus,
+            status_message_10_objects,
+            status_message_with_object_size):
+        """Applying several status messages at once has the same effect as
+        applying them one at a time, but takes at most one snapshot."""
+        basic_scanstatus.total_sources = 1
+        basic_scanstatus.save()
+
+        delta = status_collector.StatusDelta(
+                basic_scan_tag.scanner.pk, basic_scan_tag.to_json_object())
+        delta.add(status_message_10_objects)
+        for _ in range(0, 4):
+            delta.add(status_message_with_object_size)
+        list(status_collector.apply_status_delta(delta))
+
+        basic_scanstatus.refresh_from_db()
+        assert basic_scanstatus.explored_sources == 1
+        assert basic_scanstatus.total_objects == 10
+        assert basic_scanstatus.scanned_objects == 4
+        assert basic_scanstatus.scanned_size == 400
+        assert basic_scanstatus.message == "status_message_with_object_size"
+        assert ScanStatusSnapshot.objects.filter(
+                scan_status=basic_scanstatus).count() == 1
+
+    def test_finished_announced_once(
+            self,
+            basic_scanstatus,
+            status_message_with_object_size):
+        """A finished scan is announced to the pipeline once, even if more
+        status messages arrive for it afterwards."""
+        basic_scanstatus.total_sources = 1
+        basic_scanstatus.explored_sources = 1
+        basic_scanstatus.total_objects = 1
+        basic_scanstatus.save()
+
+        announced = deque()
+        body = status_message_with_object_size.to_json_object()
+        first = list(status_collector.status_message_received_raw(
+                body, announced))
+        second = list(status_collector.status_message_received_raw(
+                body, announced))
+
+        assert [
+            messages.ScanTagFragment.from_json_object(cmd["finished"]).scanner
+            for _, cmd, _, _ in first] == [
+                status_message_with_object_size.scan_tag.scanner]
+        assert second == []
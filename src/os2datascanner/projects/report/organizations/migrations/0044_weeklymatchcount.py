@@ -0,0 +1,30 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0043_outlookcategory_unique_outlook_categories'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklyMatchCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week', models.DateField(verbose_name='week')),
+                ('new', models.IntegerField(default=0, verbose_name='new matches')),
+                ('handled', models.IntegerField(default=0, verbose_name='handled matches')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_match_counts', to='organizations.account', verbose_name='account')),
+            ],
+            options={
+                'verbose_name': 'weekly match count',
+                'verbose_name_plural': 'weekly match counts',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='weeklymatchcount',
+            constraint=models.UniqueConstraint(fields=('account', 'week'), name='weekly_match_count_unique_account_week'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+from datetime import timezone as dt_timezone
+
+from django.db import migrations
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncWeek
+
+
+def backfill_match_counters(apps, schema_editor):
+    """Counts the matches of every Account from scratch, and fills in the
+    WeeklyMatchCount table, so that the incrementally maintained match
+    counters have something correct to start from."""
+    Account = apps.get_model("organizations", "Account")
+    WeeklyMatchCount = apps.get_model("organizations", "WeeklyMatchCount")
+    DocumentReport = apps.get_model("os2datascanner_report", "DocumentReport")
+
+    # Shared aliases and remediator aliases don't count towards an account's
+    # own matches
+    relevant = DocumentReport.objects.filter(
+        number_of_matches__gte=1,
+        alias_relation__shared=False,
+        alias_relation___alias_type__in=("SID", "email", "generic"),
+    ).order_by().values(account=F("alias_relation__account"))
+
+    counters = {
+        row.pop("account"): row
+        for row in relevant.annotate(
+            match_count=Count("pk", distinct=True, filter=Q(
+                resolution_status__isnull=True, only_notify_superadmin=False)),
+            withheld_matches=Count("pk", distinct=True, filter=Q(
+                resolution_status__isnull=True, only_notify_superadmin=True)),
+            handled_matches=Count("pk", distinct=True, filter=Q(
+                resolution_status__isnull=False, only_notify_superadmin=False)))}
+
+    weeks = {}
+    for field, kind, filters in (
+            ("created_timestamp", "new", {}),
+            ("resolution_time", "handled", {"resolution_status__isnull": False}),):
+        for account, week, count in relevant.filter(
+                only_notify_superadmin=False,
+                **{f"{field}__isnull": False}, **filters).annotate(
+                week=TruncWeek(field, tzinfo=dt_timezone.utc)).values_list(
+                "account", "week").annotate(count=Count("pk", distinct=True)):
+            key = (account, week.astimezone(dt_timezone.utc).date())
+            weeks.setdefault(key, {"new": 0, "handled": 0})[kind] = count
+
+    WeeklyMatchCount.objects.all().delete()
+    WeeklyMatchCount.objects.bulk_create(
+        (WeeklyMatchCount(account_id=account, week=week, **counts)
+         for (account, week), counts in weeks.items()),
+        batch_size=10000)
+
+    Account.objects.update(
+        match_count=0, withheld_matches=0, handled_matches=0)
+    for account, row in counters.items():
+        Account.objects.filter(pk=account).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0044_weeklymatchcount'),
+        ('os2datascanner_report', '0082_recrunch_ews'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_match_counters, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.11 on 2026-10-18 01:59
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0045_backfill_match_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='account',
+            name='match_status',
+        ),
+    ]
@@ -1,5 +1,5 @@
 # Import needed here for django models:
-from .account import Account, AccountSerializer  # noqa
+from .account import Account, AccountSerializer, WeeklyMatchCount  # noqa
 from .account_outlook_setting import AccountOutlookSetting, OutlookCategory  # noqa
 from .aliases import Alias, AliasSerializer  # noqa
 from .aliases import AliasType  # noqa
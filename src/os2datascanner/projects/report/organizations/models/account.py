@@ -14,11 +14,13 @@
 import os
 import structlog
 from PIL import Image
-from datetime import timedelta
+from datetime import datetime, time, timedelta, timezone as dt_timezone
 from rest_framework import serializers
 from rest_framework.fields import UUIDField
 from django.conf import settings
-from django.db.models import Count
+from django.db.models import (
+        Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When)
+from django.db.models.functions import Coalesce, TruncWeek
 from django.db import models
 from django.db.models.signals import post_save
 from django.utils.translation import gettext_lazy as _
@@ -49,6 +51,34 @@ class StatusChoices(models.IntegerChoices):
 
 
 class AccountQuerySet(models.QuerySet):
+    def with_match_status(self):
+        """Annotates each Account in this QuerySet with its current match
+        status, as the current_match_status field. (See Account.match_status
+        for the details.)"""
+        since = week_of(timezone.now()) - timedelta(weeks=STATUS_WEEKS - 1)
+        recent = WeeklyMatchCount.objects.filter(
+                account=OuterRef("pk"), week__gte=since).order_by().values(
+                "account")
+
+        def _sum(field):
+            return Coalesce(Subquery(
+                    recent.annotate(total=Sum(field)).values("total")), 0)
+
+        return self.annotate(
+                _recent_new=_sum("new"),
+                _recent_handled=_sum("handled")).annotate(
+                # Positive when fewer than three quarters of the recent
+                # matches have been handled
+                _recent_shortfall=F("_recent_new") * 3
+                - F("_recent_handled") * 4).annotate(
+                current_match_status=Case(
+                        When(Q(match_count=0) | Q(match_count__isnull=True),
+                             then=Value(StatusChoices.GOOD.value)),
+                        When(Q(_recent_handled=0) | Q(_recent_shortfall__gt=0),
+                             then=Value(StatusChoices.BAD.value)),
+                        default=Value(StatusChoices.OK.value),
+                        output_field=models.IntegerField()))
+
     def create_account_outlook_setting(self, categorize_email: bool = False):
         """ Queryset method that'll create AccountOutlookSetting
         objects for every Account in queryset, that currently has none.
@@ -146,6 +176,11 @@ class AccountManager(models.Manager):
         return super().bulk_update(objs, fields, **kwargs)
 
 
+STATUS_WEEKS = 3
+"""The number of weeks (including the current one) that the match status of an
+Account looks back over."""
+
+
 def weekly_match(**timestamps):
     """
     Returns a dict representing a summary
@@ -158,6 +193,42 @@ def weekly_match(**timestamps):
         } | timestamps
 
 
+def week_of(timestamp):
+    """Returns the date of the Monday (in UTC) of the week in which the given
+    timestamp falls, or None if there is no timestamp."""
+    if timestamp is None:
+        return None
+    day = timestamp.astimezone(dt_timezone.utc).date()
+    return day - timedelta(days=day.weekday())
+
+
+def summarise_weeks(unhandled: int, new: dict, handled: dict, weeks: int):
+    """Builds a list of weekly match summaries, starting with the current week
+    and going backwards, from the number of matches that are unhandled now and
+    the number of matches that were found and handled in each week (given as
+    dicts that map the dates returned by week_of to counts).
+
+    The number of unhandled matches at the end of a week is the number at the
+    end of the following week, less the matches found in that following week,
+    plus the matches handled in it."""
+    this_monday = week_of(timezone.now())
+    matches_by_week = []
+    for i in range(weeks):
+        monday = this_monday - timedelta(weeks=i)
+        if i > 0:
+            following = monday + timedelta(weeks=1)
+            unhandled += handled.get(following, 0) - new.get(following, 0)
+        begin = datetime.combine(monday, time(), tzinfo=dt_timezone.utc)
+        matches_by_week.append(weekly_match(
+                begin_monday=begin,
+                end_monday=begin + timedelta(weeks=1),
+                weeknum=monday.isocalendar().week,
+                matches=unhandled,
+                new=new.get(monday, 0),
+                handled=handled.get(monday, 0)))
+    return matches_by_week
+
+
 class Account(Core_Account):
     """ Core logic lives in the core_organizational_structure app.
     Additional logic can be implemented here """
@@ -199,11 +270,6 @@ class Account(Core_Account):
         blank=True,
         verbose_name=_("Number of handled matches")
     )
-    match_status = models.IntegerField(
-        choices=StatusChoices.choices,
-        default=1,
-        null=True,
-        blank=True)
     contact_person = models.BooleanField(_("Contact person"), default=False)
 
     def update_last_handle(self):
@@ -220,165 +286,112 @@ class Account(Core_Account):
     def image(self):
         return os.path.join(settings.MEDIA_ROOT, self._image.url) if self._image else None
 
+    @property
+    def match_status(self) -> StatusChoices:
+        """The status of this Account: GOOD if it has no unhandled matches,
+        BAD if it has handled none, or fewer than three quarters, of the
+        matches found in the last three weeks, and OK otherwise.
+
+        As the status changes with the passing of time as well as with the
+        matches, it isn't stored; it's worked out from the match counters when
+        it's needed. (To avoid one query per Account, annotate a QuerySet with
+        AccountQuerySet.with_match_status first.)"""
+        status = getattr(self, "current_match_status", None)
+        if status is None:
+            status = Account.objects.filter(
+                    pk=self.pk).with_match_status().values_list(
+                    "current_match_status", flat=True).get()
+        return StatusChoices(status)
+
     @property
     def status(self):
-        return StatusChoices(self.match_status).label
+        return self.match_status.label
 
-    def _count_matches(self, exclude_shared=False):
-        """Counts the number of unhandled matches associated with the account."""
+    def _relevant_reports(self, exclude_shared=False):
+        """Returns a QuerySet of the DocumentReports with matches that are
+        associated with this account (through aliases other than remediator
+        aliases), each of which appears only once."""
         from ...reportapp.models.documentreport import DocumentReport
         aliases = self.aliases.exclude(_alias_type=AliasType.REMEDIATOR)
         if exclude_shared:
             aliases = aliases.exclude(shared=True)
-        reports = DocumentReport.objects.filter(  # noqa: ECE001
-            alias_relation__in=aliases,
-            number_of_matches__gte=1,
-            resolution_status__isnull=True).values(
-                "only_notify_superadmin").order_by(
-                    "only_notify_superadmin").annotate(
-            count=Count("only_notify_superadmin")).values(
-            "only_notify_superadmin",
-            "resolution_status",
-            "count")
-
-        # TODO: Revisit logic below (and its tests, organizations/tests/test_accounts.py)
+        return DocumentReport.objects.filter(
+            pk__in=DocumentReport.objects.filter(
+                alias_relation__in=aliases).values("pk"),
+            number_of_matches__gte=1)
+
+    def _count_matches(self, exclude_shared=False):
+        """Counts the number of matches associated with the account from
+        scratch. (The match counters are normally maintained incrementally by
+        reportapp.models.match_counters; this is used to check and repair
+        them.)"""
+        reports = self._relevant_reports(exclude_shared).values(
+                "only_notify_superadmin").annotate(
+            unhandled=Count("pk", filter=Q(resolution_status__isnull=True)),
+            handled=Count("pk", filter=Q(resolution_status__isnull=False)))
+
         self.match_count = 0
         self.withheld_matches = 0
         self.handled_matches = 0
 
-        # reports contains as many dicts as there are (only_notify_superadmin,
-        # resolution_status) pairs, so we need to add them up instead of overwriting
-        # a single value
         for obj in reports:
-            if obj.get("only_notify_superadmin"):
-                self.withheld_matches += obj.get("count", 0)
-            elif obj.get("resolution_status") is not None:
-                self.handled_matches += obj.get("count", 0)
+            if obj["only_notify_superadmin"]:
+                # Handled withheld matches aren't counted anywhere
+                self.withheld_matches += obj["unhandled"]
             else:
-                self.match_count += obj.get("count", 0)
-
-    def _calculate_status(self, exclude_shared=False):
-        """Calculate the status of the user. The user can have one of three
-        statuses: GOOD, OK and BAD. The status is calulated on the basis of
-        the number of matches associated with the user, and how often the user
-        has handled matches recently."""
-
-        matches_by_week = self.count_matches_by_week(weeks=3, exclude_shared=exclude_shared)
-
-        total_new = 0
-        total_handled = 0
-        for week_obj in matches_by_week:
-            total_new += week_obj["new"]
-            total_handled += week_obj["handled"]
-
-        if matches_by_week[0]["matches"] == 0:
-            self.match_status = StatusChoices.GOOD
-        elif total_handled == 0 or total_new != 0 and total_handled/total_new < 0.75:
-            self.match_status = StatusChoices.BAD
-        else:
-            self.match_status = StatusChoices.OK
+                self.match_count += obj["unhandled"]
+                self.handled_matches += obj["handled"]
 
-    def count_matches_by_week(self, weeks: int = 52, exclude_shared=False):  # noqa: CCR001
+    def count_matches_by_week(self, weeks: int = 52, exclude_shared=False):
         """
         This method counts the number of (unhandled) matches, the number of
         new matches and the number of handled matches on a weekly basis.
 
+        If shared aliases are excluded, the counts are read from the
+        incrementally maintained match counters of this account; otherwise,
+        they're computed by the database.
+
         Keyword arguments:
           week -- the number of weeks to count matches for.
         """
-        # This is placed here to avoid circular import
-        from os2datascanner.projects.report.reportapp.models.documentreport import DocumentReport
-
-        aliases = self.aliases.exclude(_alias_type=AliasType.REMEDIATOR)
+        since = week_of(timezone.now()) - timedelta(weeks=weeks - 1)
         if exclude_shared:
-            aliases = aliases.exclude(shared=True)
-
-        all_matches = DocumentReport.objects.filter(
-            number_of_matches__gte=1,
-            alias_relation__in=aliases,
-            only_notify_superadmin=False,
-        ).values(
-            "created_timestamp",
-            "resolution_time",
-            "resolution_status",
-        )
-
-        next_monday = timezone.now() + timedelta(weeks=1) - timedelta(
-                days=timezone.now().weekday(),
-                hours=timezone.now().hour,
-                minutes=timezone.now().minute,
-                seconds=timezone.now().second)
-
-        def get_week(weeks: int):
-            return next_monday - timedelta(weeks=weeks)
-
-        matches_by_week = [
-            weekly_match(begin_monday=get_week(i+1),
-                         end_monday=get_week(i),
-                         weeknum=get_week(i+1).isocalendar().week)
-            for i in range(weeks)
-        ]
-
-        def is_this_week(week: dict, report: dict):
-            """
-            Checks of a report is created before the end of the week.
-            """
-            ctime = report.get("created_timestamp", None)
-            return ctime and ctime < week["end_monday"]
-
-        def is_unhandled(week: dict, report: dict):
-            """
-            Checks if a report is unhandled.
-
-            A report is unhandled if either the status is null
-            or the resolution time is either not set or in the future.
-            """
-            rtime = report.get("resolution_time", None)
-            status = report.get("resolution_status", None)
-            return status is None or not rtime or rtime > week["end_monday"]
-
-        def is_handled(week: dict, report: dict):
-            """
-            Checks if a report is handled.
-
-            A report is handled if the status is set and the resolution
-            time is within this week.
-            """
-            rtime = report.get("resolution_time", None)
-            status = report.get("resolution_status", None)
-            return status is not None and week["begin_monday"] <= rtime < week["end_monday"]
-
-        def is_new(week: dict, report: dict):
-            """
-            Check if a report is new.
-
-            A report is new if the created timestamp is within
-            this week.
-            """
-            ctime = report.get("created_timestamp", None)
-            return ctime and week["begin_monday"] <= ctime < week["end_monday"]
-
-        for week in matches_by_week:
-            for report in all_matches:
-                # set temporary timestamps if missing.
-                if not report.get("created_timestamp"):
-                    logger.warning(
-                        "Encountered a DocumentReport object without a created_timestamp!")
-                    report["created_timestamp"] = timezone.make_aware(timezone.datetime(1970, 1, 1))
-
-                # Skip reports that are not in this week
-                if not is_this_week(week, report):
-                    continue
-
-                if is_new(week, report):
-                    week["new"] += 1
-
-                if is_unhandled(week, report):
-                    week["matches"] += 1
-                elif is_handled(week, report):
-                    week["handled"] += 1
-
-        return matches_by_week
+            new, handled = {}, {}
+            for week, n, h in self.weekly_match_counts.filter(
+                    week__gte=since).values_list("week", "new", "handled"):
+                new[week], handled[week] = n, h
+            return summarise_weeks(self.match_count or 0, new, handled, weeks)
+
+        reports = self._relevant_reports(exclude_shared).filter(
+            only_notify_superadmin=False)
+        return summarise_weeks(
+            reports.filter(resolution_status__isnull=True).count(),
+            *self._count_weeks(exclude_shared, since),
+            weeks)
+
+    def _count_weeks(self, exclude_shared=False, since=None):
+        """Counts the number of (non-withheld) matches associated with the
+        account that were found and handled in each week (optionally only
+        from the week starting on the given Monday onwards) from scratch.
+        Returns two dicts that map the dates returned by week_of to counts."""
+        reports = self._relevant_reports(exclude_shared).filter(
+            only_notify_superadmin=False)
+        utc_since = (datetime.combine(since, time(), tzinfo=dt_timezone.utc)
+                     if since else None)
+
+        def _by_week(field, **filters):
+            if utc_since:
+                filters[f"{field}__gte"] = utc_since
+            return {
+                ts.astimezone(dt_timezone.utc).date(): count
+                for ts, count in reports.filter(
+                    **{f"{field}__isnull": False}, **filters).annotate(
+                        week=TruncWeek(field, tzinfo=dt_timezone.utc)).order_by(
+                        ).values_list("week").annotate(count=Count("pk"))}
+
+        return (
+            _by_week("created_timestamp"),
+            _by_week("resolution_time", resolution_status__isnull=False))
 
     def managed_by(self, account):
         units = self.units.all() & account.get_managed_units()
@@ -406,12 +419,42 @@ class Account(Core_Account):
         else:
             return False
 
+    COUNTER_FIELDS = ("match_count", "withheld_matches", "handled_matches",)
+    """The fields of an Account that are maintained by the match counters (see
+    reportapp.models.match_counters) rather than by saving the Account."""
+
     def save(self, *args, **kwargs):
+        # Make sure that we don't overwrite the match counters with stale
+        # values. (Call refresh_from_db to pick up their current values)
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+        return super().save(*args, **kwargs)
 
-        self._count_matches(exclude_shared=True)
-        self._calculate_status(exclude_shared=True)
 
-        return super().save(*args, **kwargs)
+class WeeklyMatchCount(models.Model):
+    """A WeeklyMatchCount records how many matches associated with an Account
+    were found, and how many were handled, in a given week. (Like the match
+    counters on the Account itself, these are maintained incrementally by
+    reportapp.models.match_counters.)"""
+    account = models.ForeignKey(
+        Account,
+        on_delete=models.CASCADE,
+        related_name="weekly_match_counts",
+        verbose_name=_("account"))
+    week = models.DateField(verbose_name=_("week"))
+    new = models.IntegerField(default=0, verbose_name=_("new matches"))
+    handled = models.IntegerField(default=0, verbose_name=_("handled matches"))
+
+    class Meta:
+        verbose_name = _("weekly match count")
+        verbose_name_plural = _("weekly match counts")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["account", "week"],
+                name="weekly_match_count_unique_account_week")
+        ]
 
 
 @receiver(post_save, sender=Account)
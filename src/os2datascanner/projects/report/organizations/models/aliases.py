@@ -43,17 +43,18 @@ class AliasQuerySet(models.query.QuerySet):
     def delete(self):
         # Avoid circular import
         from os2datascanner.projects.report.reportapp.management.commands.result_collector import \
-            create_aliases
+            create_aliases_for
         from os2datascanner.projects.report.reportapp.models.documentreport import DocumentReport
+        from os2datascanner.projects.report.reportapp.models.match_counters import tracking
 
         associated_report_keys = set(self.associated_report_keys())
 
-        with transaction.atomic():
+        with transaction.atomic(), tracking(
+                DocumentReport.objects.filter(pk__in=associated_report_keys)):
             rv = super().delete()
-            for dr in DocumentReport.objects.filter(
+            create_aliases_for(DocumentReport.objects.filter(
                     pk__in=associated_report_keys,
-                    raw_metadata__isnull=False).iterator():
-                create_aliases(dr)
+                    raw_metadata__isnull=False))
             return rv
 
     def update(self, **kwargs):
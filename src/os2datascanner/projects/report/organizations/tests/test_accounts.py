@@ -1,12 +1,19 @@
 import datetime
 import json
-
-from django.test import TestCase
+import threading
+import time
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
 from django.utils import timezone
 
 from ..models import Account, Organization, Alias
 from ..models.account import StatusChoices
 from ...reportapp.models.documentreport import DocumentReport
+from ...reportapp.models.match_counters import tracking
 
 
 # This is a real raw_matches field from test data. This could probably be done
@@ -259,8 +266,8 @@ class AccountTest(TestCase):
         # Matches related to a remediator should be ignored:
         make_matched_document_reports_for(self.egon_rem_alias, handled=5, amount=10)
 
-        # This is the real test. This is where .match_count and .match_status are set.
-        self.egon_acc.save()
+        # The match counters were kept up to date as the reports were made
+        self.egon_acc.refresh_from_db()
 
         self.assertEqual(
             self.egon_acc.match_count,
@@ -296,10 +303,10 @@ class AccountTest(TestCase):
         # Matches related to a remediator should be ignored:
         make_matched_document_reports_for(self.egon_rem_alias, handled=5, amount=10)
 
-        # This is where the match_status and match_count are set.
-        self.egon_acc.save()
-        self.benny_acc.save()
-        self.kjeld_acc.save()
+        # The match counters were kept up to date as the reports were made
+        self.egon_acc.refresh_from_db()
+        self.benny_acc.refresh_from_db()
+        self.kjeld_acc.refresh_from_db()
 
         self.assertEqual(egon_all-egon_handled, self.egon_acc.match_count)
         self.assertEqual(
@@ -331,7 +338,7 @@ class AccountTest(TestCase):
         # Matches related to a remediator should be ignored:
         make_matched_document_reports_for(self.egon_rem_alias, handled=5, amount=10)
 
-        self.kjeld_acc.save()
+        self.kjeld_acc.refresh_from_db()
 
         self.assertEqual(all_matches-handled, self.kjeld_acc.match_count)
         self.assertEqual(
@@ -357,7 +364,7 @@ class AccountTest(TestCase):
         # Matches related to a remediator should be ignored:
         make_matched_document_reports_for(self.egon_rem_alias, handled=5, amount=10)
 
-        self.benny_acc.save()
+        self.benny_acc.refresh_from_db()
 
         self.assertEqual(all_matches-handled, self.benny_acc.match_count)
         self.assertEqual(
@@ -366,6 +373,21 @@ class AccountTest(TestCase):
             f"Expected match_status to be 'BAD', but found "
             f"{self.egon_acc.match_status.label} instead.")
 
+    def test_match_status_follows_time(self):
+        """The match status of an Account reflects the last three weeks, even
+        when nothing has happened to its matches since."""
+        make_matched_document_reports_for(
+            self.benny_alias, handled=8, amount=10)
+        self.assertEqual(self.benny_acc.match_status, StatusChoices.OK)
+
+        later = timezone.now() + datetime.timedelta(weeks=4)
+        with patch("django.utils.timezone.now", return_value=later):
+            self.assertEqual(self.benny_acc.match_status, StatusChoices.BAD)
+            self.assertEqual(
+                Account.objects.filter(pk=self.benny_acc.pk).with_match_status(
+                    ).get().match_status,
+                StatusChoices.BAD)
+
     def test_count_matches_by_week_format(self):
         """The count_matches_by_week-method should return a list of dicts with
         the following structure:
@@ -482,3 +504,97 @@ class AccountTest(TestCase):
                          "Matches that shouldn't be withheld are counted as withheld!")
         self.assertEqual(self.kjeld_acc.match_count, 10,
                          "Match count is not updated!")
+
+    def test_match_counters_follow_reports(self):
+        """An account's match counters should follow changes to its reports
+        without the account having to be saved."""
+        make_matched_document_reports_for(self.kjeld_alias, handled=0, amount=4)
+        # Matches related to a remediator should be ignored:
+        make_matched_document_reports_for(self.egon_rem_alias, handled=2, amount=4)
+
+        self.kjeld_acc.refresh_from_db()
+        self.egon_acc.refresh_from_db()
+        self.assertEqual(self.kjeld_acc.match_count, 4)
+        self.assertEqual(self.egon_acc.match_count, 0)
+
+        dr = DocumentReport.objects.filter(alias_relation=self.kjeld_alias).first()
+        dr.resolution_status = 0
+        dr.save()
+        dr.alias_relation.remove(self.kjeld_alias)
+        dr.alias_relation.add(self.kjeld_alias)
+
+        self.kjeld_acc.refresh_from_db()
+        self.assertEqual(self.kjeld_acc.match_count, 3)
+        self.assertEqual(self.kjeld_acc.handled_matches, 1)
+        [this_week] = self.kjeld_acc.count_matches_by_week(weeks=1, exclude_shared=True)
+        self.assertEqual(
+            (this_week["matches"], this_week["new"], this_week["handled"]),
+            (3, 4, 1))
+
+    def test_reconcile_match_counters(self):
+        """The reconcile_match_counters command should repair counters that
+        have drifted from the real values."""
+        make_matched_document_reports_for(self.kjeld_alias, handled=2, amount=5)
+        Account.objects.filter(pk=self.kjeld_acc.pk).update(
+            match_count=100, handled_matches=0)
+        self.kjeld_acc.weekly_match_counts.all().delete()
+
+        call_command("reconcile_match_counters", stdout=StringIO())
+
+        self.kjeld_acc.refresh_from_db()
+        self.assertEqual(self.kjeld_acc.match_count, 3)
+        self.assertEqual(self.kjeld_acc.handled_matches, 2)
+        self.assertEqual(
+            sum(self.kjeld_acc.weekly_match_counts.values_list("new", flat=True)),
+            5)
+
+
+class MatchCounterConcurrencyTest(TransactionTestCase):
+
+    def setUp(self) -> None:
+        olsenbanden = Organization.objects.create(name='Olsenbanden')
+        self.kjeld_acc = Account.objects.create(username='kjeld', organization=olsenbanden)
+        self.kjeld_alias = Alias.objects.create(
+            user=self.kjeld_acc.user,
+            account=self.kjeld_acc,
+            _alias_type="generic")
+
+    def test_concurrent_changes_counted_once(self):
+        """Two transactions that change the same report at the same time
+        should not both count the first one's change."""
+        make_matched_document_reports_for(self.kjeld_alias, amount=1)
+        reports = DocumentReport.objects.filter(alias_relation=self.kjeld_alias)
+        first_watching = threading.Event()
+        errors = []
+
+        def handle(wait_for=None):
+            try:
+                if wait_for:
+                    wait_for.wait(5)
+                with transaction.atomic(), tracking(reports):
+                    if not wait_for:
+                        first_watching.set()
+                        # Give the other transaction time to read the report
+                        # (or, rather, to wait for our lock on it)
+                        time.sleep(0.5)
+                    reports.update(resolution_status=0, resolution_time=timezone.now())
+            except Exception as ex:
+                errors.append(ex)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=handle),
+            threading.Thread(target=handle, kwargs={"wait_for": first_watching}),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.kjeld_acc.refresh_from_db()
+        self.assertEqual(self.kjeld_acc.match_count, 0)
+        self.assertEqual(
+            self.kjeld_acc.handled_matches, 1,
+            "the same change was counted by both transactions")
@@ -17,6 +17,7 @@
 
 import structlog
 from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.core.management.base import BaseCommand
 from django.db.transaction import TransactionManagementError
 from rest_framework.serializers import ValidationError
@@ -26,6 +27,7 @@ from os2datascanner.engine2.pipeline.utilities.pika import PikaPipelineThread
 from os2datascanner.projects.report.organizations.models import (Account, Alias, Organization,
                                                                  OrganizationalUnit, Position)
 from os2datascanner.projects.report.reportapp.models.documentreport import DocumentReport
+from os2datascanner.projects.report.reportapp.models.match_counters import tracking
 from prometheus_client import Summary, start_http_server
 from ...utils import create_alias_and_match_relations
 
@@ -39,11 +41,38 @@ ORDER_OF_CREATION = (Organization, OrganizationalUnit, Account, Alias, Position)
 ORDER_OF_DELETION = list(reversed(ORDER_OF_CREATION))
 
 
+def _affected_reports(event_type, classes):
+    """Returns a QuerySet of the DocumentReports whose contributions to the
+    match counters might be changed by a bulk event, or None if there aren't
+    any. (Changes to Aliases and Positions made in bulk don't send the signals
+    that the match counters otherwise rely on.)"""
+    if event_type not in ("bulk_event_create", "bulk_event_update", "bulk_event_delete",):
+        return None
+
+    aliases = classes.get(Alias.__name__) or []
+    positions = classes.get(Position.__name__) or []
+    if event_type == "bulk_event_delete":
+        # Deletion events carry primary keys rather than objects
+        alias_pks, position_pks, accounts = aliases, positions, set()
+    else:
+        alias_pks = [a.get("pk") for a in aliases]
+        position_pks = [p.get("pk") for p in positions]
+        accounts = {p.get("account") for p in positions}
+    accounts.update(Position.objects.filter(
+        pk__in=position_pks).values_list("account_id", flat=True))
+
+    if not alias_pks and not accounts:
+        return None
+    return DocumentReport.objects.filter(
+        Q(alias_relation__in=alias_pks) | Q(alias_relation__account__in=accounts),
+        number_of_matches__gte=1)
+
+
 def event_message_received_raw(body):  # noqa: CCR001 C901
     event_type = body.get("type")
     classes = body.get("classes")
     try:
-        with transaction.atomic():
+        with transaction.atomic(), tracking(_affected_reports(event_type, classes)):
             if event_type == "bulk_event_create":
                 logger.info("Initiating broadcast create transaction...")
                 for model in ORDER_OF_CREATION:
@@ -152,7 +181,9 @@ def handle_clean_account_message(body):
         related_reports = DocumentReport.objects.filter(
             alias_relation__account__in=account_uuids, scanner_job_pk=scanner_pk)
 
-        _, deleted_reports_dict = related_reports.delete()
+        # (Track all of the reports at once rather than one at a time)
+        with transaction.atomic(), tracking(related_reports):
+            _, deleted_reports_dict = related_reports.delete()
         deleted_reports = deleted_reports_dict.get("os2datascanner_report.DocumentReport", 0)
 
         logger.info(
@@ -14,6 +14,7 @@
 #
 # The code is currently governed by OS2 the Danish community of open
 # source municipalities ( https://os2.eu/ )
+import time
 import atexit
 import random
 import string
@@ -42,6 +43,7 @@ from os2datascanner.engine2.model import http
 from os2datascanner.engine2.rules.cpr import CPRRule
 from os2datascanner.engine2.rules.rule import Sensitivity
 from os2datascanner.engine2.pipeline import messages
+from os2datascanner.engine2.pipeline.exporter import censor_outgoing_message
 from os2datascanner.engine2.pipeline.utilities import pika
 from .result_collector import result_message_received_raw
 
@@ -59,6 +61,16 @@ def emit_to_rabbitmq(ppt):
     return _emit_to_rabbitmq
 
 
+def emit_to_results(ppt):
+    """Sends messages straight to the result collectors, as the exporter would
+    have done (and so to the right shard of the os2ds_results queue)."""
+    def _emit_to_results(queue, m):
+        m = censor_outgoing_message(m).to_json_object()
+        m["origin"] = queue
+        ppt.enqueue_message("os2ds_results", m)
+    return _emit_to_results
+
+
 class Command(BaseCommand):
     """Create realistic (but fake) DocumentReports in the database."""
 
@@ -112,9 +124,13 @@ class Command(BaseCommand):
         )
         parser.add_argument(
             "--destination",
-            choices=('rabbit', 'collector'),
+            choices=('rabbit', 'results', 'collector'),
             default='collector',
-            help="send the produced messages to a specific component",
+            help="send the produced messages to a specific component: to the"
+            " exporter's input queues, to the result collectors' (possibly"
+            " sharded) input queue, or straight to the database. (To generate"
+            " load for a benchmark of the result collectors, use 'results' and"
+            " then start them)",
         )
         parser.add_argument(
             "--owner",
@@ -132,16 +148,7 @@ class Command(BaseCommand):
                               )
             sys.exit(1)
 
-        ppt = None
-        emit_message = emit_to_collector
-        if destination == "rabbit":
-            ppt = pika.PikaPipelineThread(
-                    write={"os2ds_metadata", "os2ds_matches"})
-            ppt.daemon = True
-            ppt.start()
-            atexit.register(ppt.enqueue_stop)
-
-            emit_message = emit_to_rabbitmq(ppt)
+        ppt, emit_message = self._make_emitter(destination)
 
         # faker is using the random generator, so seeding here does not give
         # deterministic results for the code executed after calls to Faker.
@@ -170,6 +177,7 @@ class Command(BaseCommand):
         scan_iterator = iter(handle_types.items())
 
         stats = {"scans": 0, "handles": 0, "matches": 0}
+        start = time.monotonic()
 
         if scan_type == "all":
             scan_count = len(handle_types)
@@ -229,12 +237,41 @@ class Command(BaseCommand):
                     )
 
             stats["scans"] += 1
+        self._report(ppt, stats, seed, start)
+
+    @staticmethod
+    def _make_emitter(destination):
+        """Returns a pipeline thread (or None, if messages should go straight
+        to the database) and a function that sends messages to the given
+        destination."""
+        if destination == "rabbit":
+            ppt = pika.PikaPipelineThread(
+                    write={"os2ds_metadata", "os2ds_matches"})
+            emit_message = emit_to_rabbitmq(ppt)
+        elif destination == "results":
+            ppt = pika.PikaPipelineThread(write={"os2ds_results"})
+            emit_message = emit_to_results(ppt)
+        else:
+            return None, emit_to_collector
+
+        ppt.daemon = True
+        ppt.start()
+        atexit.register(ppt.enqueue_stop)
+        return ppt, emit_message
+
+    def _report(self, ppt, stats, seed, start):
+        if ppt:
+            # Make sure that everything has really been sent before we stop
+            # the clock
+            ppt.synchronise()
+        elapsed = time.monotonic() - start
         self.stdout.write(
             self.style.SUCCESS(
                 f'Generated {stats["matches"]} matches '
                 f'from {stats["handles"]} handles '
                 f'in {stats["scans"]} scans '
-                f'using seed {seed}'
+                f'using seed {seed} '
+                f'({stats["handles"] / elapsed:.1f} handles per second)'
             )
         )
 
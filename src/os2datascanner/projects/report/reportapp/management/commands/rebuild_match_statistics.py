@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ....organizations.models import Organization
+from ...models.match_statistics import MatchStatistic, rebuild
+
+
+class Command(BaseCommand):
+    """Recount the statistics shown in the DPO overview from scratch.
+
+    These are normally kept up to date as results come and go, so this is
+    only needed to repair them. (Run it while the collectors are idle, as
+    changes made while it's running might otherwise be counted twice or not
+    at all.)"""
+
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--organization",
+            default=None,
+            help="only recount the statistics of the organization with this"
+                 " UUID")
+
+    def handle(self, *args, organization, **options):
+        if organization:
+            organizations = Organization.objects.filter(uuid=organization)
+        else:
+            organizations = [None]
+
+        for org in organizations:
+            with transaction.atomic():
+                rebuild(org)
+
+        self.stdout.write(self.style.SUCCESS(
+                f"Rebuilt statistics: {MatchStatistic.objects.count()}"
+                " rows."))
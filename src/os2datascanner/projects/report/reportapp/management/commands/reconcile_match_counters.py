@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ....organizations.models import Account, WeeklyMatchCount
+
+
+class Command(BaseCommand):
+    """Recount the matches associated with every Account from scratch, and
+    repair any of their incrementally maintained match counters that have
+    drifted from the real values."""
+
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--organization",
+            default=None,
+            help="only reconcile the accounts of the organization with this"
+                 " UUID")
+        parser.add_argument(
+            "--account",
+            default=None,
+            help="only reconcile the account with this UUID")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="report drifted accounts without repairing them")
+
+    def handle(self, *args, organization, account, dry_run, **options):
+        accounts = Account.objects.all()
+        if organization:
+            accounts = accounts.filter(organization__uuid=organization)
+        if account:
+            accounts = accounts.filter(uuid=account)
+
+        drifted = 0
+        for acc in accounts.iterator():
+            with transaction.atomic():
+                if self.reconcile(acc, dry_run):
+                    drifted += 1
+
+        self.stdout.write(self.style.SUCCESS(
+                f"Reconciled match counters: {drifted} account(s) had"
+                " drifted."))
+
+    def reconcile(self, acc: Account, dry_run: bool) -> bool:
+        """Recounts the matches of a single Account, repairing its counters
+        unless dry_run is set. Returns True if the counters had drifted."""
+        # Lock the Account so that no deltas are applied while we recount
+        acc = Account.objects.select_for_update().get(pk=acc.pk)
+        stored = {field: getattr(acc, field) for field in Account.COUNTER_FIELDS}
+        stored_weeks = {
+            week: (new, handled)
+            for week, new, handled in acc.weekly_match_counts.values_list(
+                    "week", "new", "handled")}
+
+        acc._count_matches(exclude_shared=True)
+        new, handled = acc._count_weeks(exclude_shared=True)
+        weeks = {
+            week: (new.get(week, 0), handled.get(week, 0))
+            for week in new.keys() | handled.keys()}
+
+        changed_weeks = weeks != {
+            week: counts for week, counts in stored_weeks.items()
+            if counts != (0, 0)}
+        if changed_weeks and not dry_run:
+            acc.weekly_match_counts.all().delete()
+            WeeklyMatchCount.objects.bulk_create(
+                    WeeklyMatchCount(account=acc, week=week, new=n, handled=h)
+                    for week, (n, h) in weeks.items())
+
+        current = {field: getattr(acc, field) for field in Account.COUNTER_FIELDS}
+
+        if current == stored and not changed_weeks:
+            return False
+
+        changes = [
+            f"{field} {stored[field]} -> {current[field]}"
+            for field in Account.COUNTER_FIELDS
+            if current[field] != stored[field]]
+        if changed_weeks:
+            changes.append("weekly counts")
+        self.stdout.write(f"{acc.username} ({acc.uuid}): {', '.join(changes)}")
+        if not dry_run:
+            Account.objects.filter(pk=acc.pk).update(**current)
+        return True
@@ -16,9 +16,11 @@
 # source municipalities ( https://os2.eu/ )
 
 import structlog
+from django.conf import settings
 from django.db import transaction
 from django.core.management.base import BaseCommand
 from django.db.models import Q
+from django.db.models.functions import Upper
 
 from os2datascanner.utils import debug
 from os2datascanner.engine2.conversions.types import OutputType
@@ -26,7 +28,9 @@ from os2datascanner.engine2.model.core import (
         Handle, Source, UnknownSchemeError)
 from os2datascanner.engine2.model.msgraph import MSGraphMailSource
 from os2datascanner.engine2.pipeline import messages
-from os2datascanner.engine2.pipeline.utilities.pika import PikaPipelineThread
+from os2datascanner.engine2.pipeline.utilities.pika import BatchingPipelineThread
+from os2datascanner.engine2.pipeline.utilities.sharding import (
+        ShardRouter, base_queue)
 from os2datascanner.engine2.rules.last_modified import LastModifiedRule
 from os2datascanner.projects.report.organizations.models import Alias, AliasType, Organization
 from os2datascanner.utils.system_utilities import time_now
@@ -34,6 +38,8 @@ from prometheus_client import Summary, start_http_server
 
 
 from ...models.documentreport import DocumentReport
+from ...models.match_counters import tracking
+from ...models.match_statistics import fold_deltas
 from ...utils import prepare_json_object
 from ....organizations.models import AccountOutlookSetting
 from ...views.utilities.msgraph_utilities import outlook_settings_from_owner
@@ -45,11 +51,15 @@ SUMMARY = Summary("os2datascanner_result_collector_report",
 ResolutionChoices = DocumentReport.ResolutionChoices
 
 
-def result_message_received_raw(body):
+def result_message_received_raw(body, aliases=None):
     """Method for restructuring and storing result body.
 
     The agreed structure is as follows:
     {'scan_tag': {...}, 'matches': null, 'metadata': null, 'problem': null}
+
+    If a list is given as the aliases parameter, then the DocumentReports that
+    need alias relations are appended to it instead of being given them
+    straight away.
     """
     reference = body.get("handle") or body.get("source")
     tag, queue = _identify_message(body)
@@ -69,17 +79,75 @@ def result_message_received_raw(body):
         if not body.get("handle") else None,
     )
 
-    with transaction.atomic():
+    with transaction.atomic(), tracking(
+            # (A batch tracks all of its reports at once)
+            _reports_for([body]) if aliases is None else None):
         if queue == "matches":
             handle_match_message(tag, body)
         elif queue == "problem":
             handle_problem_message(tag, body)
         elif queue == "metadata":
-            yield from handle_metadata_message(tag, body)
+            yield from handle_metadata_message(tag, body, aliases)
 
     yield from []
 
 
+def _result_target(body):
+    """Returns the primary key of the scanner job and the (crunched) path of
+    the object that a result message is about, which together identify the
+    DocumentReport that it affects, or None if it isn't about anything."""
+    tag, _ = _identify_message(body)
+    if body.get("handle"):
+        obj = Handle.from_json_object(body["handle"])
+    elif body.get("source"):
+        obj = Source.from_json_object(body["source"])
+    else:
+        return None
+    return ((tag or {}).get("scanner", {}).get("pk") or 0,
+            obj.crunch(hash=True))
+
+
+def _reports_for(bodies):
+    """Returns a QuerySet that includes every DocumentReport that the given
+    result messages could affect."""
+    paths, scanners = set(), set()
+    for body in bodies:
+        if (target := _result_target(body)):
+            scanner_pk, path = target
+            paths.add(path)
+            scanners.add(scanner_pk)
+    return DocumentReport.objects.filter(
+            path__in=paths, scanner_job_pk__in=scanners)
+
+
+def _result_key(body):
+    """Returns a key that identifies the DocumentReport that a result message
+    is about. (Unlike the raw message, this doesn't depend on hints or on
+    censoring, so messages about the same object always have the same
+    key.)"""
+    return _result_target(body) or (0, "")
+
+
+def result_messages_received_raw(bodies):
+    """Stores several result messages in a single transaction.
+
+    Messages about the same object are handled in the order in which they were
+    received, but objects are handled in a fixed order, so that result
+    collectors working on overlapping batches lock DocumentReports in the same
+    order. Alias relations are created for the whole batch at once."""
+    aliases = []
+    bodies = sorted(filter(None, bodies), key=_result_key)
+    with transaction.atomic(), tracking(_reports_for(bodies)):
+        for body in bodies:
+            yield from result_message_received_raw(body, aliases)
+
+        # (A later message in the batch might have deleted a report that an
+        # earlier one wanted to give alias relations to)
+        live = set(DocumentReport.objects.filter(
+                pk__in=[dr.pk for dr in aliases]).values_list("pk", flat=True))
+        create_aliases_for([dr for dr in aliases if dr.pk in live])
+
+
 def owner_from_metadata(message: messages.MetadataMessage) -> str:
     owner = ""
     if (email := message.metadata.get("email-account")
@@ -100,7 +168,31 @@ def outlook_categorize_enabled(owner: str) -> bool:
                                                      categorize_email=True))
 
 
-def handle_metadata_message(scan_tag, result):
+def _last_modified_from_metadata(scan_tag, message: messages.MetadataMessage):
+    if "last-modified" in message.metadata:
+        return OutputType.LastModified.decode_json_object(
+                message.metadata["last-modified"])
+    else:
+        # If no scan_tag time is found, default value to current time as this
+        # must be some-what close to actual scan_tag time.
+        # If no datasource_last_modified value is ever set, matches will not be
+        # shown.
+        return scan_tag.time or time_now()
+
+
+def _is_outlook_false_positive(owner: str, message: messages.MetadataMessage) -> bool:
+    """Specific to Outlook matches - checks if they have the owner's "False
+    Positive" category set."""
+    outlook_categories = message.metadata.get("outlook-categories", [])
+    settings = outlook_settings_from_owner(owner)
+    if outlook_categories and settings and settings.false_positive_category:
+        return (settings.false_positive_category.category_name in
+                outlook_categories)
+    else:
+        return False
+
+
+def handle_metadata_message(scan_tag, result, aliases=None):
     # Evaluate the queryset that is updated later to lock it.
     message = messages.MetadataMessage.from_json_object(result)
     path = message.handle.crunch(hash=True)
@@ -114,25 +206,10 @@ def handle_metadata_message(scan_tag, result):
     ).first()
 
     resolution_status = None
-    lm = None
-    if "last-modified" in message.metadata:
-        lm = OutputType.LastModified.decode_json_object(
-                message.metadata["last-modified"])
-    else:
-        # If no scan_tag time is found, default value to current time as this
-        # must be some-what close to actual scan_tag time.
-        # If no datasource_last_modified value is ever set, matches will not be
-        # shown.
-        lm = scan_tag.time or time_now()
+    lm = _last_modified_from_metadata(scan_tag, message)
 
-    # Specific to Outlook matches - if they have a "False Positive" category set, resolve them.
-    outlook_categories = message.metadata.get("outlook-categories", [])
-    settings = outlook_settings_from_owner(owner)
-    if outlook_categories and settings and settings.false_positive_category:
-        outlook_false_positive = (settings.false_positive_category.category_name in
-                                  outlook_categories)
-    else:
-        outlook_false_positive = False
+    # If they have a "False Positive" category set, resolve them.
+    outlook_false_positive = _is_outlook_false_positive(owner, message)
 
     # If the report is already handled as a false positive, keep it handled in that way.
     previous_false_positive = (scan_tag.scanner.keep_fp and previous_report and
@@ -166,7 +243,10 @@ def handle_metadata_message(scan_tag, result):
         else:
             logger.debug(f"Categorizing mail not enabled for {owner}")
 
-    create_aliases(dr)
+    if aliases is None:
+        create_aliases(dr)
+    else:
+        aliases.append(dr)
 
 
 def create_aliases(dr: DocumentReport):
@@ -175,42 +255,76 @@ def create_aliases(dr: DocumentReport):
     identical aliases (think shared mailboxes or websites). Thus, relations are handled by
     bulk operations.
     """
+    create_aliases_for([dr])
+
+
+def _alias_candidates(reports) -> dict:
+    """Returns the DocumentReports (keyed by primary key) that could be given
+    alias relations."""
+    candidates = {}
+    for dr in reports:
+        try:
+            metadata = dr.metadata
+        except UnknownSchemeError:
+            logger.error(f"failed to unpack metadata for {dr}", exc_info=True)
+            continue
+
+        # Skip scenarios: No metadata, no owner - nothing to do.
+        if not metadata:
+            logger.warning(f"Create aliases invoked with a DocumentReport with no metadata: {dr}")
+            continue
+        if not dr.owner:
+            logger.warning(f"Create aliases invoked with a DocumentReport with an empty owner "
+                           f"field: {dr}")
+            continue
+        # (If a report appears more than once, its last appearance is the most recent one)
+        candidates[dr.pk] = dr
+    return candidates
+
+
+def create_aliases_for(reports):
+    """ Creates relevant alias-match relations for several DocumentReports at
+    once, using the same number of queries no matter how many reports there are.
+    """
     tm = Alias.match_relation.through
     new_objects = []
-    owner = dr.owner
-    try:
-        metadata = dr.metadata
-    except UnknownSchemeError:
-        logger.error(f"failed to unpack metadata for {dr}", exc_info=True)
+    candidates = _alias_candidates(reports)
+    if not candidates:
         return
 
-    # Return early scenarios: No metadata, no owner - nothing to do.
-    if not metadata:
-        logger.warning(f"Create aliases invoked with a DocumentReport with no metadata: {dr}")
-        return
-    if not owner:
-        logger.warning(f"Create aliases invoked with a DocumentReport with an empty owner field: "
-                       f"{dr}")
-        return
+    # Look for relevant alias(es) for every owner. (Upper is what the iexact lookup uses.)
+    owner_aliases = {}
+    for alias in Alias.objects.annotate(upper_value=Upper("_value")).filter(
+            upper_value__in={dr.owner.upper() for dr in candidates.values()}):
+        owner_aliases.setdefault(alias.upper_value, []).append(alias)
+
+    # If there aren't any for an owner, we must look for remediators. Alias type must be
+    # remediator and value either 0 (all scannerjobs) or remediator for this specific
+    # scannerjob.
+    orphans = [dr for dr in candidates.values() if dr.owner.upper() not in owner_aliases]
+    remediators = list(Alias.objects.filter(
+            Q(_alias_type=AliasType.REMEDIATOR)
+            & Q(_value__in={"0"} | {str(dr.scanner_job_pk) for dr in orphans}))) if orphans else []
+
+    found = []
+    for dr in candidates.values():
+        if aliases := owner_aliases.get(dr.owner.upper()):
+            found.append(dr.pk)
+        else:
+            aliases = [alias for alias in remediators
+                       if alias._value in ("0", str(dr.scanner_job_pk))]
+        add_new_relations(aliases, new_objects, dr, tm)
 
-    # Look for relevant alias(es) and append relation(s) to new_objects.
-    aliases = Alias.objects.filter(_value__iexact=owner)
-    # If there aren't any, we must look for remediators
-    if not aliases:
-        # Alias type must be remediator and value either 0 (all scannerjobs) or remediator
-        # for this specific scannerjob.
-        aliases = Alias.objects.filter(Q(_alias_type=AliasType.REMEDIATOR) &
-                                       (Q(_value=0) | Q(_value=dr.scanner_job_pk)))
-    else:
-        # This means we've found an alias that fits the owner - delete remediator relations if any.
-        tm.objects.filter(documentreport_id=dr.pk,
+    if found:
+        # We've found aliases that fit these owners - delete remediator relations if any.
+        tm.objects.filter(documentreport_id__in=found,
                           alias___alias_type=AliasType.REMEDIATOR).delete()
 
-    add_new_relations(aliases, new_objects, dr, tm)
-
     try:
-        # Bulk create relations as there might be more than one.
-        tm.objects.bulk_create(new_objects, ignore_conflicts=True)
+        # Bulk create relations as there might be more than one. (This changes
+        # which accounts the reports count towards)
+        with tracking(DocumentReport.objects.filter(pk__in=candidates.keys())):
+            tm.objects.bulk_create(new_objects, ignore_conflicts=True)
     except Exception:
         logger.error("Failed to create match_relation", exc_info=True)
 
@@ -469,7 +583,7 @@ def get_org_from_scantag(scan_tag):
     return Organization.objects.filter(uuid=scan_tag.organisation.uuid).first()
 
 
-class ResultCollectorRunner(PikaPipelineThread):
+class ResultCollectorRunner(BatchingPipelineThread):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         start_http_server(9091)
@@ -484,15 +598,64 @@ class ResultCollectorRunner(PikaPipelineThread):
                 with transaction.atomic():
                     yield from result_message_received_raw(body)
 
+    def _write_batch(self, batch: list, methods: list):
+        """Writes a batch of result messages to the database in a single
+        transaction, and then acknowledges them. If that fails, the messages
+        are handled one at a time instead, so that a problematic message has
+        the same consequences that it would have had without batching."""
+        try:
+            with SUMMARY.time():
+                outputs = list(result_messages_received_raw(batch))
+        except Exception:
+            logger.warning(
+                    "failed to write batch, handling messages individually",
+                    messages=len(batch), exc_info=True)
+            for method, body in zip(methods, batch):
+                self._dispatch_message(
+                        method, self.handle_message(base_queue(method.routing_key), body))
+            return
+        logger.debug("Result collector wrote a batch", messages=len(batch))
+
+        self._dispatch_message(methods[0], outputs)
+        for method in methods[1:]:
+            self.enqueue_ack(method.delivery_tag)
+
+    @staticmethod
+    def _add_to_batch(batch: list, routing_key, body):
+        # (Messages that aren't results still take up a place in the batch,
+        # so that it stays in step with the list of messages)
+        batch.append(body if base_queue(routing_key) == "os2ds_results" else None)
+
 
 class Command(BaseCommand):
     """Command for starting a result collector process."""
     help = __doc__
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
+        parser.add_argument(
+                "--shard",
+                type=int,
+                metavar="N",
+                help="consume only the given shard of the os2ds_results queue"
+                     " (by default, every shard is consumed)",
+                default=None)
+
+    def handle(self, *args, shard=None, **options):
         debug.register_debug_signal()
 
+        # Changes to the DPO overview's statistics are folded in as soon as
+        # they've been committed, but a collector that stopped at the wrong
+        # moment might have left some behind
+        if (folded := fold_deltas()):
+            logger.info("folded in leftover statistic changes", count=folded)
+
+        batching = settings.RESULT_COLLECTOR_BATCH_INTERVAL > 0
         ResultCollectorRunner(
-            read=["os2ds_results"],
+            read=ShardRouter().read_queues("os2ds_results", shard),
             write=["os2ds_email_tags"],
-            prefetch_count=8).run_consumer()
+            # (A batch can't be bigger than the number of unacknowledged
+            # messages that RabbitMQ will give us)
+            prefetch_count=max(8, settings.RESULT_COLLECTOR_BATCH_SIZE)
+            if batching else 8,
+            batch_interval=settings.RESULT_COLLECTOR_BATCH_INTERVAL,
+            collect_batch_size=settings.RESULT_COLLECTOR_BATCH_SIZE).run_consumer()
@@ -0,0 +1,54 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+from os2datascanner.projects.report.reportapp.models.match_statistics import rebuild
+
+
+def build_match_statistics(apps, schema_editor):
+    rebuild(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0045_backfill_match_counters'),
+        ('os2datascanner_report', '0082_recrunch_ews'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documentreport',
+            name='created_timestamp',
+            field=models.DateTimeField(db_index=True, null=True, verbose_name='created timestamp'),
+        ),
+        migrations.AlterField(
+            model_name='documentreport',
+            name='resolution_time',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='resolution time'),
+        ),
+        migrations.CreateModel(
+            name='MatchStatistic',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scanner_job_pk', models.IntegerField(null=True)),
+                ('scanner_job_name', models.CharField(max_length=256, null=True)),
+                ('source_category', models.CharField(max_length=32, verbose_name='source category')),
+                ('month', models.DateField(null=True, verbose_name='month')),
+                ('resolution_status', models.IntegerField(choices=[(0, 'Other'), (1, 'Edited'), (2, 'Deleted and journalized'), (3, 'Deleted'), (4, 'False positive')], null=True, verbose_name='resolution status')),
+                ('created', models.IntegerField(default=0, verbose_name='created')),
+                ('resolved', models.IntegerField(default=0, verbose_name='resolved')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('org_unit', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='match_statistics', to='organizations.organizationalunit', verbose_name='organizational unit')),
+                ('organization', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='match_statistics', to='organizations.organization', verbose_name='organization')),
+            ],
+            options={
+                'verbose_name': 'match statistic',
+                'verbose_name_plural': 'match statistics',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='matchstatistic',
+            index=models.Index(fields=['organization', 'org_unit', 'scanner_job_pk'], name='match_statistic_lookup'),
+        ),
+        migrations.RunPython(build_match_statistics, reverse_code=migrations.RunPython.noop),
+    ]
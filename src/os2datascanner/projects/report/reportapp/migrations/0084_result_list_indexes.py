@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+def _index(name, fields, handled=False):
+    return migrations.AddIndex(
+        model_name='documentreport',
+        index=models.Index(
+            condition=models.Q(
+                ('number_of_matches__gte', 1),
+                ('resolution_status__isnull', not handled)),
+            fields=list(fields),
+            name=name),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('os2datascanner_report', '0083_matchstatistic'),
+    ]
+
+    operations = [
+        _index('dr_unhandled_sort_idx',
+               ('organization', 'sort_key', 'id')),
+        _index('dr_unhandled_job_sort_idx',
+               ('organization', 'scanner_job_pk', 'sort_key', 'id')),
+        _index('dr_unhandled_matches_idx',
+               ('organization', 'number_of_matches', 'id')),
+        _index('dr_unhandled_modified_idx',
+               ('organization', 'datasource_last_modified', 'id')),
+        _index('dr_handled_sort_idx',
+               ('organization', 'sort_key', 'id'), handled=True),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.11 on 2026-10-18 01:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0045_backfill_match_counters'),
+        ('os2datascanner_report', '0084_result_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchStatisticDelta',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scanner_job_pk', models.IntegerField(null=True)),
+                ('scanner_job_name', models.CharField(max_length=256, null=True)),
+                ('source_category', models.CharField(max_length=32)),
+                ('month', models.DateField(null=True)),
+                ('resolution_status', models.IntegerField(null=True)),
+                ('created', models.IntegerField(default=0)),
+                ('resolved', models.IntegerField(default=0)),
+                ('key', models.CharField(max_length=255)),
+                ('org_unit', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='organizations.organizationalunit')),
+                ('organization', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='organizations.organization')),
+            ],
+        ),
+    ]
@@ -1 +1,3 @@
 from . import documentreport  # noqa
+from . import match_statistics  # noqa
+from . import match_counters  # noqa
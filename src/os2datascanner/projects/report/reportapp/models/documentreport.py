@@ -1,9 +1,9 @@
 import enum
 from functools import cached_property
 
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
-from django.db.models import JSONField
+from django.db.models import JSONField, Q
 from django.db.models.functions import Upper
 from django.utils.translation import gettext_lazy as _
 
@@ -34,7 +34,7 @@ class DocumentReport(models.Model):
     scan_time = models.DateTimeField(null=True, db_index=True,
                                      verbose_name=_('scan time'))
 
-    created_timestamp = models.DateTimeField(null=True,
+    created_timestamp = models.DateTimeField(null=True, db_index=True,
                                              verbose_name=_('created timestamp'))
 
     last_opened_time = models.DateTimeField(null=True, verbose_name=_('time last opened'))
@@ -153,7 +153,7 @@ class DocumentReport(models.Model):
                                             null=True, blank=True, db_index=True,
                                             verbose_name=_("resolution status"))
 
-    resolution_time = models.DateTimeField(blank=True, null=True,
+    resolution_time = models.DateTimeField(blank=True, null=True, db_index=True,
                                            verbose_name=_("resolution time"))
 
     custom_resolution_status = models.CharField(max_length=1024, blank=True,
@@ -202,7 +202,10 @@ class DocumentReport(models.Model):
         if len(old_sort_key := self.sort_key) > 256:
             self.sort_key = self.sort_key[:256]
 
-        super().save(*args, **kwargs)
+        # The match counters lock this report while they work out what this
+        # save changes, so make sure there's a transaction to hold that lock
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
 
         # log after save, so self returns the Object pk.
         if len(old_name) > 256:
@@ -230,6 +233,30 @@ class DocumentReport(models.Model):
             models.Index(
                 Upper("owner"),
                 name="alias_creation_query_idx"),
+            # The result lists are filtered by organisation (and sometimes by
+            # scanner job) and ordered by one of a few fields and then by
+            # primary key. These partial indexes cover those orderings for
+            # the unhandled and the handled results, so that both counting
+            # and paging through them (with cursors) can avoid scanning the
+            # whole table
+            *(models.Index(
+                fields=fields,
+                condition=Q(
+                    number_of_matches__gte=1, resolution_status__isnull=True),
+                name=name) for name, fields in (
+                    ("dr_unhandled_sort_idx",
+                     ("organization", "sort_key", "id")),
+                    ("dr_unhandled_job_sort_idx",
+                     ("organization", "scanner_job_pk", "sort_key", "id")),
+                    ("dr_unhandled_matches_idx",
+                     ("organization", "number_of_matches", "id")),
+                    ("dr_unhandled_modified_idx",
+                     ("organization", "datasource_last_modified", "id")),)),
+            models.Index(
+                fields=("organization", "sort_key", "id"),
+                condition=Q(
+                    number_of_matches__gte=1, resolution_status__isnull=False),
+                name="dr_handled_sort_idx"),
         ]
         constraints = [
             models.UniqueConstraint(
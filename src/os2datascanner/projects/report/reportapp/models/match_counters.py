@@ -0,0 +1,399 @@
+"""Incrementally maintained match counters for Accounts.
+
+Every Account keeps count of the matches that it's responsible for (its
+match_count, withheld_matches and handled_matches fields), and of how many of
+its matches were found and handled in each week (its WeeklyMatchCount
+objects). The DPO overview's statistics (MatchStatistic objects) are also
+counts of matches. Rather than recounting these from scratch whenever they're
+needed, we work out how each change to DocumentReports, their alias relations
+and the employees of organisational units affects them and apply only the
+difference.
+
+Changes made through model methods -- DocumentReport.save(), delete(), the
+alias_relation manager and the equivalents for Positions -- are picked up by
+the signal handlers in this module. Changes made in bulk (QuerySet.update(),
+bulk_update() and bulk operations on the alias relation table) must be made
+inside a tracking() block that names the DocumentReports they affect.
+Anything that slips through the cracks can be repaired with the
+reconcile_match_counters and rebuild_match_statistics management commands.
+
+Working out the difference means reading the state of the affected reports
+before and after the change. Inside a transaction, the "before" state is read
+with SELECT ... FOR UPDATE, so that two transactions changing the same reports
+can't both start from the same state and count the change between them twice.
+(DocumentReport.save() always runs in a transaction for this reason.)
+
+This isn't free: a tracked save, delete or relation change costs about six
+extra queries (three to read the reports' states, their alias relations and
+their accounts' positions before the change, and three more afterwards), plus
+the counter updates themselves. Reports without matches can't affect the
+counters, so their relations and positions aren't looked up. The delete
+receivers also mean that Django can no longer "fast-delete" DocumentReports:
+QuerySet.delete() fetches every report it deletes and sends signals for each
+of them. Deleting many reports at once should therefore be done inside a
+tracking() block, which folds all of those signals into a single update."""
+
+import threading
+import weakref
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.db.models.signals import (
+        pre_save, post_save, pre_delete, post_delete, m2m_changed)
+from django.dispatch import receiver
+
+from os2datascanner.core_organizational_structure.models.aliases import AliasType
+from os2datascanner.core_organizational_structure.models.position import Role
+from ...organizations.models import Account, Position, WeeklyMatchCount
+from ...organizations.models.account import week_of
+from .documentreport import DocumentReport
+from . import match_statistics
+
+
+COUNTED_FIELDS = frozenset({
+    "number_of_matches", "only_notify_superadmin", "resolution_status",
+    "resolution_time", "created_timestamp", "organization", "organization_id",
+    "scanner_job_pk", "source_type",
+})
+"""The DocumentReport fields that the match counters depend on."""
+
+
+class _State(NamedTuple):
+    """The state of a DocumentReport that the match counters depend on."""
+    matches: int
+    withheld: bool
+    status: int | None
+    rtime: object
+    ctime: object
+    organization: object
+    scanner_job_pk: int | None
+    scanner_job_name: str | None
+    source_type: str
+    # The Accounts that the report counts towards, and the organisational
+    # units that those Accounts are employed in
+    accounts: set
+    units: set
+
+
+_local = threading.local()
+
+
+def _open_trackers() -> weakref.WeakSet:
+    """Returns the _Trackers on this thread that haven't been applied yet.
+    (A _Tracker whose change failed part of the way through is never
+    applied; it's forgotten when it's garbage collected.)"""
+    if (trackers := getattr(_local, "open", None)) is None:
+        trackers = _local.open = weakref.WeakSet()
+    return trackers
+
+
+def _snapshot(queryset, lock=False) -> dict:
+    """Returns a dictionary mapping the primary keys of the DocumentReports in
+    the given QuerySet to their _States.
+
+    If lock is True and we're in a transaction, the DocumentReports are also
+    locked until the end of that transaction, so that nothing else can change
+    them between this snapshot and the next."""
+    if lock and transaction.get_connection().in_atomic_block:
+        # Always lock the rows in the same order, so that concurrent
+        # transactions can't deadlock each other
+        queryset = queryset.select_for_update(of=("self",)).order_by("pk")
+    else:
+        queryset = queryset.order_by()
+
+    states = {
+        pk: _State(*fields, accounts=set(), units=set())
+        for pk, *fields in queryset.values_list(
+                "pk", "number_of_matches", "only_notify_superadmin",
+                "resolution_status", "resolution_time", "created_timestamp",
+                "organization_id", "scanner_job_pk", "scanner_job_name",
+                "source_type")}
+    if (matched := [pk for pk, state in states.items() if _matched(state)]):
+        relations = DocumentReport.alias_relation.through.objects.filter(
+                documentreport_id__in=matched,
+                alias__shared=False).exclude(
+                alias___alias_type=AliasType.REMEDIATOR).values_list(
+                "documentreport_id", "alias__account_id")
+        accounts = defaultdict(set)
+        for report, account in relations:
+            states[report].accounts.add(account)
+            accounts[account].add(report)
+
+        for account, unit in Position.employees.filter(
+                account_id__in=accounts.keys()).values_list(
+                "account_id", "unit_id"):
+            for report in accounts[account]:
+                states[report].units.add(unit)
+    return states
+
+
+def _matched(state) -> bool:
+    return bool(state.matches) and state.matches >= 1
+
+
+def _counters_of(state) -> list:
+    """Returns the match counters that a DocumentReport in the given state
+    counts towards: the names of Account fields, and ("new", week) and
+    ("handled", week) pairs for WeeklyMatchCounts."""
+    if state.withheld:
+        return ["withheld_matches"] if state.status is None else []
+
+    keys = ["match_count" if state.status is None else "handled_matches"]
+    if (week := week_of(state.ctime)):
+        keys.append(("new", week))
+    if state.status is not None and (week := week_of(state.rtime)):
+        keys.append(("handled", week))
+    return keys
+
+
+def _contributions(states) -> Counter:
+    """Returns a Counter of the amounts that the given DocumentReport states
+    contribute to each match counter, keyed by (account primary key, counter)
+    pairs."""
+    rv = Counter()
+    for state in states:
+        if not _matched(state) or not state.accounts:
+            continue
+        keys = _counters_of(state)
+        for account in state.accounts:
+            for key in keys:
+                rv[account, key] += 1
+    return rv
+
+
+def apply_deltas(deltas: Counter):
+    """Adds the given (possibly negative) amounts to the match counters. (The
+    match status of an Account isn't stored, but worked out from these
+    counters when it's needed; see Account.match_status.)"""
+    fields = defaultdict(dict)
+    weeks = defaultdict(Counter)
+    for (account, key), delta in deltas.items():
+        if not delta:
+            continue
+        elif isinstance(key, str):
+            fields[account][key] = delta
+        else:
+            kind, week = key
+            weeks[account, week][kind] += delta
+
+    # Always update the rows in the same order, so that concurrent
+    # transactions can't deadlock each other
+    for account, changes in sorted(fields.items()):
+        Account.objects.filter(pk=account).update(**{
+            field: Coalesce(F(field), 0) + delta
+            for field, delta in changes.items()})
+
+    if weeks:
+        WeeklyMatchCount.objects.bulk_create(
+                [WeeklyMatchCount(account_id=account, week=week)
+                 for account, week in weeks],
+                ignore_conflicts=True)
+        for (account, week), changes in sorted(weeks.items()):
+            WeeklyMatchCount.objects.filter(
+                    account_id=account, week=week).update(
+                    new=F("new") + changes["new"],
+                    handled=F("handled") + changes["handled"])
+
+
+class _Tracker:
+    """A _Tracker remembers the state of some DocumentReports before they were
+    changed, so that the effect of those changes on the match counters can be
+    worked out afterwards."""
+
+    def __init__(self):
+        # Maps primary keys to the first known state of a report, or to None
+        # for reports created while we were watching
+        self.before = {}
+        _open_trackers().add(self)
+
+    def watch(self, queryset):
+        """Remembers the current state of the DocumentReports in the given
+        QuerySet (unless we already know an earlier state for them), locking
+        them until the end of the current transaction."""
+        for pk, state in _snapshot(queryset, lock=True).items():
+            self.before.setdefault(pk, state)
+
+    def watch_pks(self, pks):
+        if (unknown := set(pks) - self.before.keys()):
+            self.watch(DocumentReport.objects.filter(pk__in=unknown))
+
+    def created(self, pk):
+        """Records that a DocumentReport was created while we were
+        watching."""
+        self.before.setdefault(pk, None)
+
+    def apply(self):
+        if not self.before:
+            return
+        after = _snapshot(
+                DocumentReport.objects.filter(pk__in=self.before.keys()))
+        before = [state for state in self.before.values() if state]
+
+        deltas = _contributions(after.values())
+        deltas.subtract(_contributions(before))
+        apply_deltas(deltas)
+
+        deltas, names = match_statistics.contributions(after.values())
+        old_deltas, _ = match_statistics.contributions(before)
+        deltas.subtract(old_deltas)
+        match_statistics.apply_deltas(deltas, names)
+        self._hand_over(after)
+        self.before = {}
+
+    def _hand_over(self, after):
+        """Tells the other open _Trackers that the changes to our reports have
+        been counted up to the given states.
+
+        Several _Trackers can be watching the same reports at once -- Django
+        sends the pre_delete signals for all of the objects that a QuerySet
+        deletes before any of their post_delete signals, for example, and
+        removing an Account from an organisational unit deletes a Position
+        as well as changing the relation -- and without this they would all
+        count the same change."""
+        trackers = _open_trackers()
+        trackers.discard(self)
+        for other in trackers:
+            for pk in other.before.keys() & self.before.keys():
+                other.before[pk] = after.get(pk)
+
+
+@contextmanager
+def tracking(queryset=None):
+    """Context manager. Applies the changes made to DocumentReports inside
+    the block to the match counters when the block finishes.
+
+    The optional queryset should include every DocumentReport that the block
+    changes in bulk, but it's fine for it to include more than that. (Changes
+    made through DocumentReport.save() and the like don't need to be included
+    in it.)
+
+    The block should run inside a transaction, so that the match counters are
+    changed along with the DocumentReports. Nested blocks are folded into the
+    outermost one."""
+    outer = getattr(_local, "tracker", None)
+    tracker = outer or _Tracker()
+    if queryset is not None:
+        tracker.watch(queryset)
+
+    if outer:
+        yield tracker
+        return
+
+    _local.tracker = tracker
+    try:
+        yield tracker
+        tracker.apply()
+    finally:
+        _local.tracker = None
+
+
+def _begin(pks):
+    if (outer := getattr(_local, "tracker", None)):
+        outer.watch_pks(pks)
+        return (outer, False)
+    tracker = _Tracker()
+    tracker.watch_pks(pks)
+    return (tracker, True)
+
+
+def _end(token, created=None):
+    tracker, owned = token
+    if created is not None:
+        tracker.created(created)
+    if owned:
+        tracker.apply()
+
+
+@receiver(pre_save, sender=DocumentReport)
+def _before_report_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None
+               and not COUNTED_FIELDS.intersection(update_fields)):
+        return
+    instance._match_counter_token = _begin([instance.pk] if instance.pk else [])
+
+
+@receiver(post_save, sender=DocumentReport)
+def _after_report_saved(sender, instance, created=False, **kwargs):
+    if (token := instance.__dict__.pop("_match_counter_token", None)):
+        _end(token, instance.pk if created else None)
+
+
+@receiver(pre_delete, sender=DocumentReport)
+def _before_report_deleted(sender, instance, **kwargs):
+    instance._match_counter_token = _begin([instance.pk])
+
+
+@receiver(post_delete, sender=DocumentReport)
+def _after_report_deleted(sender, instance, **kwargs):
+    if (token := instance.__dict__.pop("_match_counter_token", None)):
+        _end(token)
+
+
+@receiver(m2m_changed, sender=DocumentReport.alias_relation.through)
+def _alias_relation_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    phase, _, _ = action.partition("_")
+    if phase == "pre":
+        if not reverse:
+            pks = [instance.pk]
+        elif pk_set is not None:
+            pks = pk_set
+        else:
+            pks = instance.match_relation.values_list("pk", flat=True)
+        instance._match_counter_token = _begin(pks)
+    elif (token := instance.__dict__.pop("_match_counter_token", None)):
+        _end(token)
+
+
+def _reports_of(accounts):
+    """Returns the primary keys of the DocumentReports with matches that
+    count towards the given Accounts."""
+    return DocumentReport.alias_relation.through.objects.filter(
+            alias__account_id__in=accounts,
+            alias__shared=False,
+            documentreport__number_of_matches__gte=1).values_list(
+            "documentreport_id", flat=True)
+
+
+@receiver(pre_save, sender=Position)
+def _before_position_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    accounts = {instance.account_id} if instance.role == Role.EMPLOYEE else set()
+    if instance.pk:
+        accounts.update(Position.employees.filter(
+                pk=instance.pk).values_list("account_id", flat=True))
+    if accounts:
+        instance._match_counter_token = _begin(_reports_of(accounts))
+
+
+@receiver(pre_delete, sender=Position)
+def _before_position_deleted(sender, instance, **kwargs):
+    if instance.role == Role.EMPLOYEE:
+        instance._match_counter_token = _begin(
+                _reports_of([instance.account_id]))
+
+
+@receiver(post_save, sender=Position)
+@receiver(post_delete, sender=Position)
+def _after_position_changed(sender, instance, **kwargs):
+    if (token := instance.__dict__.pop("_match_counter_token", None)):
+        _end(token)
+
+
+@receiver(m2m_changed, sender=Account.units.through)
+def _units_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    phase, _, _ = action.partition("_")
+    if phase == "pre":
+        if not reverse:
+            accounts = [instance.pk]
+        elif pk_set is not None:
+            accounts = pk_set
+        else:
+            accounts = instance.positions.values_list("account_id", flat=True)
+        instance._match_counter_token = _begin(_reports_of(accounts))
+    elif (token := instance.__dict__.pop("_match_counter_token", None)):
+        _end(token)
@@ -0,0 +1,331 @@
+"""Materialised match statistics for the DPO overview.
+
+A MatchStatistic counts the DocumentReports with matches that share an
+organisation, organisational unit, scanner job, source category, month and
+resolution status. The rows without an organisational unit cover the whole
+organisation; the rows with one cover the reports associated (through
+non-shared aliases) with the employees of that unit.
+
+The counts are kept up to date by the match counter machinery in
+reportapp.models.match_counters, which works out how each change to
+DocumentReports, their alias relations and the employees of organisational
+units affects them. The rebuild_match_statistics management command recounts
+them from scratch.
+
+Every result collector would otherwise have to update the same few
+organisation-wide rows, serialising their transactions, so changes are first
+written as new MatchStatisticDelta rows. These are folded into the
+MatchStatistic objects in a short transaction of their own once the change
+has been committed (and, in case a process stopped before it could do that,
+whenever a result collector starts). Reading the statistics never changes
+them."""
+
+from collections import Counter
+from datetime import date
+
+from django.db import models, transaction
+from django.db.models import (
+        Case, CharField, Count, DateField, F, Max, Q, Value, When)
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from os2datascanner.core_organizational_structure.models.aliases import AliasType
+from os2datascanner.core_organizational_structure.models.position import Role
+from ...organizations.models import Organization, OrganizationalUnit
+from .documentreport import DocumentReport
+
+
+SOURCE_CATEGORIES = {
+    'smb': 'filescan',
+    'smbc': 'filescan',
+    'msgraph-files': 'filescan',
+    'googledrive': 'filescan',
+    'web': 'webscan',
+    'ews': 'mailscan',
+    'msgraph-mail': 'mailscan',
+    'mail': 'mailscan',
+    'gmail': 'mailscan',
+    'msgraph-teams-files': 'teamsscan',
+    'msgraph-calendar': 'calendarscan',
+}
+"""The source category that the DPO overview puts the results of each type of
+Source into. (Other types of Source go into the 'other' category.)"""
+
+
+EMPLOYEE_RELATION = {
+    "alias_relation__shared": False,
+    "alias_relation___alias_type__in": [
+        t.value for t in AliasType if t != AliasType.REMEDIATOR],
+    "alias_relation__account__positions__role": Role.EMPLOYEE,
+}
+"""Filters that select the DocumentReports associated with the employees of an
+organisational unit. (These must all be given in the same call to filter(), so
+that they apply to the same alias and Position.)"""
+
+
+def source_category(source_type: str) -> str:
+    return SOURCE_CATEGORIES.get(source_type, 'other')
+
+
+def month_of(timestamp) -> date | None:
+    """Returns the first day of the month (in the current time zone) in which
+    the given timestamp falls, or None if there is no timestamp."""
+    if timestamp is None:
+        return None
+    return timezone.localtime(timestamp).date().replace(day=1)
+
+
+class MatchStatistic(models.Model):
+    organization = models.ForeignKey(
+        Organization,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name="match_statistics",
+        verbose_name=_("organization"))
+    org_unit = models.ForeignKey(
+        OrganizationalUnit,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name="match_statistics",
+        verbose_name=_("organizational unit"))
+    scanner_job_pk = models.IntegerField(null=True)
+    scanner_job_name = models.CharField(max_length=256, null=True)
+    source_category = models.CharField(
+        max_length=32, verbose_name=_("source category"))
+    month = models.DateField(null=True, verbose_name=_("month"))
+    resolution_status = models.IntegerField(
+        choices=DocumentReport.ResolutionChoices.choices, null=True,
+        verbose_name=_("resolution status"))
+
+    # The number of reports with this resolution status that were created in
+    # this month, and the number that were resolved in this month
+    created = models.IntegerField(default=0, verbose_name=_("created"))
+    resolved = models.IntegerField(default=0, verbose_name=_("resolved"))
+
+    # Several of the fields above are nullable, and PostgreSQL doesn't
+    # consider NULL values to be equal in unique constraints, so we keep a
+    # unique string built from all of them instead
+    key = models.CharField(max_length=255, unique=True)
+
+    class Meta:
+        verbose_name = _("match statistic")
+        verbose_name_plural = _("match statistics")
+        indexes = [
+            models.Index(
+                fields=("organization", "org_unit", "scanner_job_pk"),
+                name="match_statistic_lookup"),
+        ]
+
+
+class MatchStatisticDelta(models.Model):
+    """A change to a MatchStatistic that hasn't been folded into it yet."""
+    organization = models.ForeignKey(
+        Organization, null=True, on_delete=models.CASCADE, related_name="+")
+    org_unit = models.ForeignKey(
+        OrganizationalUnit, null=True, on_delete=models.CASCADE,
+        related_name="+")
+    scanner_job_pk = models.IntegerField(null=True)
+    scanner_job_name = models.CharField(max_length=256, null=True)
+    source_category = models.CharField(max_length=32)
+    month = models.DateField(null=True)
+    resolution_status = models.IntegerField(null=True)
+
+    created = models.IntegerField(default=0)
+    resolved = models.IntegerField(default=0)
+
+    # The key of the MatchStatistic that this changes (not unique: there may
+    # be any number of changes waiting to be folded into it)
+    key = models.CharField(max_length=255)
+
+
+DIMENSIONS = (
+    "organization_id", "org_unit_id", "scanner_job_pk", "source_category",
+    "month", "resolution_status",)
+"""The fields of a MatchStatistic that identify it, in the order used in the
+keys of the Counters produced by contributions()."""
+
+
+def make_key(dimensions: tuple) -> str:
+    """Returns the key of the MatchStatistic with the given dimensions."""
+    return "|".join("" if d is None else str(d) for d in dimensions)
+
+
+def contributions(states) -> tuple[Counter, dict]:
+    """Returns a Counter of the amounts that the given DocumentReport states
+    (see reportapp.models.match_counters) contribute to each MatchStatistic,
+    keyed by (dimensions, "created" or "resolved") pairs, and a dictionary
+    mapping scanner job primary keys to names."""
+    rv = Counter()
+    names = {}
+    for state in states:
+        if not state.matches or state.matches < 1:
+            continue
+        names.setdefault(state.scanner_job_pk, state.scanner_job_name)
+
+        category = source_category(state.source_type)
+        created = month_of(state.ctime)
+        resolved = month_of(state.rtime or state.ctime)
+        for unit in (None, *state.units):
+            prefix = (state.organization, unit, state.scanner_job_pk, category)
+            rv[(*prefix, created, state.status), "created"] += 1
+            if state.status is not None:
+                rv[(*prefix, resolved, state.status), "resolved"] += 1
+    return rv, names
+
+
+def _group(deltas: Counter) -> dict:
+    changes = {}
+    for (dimensions, kind), delta in deltas.items():
+        if delta:
+            changes.setdefault(dimensions, Counter())[kind] += delta
+    return changes
+
+
+def _make(model, dimensions, names, **counts):
+    return model(
+            key=make_key(dimensions),
+            scanner_job_name=names.get(dimensions[2]),
+            **dict(zip(DIMENSIONS, dimensions)),
+            **counts)
+
+
+def apply_deltas(deltas: Counter, names: dict):
+    """Records that the given (possibly negative) amounts should be added to
+    the MatchStatistic objects, and arranges for them to be folded in when the
+    current transaction has been committed."""
+    if not (changes := _group(deltas)):
+        return
+
+    MatchStatisticDelta.objects.bulk_create(
+            [_make(MatchStatisticDelta, dimensions, names,
+                   created=change["created"], resolved=change["resolved"])
+             for dimensions, change in changes.items()])
+    transaction.on_commit(fold_deltas)
+
+
+def fold_deltas(batch_size: int = 10000) -> int:
+    """Adds the pending MatchStatisticDelta objects to the MatchStatistic
+    objects, creating any that don't exist yet, and deletes them. Returns the
+    number of MatchStatisticDelta objects folded in.
+
+    Several processes can safely do this at once: each of them takes the
+    changes that the others haven't already locked."""
+    folded = 0
+    while True:
+        with transaction.atomic():
+            pending = list(MatchStatisticDelta.objects.select_for_update(
+                    skip_locked=True).order_by("pk")[:batch_size])
+            if not pending:
+                return folded
+
+            examples = {}
+            changes = {}
+            for delta in pending:
+                examples.setdefault(delta.key, delta)
+                changes.setdefault(delta.key, Counter()).update(
+                        created=delta.created, resolved=delta.resolved)
+
+            MatchStatistic.objects.bulk_create(
+                    [_copy(MatchStatistic, delta)
+                     for delta in examples.values()],
+                    ignore_conflicts=True)
+            # Always update the rows in the same order, so that concurrent
+            # transactions can't deadlock each other
+            for key, change in sorted(changes.items()):
+                if change["created"] or change["resolved"]:
+                    MatchStatistic.objects.filter(key=key).update(
+                            created=F("created") + change["created"],
+                            resolved=F("resolved") + change["resolved"])
+            MatchStatisticDelta.objects.filter(
+                    pk__in=[delta.pk for delta in pending]).delete()
+        folded += len(pending)
+
+
+def _copy(model, statistic):
+    return model(
+            key=statistic.key,
+            scanner_job_name=statistic.scanner_job_name,
+            **{d: getattr(statistic, d) for d in DIMENSIONS})
+
+
+def _category_expression():
+    categories = {}
+    for source_type, category in SOURCE_CATEGORIES.items():
+        categories.setdefault(category, []).append(source_type)
+    return Case(
+            *(When(source_type__in=types, then=Value(category))
+              for category, types in categories.items()),
+            default=Value('other'),
+            output_field=CharField())
+
+
+def _count(reports, unit=None) -> Counter:
+    """Counts the given DocumentReports in the database, returning a Counter
+    like the one produced by contributions(). (If unit is a path to an
+    organisational unit field, the counts are broken down by that unit.)"""
+    unit_field = {"unit": F(unit)} if unit else {}
+    reports = reports.order_by().annotate(
+            category=_category_expression(),
+            created_month=TruncMonth(
+                    "created_timestamp", output_field=DateField()),
+            resolved_month=TruncMonth(
+                    Coalesce("resolution_time", "created_timestamp"),
+                    output_field=DateField()))
+
+    rv = Counter()
+    for kind, month, filters in (
+            ("created", "created_month", Q()),
+            ("resolved", "resolved_month", Q(resolution_status__isnull=False)),):
+        for row in reports.filter(filters).values(
+                "organization_id", "scanner_job_pk", "category",
+                "resolution_status", month, **unit_field).annotate(
+                count=Count("pk", distinct=True)):
+            dimensions = (
+                row["organization_id"], row.get("unit"), row["scanner_job_pk"],
+                row["category"], row[month], row["resolution_status"])
+            rv[dimensions, kind] += row["count"]
+    return rv
+
+
+def rebuild(organization=None, apps=None):
+    """Recounts the MatchStatistic objects (optionally only those of the given
+    Organization) from scratch. This should be done in a transaction.
+
+    (If an application registry is given, the models are taken from it, so
+    that this function can also be used by migrations.)"""
+    if apps:
+        report_model = apps.get_model("os2datascanner_report", "DocumentReport")
+        statistic_model = apps.get_model("os2datascanner_report", "MatchStatistic")
+        try:
+            delta_model = apps.get_model(
+                    "os2datascanner_report", "MatchStatisticDelta")
+        except LookupError:
+            # (This migration predates the pending changes)
+            delta_model = None
+    else:
+        report_model, statistic_model, delta_model = (
+                DocumentReport, MatchStatistic, MatchStatisticDelta)
+
+    reports = report_model.objects.filter(number_of_matches__gte=1)
+    if organization is not None:
+        reports = reports.filter(organization=organization)
+
+    deltas = _count(reports)
+    deltas.update(_count(
+            reports.filter(**EMPLOYEE_RELATION),
+            unit="alias_relation__account__positions__unit"))
+    names = dict(reports.order_by().values_list(
+            "scanner_job_pk").annotate(Max("scanner_job_name")))
+
+    # The pending changes are already reflected in the reports
+    for model in filter(None, (statistic_model, delta_model)):
+        statistics = model.objects.all()
+        if organization is not None:
+            statistics = statistics.filter(organization=organization)
+        statistics.delete()
+    statistic_model.objects.bulk_create(
+            (_make(statistic_model, dimensions, names,
+                   created=change["created"], resolved=change["resolved"])
+             for dimensions, change in _group(deltas).items()),
+            batch_size=10000)
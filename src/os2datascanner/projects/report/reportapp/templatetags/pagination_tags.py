@@ -37,5 +37,7 @@ def match_interval(document_reports, page_obj, paginate_by):
     curr_page = int(page_obj.number)
     pag_by = int(paginate_by)
     first_match = pag_by * curr_page - (pag_by - 1)
-    last_match = first_match + document_reports.count() - 1
+    # (len() rather than count(), as this might be a list, and as the page of
+    # results will have been fetched to display it anyway)
+    last_match = first_match + len(document_reports) - 1
     return f"{intcomma(first_match)} - {intcomma(last_match)}"
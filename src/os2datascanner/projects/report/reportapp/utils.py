@@ -7,12 +7,14 @@ import structlog
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.db.models import Q
 from mozilla_django_oidc import auth
 from django.utils.translation import gettext_lazy as _
 
 from os2datascanner.engine2.pipeline import messages
 from .models.documentreport import DocumentReport
+from .models.match_counters import tracking
 
 from os2datascanner.engine2.utilities.equality import TypePropertyEquality
 from os2datascanner.projects.report.organizations.models import (
@@ -50,7 +52,9 @@ def relate_matches_to_user(user, account, value, alias_type):
         if aliases.count() > 1:
             aliases.exclude(pk=alias.pk).delete()
 
-        aliases.update(account=account)
+        with transaction.atomic(), tracking(
+                DocumentReport.objects.filter(alias_relation__in=aliases)):
+            aliases.update(account=account)
         create_alias_and_match_relations(alias)
 
 
@@ -275,16 +279,25 @@ def create_alias_and_match_relations(sub_alias: Alias) -> int:
                 Q(scanner_job_pk=remediator_for)
             )
 
+    def _create_relations(objs):
+        # Relations to remediator aliases don't affect the match counters, so
+        # there's no need to track those
+        with transaction.atomic(), tracking(
+                DocumentReport.objects.filter(
+                    pk__in=[tm_obj.documentreport_id for tm_obj in objs])
+                if sub_alias.alias_type != AliasType.REMEDIATOR else None):
+            tm.objects.bulk_create(objs, ignore_conflicts=True)
+
     tm_create_list = []
     for i, report in enumerate(reports.iterator(chunk_size=2000)):
         tm_create_list.append(tm(documentreport_id=report.pk, alias_id=sub_alias.pk))
 
         if i % 2000 == 0 and tm_create_list:
-            tm.objects.bulk_create(tm_create_list, ignore_conflicts=True)
+            _create_relations(tm_create_list)
             tm_create_list.clear()
 
     if tm_create_list:
-        tm.objects.bulk_create(tm_create_list, ignore_conflicts=True)
+        _create_relations(tm_create_list)
 
     return reports.count()
 
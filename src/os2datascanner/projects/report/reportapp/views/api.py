@@ -2,11 +2,13 @@ import json
 import structlog
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.http import JsonResponse
 from django.views.generic import View
 
 from os2datascanner.utils.system_utilities import time_now
 from ..models.documentreport import DocumentReport
+from ..models.match_counters import tracking
 from ..utils import iterate_queryset_in_batches
 
 logger = structlog.get_logger("api")
@@ -92,7 +94,9 @@ def set_status_2(username, body):
                 dr.resolution_status = status_value
                 dr.resolution_time = time_now()
 
-        DocumentReport.objects.bulk_update(batch, ['resolution_status', 'resolution_time'])
+        with transaction.atomic(), tracking(
+                DocumentReport.objects.filter(pk__in=[dr.pk for dr in batch])):
+            DocumentReport.objects.bulk_update(batch, ['resolution_status', 'resolution_time'])
         return {
             "status": "ok"
         }
@@ -25,6 +25,7 @@ from django.shortcuts import redirect
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.paginator import Paginator, EmptyPage
+from django.db import transaction
 from django.db.models import Count, Q
 from django.http import Http404, HttpResponse
 from django.utils.translation import ugettext_lazy as _
@@ -46,7 +47,9 @@ from os2datascanner.engine2.rules.passport import PassportRule
 from .utilities.smb_utilities import try_smb_delete_1
 from .utilities.document_report_utilities import handle_report
 from .utilities.msgraph_utilities import delete_email, delete_file
+from .utilities.pagination_utilities import KeysetPaginator
 from ..models.documentreport import DocumentReport
+from ..models.match_counters import tracking
 from ...organizations.models.account import Account
 from ...organizations.models.aliases import AliasType
 
@@ -95,6 +98,8 @@ class ReportView(LoginRequiredMixin, ListView):
 
         return self.document_reports.only(
             "name",
+            "sort_key",
+            "number_of_matches",
             "resolution_status",
             "resolution_time",
             "last_opened_time",
@@ -103,9 +108,20 @@ class ReportView(LoginRequiredMixin, ListView):
             "raw_problem"
         )
 
+    def paginate_queryset(self, queryset, page_size):
+        if not settings.KEYSET_PAGINATION or not KeysetPaginator.supports(queryset):
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size)
+        page = paginator.page(
+                self.request.GET.get("cursor"), self.request.GET.get("page"))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["renderable_rules"] = RENDERABLE_RULES
+        context["keyset_pagination"] = isinstance(
+                context.get("paginator"), KeysetPaginator)
         context["resolution_choices"] = DocumentReport.ResolutionChoices.choices
         self.add_form_context(context)
 
@@ -443,10 +459,13 @@ class MassHandleView(HTMXEndpointView, BaseMassView):
             logger.warning("Exception raised while trying to update last_handle field "
                            f"of account belonging to user {self.request.user}:", e)
 
-        for report in reports:
-            report.resolution_status = action
-            report.raw_problem = None
-            report.save()
+        # (Track all of the reports at once rather than one at a time)
+        with transaction.atomic(), tracking(
+                DocumentReport.objects.filter(pk__in=[report.pk for report in reports])):
+            for report in reports:
+                report.resolution_status = action
+                report.raw_problem = None
+                report.save()
         logger.info(
             f"Successfully handled DocumentReports "
             f"{', '.join([str(report) for report in reports])} with "
@@ -504,7 +523,8 @@ class DistributeMatchesView(HTMXEndpointView, ListView):
         response = super().post(request, *args, **kwargs)
         object_list = self.get_queryset()
 
-        update_output = object_list.update(only_notify_superadmin=False)
+        with transaction.atomic(), tracking(object_list):
+            update_output = object_list.update(only_notify_superadmin=False)
 
         logger.info(f"Updated DocumetReport objects: {update_output}")
 
@@ -21,8 +21,8 @@ from dateutil.relativedelta import relativedelta
 
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import PermissionDenied
-from django.db.models import Q, Count, DateField, When, Case
-from django.db.models.functions import Coalesce, TruncMonth
+from django.db import transaction
+from django.db.models import Q, Count, Max, Sum
 from django.http import HttpResponseForbidden, Http404, HttpResponse
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
@@ -32,6 +32,9 @@ from django.urls import reverse_lazy
 from django.conf import settings
 
 from ..models.documentreport import DocumentReport
+from ..models.match_counters import tracking
+from ..models.match_statistics import (
+    EMPLOYEE_RELATION, MatchStatistic, source_category)
 from ...organizations.models.account import Account
 from ...organizations.models.aliases import AliasType
 from ...organizations.models.position import Position
@@ -64,45 +67,36 @@ class DPOStatisticsPageView(LoginRequiredMixin, TemplateView):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        today = timezone.now()
-        a_month_ago = today - timedelta(days=30)
-
-        self.matches = DocumentReport.objects.filter(number_of_matches__gte=1).annotate(
-            created_recently=Case(
-                When(
-                    created_timestamp__gte=a_month_ago,
-                    then=True
-                ),
-                default=False
-            ),
-            handled_recently=Case(
-                When(
-                    resolution_time__gte=a_month_ago,
-                    then=True,
-                ),
-                default=False
-            ),
-            created_month=TruncMonth('created_timestamp', output_field=DateField()),
-            resolved_month=TruncMonth(
-                        # If resolution_time isn't set on a report that has been
-                        # handled, then assume it was handled in the same month it
-                        # was created
-                        Coalesce('resolution_time', 'created_timestamp'),
-                        output_field=DateField())).values(
-                            'resolution_status',
-                            'source_type',
-                            'created_month',
-                            'resolved_month',
-                            'created_recently',
-                            'handled_recently',
-                        ).annotate(count=Count('source_type')).order_by()
+        # The statistics are read from the MatchStatistic table, which is
+        # maintained as reports come and go, rather than by counting reports
+        self.statistics = MatchStatistic.objects.all()
+        self.org_unit = None
+        # ... except for those about the last 30 days, which are counted from
+        # the (indexed) timestamps of the reports
+        self.reports = DocumentReport.objects.filter(number_of_matches__gte=1)
+
+    @property
+    def matches(self):
+        """Sums up the statistics for the selected organisational unit (or
+        the whole organisation) by resolution status, source category and
+        month."""
+        if self.org_unit:
+            statistics = self.statistics.filter(org_unit=self.org_unit)
+        else:
+            statistics = self.statistics.filter(org_unit__isnull=True)
+        return statistics.values(
+                'resolution_status',
+                'source_category',
+                'month',
+            ).annotate(created=Sum('created'), resolved=Sum('resolved')).order_by()
 
     def _check_access(self, request):
         if self.request.user.account:
             # Only allow the user to see reports and units from their own
             # organization
             org = request.user.account.organization
-            self.matches = self.matches.filter(organization=org)
+            self.statistics = self.statistics.filter(organization=org)
+            self.reports = self.reports.filter(organization=org)
             org_units = OrganizationalUnit.objects.filter(organization=org)
         else:
             raise Account.DoesNotExist(_("The user does not have an account."))
@@ -123,27 +117,27 @@ class DPOStatisticsPageView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         today = timezone.now()
 
+        if self.scannerjob_filters is None:
+            # Create select options
+            self.scannerjob_filters = self.statistics.filter(
+                org_unit__isnull=True).order_by('scanner_job_pk').values(
+                "scanner_job_name", "scanner_job_pk").distinct()
+
         if (scannerjob := self.request.GET.get('scannerjob')) and scannerjob != 'all':
-            self.matches = self.matches.filter(
-                scanner_job_pk=scannerjob)
+            self.statistics = self.statistics.filter(scanner_job_pk=scannerjob)
+            self.reports = self.reports.filter(scanner_job_pk=scannerjob)
 
         if (orgunit := self.request.GET.get('orgunit')) and orgunit != 'all':
             confirmed_dpo = self.request.user.account.get_dpo_units().filter(uuid=orgunit).exists()
             if self.request.user.is_superuser or confirmed_dpo:
-                positions = Position.employees.filter(unit=orgunit)
-                self.matches = self.matches.filter(
-                    alias_relation__account__positions__in=positions).exclude(
-                    alias_relation__shared=True)
+                self.org_unit = orgunit
+                self.reports = self.reports.filter(
+                    **EMPLOYEE_RELATION,
+                    alias_relation__account__positions__unit=orgunit)
             else:
                 raise OrganizationalUnit.DoesNotExist(
                     _("An organizational unit with the UUID '{0}' was not found.".format(orgunit)))
 
-        if self.scannerjob_filters is None:
-            # Create select options
-            self.scannerjob_filters = DocumentReport.objects.filter(
-                number_of_matches__gte=1).order_by('scanner_job_pk').values(
-                "scanner_job_name", "scanner_job_pk").distinct()
-
         (context['match_data'],
          source_type_data,
          context['resolution_status'],
@@ -156,15 +150,15 @@ class DPOStatisticsPageView(LoginRequiredMixin, TemplateView):
         context['new_matches_by_month'] = \
             self.count_new_matches_by_month(today, num_months=number_of_months)
 
-        # This is removed, until we make some structural changes, which should
-        # prevent clients from having stupid amounts of organizational data.
-        # if self.request.GET.get('orgunit') is None:
-        #     highest_unhandled_ou, highest_handled_ou, highest_total_ou = (
-        #         self.count_match_status_by_org_unit())
+        if self.request.GET.get('orgunit') is None:
+            highest_unhandled_ou, highest_handled_ou, highest_total_ou = (
+                self.count_match_status_by_org_unit())
+
+            context['matches_by_org_unit_unhandled'] = highest_unhandled_ou
+            context['matches_by_org_unit_handled'] = highest_handled_ou
+            context['matches_by_org_unit_total'] = highest_total_ou
 
-        #     context['matches_by_org_unit_unhandled'] = highest_unhandled_ou
-        #     context['matches_by_org_unit_handled'] = highest_handled_ou
-        #     context['matches_by_org_unit_total'] = highest_total_ou
+        self.count_recent_matches(source_type_data)
 
         context['total_by_source'] = {}
         context['unhandled_by_source'] = {}
@@ -205,8 +199,8 @@ class DPOStatisticsPageView(LoginRequiredMixin, TemplateView):
                            f"{request.user}: {e}")
         return redirect(reverse_lazy('index'))
 
-    def make_data_structures(self, matches):  # noqa C901, CCR001
-        """To avoid making multiple separate queries to the DocumentReport
+    def make_data_structures(self, matches):  # noqa CCR001
+        """To avoid making multiple separate queries to the MatchStatistic
         table, we instead use the one call defined previously, then packages
         data into separate structures, which can then be used for statistical
         presentations."""
@@ -236,43 +230,43 @@ class DPOStatisticsPageView(LoginRequiredMixin, TemplateView):
         resolved_month = {}
 
         for obj in matches:
-            count = obj.get('count', 0)
-            match obj:
-                case {'source_type': 'smb' | 'smbc' | 'msgraph-files' | 'googledrive'}:
-                    source_category = 'filescan'
-                case {'source_type': 'web'}:
-                    source_category = 'webscan'
-                case {'source_type': 'ews' | 'msgraph-mail' | 'mail' | 'gmail'}:
-                    source_category = 'mailscan'
-                case {'source_type': 'msgraph-teams-files'}:
-                    source_category = 'teamsscan'
-                case {'source_type': 'msgraph-calendar'}:
-                    source_category = 'calendarscan'
-                case _:
-                    source_category = 'other'
-
-            status = obj.get('resolution_status')
+            # The number of reports with this status created in this month,
+            # and the number resolved in it
+            created, resolved = obj['created'], obj['resolved']
+            source_category = obj['source_category']
+            month = obj['month']
+
+            status = obj['resolution_status']
             key = 'handled' if status is not None else 'unhandled'
 
-            source_type[source_category]['total'] += count
-            source_type[source_category]['unhandled'] += count if key == 'unhandled' else 0
-            source_type[source_category]['created_recent'] += count if obj.get(
-                'created_recently') else 0
-            source_type[source_category]['handled_recent'] += count if obj.get(
-                'handled_recently') else 0
+            source_type[source_category]['total'] += created
+            source_type[source_category]['unhandled'] += created if key == 'unhandled' else 0
 
             if status is not None:
-                resolution_status[status]['count'] += count
-                month_resolved = obj['resolved_month']
-                resolved_month[month_resolved] = resolved_month.get(month_resolved, 0) + count
+                resolution_status[status]['count'] += created
+                if resolved:
+                    resolved_month[month] = resolved_month.get(month, 0) + resolved
 
-            handled_unhandled[key]['count'] += count
+            handled_unhandled[key]['count'] += created
 
-            month_created = obj['created_month']
-            created_month[month_created] = created_month.get(month_created, 0) + count
+            if created and month is not None:
+                created_month[month] = created_month.get(month, 0) + created
 
         return handled_unhandled, source_type, resolution_status, created_month, resolved_month
 
+    def count_recent_matches(self, source_type_data):
+        """Counts the matches created and handled in the last 30 days by
+        source category, and adds them to the structure made by
+        make_data_structures."""
+        a_month_ago = timezone.now() - timedelta(days=30)
+
+        for field, timestamp in (('created_recent', 'created_timestamp'),
+                                 ('handled_recent', 'resolution_time'),):
+            for source, count in self.reports.filter(
+                    **{f'{timestamp}__gte': a_month_ago}).order_by().values_list(
+                    'source_type').annotate(count=Count('pk', distinct=True)):
+                source_type_data[source_category(source)][field] += count
+
     def count_unhandled_matches_by_month(self, current_date, num_months=12):
         """Counts new matches and resolved matches by month for the last year,
         rotates the current month to the end of the list, inserts and subtracts using the counts
@@ -366,11 +360,15 @@ class DPOStatisticsPageView(LoginRequiredMixin, TemplateView):
 
     def count_match_status_by_org_unit(self):
 
-        stats = OrganizationalUnit.objects.with_match_counts().filter(
-            organization=self.request.user.account.organization
+        stats = self.statistics.filter(
+            org_unit__isnull=False
         ).values(
-            "name", "total_ou_matches", "handled_ou_matches"
-        )
+            "org_unit"
+        ).annotate(
+            name=Max("org_unit__name"),
+            total_ou_matches=Sum("created"),
+            handled_ou_matches=Sum("created", filter=Q(resolution_status__isnull=False)),
+        ).order_by()
 
         def get_matches(match_type):
             match match_type:
@@ -512,7 +510,7 @@ class LeaderStatisticsPageView(LoginRequiredMixin, ListView):
                 Q(last_name__icontains=search_field) |
                 Q(username__istartswith=search_field))
 
-        qs = self.order_employees(qs)
+        qs = self.order_employees(qs.with_match_status())
 
         self.employee_count = qs.count()
 
@@ -534,21 +532,17 @@ class LeaderStatisticsPageView(LoginRequiredMixin, ListView):
 
     def order_employees(self, qs):
         """Checks if a sort key is allowed and orders the employees queryset"""
-        allowed_sorting_properties = [
-            'first_name',
-            'match_count',
-            'match_status']
+        allowed_sorting_properties = {
+            'first_name': 'first_name',
+            'match_count': 'match_count',
+            # (The match status isn't stored, but annotated by get_queryset)
+            'match_status': 'current_match_status'}
         if (sort_key := self.request.GET.get('order_by', 'first_name')) and (
                 order := self.request.GET.get('order', 'ascending')):
 
             if sort_key not in allowed_sorting_properties:
                 return
-
-            if sort_key == "match_count":
-                # Trigger recomputation of match_count by saving
-                # all the objects again. FIXME FIXME FIXME!!!
-                for acc in qs:
-                    acc.save()
+            sort_key = allowed_sorting_properties[sort_key]
 
             if order != 'ascending':
                 sort_key = '-'+sort_key
@@ -643,7 +637,9 @@ class UserStatisticsPageView(LoginRequiredMixin, DetailView):
         response_string = _('You deleted all results from {0} associated with {1}.'.format(
                 scannerjob_name, account.get_full_name()))
 
-        reports.delete()
+        # (Track all of the reports at once rather than one at a time)
+        with transaction.atomic(), tracking(reports):
+            reports.delete()
 
         response = HttpResponse(
             "<li>" +
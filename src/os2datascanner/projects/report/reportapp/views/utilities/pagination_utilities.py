@@ -0,0 +1,205 @@
+"""Keyset ("cursor") pagination for the result lists.
+
+Django's Paginator fetches a page by asking the database to skip over every
+result before it (with OFFSET), and works out how many pages there are by
+counting every result (with COUNT(*)), so both get slower the more results a
+user has. A KeysetPaginator instead remembers the sort key of the first and
+last result on each page in a cursor, and fetches the neighbouring pages by
+asking for the results just before or after those -- which, given a suitable
+index, takes the same time no matter how deep into the list the page is. The
+total number of results is counted only now and then, and cached."""
+
+import hashlib
+from collections.abc import Sequence
+from datetime import datetime
+from math import ceil
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+
+
+_SALT = "os2datascanner.reportapp.keyset"
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return ["datetime", value.isoformat()]
+    return ["value", value]
+
+
+def _decode_value(encoded):
+    kind, value = encoded
+    if kind == "datetime":
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _beyond(field: str, descending: bool, nullable: bool, value, pk,
+            pk_descending: bool) -> Q:
+    """Returns a Q object that selects the rows that come after the row with
+    the given value and primary key when ordering by the given field and then
+    by primary key.
+
+    (PostgreSQL puts NULL values last when sorting in ascending order, and
+    first when sorting in descending order.)"""
+    beyond_pk = Q(pk__lt=pk) if pk_descending else Q(pk__gt=pk)
+    if value is None:
+        rv = Q(**{f"{field}__isnull": True}) & beyond_pk
+        if descending:
+            rv |= Q(**{f"{field}__isnull": False})
+        return rv
+
+    lookup = "lt" if descending else "gt"
+    rv = Q(**{f"{field}__{lookup}": value}) | (Q(**{field: value}) & beyond_pk)
+    if nullable and not descending:
+        rv |= Q(**{f"{field}__isnull": True})
+    return rv
+
+
+class KeysetPage(Sequence):
+    """A page of results produced by a KeysetPaginator. This has (most of) the
+    interface of Django's Page class, along with the cursors needed to fetch
+    the neighbouring pages."""
+
+    def __init__(self, object_list, number, paginator, has_previous, has_next):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __repr__(self):
+        return f"<KeysetPage {self.number} of approx. {self.paginator.num_pages}>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def start_index(self):
+        return (self.number - 1) * self.paginator.per_page + 1 if self.object_list else 0
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.make_cursor(
+                    "after", self.object_list[-1], self.number + 1)
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.number > 2:
+            return self.paginator.make_cursor(
+                    "before", self.object_list[0], self.number - 1)
+        # (The first page doesn't need a cursor)
+        return None
+
+
+class KeysetPaginator:
+    """Paginates a QuerySet ordered by a single field and then by primary key
+    (which is how the result lists are always ordered) using cursors."""
+
+    def __init__(self, object_list, per_page):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+
+        ordering = object_list.query.order_by
+        if len(ordering) != 2 or ordering[1] != "pk":
+            raise ValueError(f"can't paginate by ordering {ordering}")
+        self.descending = ordering[0].startswith("-")
+        self.field = ordering[0].lstrip("-")
+        self.nullable = object_list.model._meta.get_field(self.field).null
+
+    @staticmethod
+    def supports(queryset) -> bool:
+        ordering = queryset.query.order_by
+        return len(ordering) == 2 and ordering[1] == "pk"
+
+    @property
+    def count(self) -> int:
+        """Returns the (approximate) number of results. The count is cached
+        for RESULT_COUNT_CACHE_TIMEOUT seconds, so it won't always reflect the
+        latest changes."""
+        query = self.object_list.order_by().query
+        key = "report-count-" + hashlib.sha256(str(query).encode()).hexdigest()
+        if (rv := cache.get(key)) is None:
+            rv = self.object_list.order_by().count()
+            cache.set(key, rv, settings.RESULT_COUNT_CACHE_TIMEOUT)
+        return rv
+
+    @property
+    def num_pages(self) -> int:
+        return max(1, ceil(self.count / self.per_page))
+
+    @property
+    def page_range(self):
+        return range(1, self.num_pages + 1)
+
+    def make_cursor(self, direction, obj, number) -> str:
+        return signing.dumps({
+            "d": direction,
+            "v": _encode_value(getattr(obj, self.field)),
+            "k": obj.pk,
+            "n": number,
+        }, salt=_SALT, compress=True)
+
+    def page(self, cursor=None, number=None) -> KeysetPage:
+        """Returns a page of results. If a valid cursor is given, the page is
+        fetched using it; otherwise, the page with the given number is fetched
+        the slow way (which is what happens when the user jumps straight to a
+        particular page)."""
+        try:
+            cursor = signing.loads(cursor, salt=_SALT) if cursor else None
+        except signing.BadSignature:
+            cursor = None
+
+        if cursor is None:
+            try:
+                number = max(1, int(number or 1))
+            except ValueError:
+                number = 1
+            offset = (number - 1) * self.per_page
+            rows = list(self.object_list[offset:offset + self.per_page + 1])
+            return KeysetPage(
+                    rows[:self.per_page], number, self,
+                    has_previous=number > 1,
+                    has_next=len(rows) > self.per_page)
+
+        backwards = cursor["d"] == "before"
+        condition = _beyond(
+                self.field, self.descending != backwards, self.nullable,
+                _decode_value(cursor["v"]), cursor["k"], backwards)
+        queryset = self.object_list.filter(condition)
+        if backwards:
+            queryset = queryset.reverse()
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+            return KeysetPage(
+                    rows, cursor["n"], self, has_previous=more, has_next=True)
+        else:
+            return KeysetPage(
+                    rows, cursor["n"], self, has_previous=True, has_next=more)
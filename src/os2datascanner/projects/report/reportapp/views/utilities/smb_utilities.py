@@ -3,6 +3,7 @@ import structlog
 from traceback import print_exc
 
 from django.conf import settings
+from django.db import transaction
 
 from os2datascanner.utils.system_utilities import time_now
 
@@ -12,6 +13,8 @@ from os2datascanner.engine2.model.smbc import SMBCHandle
 from os2datascanner.projects.grants.models.smbgrant import SMBGrant
 from os2datascanner.projects.report.reportapp.models.documentreport import (
         DocumentReport)
+from os2datascanner.projects.report.reportapp.models.match_counters import (
+        tracking)
 
 
 logger = structlog.get_logger("reportapp")
@@ -102,9 +105,11 @@ def try_smb_delete_1(request, pks: list[int]) -> (bool, str):  # noqa: CCR001
             result = (False, f"unexpected error during deletion of report {report.pk}: {ex}")
 
     # Update the reports to indicate that the file is gone
-    DocumentReport.objects.filter(pk__in=deleted_matches).update(
-        resolution_status=DocumentReport.ResolutionChoices.REMOVED,
-        resolution_time=time_now()
-        )
+    deleted = DocumentReport.objects.filter(pk__in=deleted_matches)
+    with transaction.atomic(), tracking(deleted):
+        deleted.update(
+            resolution_status=DocumentReport.ResolutionChoices.REMOVED,
+            resolution_time=time_now()
+            )
 
     return result or (True, "ok")
@@ -14,6 +14,7 @@ from os2datascanner.engine2.utilities.datetime import parse_datetime
 
 from ..reportapp.models.documentreport import DocumentReport
 from ..reportapp.utils import create_alias_and_match_relations
+from ..reportapp.views.utilities.pagination_utilities import KeysetPaginator
 from ..reportapp.views.report_views import (
     UserReportView, RemediatorView,
     UserArchiveView, RemediatorArchiveView, UndistributedArchiveView)
@@ -865,3 +866,70 @@ class UndistributedArchiveViewTest(TestCase):
         view.setup(request)
         qs = view.get_queryset()
         return qs
+
+
+class KeysetPaginatorTest(TestCase):
+    def setUp(self):
+        # Lots of duplicated sort keys and missing modification dates, so
+        # that the primary key and NULL handling both get a workout
+        for i in range(23):
+            DocumentReport.objects.create(
+                path=f"report-{i}", scanner_job_pk=1,
+                sort_key=f"key-{i % 4}", number_of_matches=i % 3 + 1,
+                datasource_last_modified=(
+                    None if i % 5 == 0 else time0 + timedelta(days=i % 7)))
+
+    def walk(self, paginator):
+        """Pages forwards through a KeysetPaginator using cursors, and then
+        backwards again, returning the primary keys seen in each direction."""
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        back = [pages[-1]]
+        while back[-1].has_previous():
+            back.append(paginator.page(back[-1].previous_cursor))
+        back.reverse()
+
+        for n, page in enumerate(pages, start=1):
+            self.assertEqual(page.number, n)
+        return ([r.pk for p in pages for r in p],
+                [r.pk for p in back for r in p])
+
+    @parameterized.expand([
+        ("sort_key",),
+        ("-sort_key",),
+        ("number_of_matches",),
+        ("-number_of_matches",),
+        ("datasource_last_modified",),
+        ("-datasource_last_modified",),
+    ])
+    def test_keyset_pages_match_offset_pages(self, ordering):
+        qs = DocumentReport.objects.order_by(ordering, "pk")
+        expected = list(qs.values_list("pk", flat=True))
+
+        forwards, backwards = self.walk(KeysetPaginator(qs, 5))
+
+        self.assertEqual(forwards, expected)
+        self.assertEqual(backwards, expected)
+
+    def test_page_number_without_cursor(self):
+        qs = DocumentReport.objects.order_by("sort_key", "pk")
+        paginator = KeysetPaginator(qs, 5)
+
+        page = paginator.page(number="3")
+
+        self.assertEqual(
+                [r.pk for r in page],
+                list(qs.values_list("pk", flat=True)[10:15]))
+        self.assertTrue(page.has_previous())
+        self.assertTrue(page.has_next())
+        self.assertEqual(paginator.num_pages, 5)
+
+    def test_tampered_cursor_is_ignored(self):
+        qs = DocumentReport.objects.order_by("sort_key", "pk")
+        paginator = KeysetPaginator(qs, 5)
+        cursor = paginator.page().next_cursor
+
+        page = paginator.page(cursor[:-2] + "xx")
+
+        self.assertEqual(page.number, 1)
@@ -472,6 +472,48 @@ class PipelineCollectorTests(TestCase):
         self.assertEqual(DocumentReport.objects.count(), 1)
         self.assertEqual(smb_dr_1.path, smb_dr_3.path)
 
+    def test_batched_results(self):
+        """Result messages handled in a batch should have the same effect as
+        they would have had if they'd been handled one at a time."""
+        list(result_collector.result_messages_received_raw([
+            dict(positive_match.to_json_object(), origin="os2ds_matches"),
+            dict(smb_match_1.to_json_object(), origin="os2ds_matches"),
+            dict(transient_handle_error.to_json_object(),
+                 origin="os2ds_problems"),
+        ]))
+
+        self.assertEqual(DocumentReport.objects.count(), 2)
+        report = DocumentReport.objects.get(
+                path=common_handle.crunch(hash=True))
+        self.assertTrue(
+                report.matches.matched,
+                "matches were not saved")
+        self.assertIsNotNone(
+                report.raw_problem,
+                "problem was handled before the matches")
+
+    def test_batched_results_keep_order(self):
+        """Messages in a batch about the same object are handled in the order
+        in which they were received, even if they describe that object
+        differently."""
+        problem = messages.ProblemMessage(
+                scan_tag=scan_tag0, source=None, handle=smb_handle_1,
+                message="The network path was not found")
+        list(result_collector.result_messages_received_raw([
+            # (These handles differ only in their drive letters)
+            dict(smb_match_3._replace(scan_spec=smb_match_1.scan_spec)
+                 .to_json_object(), origin="os2ds_matches"),
+            dict(problem.to_json_object(), origin="os2ds_problems"),
+        ]))
+
+        report = DocumentReport.objects.get()
+        self.assertTrue(
+                report.matches.matched,
+                "matches were not saved")
+        self.assertIsNotNone(
+                report.raw_problem,
+                "problem was handled before the matches")
+
     def test_missing_file_with_no_previous_report(self):
         """ A problem message containing information about a missing file, with
         no unresolved or resolution_status=0 DocumentReport,
@@ -19,6 +19,9 @@ from os2datascanner.core_organizational_structure.models.position import Role
 from ...report.organizations.models import (
     Account, Organization, OrganizationalUnit, Position, Alias)
 from ..reportapp.models.documentreport import DocumentReport
+from ..reportapp.models.match_counters import tracking
+from ..reportapp.models.match_statistics import (
+        MatchStatistic, MatchStatisticDelta, fold_deltas, rebuild)
 from ..reportapp.views.statistics_views import (
         UserStatisticsPageView, LeaderStatisticsPageView,
         DPOStatisticsPageView, DPOStatisticsCSVView)
@@ -438,6 +441,28 @@ class StatisticsPageViewTest(TestCase):
             200,
             "A superuser cannot access the leader overview.")
 
+    def test_leader_statisticspage_sorted_by_status(self):
+        """The leader overview can sort employees by their current match
+        status, which is worked out in the same query."""
+        self.egon.is_superuser = True
+        self.egon.save()
+        self.benny_account.units.add(self.olsen_banden)
+        self.kjeld_account.units.add(self.olsen_banden)
+
+        request = self.factory.get(reverse('statistics-leader'), {
+            "org_unit": str(self.olsen_banden.uuid),
+            "order_by": "match_status",
+            "order": "descending"})
+        request.user = self.egon
+        employees = list(LeaderStatisticsPageView.as_view()(
+                request).context_data["employees"])
+
+        self.assertEqual(len(employees), 2)
+        self.assertTrue(all(
+                hasattr(e, "current_match_status") for e in employees))
+        statuses = [e.match_status for e in employees]
+        self.assertEqual(statuses, sorted(statuses, reverse=True))
+
     def test_leader_statisticspage_with_no_privileges(self):
         """A user with no privileges should not be able to access the leader
         overview page."""
@@ -450,7 +475,7 @@ class StatisticsPageViewTest(TestCase):
     def test_statisticspage_created_timestamp_as_dpo(self):
         Position.objects.create(account=self.kjeld_account, unit=self.olsen_banden, role=Role.DPO)
         view = self.get_statisticspage_object()
-        created_timestamp = view.matches[0].get('created_month')
+        created_timestamp = view.matches[0].get('month')
         now = timezone.now().date()
 
         self.assertEqual(created_timestamp, timezone.datetime(now.year, now.month, 1).date())
@@ -700,11 +725,85 @@ class StatisticsPageViewTest(TestCase):
         self.assertIn("unhandled,7", str(line2_ex))
         self.assertIn("unhandled,7", str(line2_im))
 
+    def test_match_statistics_follow_changes(self):
+        """The materialised statistics should always be the same as those
+        counted from scratch, even as reports are handled and employees move
+        between organizational units."""
+        def _statistics():
+            fold_deltas()
+            return {
+                key: (created, resolved)
+                for key, created, resolved in MatchStatistic.objects.values_list(
+                    "key", "created", "resolved")
+                if created or resolved}
+
+        self.egon_account.units.add(self.olsen_banden)
+        Position.objects.create(account=self.benny_account, unit=self.olsen_banden)
+        report = DocumentReport.objects.filter(alias_relation=self.egon_alias).first()
+        report.resolution_status = DocumentReport.ResolutionChoices.EDITED
+        report.save()
+        self.egon_account.units.remove(self.olsen_banden)
+        self.kjeld_account.units.add(self.olsen_banden)
+
+        maintained = _statistics()
+        rebuild()
+        self.assertEqual(maintained, _statistics())
+
+    def test_match_statistics_changed_after_commit(self):
+        """Changes to reports should not touch the statistics themselves until
+        they're folded in."""
+        before = dict(MatchStatistic.objects.values_list("key", "created"))
+        report = DocumentReport.objects.filter(alias_relation=self.egon_alias).first()
+        report.resolution_status = DocumentReport.ResolutionChoices.EDITED
+        with self.captureOnCommitCallbacks() as callbacks:
+            report.save()
+
+        self.assertEqual(
+            dict(MatchStatistic.objects.values_list("key", "created")), before)
+        self.assertTrue(MatchStatisticDelta.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertFalse(MatchStatisticDelta.objects.exists())
+        self.assertNotEqual(
+            dict(MatchStatistic.objects.values_list("key", "created")), before)
+
+    def test_dpo_overview_read_only(self):
+        """Looking at the DPO overview should not fold in pending changes to
+        its statistics."""
+        Position.objects.create(
+            account=self.egon_account, unit=self.olsen_banden, role=Role.DPO)
+        pending = MatchStatisticDelta.objects.count()
+        self.assertTrue(pending)
+
+        request = self.factory.get(reverse('statistics-dpo'))
+        request.user = self.egon
+        DPOStatisticsPageView.as_view()(request)
+
+        self.assertEqual(MatchStatisticDelta.objects.count(), pending)
+
+    def test_org_unit_breakdown(self):
+        """The DPO overview should show the matches of each organizational
+        unit."""
+        self.egon_account.units.add(self.olsen_banden)
+        Position.dpos.create(account=self.egon_account, unit=self.olsen_banden)
+
+        response = self.get_dpo_statisticspage_response(self.egon)
+
+        self.assertEqual(
+            response.context_data.get('matches_by_org_unit_total'),
+            [["Olsen Banden", 2]])
+
+    # (Outside of tests, changes to the DPO overview's statistics are folded in
+    # once they've been committed, which never happens in a TestCase, so the
+    # helpers below that read them fold the changes in first)
+
     # StatisticsPageView()
     def get_statisticspage_object(self):
         # XXX: we don't use request for anything! Is this deliberate?
         # request = self.factory.get('/statistics')
         # request.user = self.kjeld
+        fold_deltas()
         view = DPOStatisticsPageView()
         return view
 
@@ -727,11 +826,13 @@ class StatisticsPageViewTest(TestCase):
         return LeaderStatisticsPageView.as_view()(request, **kwargs)
 
     def get_dpo_statisticspage_response(self, user, params='', **kwargs):
+        fold_deltas()
         request = self.factory.get(reverse('statistics-dpo') + params)
         request.user = user
         return DPOStatisticsPageView.as_view()(request, **kwargs)
 
     def get_dpo_statistics_csv_response(self, user, params='', **kwargs):
+        fold_deltas()
         request = self.factory.get(reverse('statistics-dpo-export') + params)
         request.user = user
         return DPOStatisticsCSVView.as_view()(request, **kwargs)
@@ -755,7 +856,9 @@ def static_timestamps(time_type: str = 'created_timestamp',
                 original_timestamps.append((match.pk, match.resolution_time))
                 match.resolution_status = 3
                 match.resolution_time = dateutil.parser.parse("2021-3-28T14:21:59+05:00")
-            DocumentReport.objects.bulk_update(batch, ['resolution_status', 'resolution_time'])
+            with tracking(DocumentReport.objects.filter(pk__in=[m.pk for m in batch])):
+                DocumentReport.objects.bulk_update(
+                    batch, ['resolution_status', 'resolution_time'])
     else:
         print("Typo in argument 'time_type' in static_timestamps()")
 
@@ -1,5 +1,8 @@
+import json
+import base64
 import structlog
 import requests
+from typing import Optional
 
 
 logger = structlog.get_logger("utils")
@@ -36,6 +39,23 @@ def mint_cc_token(
     return response.json()["access_token"]
 
 
+def token_expiry(token: str) -> Optional[float]:
+    """Returns the time (as a Unix timestamp) at which the given access token
+    expires, if it's a JSON Web Token with an expiry claim, or None otherwise.
+
+    The token's signature is not checked: this function is only meant to let
+    a client know when it's time to get a new token."""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(
+                base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        # (binascii.Error and json.JSONDecodeError are both ValueErrors)
+        return None
+
+
 __all__ = [
     "mint_cc_token",
+    "token_expiry",
 ]
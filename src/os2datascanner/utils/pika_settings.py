@@ -64,3 +64,7 @@ AMQP_PORT = _config['AMQP_PORT']
 AMQP_HEARTBEAT = _config['AMQP_HEARTBEAT']
 AMQP_VHOST = _config['AMQP_VHOST']
 AMQP_BACKOFF_PARAMS = _config.get('AMQP_BACKOFF_PARAMS', {})
+AMQP_BATCH_SIZE = _config.get('AMQP_BATCH_SIZE', 256)
+AMQP_PUBLISHER_CONFIRMS = _config.get('AMQP_PUBLISHER_CONFIRMS', False)
+AMQP_CODEC = _config.get('AMQP_CODEC', {})
+AMQP_SHARDS = _config.get('AMQP_SHARDS', {})
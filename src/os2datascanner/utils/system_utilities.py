@@ -7,6 +7,7 @@ import tempfile
 import subprocess
 
 from os2datascanner.engine2.utilities.datetime import parse_datetime
+from os2datascanner.utils import timer
 
 
 def json_utf8_decode(body):
@@ -44,7 +45,19 @@ def run_custom(  # noqa
                    individual process will be killed
     * isolate_tmp - if True, runs the subprocess with an environment in which
                     $TMP, $TMPDIR and $TEMP all point to a freshly-created
-                    temporary folder that will be deleted at process exit"""
+                    temporary folder that will be deleted at process exit
+
+    On threads other than the main one, the subprocess is also killed if one of
+    the calling thread's timeouts expires while it's running, in which case
+    that timeout's exception is raised."""
+
+    # Don't start a process that we'd have to kill straight away
+    timer.check_timeouts()
+    wait_for = timeout
+    if (remaining := timer.remaining()) is not None:
+        wait_for = max(
+                min(remaining, timeout if timeout is not None else remaining),
+                0)
 
     def _setpgrp(next=None):
         def __setpgrp():
@@ -68,7 +81,7 @@ def run_custom(  # noqa
     out, err = None, None
     with subprocess.Popen(args, **kwargs) as process:
         try:
-            out, err = process.communicate(input, timeout)
+            out, err = process.communicate(input, wait_for)
         except subprocess.TimeoutExpired:
             if kill_group:
                 os.killpg(process.pid, signal.SIGKILL)
@@ -77,6 +90,9 @@ def run_custom(  # noqa
             # We only need to take responsibility for our immediate child
             # process -- init will reap anything else
             o2, e2 = process.communicate()
+            # If it was one of our thread's timeouts that expired rather than
+            # our own, then raise that timeout's exception
+            timer.check_timeouts()
             raise subprocess.TimeoutExpired(
                     args, timeout, output=o2, stderr=e2)
         except Exception:
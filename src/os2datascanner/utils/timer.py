@@ -1,6 +1,8 @@
 from time import time, sleep
 from dataclasses import dataclass, field
-from typing import Callable, Any, Dict
+from typing import Callable, Any, Dict, Optional
+import os
+import ctypes
 import signal
 import structlog
 import threading
@@ -10,6 +12,9 @@ import heapq
 logger = structlog.get_logger("utils")
 
 
+_local = threading.local()
+
+
 def _throw(ex, *args, **kwargs):
     """Raises an instance of the given exception type, optionally passing
     positional and/or keyword arguments to its constructor."""
@@ -56,10 +61,12 @@ class TimerManager:
         """Returns the unique TimerManager singleton, creating it if necessary.
 
         As signal handlers can only execute in the scope of the main thread,
-        this function will return a dummy TimerManager instance that doesn't do
-        anything if called on a background thread."""
+        this function will instead return this thread's ThreadTimerManager if
+        called on a background thread."""
         if threading.main_thread() != threading.current_thread():
-            return DummyTimerManager(key=cls.__key)
+            if not (manager := getattr(_local, "manager", None)):
+                manager = _local.manager = ThreadTimerManager(key=cls.__key)
+            return manager
 
         if not cls._Singleton:
             cls._Singleton = TimerManager(key=cls.__key)
@@ -355,11 +362,223 @@ class TimerManager:
         return self._Suspension(self, delay)
 
 
-class DummyTimerManager(TimerManager):
+def _interrupt(thread_id: int, exception: Optional[type]):
+    """Arranges for the given exception type to be raised in the thread with
+    the given identifier the next time that thread runs Python code. (If the
+    exception type is None, then any exception that was previously arranged
+    but hasn't been raised yet is cancelled instead.)"""
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_ulong(thread_id),
+            ctypes.py_object(exception) if exception else None)
+
+
+class _Watchdog:
+    """The watchdog is a background thread that interrupts other threads when
+    their timeouts expire."""
+
+    def __init__(self):
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._condition = threading.Condition()
+        self._queue = []
+        self._counter = 0
+        self._thread = None
+
+    def watch(self, ts: float, operation, *args):
+        """Arranges for the watchdog thread to call a function no earlier than
+        the given UNIX timestamp.
+
+        Calls can't be cancelled; functions that might no longer be relevant
+        when they're called should check that for themselves."""
+        with self._condition:
+            # (The counter just stops the heap from trying to compare the
+            # functions with each other)
+            self._counter += 1
+            heapq.heappush(self._queue, (ts, self._counter, operation, args))
+            if not self._thread or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                        target=self._run, name="TimerManager watchdog",
+                        daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue or self._queue[0][0] > time():
+                    self._condition.wait(
+                            self._queue[0][0] - time()
+                            if self._queue else None)
+                _, _, operation, args = heapq.heappop(self._queue)
+            try:
+                operation(*args)
+            except Exception:
+                logger.exception("watchdog operation failed")
+
+
+_watchdog = _Watchdog()
+
+
+class ThreadTimerManager(TimerManager):
+    """A ThreadTimerManager is the TimerManager used by a thread other than the
+    main one.
+
+    As only the main thread can handle signals, a ThreadTimerManager can't
+    schedule arbitrary function calls. It does, however, enforce timeouts, in
+    two stages. When a timeout expires, a watchdog thread sets its cancellation
+    token; operations that check the token (by calling the check_timeouts
+    function) then raise the Timeout exception themselves, and the run_custom
+    function will not let a subprocess outlive the timeouts of the thread that
+    started it. If the thread still hasn't left the timeout's context when the
+    grace period is over, then the watchdog falls back on arranging for the
+    Timeout exception to be raised asynchronously in it. (That's a last
+    resort: a thread that's stuck in a single long-running call into C code
+    won't see that exception until the call returns, and one that's in the
+    middle of cleaning something up might see it at an awkward moment.)"""
+
+    # The number of seconds that a thread has to notice that one of its
+    # timeouts has expired before the watchdog interrupts it
+    grace_period = 5.0
+
     def _install_handler(self):
-        logger.warning(
-                "attempted to get a TimerManager on a non-main thread:"
-                " not enforcing timeout operations")
+        self._active = set()
 
     def _setitimer_real(self, _):
         pass
+
+    def at(self, ts: float, op, *args, **kwargs) -> 'TimerManager.Cookie':
+        logger.warning(
+                "attempted to schedule a function call on a non-main thread:"
+                " ignoring it")
+        return self.Cookie()
+
+    def pause(self):
+        if not self._pauses:
+            for ctx in self._active:
+                ctx._disarm()
+        super().pause()
+
+    def resume(self, delay=True):
+        first_paused_at = self._pauses[0] if self._pauses else None
+        super().resume(delay)
+        if first_paused_at is not None and not self._pauses:
+            seconds = time() - first_paused_at if delay is True else 0
+            for ctx in self._active:
+                # (Timeouts that had already expired will have their grace
+                # period restarted)
+                ctx._arm(ctx.deadline + seconds)
+
+    def _live_timeouts(self):
+        return (ctx for ctx in self._active if not ctx.cancelled.is_set())
+
+    def remaining(self) -> Optional[float]:
+        """Returns the number of seconds left before the first of this
+        thread's active timeouts expires, or None if there are no active
+        timeouts (or if they've been suspended)."""
+        if self._pauses:
+            return None
+        return min(
+                (ctx.deadline - time() for ctx in self._live_timeouts()),
+                default=None)
+
+    def check(self):
+        """Raises the Timeout exception of the first of this thread's active
+        timeouts to expire if its time is up."""
+        if self._pauses:
+            return
+        expired = [ctx for ctx in self._active
+                   if ctx.cancelled.is_set() or ctx.deadline <= time()]
+        if expired:
+            _throw(min(expired, key=lambda ctx: ctx.deadline).Timeout)
+
+    class _Timeout(TimerManager._Timeout):
+        def __init__(self, parent: 'ThreadTimerManager', seconds: float):
+            super().__init__(parent, seconds)
+            self.deadline = None
+            # The cancellation token, set by the watchdog thread when this
+            # timeout expires
+            self.cancelled = threading.Event()
+            self._lock = threading.Lock()
+            self._thread_id = None
+            self._generation = 0
+            self._interrupted = False
+
+        def _arm(self, ts: float):
+            with self._lock:
+                self._generation += 1
+                self.deadline = ts
+                _watchdog.watch(ts, self._expire, self._generation)
+
+        def _disarm(self):
+            with self._lock:
+                self._generation += 1
+
+        def _expire(self, generation: int):
+            # Called on the watchdog thread
+            with self._lock:
+                if generation == self._generation:
+                    self.cancelled.set()
+                    _watchdog.watch(
+                            time() + self.parent.grace_period,
+                            self._interrupt, generation)
+
+        def _interrupt(self, generation: int):
+            # Called on the watchdog thread
+            with self._lock:
+                if generation == self._generation:
+                    logger.warning(
+                            "thread did not notice that its timeout had"
+                            " expired: interrupting it",
+                            seconds=self.seconds,
+                            grace_period=self.parent.grace_period)
+                    self._interrupted = True
+                    _interrupt(self._thread_id, self.Timeout)
+
+        def __enter__(self):
+            deadline = time() + self.seconds
+            self._thread_id = threading.get_ident()
+            self._interrupted = False
+            self.cancelled.clear()
+            self.deadline = deadline
+            self.parent._active.add(self)
+            if not self.parent._pauses:
+                self._arm(deadline)
+            return self
+
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            with self._lock:
+                self._generation += 1
+                if self._interrupted:
+                    # Either the exception arranged by the watchdog was raised
+                    # and handled, or the context finished just before it
+                    # could be raised; either way, make sure that it won't
+                    # now be raised outside of the context
+                    _interrupt(self._thread_id, None)
+            self.parent._active.discard(self)
+
+    def timeout(self, seconds: float):
+        return self._Timeout(self, seconds)
+
+
+def remaining() -> Optional[float]:
+    """Returns the number of seconds left before the first of the current
+    thread's active timeouts expires, or None if the current thread has no
+    active timeouts (or if it's the main thread, where timeouts are enforced by
+    a signal instead)."""
+    if (manager := getattr(_local, "manager", None)):
+        return manager.remaining()
+    return None
+
+
+def check_timeouts():
+    """Raises the Timeout exception of the current thread's first expired
+    timeout, if there is one. (On the main thread, this function does
+    nothing.)
+
+    Long-running operations on background threads should call this function
+    every so often, so that they give up when asked to rather than being
+    interrupted at an arbitrary point once the grace period is over."""
+    if (manager := getattr(_local, "manager", None)):
+        manager.check()